@@ -13,6 +13,9 @@ from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 from django.contrib.messages import get_messages
 from .test_settings import test_settings
+from asgiref.sync import sync_to_async
+from unittest import mock
+import json
 
 User = get_user_model()
 
@@ -197,4 +200,39 @@ class QuotaDecoratorTests(TestCase):
         
         response = self.client.get(self.quota_url)
         self.assertEqual(response.status_code, status.HTTP_403_FORBIDDEN)
-        self.assertIn('quota', response.data['error'].lower()) 
\ No newline at end of file
+        self.assertIn('quota', response.data['error'].lower())
+
+
+class ChatStreamViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(email='chat@example.com', password='testpass123', is_active=True)
+        self.url = reverse('chat_stream')
+
+    async def _stream_user_message(self, message, user_context=None):
+        yield 'token', 'Bonjour'
+        yield 'token', ' !'
+        yield 'response', {"response_chat": "Bonjour !", "actions_launched": "no_action"}
+
+    async def test_answer_is_streamed_as_server_sent_events(self):
+        from rest_framework_simplejwt.tokens import AccessToken
+        from core.utils.ai_utils import AIManager
+        token = await sync_to_async(AccessToken.for_user)(self.user)
+
+        with mock.patch.object(AIManager, 'stream_user_message', self._stream_user_message):
+            response = await self.async_client.post(
+                self.url, {'message': 'Bonjour'}, content_type='application/json',
+                headers={'Authorization': f'Bearer {token}'},
+            )
+            body = b''.join([chunk async for chunk in response.streaming_content]).decode()
+
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        events = [block.split('\n', 1) for block in body.strip().split('\n\n')]
+        self.assertEqual([event for event, _ in events], ['event: token', 'event: token', 'event: done'])
+        self.assertEqual(json.loads(events[0][1][len('data: '):]), {"text": "Bonjour"})
+        done = json.loads(events[2][1][len('data: '):])
+        self.assertEqual((done["success"], done["message"]), (True, "Bonjour !"))
+
+    async def test_anonymous_request_is_rejected(self):
+        response = await self.async_client.post(self.url, {'message': 'Bonjour'}, content_type='application/json')
+
+        self.assertEqual(response.status_code, 401)
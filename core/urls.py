@@ -10,7 +10,7 @@ from .views import (
     LoginView, RegisterView, PasswordResetView,
     PasswordResetConfirmView, AccountActivationView,
     DashboardView, VerifyActivationCodeView, HomeView, ProtectedRegistrationView,
-    ChatView, ChatHistoryView, ChatJobsStatusView, ChatClearView, ChatStructureUpdateView,
+    ChatView, ChatStreamView, ChatHistoryView, ChatJobsStatusView, ChatClearView, ChatStructureUpdateView,
     ScrapingStructureView, ScrapingJobView, SubscriptionAPIView,
     DashboardStatsView, ActiveScrapingJobsView, WorkerActivityView,
     ScrapingJobControlView, ScrapingJobHistoryView, UserProfileAPIView, 
@@ -69,6 +69,7 @@ urlpatterns = [
     # Chat API endpoints
     path('api/chat/', csrf_exempt(ChatView.as_view()), name='chat'),
     path('api/chat/send/', csrf_exempt(ChatView.as_view()), name='chat_send'),
+    path('api/chat/stream/', csrf_exempt(ChatStreamView.as_view()), name='chat_stream'),
     path('api/chat/history/', csrf_exempt(ChatHistoryView.as_view()), name='chat_history'),
     path('api/chat/jobs-status/', csrf_exempt(ChatJobsStatusView.as_view()), name='chat_jobs_status'),
     path('api/chat/clear/', csrf_exempt(ChatClearView.as_view()), name='chat_clear'),
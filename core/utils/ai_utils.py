@@ -1,12 +1,19 @@
+import asyncio
 import os
 import json
 import logging
-import time
+from asgiref.sync import sync_to_async
 from django.conf import settings
+from mistralai.async_client import MistralAsyncClient
 from mistralai.client import MistralClient
 from typing import List, Dict, Any, Optional
 import sys
+import time
 from .prompt_templates import SYSTEM_PROMPTS, SCRAPING_PROMPTS
+from utils import json_repair, llm_cache, model_router
+from utils.context_builder import build_context
+from utils.rate_limiter import get_limiter
+from utils.structured_extractor import pre_extract
 import re
 
 # Configure logging
@@ -26,9 +33,6 @@ formatter = logging.Formatter("%(asctime)s [%(levelname)s] %(message)s")
 console_handler.setFormatter(formatter)
 logger.addHandler(console_handler)
 
-# Global variables for rate limiting
-last_request_time = 0
-
 class AIManager:
     _instance = None
 
@@ -50,37 +54,37 @@ class AIManager:
         if not self.mistral_client:
             logger.error("❌ MistralAI client not initialized - missing API key")
 
-    def send_mistral_request(self, messages, model=None, max_tokens=None, temperature=None):
+    def send_mistral_request(self, messages, model=None, max_tokens=None, temperature=None,
+                             cache_purpose=None, schema_hash='', route=None):
         """
         Send a request to the Mistral API with JSON response format.
-        Adds a pause if the last request was made less than a second ago.
-        """
-        global last_request_time
+        Waits for a slot of the cluster-wide Mistral rate limiter first.
 
+        Requests with a `cache_purpose` (e.g. 'html_extraction') are answered from the LLM
+        cache when the same model, parameters, messages and `schema_hash` were seen before.
+        Without a `model`, the model router picks the first model of the `route`; the
+        latency, tokens and errors of the call are recorded for that route.
+        """
         if not self.mistral_api_key:
-            logger.error("❌ Missing Mistral API key!")
-            return {
-                "message": "Configuration error: Missing Mistral API key",
-                "response_chat": "Je suis désolé, il y a un problème avec la configuration du service IA. Veuillez contacter le support.",
-                "actions_launched": "no_action",
-                "error": "Missing API key"
-            }
+            return self._missing_key_response()
 
         # Use provided parameters or fallback to config
-        model = model or self.mistral_config['default_model']
+        model = model or model_router.choose(route) or self.mistral_config['default_model']
         max_tokens = max_tokens or self.mistral_config['max_tokens']
         temperature = temperature or self.mistral_config['temperature']
 
-        # Check time elapsed since last request
-        elapsed_time = time.time() - last_request_time
-        min_delay = self.mistral_config.get('rate_limit', {}).get('min_delay_between_requests', 1.0)
-        
-        if elapsed_time < min_delay:
-            sleep_time = min_delay - elapsed_time
-            logger.info(f"⏳ Waiting {sleep_time:.2f} seconds to avoid too many requests.")
-            time.sleep(sleep_time)
+        key = None
+        if cache_purpose:
+            key = llm_cache.cache_key(model, messages, temperature, max_tokens, schema_hash)
+            cached = llm_cache.get(key, cache_purpose)
+            if cached is not None:
+                logger.info(f"♻️ Cached Mistral answer reused ({cache_purpose})")
+                return cached
 
         try:
+            # Shared by every worker for this model and API key
+            get_limiter('mistral', model, self.mistral_api_key).acquire()
+
             # Send request via the official library
             logger.info(f"🔄 Sending request to Mistral API using model: {model}")
             
@@ -88,7 +92,96 @@ class AIManager:
             for idx, msg in enumerate(messages):
                 logger.debug(f"Message {idx} - {msg['role']}: {msg['content'][:100]}...")
                 
-            chat_response = self.mistral_client.chat(
+            started = time.monotonic()
+            try:
+                chat_response = self.mistral_client.chat(
+                    model=model,
+                    messages=messages,
+                    max_tokens=max_tokens,
+                    temperature=temperature,
+                    response_format={"type": "json_object"}
+                )
+            except Exception:
+                model_router.record_call(route, model, time.monotonic() - started, error=True)
+                raise
+            model_router.record_call(route, model, time.monotonic() - started, self._usage_tokens(chat_response))
+
+            # Debug the response
+            logger.info(f"🔵 Mistral Response received")
+            
+            result = self._parse_chat_response(chat_response)
+            if key:
+                llm_cache.store(key, cache_purpose, model, result)
+            return result
+
+        except Exception as e:
+            logger.error(f"🚨 Error in Mistral API call: {str(e)}")
+            # Include traceback for debugging
+            import traceback
+            logger.error(f"Traceback: {traceback.format_exc()}")
+            
+            return self._api_error_response(e)
+
+    async def send_mistral_request_async(self, messages, model=None, max_tokens=None, temperature=None, deadline=None,
+                                         cache_purpose=None, schema_hash='', route=None):
+        """
+        Async counterpart of `send_mistral_request`, for callers running on an event loop.
+
+        At most `max_in_flight` requests of this process are in flight at once, the others
+        wait for a slot. `deadline` (seconds, defaults to `request_timeout`) bounds the whole
+        call, waiting for a slot included. Cancelling the awaiting task cancels the request.
+        The LLM cache and the model router are used as in `send_mistral_request`.
+        """
+        if not self.mistral_api_key:
+            return self._missing_key_response()
+
+        model = model or model_router.choose(route) or self.mistral_config['default_model']
+        max_tokens = max_tokens or self.mistral_config['max_tokens']
+        temperature = temperature or self.mistral_config['temperature']
+        deadline = deadline or self.mistral_config.get('request_timeout', 120)
+
+        key = None
+        if cache_purpose:
+            key = llm_cache.cache_key(model, messages, temperature, max_tokens, schema_hash)
+            # The cache may read the database, keep it off the event loop
+            cached = await sync_to_async(llm_cache.get)(key, cache_purpose)
+            if cached is not None:
+                logger.info(f"♻️ Cached Mistral answer reused ({cache_purpose})")
+                return cached
+
+        started = time.monotonic()
+        try:
+            chat_response = await asyncio.wait_for(
+                self._chat_async(messages, model, max_tokens, temperature), timeout=deadline
+            )
+            await self._record_call_async(route, model, time.monotonic() - started, self._usage_tokens(chat_response))
+            logger.info(f"🔵 Mistral Response received")
+            result = self._parse_chat_response(chat_response)
+            if key:
+                await sync_to_async(llm_cache.store)(key, cache_purpose, model, result)
+            return result
+
+        except asyncio.TimeoutError:
+            await self._record_call_async(route, model, time.monotonic() - started, error=True)
+            logger.error(f"⏱️ Mistral request to {model} cancelled after its {deadline}s deadline")
+            return self._api_error_response(f"deadline of {deadline}s exceeded")
+        except Exception as e:
+            await self._record_call_async(route, model, time.monotonic() - started, error=True)
+            logger.error(f"🚨 Error in async Mistral API call: {str(e)}", exc_info=True)
+            return self._api_error_response(e)
+
+    @staticmethod
+    async def _record_call_async(*args, **kwargs):
+        """`model_router.record_call` off the event loop: it may write the metrics to Redis."""
+        await sync_to_async(model_router.record_call, thread_sensitive=False)(*args, **kwargs)
+
+    async def _chat_async(self, messages, model, max_tokens, temperature):
+        client, in_flight = await self._get_async_client()
+        async with in_flight:
+            # Take the rate limiter slot only once a request may actually be sent
+            await get_limiter('mistral', model, self.mistral_api_key).acquire_async()
+            logger.info(f"🔄 Sending async request to Mistral API using model: {model}")
+            return await client.chat(
                 model=model,
                 messages=messages,
                 max_tokens=max_tokens,
@@ -96,232 +189,329 @@ class AIManager:
                 response_format={"type": "json_object"}
             )
 
-            # Update last request time
-            last_request_time = time.time()
+    async def _get_async_client(self):
+        """
+        Async client and in-flight semaphore of the running event loop.
 
-            # Debug the response
-            logger.info(f"🔵 Mistral Response received")
+        Both are bound to the loop that created them, and every asyncio.run() of a Celery
+        task or async_to_sync() of a view starts a new loop, so each loop gets its own
+        pair: the manager is shared by the threads of the server. Clients left behind by
+        loops that ended without `close_async_client` are closed here.
+        """
+        loop = asyncio.get_running_loop()
+        # setdefault is atomic, a bare manager (tests) gets its map on first use
+        clients = self.__dict__.setdefault('_async_clients', {})
+        entry = clients.get(loop)
+        if entry is None:
+            for stale_loop in [stale for stale in list(clients) if stale.is_closed()]:
+                stale_entry = clients.pop(stale_loop, None)
+                if stale_entry is not None:
+                    await self._close_client(stale_entry[0])
+            max_in_flight = self.mistral_config.get('max_in_flight', 8)
+            entry = clients[loop] = (
+                MistralAsyncClient(
+                    api_key=self.mistral_api_key,
+                    timeout=self.mistral_config.get('request_timeout', 120),
+                    max_concurrent_requests=max_in_flight,
+                ),
+                asyncio.Semaphore(max_in_flight),
+            )
+        return entry
+
+    async def close_async_client(self):
+        """Close the async client of the running loop (call before the loop ends)."""
+        clients = self.__dict__.get('_async_clients')
+        entry = clients.pop(asyncio.get_running_loop(), None) if clients is not None else None
+        if entry is not None:
+            await self._close_client(entry[0])
+
+    @staticmethod
+    async def _close_client(client):
+        try:
+            await client.close()
+        except Exception as e:
+            # The loop of its connections may already be closed, they are released with it
+            logger.debug(f"Could not close an async Mistral client: {str(e)}")
+
+    @staticmethod
+    def _usage_tokens(chat_response):
+        """Total tokens billed for a chat response (0 when the API did not report usage)."""
+        tokens = getattr(getattr(chat_response, 'usage', None), 'total_tokens', 0)
+        return tokens if isinstance(tokens, int) else 0
+
+    def _missing_key_response(self):
+        logger.error("❌ Missing Mistral API key!")
+        return {
+            "message": "Configuration error: Missing Mistral API key",
+            "response_chat": "Je suis désolé, il y a un problème avec la configuration du service IA. Veuillez contacter le support.",
+            "actions_launched": "no_action",
+            "error": "Missing API key"
+        }
+
+    def _api_error_response(self, error):
+        return {
+            "message": f"Erreur lors de la communication avec Mistral AI",
+            "response_chat": "Je suis désolé, une erreur est survenue lors de la communication avec le service IA. Veuillez réessayer dans quelques instants ou contacter le support si le problème persiste.",
+            "actions_launched": "no_action",
+            "error": f"API error: {str(error)}"
+        }
+
+    def _parse_chat_response(self, chat_response):
+        """Parse the JSON content of a Mistral chat response, repairing truncated output when possible."""
+        # Check response format
+        if chat_response.choices and len(chat_response.choices) > 0:
+            json_response = chat_response.choices[0].message.content.strip()
             
-            # Check response format
-            if chat_response.choices and len(chat_response.choices) > 0:
-                json_response = chat_response.choices[0].message.content.strip()
-                
-                # Log the raw response for debugging
-                logger.debug(f"Raw Mistral content: {json_response}")
+            # Log the raw response for debugging
+            logger.debug(f"Raw Mistral content: {json_response}")
+
+            # Check if json_response is already a dictionary
+            if isinstance(json_response, str):
+                try:
+                    # Simple case - try to parse the JSON directly first
+                    try:
+                        parsed_json = json.loads(json_response)
+                        return parsed_json
+                    except json.JSONDecodeError:
+                        # If direct parsing fails, try to fix common issues
+                        logger.warning("JSON parsing failed on first attempt, trying to fix response")
+                    
+                    # Repair in one pass: truncated output (token limit), trailing commas, raw newlines
+                    parsed_json = json_repair.try_loads(json_response)
+                    if parsed_json is not None:
+                        logger.info("Successfully recovered malformed or truncated JSON")
+                        return parsed_json
 
-                # Check if json_response is already a dictionary
-                if isinstance(json_response, str):
+                    # If all parsing attempts fail, try to extract just the "response_chat" part
+                    # This is a last resort to at least show something to the user
                     try:
-                        # Simple case - try to parse the JSON directly first
-                        try:
-                            parsed_json = json.loads(json_response)
-                            return parsed_json
-                        except json.JSONDecodeError:
-                            # If direct parsing fails, try to fix common issues
-                            logger.warning("JSON parsing failed on first attempt, trying to fix response")
-                        
-                        # Try to safely parse the JSON, handling potential truncation
-                        # Sometimes the response might be truncated due to token limits
-                        json_response = json_response.rstrip(',')  # Remove trailing commas
-                        
-                        # Handle common truncation patterns
-                        if json_response.endswith('"'):  # Incomplete string
-                            json_response += '"}'  # Close the string and object
-                        
-                        # Check for unmatched brackets
-                        open_braces = json_response.count('{')
-                        close_braces = json_response.count('}')
-                        if open_braces > close_braces:
-                            # Add missing closing braces
-                            json_response += '}' * (open_braces - close_braces)
-                            
-                        # Try to parse the fixed JSON
-                        try:
-                            parsed_json = json.loads(json_response)
-                            logger.info("Successfully parsed JSON after fixing format issues")
-                            return parsed_json
-                        except json.JSONDecodeError as e:
-                            # If still fails, try more aggressive fix
-                            logger.warning(f"Second JSON parsing attempt failed: {e}")
-                            
-                            # Find the last valid position of JSON
-                            for i in range(len(json_response) - 1, 0, -1):
-                                try:
-                                    test_json = json_response[:i] + "}"
-                                    parsed_json = json.loads(test_json)
-                                    logger.info("Successfully recovered truncated JSON")
-                                    return parsed_json
-                                except:
-                                    continue
-                            
-                            # If all parsing attempts fail, try to extract just the "response_chat" part
-                            # This is a last resort to at least show something to the user
-                            try:
-                                # Look for "response_chat": "some text" pattern
-                                match = re.search(r'"response_chat"\s*:\s*"([^"]+)"', json_response)
-                                if match:
-                                    response_text = match.group(1)
-                                    logger.info(f"Extracted response_chat text: {response_text[:50]}...")
-                                    return {
-                                        "message": response_text,
-                                        "response_chat": response_text,
-                                        "actions_launched": "no_action",
-                                        "parsing_error": True
-                                    }
-                            except Exception as ex:
-                                logger.error(f"Failed to extract response_chat: {ex}")
-                            
-                            logger.error(f"❌ Could not parse Mistral response as JSON after recovery attempts")
-                            
-                            # Return a friendly error message to the user
+                        # Look for "response_chat": "some text" pattern
+                        match = re.search(r'"response_chat"\s*:\s*"([^"]+)"', json_response)
+                        if match:
+                            response_text = match.group(1)
+                            logger.info(f"Extracted response_chat text: {response_text[:50]}...")
                             return {
-                                "message": "Je suis désolé, j'ai eu un problème technique avec ma réponse.",
-                                "response_chat": "Je suis désolé, j'ai rencontré un problème technique dans le traitement de votre demande. Pourriez-vous reformuler ou essayer une autre question ?",
+                                "message": response_text,
+                                "response_chat": response_text,
                                 "actions_launched": "no_action",
-                                "error": f"JSON parsing error: {str(e)}"
+                                "parsing_error": True
                             }
-                    except json.JSONDecodeError as e:
-                        logger.error(f"❌ Could not parse Mistral response as JSON: {json_response[:200]}...")
-                        logger.error(f"JSONDecodeError: {str(e)}")
-                        # Return a basic response structure
-                        return {
-                            "message": "Je suis désolé, j'ai rencontré une erreur dans le traitement de la réponse.",
-                            "response_chat": "Je suis désolé, j'ai rencontré une erreur dans le traitement de la réponse. Veuillez réessayer votre demande avec des termes différents.",
-                            "actions_launched": "no_action",
-                            "error": f"JSON parsing error: {str(e)}"
-                        }
-                elif isinstance(json_response, dict):
-                    return json_response  # If it's already a dictionary, return it directly
-                else:
-                    logger.error(f"❌ Unexpected format of Mistral response: {type(json_response)}")
+                    except Exception as ex:
+                        logger.error(f"Failed to extract response_chat: {ex}")
+                    
+                    logger.error(f"❌ Could not parse Mistral response as JSON after recovery attempts")
+                    
+                    # Return a friendly error message to the user
                     return {
-                        "message": "Erreur de format dans la réponse.",
-                        "response_chat": "Je suis désolé, j'ai rencontré une erreur dans le format de la réponse. Veuillez réessayer avec une question plus simple.",
+                        "message": "Je suis désolé, j'ai eu un problème technique avec ma réponse.",
+                        "response_chat": "Je suis désolé, j'ai rencontré un problème technique dans le traitement de votre demande. Pourriez-vous reformuler ou essayer une autre question ?",
                         "actions_launched": "no_action",
-                        "error": f"Unexpected response format: {type(json_response)}"
+                        "error": "JSON parsing error: no JSON value could be recovered"
                     }
+                except json.JSONDecodeError as e:
+                    logger.error(f"❌ Could not parse Mistral response as JSON: {json_response[:200]}...")
+                    logger.error(f"JSONDecodeError: {str(e)}")
+                    # Return a basic response structure
+                    return {
+                        "message": "Je suis désolé, j'ai rencontré une erreur dans le traitement de la réponse.",
+                        "response_chat": "Je suis désolé, j'ai rencontré une erreur dans le traitement de la réponse. Veuillez réessayer votre demande avec des termes différents.",
+                        "actions_launched": "no_action",
+                        "error": f"JSON parsing error: {str(e)}"
+                    }
+            elif isinstance(json_response, dict):
+                return json_response  # If it's already a dictionary, return it directly
             else:
-                logger.error("❌ Mistral returned an empty or malformed response.")
+                logger.error(f"❌ Unexpected format of Mistral response: {type(json_response)}")
                 return {
-                    "message": "Réponse vide ou mal formatée.",
-                    "response_chat": "Je suis désolé, j'ai reçu une réponse vide ou mal formatée. Le service IA semble avoir des problèmes temporaires. Veuillez réessayer plus tard.",
+                    "message": "Erreur de format dans la réponse.",
+                    "response_chat": "Je suis désolé, j'ai rencontré une erreur dans le format de la réponse. Veuillez réessayer avec une question plus simple.",
                     "actions_launched": "no_action",
-                    "error": "Empty or malformed response"
+                    "error": f"Unexpected response format: {type(json_response)}"
                 }
-
-        except Exception as e:
-            logger.error(f"🚨 Error in Mistral API call: {str(e)}")
-            # Include traceback for debugging
-            import traceback
-            logger.error(f"Traceback: {traceback.format_exc()}")
-            
+        else:
+            logger.error("❌ Mistral returned an empty or malformed response.")
             return {
-                "message": f"Erreur lors de la communication avec Mistral AI",
-                "response_chat": "Je suis désolé, une erreur est survenue lors de la communication avec le service IA. Veuillez réessayer dans quelques instants ou contacter le support si le problème persiste.",
+                "message": "Réponse vide ou mal formatée.",
+                "response_chat": "Je suis désolé, j'ai reçu une réponse vide ou mal formatée. Le service IA semble avoir des problèmes temporaires. Veuillez réessayer plus tard.",
                 "actions_launched": "no_action",
-                "error": f"API error: {str(e)}"
+                "error": "Empty or malformed response"
             }
 
     async def analyze_user_message(self, message: str, user_context: Optional[Dict] = None) -> Dict[str, Any]:
         """
         Analyze user message and determine appropriate action and response.
         """
-        language = 'fr'  # Default language
-        if user_context:
-            language = user_context.get('language', settings.LANGUAGE_SETTINGS['default'])
-            
+        language = self._chat_language(user_context)
         try:
-            # Prepare the system message with available actions and context
-            system_message = self._build_system_message(user_context)
-            
-            # Prepare the messages for the AI
-            messages = [
-                {"role": "system", "content": system_message},
-                {"role": "user", "content": message}
-            ]
-            
-            logger.info(f"Sending message to Mistral: {message[:50]}...")
+            messages, model_to_use = self._prepare_chat(message, user_context)
 
-            # Determine if we should use the large model based on message complexity
-            complex_indicators = [
-                'structure', 'scraping', 'extraire', 'analyser', 'complexe', 'données', 
-                'stratégie', 'avancé', 'specifique', 'détaillé', 'intelligence'
-            ]
-            message_complexity = sum(1 for indicator in complex_indicators if indicator in message.lower())
-            use_large_model = message_complexity >= 2 or len(message.split()) > 25
-            
-            model_to_use = "mistral-large-latest" if use_large_model else None
-            logger.info(f"Complexity assessment: {message_complexity}/10, using model: {model_to_use or 'default'}")
+            # Awaited on the event loop, the worker is not held for the Mistral latency
+            response_data = await self.send_mistral_request_async(messages, model=model_to_use, route='chat')
+            return await self._finish_user_message(message, response_data, language)
 
-            # Use send_mistral_request with model choice based on complexity
-            response_data = self.send_mistral_request(messages, model=model_to_use)
+        except Exception as e:
+            logger.error(f"🚨 Error in analyze_user_message: {str(e)}", exc_info=True)
+            return self._chat_error_response(language, e)
 
-            # Validate response
-            if not response_data:
-                logger.error("Empty response from Mistral")
-                return {
-                    "message": settings.LANGUAGE_SETTINGS['responses'][language]['error'],
-                    "response_chat": settings.LANGUAGE_SETTINGS['responses'][language]['error'],
-                    "actions_launched": "no_action",
-                    "error": "Empty response from Mistral"
-                }
+    async def stream_user_message(self, message: str, user_context: Optional[Dict] = None):
+        """
+        Streaming counterpart of `analyze_user_message`.
 
-            # Make sure message field exists
-            if "message" not in response_data:
-                logger.warning("Response missing 'message' field")
-                response_data["message"] = settings.LANGUAGE_SETTINGS['responses'][language]['default_response']
-                response_data["response_chat"] = response_data["message"]
-            
-            # Ensure response_chat field exists
-            if "response_chat" not in response_data:
-                response_data["response_chat"] = response_data["message"]
-                
-            # Ensure actions_launched field exists
-            if "actions_launched" not in response_data:
-                if "action" in response_data and "type" in response_data["action"]:
-                    response_data["actions_launched"] = response_data["action"]["type"]
-                else:
-                    response_data["actions_launched"] = "no_action"
-            
-            # Validate and fix structure if needed
-            valid_structure = self._validate_response_structure(response_data)
-            if not valid_structure:
-                logger.warning("Invalid response structure, using default response")
-                response_data = {
-                    "message": settings.LANGUAGE_SETTINGS['responses'][language]['default_response'],
-                    "response_chat": settings.LANGUAGE_SETTINGS['responses'][language]['default_response'],
-                    "actions_launched": "no_action"
-                }
-            
-            # Detect structure information from the message and response
-            self._detect_and_enrich_scraping_structure(message, response_data)
-            
-            # If an action is present, process it
-            if 'action' in response_data:
-                logger.info(f"Processing action: {response_data['action'].get('type')}")
-                action_response = await self.process_action(
-                    response_data['action']['type'],
-                    response_data['action'].get('parameters', {}),
-                    language
-                )
-                response_data.update(action_response)
-            
-            # Ensure the response is properly formatted before returning
-            if 'structure_update' in response_data:
-                logger.info(f"Structure update present in response: {response_data['structure_update'].get('name', 'Unnamed')}")
-                response_data['actions_launched'] = 'update_structure'
-            
-            return response_data
+        Yields ('token', text) events as the "response_chat" text of the answer is written
+        by Mistral, then a single ('response', response_data) event with the complete answer,
+        validated and processed as in `analyze_user_message`.
+        """
+        language = self._chat_language(user_context)
+        try:
+            if not self.mistral_api_key:
+                yield 'response', self._missing_key_response()
+                return
+            messages, model_to_use = self._prepare_chat(message, user_context)
+            model = model_to_use or model_router.choose('chat') or self.mistral_config['default_model']
+
+            reader = json_repair.StreamingFieldReader(('response_chat', 'message'))
+            tokens = 0
+            started = time.monotonic()
+            try:
+                async for chunk in self._chat_stream_async(messages, model):
+                    tokens = self._usage_tokens(chunk) or tokens
+                    content = chunk.choices[0].delta.content if chunk.choices else None
+                    text = reader.feed(content) if content else ''
+                    if text:
+                        yield 'token', text
+            except Exception:
+                await self._record_call_async('chat', model, time.monotonic() - started, error=True)
+                raise
+            await self._record_call_async('chat', model, time.monotonic() - started, tokens)
+            logger.info(f"🔵 Mistral stream completed ({len(reader.text)} characters)")
+
+            response_data = json_repair.try_loads(reader.text)
+            if not isinstance(response_data, dict):
+                logger.error(f"❌ Could not parse streamed Mistral response as JSON: {reader.text[:200]}...")
+                yield 'response', self._chat_error_response(language, "JSON parsing error: no JSON value could be recovered")
+                return
+            yield 'response', await self._finish_user_message(message, response_data, language)
 
         except Exception as e:
-            logger.error(f"🚨 Error in analyze_user_message: {str(e)}", exc_info=True)
+            logger.error(f"🚨 Error in stream_user_message: {str(e)}", exc_info=True)
+            yield 'response', self._chat_error_response(language, e)
+
+    async def _chat_stream_async(self, messages, model):
+        client, in_flight = await self._get_async_client()
+        async with in_flight:
+            await get_limiter('mistral', model, self.mistral_api_key).acquire_async()
+            logger.info(f"🔄 Streaming request to Mistral API using model: {model}")
+            async for chunk in client.chat_stream(
+                model=model,
+                messages=messages,
+                max_tokens=self.mistral_config['max_tokens'],
+                temperature=self.mistral_config['temperature'],
+                response_format={"type": "json_object"}
+            ):
+                yield chunk
+
+    def _chat_language(self, user_context):
+        if user_context:
+            return user_context.get('language', settings.LANGUAGE_SETTINGS['default'])
+        return 'fr'  # Default language
+
+    def _chat_error_response(self, language, error):
+        return {
+            "message": settings.LANGUAGE_SETTINGS['responses'][language]['error'],
+            "response_chat": settings.LANGUAGE_SETTINGS['responses'][language]['error'],
+            "actions_launched": "no_action",
+            "error": str(error)
+        }
+
+    def _prepare_chat(self, message, user_context):
+        """Messages of a chat request and the model it starts on (None for the route's default)."""
+        # Prepare the system message with available actions and context
+        system_message = self._build_system_message(user_context)
+
+        # Prepare the messages for the AI
+        messages = [
+            {"role": "system", "content": system_message},
+            {"role": "user", "content": message}
+        ]
+
+        logger.info(f"Sending message to Mistral: {message[:50]}...")
+
+        # Determine if we should use the large model based on message complexity
+        complex_indicators = [
+            'structure', 'scraping', 'extraire', 'analyser', 'complexe', 'données', 
+            'stratégie', 'avancé', 'specifique', 'détaillé', 'intelligence'
+        ]
+        message_complexity = sum(1 for indicator in complex_indicators if indicator in message.lower())
+        use_large_model = message_complexity >= 2 or len(message.split()) > 25
+
+        # Complex messages start on the route's larger model
+        model_to_use = model_router.choose(
+            'chat', tier=1 if use_large_model else 0,
+            default="mistral-large-latest" if use_large_model else None,
+        )
+        logger.info(f"Complexity assessment: {message_complexity}/10, using model: {model_to_use or 'default'}")
+        return messages, model_to_use
+
+    async def _finish_user_message(self, message, response_data, language):
+        """Validate a chat answer, fill its missing fields and process the action it launches."""
+        # Validate response
+        if not response_data:
+            logger.error("Empty response from Mistral")
             return {
                 "message": settings.LANGUAGE_SETTINGS['responses'][language]['error'],
                 "response_chat": settings.LANGUAGE_SETTINGS['responses'][language]['error'],
                 "actions_launched": "no_action",
-                "error": str(e)
+                "error": "Empty response from Mistral"
             }
 
+        # Make sure message field exists
+        if "message" not in response_data:
+            logger.warning("Response missing 'message' field")
+            # Keep the text the user may already have seen streamed
+            response_data["message"] = (response_data.get("response_chat")
+                                        or settings.LANGUAGE_SETTINGS['responses'][language]['default_response'])
+        
+        # Ensure response_chat field exists
+        if "response_chat" not in response_data:
+            response_data["response_chat"] = response_data["message"]
+            
+        # Ensure actions_launched field exists
+        if "actions_launched" not in response_data:
+            if "action" in response_data and "type" in response_data["action"]:
+                response_data["actions_launched"] = response_data["action"]["type"]
+            else:
+                response_data["actions_launched"] = "no_action"
+        
+        # Validate and fix structure if needed
+        valid_structure = self._validate_response_structure(response_data)
+        if not valid_structure:
+            logger.warning("Invalid response structure, using default response")
+            response_data = {
+                "message": settings.LANGUAGE_SETTINGS['responses'][language]['default_response'],
+                "response_chat": settings.LANGUAGE_SETTINGS['responses'][language]['default_response'],
+                "actions_launched": "no_action"
+            }
+        
+        # Detect structure information from the message and response
+        self._detect_and_enrich_scraping_structure(message, response_data)
+        
+        # If an action is present, process it
+        if 'action' in response_data:
+            logger.info(f"Processing action: {response_data['action'].get('type')}")
+            action_response = await self.process_action(
+                response_data['action']['type'],
+                response_data['action'].get('parameters', {}),
+                language
+            )
+            response_data.update(action_response)
+        
+        # Ensure the response is properly formatted before returning
+        if 'structure_update' in response_data:
+            logger.info(f"Structure update present in response: {response_data['structure_update'].get('name', 'Unnamed')}")
+            response_data['actions_launched'] = 'update_structure'
+        
+        return response_data
+
     def _build_system_message(self, user_context: Optional[Dict] = None) -> str:
         """Build the system message including available actions and context"""
         # Determine which prompt to use based on user_context
@@ -503,8 +693,15 @@ class AIManager:
             logger.debug("---------------------------------")
             # --- END DEBUG ---
 
-            # Send the request to Mistral - explicitly use the large model for complex analysis
-            result = self.send_mistral_request(messages, model="mistral-large-latest")
+            # Small model first, the larger one when it finds neither the official site nor any link
+            model = model_router.choose('serp_analysis', default="mistral-large-latest")
+            while True:
+                result = self.send_mistral_request(messages, model=model, route='serp_analysis', cache_purpose='serp_analysis')
+                valid = isinstance(result, dict) and bool(result.get("official_website") or result.get("priority_links"))
+                model_router.record_validation('serp_analysis', model, valid)
+                model = None if valid else model_router.escalate('serp_analysis', model)
+                if model is None:
+                    break
             
             if not isinstance(result, dict):
                 logger.error(f"❌ Invalid response from Mistral: {result}")
@@ -528,7 +725,7 @@ class AIManager:
             logger.error(f"Error in analyze_serp_results: {str(e)}", exc_info=True)
             return {"official_website": "", "priority_links": []}
 
-    def analyze_html_content(self, html_content, objective, json_structure, structure_schema=None):
+    def analyze_html_content(self, html_content, objective, json_structure, structure_schema=None, url=None):
         """
         Analyze HTML content to extract structured data according to the provided template.
         
@@ -537,88 +734,298 @@ class AIManager:
             objective (str): Extraction objective
             json_structure (dict): Base JSON structure
             structure_schema (list, optional): Custom structure schema defining fields
+            url (str, optional): Page URL, to resolve the links kept in the page context
             
         Returns:
             dict: Extracted data in structured format
         """
+        response_template = {}
         try:
-            # Limit HTML content length to prevent token overflow
-            html_content_truncated = html_content[:12000] if html_content else ""
-            
-            if not html_content_truncated:
-                logger.warning("Empty HTML content provided to analyze_html_content")
+            # Fields readable from the markup (JSON-LD, microdata, mailto:...) are not asked to Mistral
+            prefilled, pending_schema = pre_extract(html_content, url, structure_schema)
+            if self._pre_extraction_complete(prefilled, structure_schema):
+                return self._merge_pre_extraction({}, prefilled, structure_schema)
+
+            messages, response_template, early_result = self._prepare_html_analysis(
+                html_content, objective, json_structure, pending_schema or structure_schema, url=url
+            )
+            if messages is None:
+                return self._merge_pre_extraction(early_result, prefilled, structure_schema)
+
+            return self._run_extraction(
+                messages, json_structure, pending_schema or structure_schema, response_template, prefilled, structure_schema
+            )
+
+        except Exception as e:
+            logger.error(f"Error in analyze_html_content: {str(e)}", exc_info=True)
+            # Return template or original structure
+            return structure_schema and response_template or json_structure
+
+    async def analyze_html_content_async(self, html_content, objective, json_structure, structure_schema=None,
+                                         url=None, deadline=None):
+        """
+        Async counterpart of `analyze_html_content`, so extractions can overlap each other
+        and page downloads. `deadline` bounds the Mistral call (see `send_mistral_request_async`).
+        """
+        response_template = {}
+        try:
+            prefilled, pending_schema = pre_extract(html_content, url, structure_schema)
+            if self._pre_extraction_complete(prefilled, structure_schema):
+                return self._merge_pre_extraction({}, prefilled, structure_schema)
+
+            messages, response_template, early_result = self._prepare_html_analysis(
+                html_content, objective, json_structure, pending_schema or structure_schema, url=url
+            )
+            if messages is None:
+                return self._merge_pre_extraction(early_result, prefilled, structure_schema)
+
+            return await self._run_extraction_async(
+                messages, json_structure, pending_schema or structure_schema, response_template, prefilled,
+                structure_schema, deadline=deadline,
+            )
+
+        except Exception as e:
+            logger.error(f"Error in analyze_html_content_async: {str(e)}", exc_info=True)
+            return structure_schema and response_template or json_structure
+
+    def analyze_site_pages(self, pages, objective, json_structure, structure_schema=None, token_budget=6000):
+        """
+        Extract one merged result from several pages of the same site (home, contact, legal
+        notice, team...) with a single Mistral call instead of one call per page.
+
+        Each page gets an equal share of the token budget for its context, and fields found
+        in the markup of any page are not asked (see `analyze_html_content`).
+
+        Args:
+            pages (list): dicts with the `url` and `html` of each page, home page first
+            objective (str): Extraction objective
+            json_structure (dict): Base JSON structure
+            structure_schema (list, optional): Custom structure schema defining fields
+            token_budget (int): Tokens of page content for all the pages together
+
+        Returns:
+            dict: Extracted data in structured format
+        """
+        response_template = {}
+        try:
+            pages = [page for page in pages if page.get("html")]
+            if not pages:
+                logger.warning("No page content provided to analyze_site_pages")
                 return {"contacts": [], "tenders": []} if not structure_schema else {}
+
+            # Markup values of the first pages win, the home page usually carries the organization data
+            prefilled = {}
+            for page in pages:
+                page_fields, _ = pre_extract(page["html"], page["url"], structure_schema)
+                for field_name, value in page_fields.items():
+                    prefilled.setdefault(field_name, value)
+            if self._pre_extraction_complete(prefilled, structure_schema):
+                return self._merge_pre_extraction({}, prefilled, structure_schema)
+            pending_schema = [field for field in structure_schema or [] if field.get('name') not in prefilled]
+
+            page_budget = max(1, token_budget // len(pages))
+            sections = []
+            for index, page in enumerate(pages, 1):
+                context = build_context(page["html"], url=page["url"], structure_schema=pending_schema or structure_schema,
+                                        budget=page_budget)
+                if context:
+                    sections.append(f"=== PAGE {index}: {page['url']} ===\n{context}")
+
+            site_objective = (f"{objective}\nThe pages below all belong to the same website: merge them into ONE result, "
+                              f"preferring contact and legal notice pages for contact details.")
+            messages, response_template, early_result = self._prepare_html_analysis(
+                None, site_objective, json_structure, pending_schema or structure_schema,
+                page_context='\n\n'.join(sections),
+            )
+            if messages is None:
+                return self._merge_pre_extraction(early_result, prefilled, structure_schema)
+
+            return self._run_extraction(
+                messages, json_structure, pending_schema or structure_schema, response_template, prefilled, structure_schema
+            )
+
+        except Exception as e:
+            logger.error(f"Error in analyze_site_pages: {str(e)}", exc_info=True)
+            return structure_schema and response_template or json_structure
+
+    def _run_extraction(self, messages, json_structure, requested_schema, response_template, prefilled, structure_schema):
+        """
+        Send an extraction prompt along the 'html_extraction' route: the cheapest model first,
+        the next one while the result fails `is_valid_contact`.
+
+        Args:
+            requested_schema (list): Fields asked in the prompt (the schema without the prefilled fields)
+            prefilled (dict): Fields read from the markup, laid over each answer before validation
+        """
+        model = model_router.choose('html_extraction', default="mistral-large-latest")
+        while True:
+            result = self.send_mistral_request(
+                messages, model=model, route='html_extraction',
+                cache_purpose='html_extraction', schema_hash=llm_cache.schema_hash(requested_schema),
+            )
+            result = self._finish_html_analysis(result, json_structure, requested_schema, dict(response_template))
+            result = self._merge_pre_extraction(result, prefilled, structure_schema)
+            model = self._next_extraction_model(model, result, structure_schema)
+            if model is None:
+                return result
+
+    async def _run_extraction_async(self, messages, json_structure, requested_schema, response_template, prefilled,
+                                    structure_schema, deadline=None):
+        """Async counterpart of `_run_extraction`."""
+        model = model_router.choose('html_extraction', default="mistral-large-latest")
+        while True:
+            result = await self.send_mistral_request_async(
+                messages, model=model, deadline=deadline, route='html_extraction',
+                cache_purpose='html_extraction', schema_hash=llm_cache.schema_hash(requested_schema),
+            )
+            result = self._finish_html_analysis(result, json_structure, requested_schema, dict(response_template))
+            result = self._merge_pre_extraction(result, prefilled, structure_schema)
+            model = self._next_extraction_model(model, result, structure_schema)
+            if model is None:
+                return result
+
+    def _next_extraction_model(self, model, result, structure_schema):
+        """
+        Record whether an extraction passed validation and return the model to retry it with,
+        or None when it is valid or no larger model is left.
+
+        A schema result must pass `is_valid_contact`; without a schema, the extraction fails
+        only when it returns contacts and none of them is valid (pages without contacts are fine).
+        """
+        from scraping.tasks import is_valid_contact
+
+        if not isinstance(result, dict):
+            valid = False
+        elif structure_schema:
+            valid = is_valid_contact(dict(result), structure_schema)
+        else:
+            contacts = [contact for contact in result.get("contacts") or [] if isinstance(contact, dict)]
+            valid = not contacts or any(is_valid_contact(dict(contact)) for contact in contacts)
+        model_router.record_validation('html_extraction', model, valid)
+        return None if valid else model_router.escalate('html_extraction', model)
+
+    def _pre_extraction_complete(self, prefilled, structure_schema):
+        """
+        Whether the markup alone answers a schema: every required field is filled (every
+        field when none is marked required), so Mistral does not need to be called.
+        """
+        if not prefilled or not structure_schema:
+            return False
+        required = [field for field in structure_schema if field.get('required', False)] or structure_schema
+        return all(field.get('name') in prefilled for field in required)
+
+    def _merge_pre_extraction(self, result, prefilled, structure_schema):
+        """Lay the fields read from the markup over an extraction, in schema order with defaults."""
+        if not prefilled or not structure_schema:
+            return result
+        result = result if isinstance(result, dict) else {}
+        merged = {}
+        for field in structure_schema:
+            field_name = field.get('name')
+            if field_name in prefilled:
+                merged[field_name] = prefilled[field_name]
+            elif result.get(field_name) not in (None, ""):
+                merged[field_name] = result[field_name]
+            else:
+                merged[field_name] = 0 if field.get('type') == 'number' else ""
+        logger.info(f"✅ Fields read from the markup: {list(prefilled.keys())}")
+        return merged
+
+    def _prepare_html_analysis(self, html_content, objective, json_structure, structure_schema=None, url=None,
+                               page_context=None):
+        """
+        Build the extraction prompt of `analyze_html_content`.
+
+        Args:
+            page_context (str, optional): Page content already condensed for the prompt
+                (e.g. several pages of a site), used instead of `html_content`
+
+        Returns:
+            tuple: (messages, response_template, early_result); messages is None when there is
+            nothing to send to Mistral and early_result is the answer
+        """
+        # Keep the blocks most likely to hold the requested fields, within the model's token budget
+        if page_context is not None:
+            html_content_truncated = page_context
+        else:
+            html_content_truncated = build_context(
+                html_content, url=url, structure_schema=structure_schema, model="mistral-large-latest"
+            ) if html_content else ""
+        
+        if not html_content_truncated:
+            logger.warning("Empty HTML content provided to analyze_html_content")
+            return None, {}, ({"contacts": [], "tenders": []} if not structure_schema else {})
+        
+        # Check for custom structure schema
+        custom_structure_guidance = ""
+        response_template = {}
+        
+        if structure_schema:
+            # Create a template based on the schema
+            for field in structure_schema:
+                field_name = field.get('name')
+                field_type = field.get('type', 'text')
+                
+                # Set default value based on type
+                if field_type == 'number':
+                    response_template[field_name] = 0
+                else:
+                    response_template[field_name] = ""
             
-            # Check for custom structure schema
-            custom_structure_guidance = ""
-            response_template = {}
+            # Extract required fields for emphasis
+            required_fields = [field.get('name') for field in structure_schema if field.get('required', False)]
             
-            if structure_schema:
-                # Create a template based on the schema
-                for field in structure_schema:
-                    field_name = field.get('name')
-                    field_type = field.get('type', 'text')
-                    
-                    # Set default value based on type
-                    if field_type == 'number':
-                        response_template[field_name] = 0
-                    else:
-                        response_template[field_name] = ""
-                
-                # Extract required fields for emphasis
-                required_fields = [field.get('name') for field in structure_schema if field.get('required', False)]
-                
-                # Create an example based on the schema with realistic values
-                example_structure = {}
-                for field in structure_schema:
-                    field_name = field.get('name')
-                    field_type = field.get('type', 'text')
-                    
-                    # Add appropriate example values based on field name and type
-                    if field_type == 'number':
-                        example_structure[field_name] = 42
-                    elif field_type == 'email':
-                        example_structure[field_name] = "contact@example.com"
-                    elif field_type == 'url' or field_name.endswith('_web') or field_name.endswith('website') or 'site_web' in field_name:
-                        example_structure[field_name] = "https://www.example.com"
-                    elif field_name.startswith('linkedin') or 'linkedin' in field_name:
-                        example_structure[field_name] = "https://www.linkedin.com/company/example"
-                    elif field_name.startswith('twitter') or 'twitter' in field_name:
-                        example_structure[field_name] = "https://twitter.com/example"
-                    elif 'description' in field_name or 'about' in field_name:
-                        example_structure[field_name] = "This is a company that specializes in software development."
-                    elif 'nom_entreprise' in field_name or 'company' in field_name or 'entreprise' in field_name:
-                        example_structure[field_name] = "Example Company, Inc."
-                    elif 'secteur' in field_name or 'industry' in field_name or 'activite' in field_name:
-                        example_structure[field_name] = "Technology"
-                    elif 'taille' in field_name or 'size' in field_name:
-                        example_structure[field_name] = "50-200 employees"
-                    elif 'contact' in field_name and ('nom' in field_name or 'name' in field_name):
-                        example_structure[field_name] = "John Doe"
-                    elif 'fonction' in field_name or 'titre' in field_name or 'position' in field_name:
-                        example_structure[field_name] = "Chief Technology Officer"
-                    elif 'telephone' in field_name or 'phone' in field_name:
-                        example_structure[field_name] = "+1 (555) 123-4567"
-                    else:
-                        example_structure[field_name] = f"Example value for {field_name}"
-                
-                # Create field mapping guidance to help the AI understand field names
-                field_mappings = {
-                    "name": ["nom", "name", "contact_name", "nom_contact"],
-                    "company": ["nom_entreprise", "entreprise", "company", "société", "organization"],
-                    "website": ["site_web", "website", "url", "site_internet"],
-                    "industry": ["secteur_activite", "industry", "sector", "domaine"],
-                    "size": ["taille_entreprise", "size", "employees", "effectif"],
-                    "description": ["description", "about", "a_propos", "presentation"],
-                    "email": ["email", "courriel", "mail", "email_contact"],
-                    "phone": ["telephone", "phone", "tel", "telephone_contact"],
-                    "position": ["fonction", "position", "titre", "title", "titre_contact"],
-                    "linkedin": ["linkedin", "linkedin_url", "linkedin_profile"],
-                    "twitter": ["twitter", "twitter_url", "twitter_profile"]
-                }
+            # Create an example based on the schema with realistic values
+            example_structure = {}
+            for field in structure_schema:
+                field_name = field.get('name')
+                field_type = field.get('type', 'text')
                 
-                # Build custom structure guidance
-                custom_structure_guidance = f"""
+                # Add appropriate example values based on field name and type
+                if field_type == 'number':
+                    example_structure[field_name] = 42
+                elif field_type == 'email':
+                    example_structure[field_name] = "contact@example.com"
+                elif field_type == 'url' or field_name.endswith('_web') or field_name.endswith('website') or 'site_web' in field_name:
+                    example_structure[field_name] = "https://www.example.com"
+                elif field_name.startswith('linkedin') or 'linkedin' in field_name:
+                    example_structure[field_name] = "https://www.linkedin.com/company/example"
+                elif field_name.startswith('twitter') or 'twitter' in field_name:
+                    example_structure[field_name] = "https://twitter.com/example"
+                elif 'description' in field_name or 'about' in field_name:
+                    example_structure[field_name] = "This is a company that specializes in software development."
+                elif 'nom_entreprise' in field_name or 'company' in field_name or 'entreprise' in field_name:
+                    example_structure[field_name] = "Example Company, Inc."
+                elif 'secteur' in field_name or 'industry' in field_name or 'activite' in field_name:
+                    example_structure[field_name] = "Technology"
+                elif 'taille' in field_name or 'size' in field_name:
+                    example_structure[field_name] = "50-200 employees"
+                elif 'contact' in field_name and ('nom' in field_name or 'name' in field_name):
+                    example_structure[field_name] = "John Doe"
+                elif 'fonction' in field_name or 'titre' in field_name or 'position' in field_name:
+                    example_structure[field_name] = "Chief Technology Officer"
+                elif 'telephone' in field_name or 'phone' in field_name:
+                    example_structure[field_name] = "+1 (555) 123-4567"
+                else:
+                    example_structure[field_name] = f"Example value for {field_name}"
+            
+            # Create field mapping guidance to help the AI understand field names
+            field_mappings = {
+                "name": ["nom", "name", "contact_name", "nom_contact"],
+                "company": ["nom_entreprise", "entreprise", "company", "société", "organization"],
+                "website": ["site_web", "website", "url", "site_internet"],
+                "industry": ["secteur_activite", "industry", "sector", "domaine"],
+                "size": ["taille_entreprise", "size", "employees", "effectif"],
+                "description": ["description", "about", "a_propos", "presentation"],
+                "email": ["email", "courriel", "mail", "email_contact"],
+                "phone": ["telephone", "phone", "tel", "telephone_contact"],
+                "position": ["fonction", "position", "titre", "title", "titre_contact"],
+                "linkedin": ["linkedin", "linkedin_url", "linkedin_profile"],
+                "twitter": ["twitter", "twitter_url", "twitter_profile"]
+            }
+            
+            # Build custom structure guidance
+            custom_structure_guidance = f"""
 CUSTOM STRUCTURE EXTRACTION:
 You MUST return data in this EXACT format with these EXACT field names:
 ```json
@@ -646,22 +1053,22 @@ SPECIAL INSTRUCTIONS FOR INDUSTRY/SECTOR:
 - For '{next((f for f in structure_schema if f.get('name') in field_mappings["industry"]), {}).get('name', 'secteur_activite')}', you MUST make a best effort to identify the company's industry
 - Look for keywords in the description, text, meta tags, and navigation menu
 - If industry isn't explicitly stated, infer it from:
-  * Company description
-  * Products/services mentioned
-  * Case studies
-  * Client types
-  * Messaging/terminology used
+* Company description
+* Products/services mentioned
+* Case studies
+* Client types
+* Messaging/terminology used
 - Always provide a value - never leave it empty if the field is required
 - Use broad categories like "Technology", "Manufacturing", "Healthcare", "Finance", "Education", "Retail", "Media", etc.
 - If you're unsure but can make an educated guess, add "Probable: " prefix (e.g., "Probable: Technology Services")
 
 IMPORTANT: Return ONLY a valid JSON object with NO explanations, and EXACTLY the field names shown above.
 """
-            
-            # Prepare the prompt - either with standard template or custom structure
-            if structure_schema:
-                # Custom prompt for structure schema
-                prompt = f"""
+        
+        # Prepare the prompt - either with standard template or custom structure
+        if structure_schema:
+            # Custom prompt for structure schema
+            prompt = f"""
 You are an expert in extracting structured data from HTML content.
 
 OBJECTIVE: {objective}
@@ -677,109 +1084,105 @@ CRITICAL REQUIREMENTS:
 3. Do NOT use markdown code blocks
 4. Include ALL fields from the schema with at least empty values if not found
 """
-            else:
-                # Use the standard prompt template
-                try:
-                    template = SCRAPING_PROMPTS.get('html_extraction', '')
-                    if not template:
-                        logger.error("Template 'html_extraction' not found in SCRAPING_PROMPTS")
-                        return {"contacts": [], "tenders": []}
-                        
-                    prompt = template.format(
-                        objective=objective,
-                        json_structure=json.dumps(json_structure, indent=2),
-                        html_content=html_content_truncated
-                    )
-                except KeyError as ke:
-                    logger.error(f"KeyError while accessing html_extraction template: {str(ke)}")
-                    return json_structure # Return original structure instead of empty
-                except Exception as fe:
-                    logger.error(f"Formatting error with html_extraction template: {str(fe)}")
-                    return json_structure # Return original structure instead of empty
-            
-            # Create a message for the AI
-            messages = [
-                {"role": "system", "content": "You are an expert in extracting structured data from HTML. Return ONLY valid JSON with no explanations."},
-                {"role": "user", "content": prompt}
-            ]
+        else:
+            # Use the standard prompt template
+            try:
+                template = SCRAPING_PROMPTS.get('html_extraction', '')
+                if not template:
+                    logger.error("Template 'html_extraction' not found in SCRAPING_PROMPTS")
+                    return None, response_template, {"contacts": [], "tenders": []}
+                    
+                prompt = template.format(
+                    objective=objective,
+                    json_structure=json.dumps(json_structure, indent=2),
+                    html_content=html_content_truncated
+                )
+            except KeyError as ke:
+                logger.error(f"KeyError while accessing html_extraction template: {str(ke)}")
+                return None, response_template, json_structure # Return original structure instead of empty
+            except Exception as fe:
+                logger.error(f"Formatting error with html_extraction template: {str(fe)}")
+                return None, response_template, json_structure # Return original structure instead of empty
+        
+        # Create a message for the AI
+        messages = [
+            {"role": "system", "content": "You are an expert in extracting structured data from HTML. Return ONLY valid JSON with no explanations."},
+            {"role": "user", "content": prompt}
+        ]
 
-            # --- DEBUG: Log the final prompt being sent ---
-            logger.debug("--- PROMPT POUR EXTRACTION HTML ---")
-            logger.debug(f"System: {messages[0]['content']}")
-            logger.debug(f"User: {messages[1]['content']}") # Log the full user prompt
-            logger.debug("----------------------------------")
-            # --- END DEBUG ---
+        # --- DEBUG: Log the final prompt being sent ---
+        logger.debug("--- PROMPT POUR EXTRACTION HTML ---")
+        logger.debug(f"System: {messages[0]['content']}")
+        logger.debug(f"User: {messages[1]['content']}") # Log the full user prompt
+        logger.debug("----------------------------------")
+        # --- END DEBUG ---
+
+        return messages, response_template, None
 
-            # Send the request to Mistral - explicitly use the large model for complex extraction
-            result = self.send_mistral_request(messages, model="mistral-large-latest")
+    def _finish_html_analysis(self, result, json_structure, structure_schema, response_template):
+        """Validate a Mistral extraction against the schema (or base structure) it was asked for."""
+        if not isinstance(result, dict):
+            logger.error(f"❌ Could not retrieve a valid JSON from Mistral: {result}")
+            # Try to extract JSON from the response text if it's a string
+            if isinstance(result, str):
+                json_str = self._extract_json_from_text(result)
+                if json_str:
+                    try:
+                        result = json.loads(json_str)
+                    except json.JSONDecodeError:
+                        logger.error("Failed to parse extracted JSON string")
+                        return structure_schema and response_template or json_structure
+            else:
+                return structure_schema and response_template or json_structure
+        
+        # Validate the results depending on structure type
+        if structure_schema:
+            # For custom structure schema, validate required fields
+            missing_fields = []
+            for field in structure_schema:
+                field_name = field.get('name')
+                is_required = field.get('required', False)
+                
+                if is_required and (field_name not in result or result[field_name] is None or 
+                                    (isinstance(result[field_name], str) and not result[field_name].strip())):
+                    missing_fields.append(field_name)
+                    # Add default values for missing fields
+                    if field.get('type') == 'number':
+                        result[field_name] = 0
+                    else:
+                        result[field_name] = ""
             
-            if not isinstance(result, dict):
-                logger.error(f"❌ Could not retrieve a valid JSON from Mistral: {result}")
-                # Try to extract JSON from the response text if it's a string
-                if isinstance(result, str):
-                    json_str = self._extract_json_from_text(result)
-                    if json_str:
-                        try:
-                            result = json.loads(json_str)
-                        except json.JSONDecodeError:
-                            logger.error("Failed to parse extracted JSON string")
-                            return structure_schema and response_template or json_structure
-                else:
-                    return structure_schema and response_template or json_structure
+            if missing_fields:
+                logger.warning(f"❌ Missing required fields in result: {', '.join(missing_fields)}")
             
-            # Validate the results depending on structure type
-            if structure_schema:
-                # For custom structure schema, validate required fields
-                missing_fields = []
-                for field in structure_schema:
-                    field_name = field.get('name')
-                    is_required = field.get('required', False)
-                    
-                    if is_required and (field_name not in result or result[field_name] is None or 
-                                        (isinstance(result[field_name], str) and not result[field_name].strip())):
-                        missing_fields.append(field_name)
-                        # Add default values for missing fields
-                        if field.get('type') == 'number':
-                            result[field_name] = 0
-                        else:
-                            result[field_name] = ""
-                
-                if missing_fields:
-                    logger.warning(f"❌ Missing required fields in result: {', '.join(missing_fields)}")
-                
-                # Remove fields not in the schema
-                schema_fields = [field.get('name') for field in structure_schema]
-                extra_fields = [field for field in list(result.keys()) if field not in schema_fields]
-                
-                for field in extra_fields:
-                    logger.warning(f"⚠️ Removing extra field from result: {field}")
-                    del result[field]
-                
-                logger.info(f"✅ Custom structure extraction complete with fields: {list(result.keys())}")
-                return result
+            # Remove fields not in the schema
+            schema_fields = [field.get('name') for field in structure_schema]
+            extra_fields = [field for field in list(result.keys()) if field not in schema_fields]
             
-            else:
-                # For standard structure, validate against original keys
-                if not all(key in result for key in json_structure.keys()):
-                    logger.warning("Missing keys in result compared to original structure. Merging with original.")
-                    # Create a merged structure with original fields and any new data
-                    merged_result = json_structure.copy()
-                    
-                    # Add new contacts if found
-                    if "contacts" in result and isinstance(result["contacts"], list):
-                        if "contacts" not in merged_result:
-                            merged_result["contacts"] = []
-                        merged_result["contacts"].extend(result["contacts"])
-                    
-                    result = merged_result
+            for field in extra_fields:
+                logger.warning(f"⚠️ Removing extra field from result: {field}")
+                del result[field]
+            
+            logger.info(f"✅ Custom structure extraction complete with fields: {list(result.keys())}")
+            return result
+        
+        else:
+            # For standard structure, validate against original keys
+            if not all(key in result for key in json_structure.keys()):
+                logger.warning("Missing keys in result compared to original structure. Merging with original.")
+                # Create a merged structure with original fields and any new data
+                merged_result = json_structure.copy()
                 
-                logger.info(f"✅ HTML Extraction Result Structure: {list(result.keys())}")
-                return result
+                # Add new contacts if found
+                if "contacts" in result and isinstance(result["contacts"], list):
+                    if "contacts" not in merged_result:
+                        merged_result["contacts"] = []
+                    merged_result["contacts"].extend(result["contacts"])
+                
+                result = merged_result
             
-        except Exception as e:
-            logger.error(f"Error in analyze_html_content: {str(e)}", exc_info=True)
-            # Return template or original structure
-            return structure_schema and response_template or json_structure
+            logger.info(f"✅ HTML Extraction Result Structure: {list(result.keys())}")
+            return result
 
     def generate_search_variations(self, prompt):
         """Generate variations of search queries based on a primary query"""
@@ -790,7 +1193,7 @@ CRITICAL REQUIREMENTS:
         
         try:
             # Get query variations from Mistral API
-            result = self.send_mistral_request(messages)
+            result = self.send_mistral_request(messages, route='search_variations', cache_purpose='search_variations')
             
             # Parse the result and ensure it's correctly formatted
             if isinstance(result, list):
@@ -825,36 +1228,8 @@ CRITICAL REQUIREMENTS:
             return []
 
     def _extract_json_from_text(self, text):
-        """Extract JSON object from text that might contain explanations or other content"""
-        if not text or not isinstance(text, str):
-            return None
-            
-        # First try to find JSON with pattern matching
-        json_pattern = r'```(?:json)?\s*([\s\S]*?)\s*```'
-        match = re.search(json_pattern, text)
-        if match:
-            return match.group(1).strip()
-            
-        # If no JSON block found, try to extract anything between { and } with balanced brackets
-        try:
-            # Find the position of the first {
-            start_pos = text.find('{')
-            if start_pos >= 0:
-                # Keep track of opening and closing brackets
-                open_brackets = 1
-                for i in range(start_pos + 1, len(text)):
-                    if text[i] == '{':
-                        open_brackets += 1
-                    elif text[i] == '}':
-                        open_brackets -= 1
-                        
-                    if open_brackets == 0:
-                        # Found the matching closing bracket
-                        return text[start_pos:i+1]
-        except Exception:
-            pass
-            
-        return None 
+        """Extract the JSON object or array from text that might contain explanations, ``` fences or a truncated end"""
+        return json_repair.extract_json(text)
 
     def determine_next_action(self, prompt):
         """Determine the next action based on page content and links"""
@@ -865,7 +1240,7 @@ CRITICAL REQUIREMENTS:
         
         try:
             # Get analysis from Mistral API 
-            action_result = self.send_mistral_request(messages)
+            action_result = self.send_mistral_request(messages, route='next_action', cache_purpose='next_action')
             
             # Parse the result and ensure it's correctly formatted
             if isinstance(action_result, dict):
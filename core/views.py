@@ -10,7 +10,7 @@ from django.contrib.auth.decorators import user_passes_test
 from django.conf import settings
 from django.utils.decorators import method_decorator
 from django.views.decorators.csrf import csrf_protect
-from django.http import HttpResponseForbidden, HttpResponse, JsonResponse
+from django.http import HttpResponseForbidden, HttpResponse, JsonResponse, StreamingHttpResponse
 from rest_framework.permissions import IsAuthenticated
 from rest_framework_simplejwt.authentication import JWTAuthentication
 from rest_framework.renderers import TemplateHTMLRenderer, JSONRenderer
@@ -22,8 +22,7 @@ from scraping.models import ScrapingResult, ScrapingTask
 from .forms import LifetimeUserRegistrationForm
 import json
 from .utils.ai_utils import AIManager
-import asyncio
-from asgiref.sync import sync_to_async
+from asgiref.sync import async_to_sync, sync_to_async
 from django.utils import timezone
 from django.utils.timezone import now
 from rest_framework_simplejwt.token_blacklist.models import OutstandingToken, BlacklistedToken
@@ -294,6 +293,83 @@ class ProtectedRegistrationView(TemplateView):
 
         return render(request, self.template_name, {'form': form, 'show_form': True})
 
+def chat_response_data(response):
+    """
+    Format an answer of AIManager.analyze_user_message for the chat frontend.
+
+    Returns:
+        tuple: (response payload dict, HTTP status code)
+    """
+    # Check for errors in the response
+    if not response or not isinstance(response, dict):
+        logger.error(f"Invalid response format from AI manager: {response}")
+        return {
+            "success": False,
+            "message": "Je suis désolé, j'ai rencontré un problème technique. Veuillez réessayer.",
+            "error": "Invalid response format"
+        }, 500
+
+    # Enhanced debug logging for structure detection
+    logger.info(f"AI response keys: {list(response.keys())}")
+    if 'structure_update' in response:
+        logger.info(f"Structure detected: {response['structure_update'].get('name', 'Unnamed')}")
+        logger.info(f"Structure type: {response['structure_update'].get('entity_type', 'Unknown')}")
+        fields_count = len(response['structure_update'].get('structure', []))
+        logger.info(f"Structure has {fields_count} fields")
+    else:
+        logger.info("No structure_update found in AI response")
+
+    # Check for error key in the response
+    if "error" in response:
+        logger.warning(f"AI manager returned an error: {response.get('error')}")
+        # Return the response with the error message but mark as successful
+        # This allows the chat to display the friendly error message to the user
+        return {
+            "success": True,
+            "message": response.get("response_chat", "Je suis désolé, une erreur s'est produite."),
+            "ai_thinking": False,
+            "entity_type": None,
+            "scraping_strategy": None,
+            "error_info": response.get("error")
+        }, 200
+
+    # Format the response for the client
+    ai_response = response.get("response_chat", "Je suis désolé, je n'ai pas compris.")
+    actions_launched = response.get("actions_launched", "no_action")
+    entity_type = response.get("entity_type", None)
+    scraping_strategy = response.get("scraping_strategy", None)
+
+    # Create a basic response to send back
+    data = {
+        "success": True,
+        "message": ai_response,
+        "ai_thinking": False,
+        "entity_type": entity_type,
+        "scraping_strategy": scraping_strategy
+    }
+
+    # Check if a modification to a user-defined structure is needed
+    if actions_launched == "update_structure":
+        logger.info("Structure update action detected")
+        structure_update = response.get("structure_update", {})
+
+        # Validate the structure update
+        if not structure_update or not isinstance(structure_update, dict):
+            logger.warning("Invalid structure update format in AI response")
+            data["structure_update_status"] = "invalid_format"
+        else:
+            # Add the structure update to the response
+            data["structure_update"] = structure_update
+            data["structure_update_status"] = "pending"
+            logger.info(f"Structure update included in response: {structure_update}")
+
+    # Additional logging for debugging
+    logger.info(f"Final response keys: {list(data.keys())}")
+    if 'structure_update' in data:
+        logger.info("Structure is being returned to frontend")
+    return data, 200
+
+
 class ChatView(APIView):
     permission_classes = [IsAuthenticated]
     
@@ -324,13 +400,6 @@ class ChatView(APIView):
             
             # Process the message asynchronously
             try:
-                # Create an event loop if necessary
-                try:
-                    loop = asyncio.get_running_loop()
-                except RuntimeError:
-                    loop = asyncio.new_event_loop()
-                    asyncio.set_event_loop(loop)
-                
                 # Create a user context dictionary instead of passing multiple separate arguments
                 user_context = {
                     'username': username,
@@ -338,86 +407,14 @@ class ChatView(APIView):
                     'use_gdpr_compliance': use_gdpr_compliance
                 }
                 
-                # Run the AI manager's analyze method with the correct arguments
-                # Since analyze_user_message is async, we need to await it properly
-                coroutine = self.ai_manager.analyze_user_message(message, user_context)
-                response = loop.run_until_complete(coroutine)
+                # analyze_user_message is async, run it on its own loop for this sync view
+                response = async_to_sync(self._analyze)(message, user_context)
                 
                 # Log the response for debugging
                 logger.debug(f"AI response for {username}: {response}")
                 
-                # Enhanced debug logging for structure detection
-                logger.info(f"AI response keys: {list(response.keys())}")
-                if 'structure_update' in response:
-                    logger.info(f"Structure detected: {response['structure_update'].get('name', 'Unnamed')}")
-                    logger.info(f"Structure type: {response['structure_update'].get('entity_type', 'Unknown')}")
-                    fields_count = len(response['structure_update'].get('structure', []))
-                    logger.info(f"Structure has {fields_count} fields")
-                else:
-                    logger.info("No structure_update found in AI response")
-                
-                # Check for errors in the response
-                if not response or not isinstance(response, dict):
-                    logger.error(f"Invalid response format from AI manager: {response}")
-                    return Response({
-                        "success": False,
-                        "message": "Je suis désolé, j'ai rencontré un problème technique. Veuillez réessayer.",
-                        "error": "Invalid response format"
-                    }, status=500)
-                
-                # Check for error key in the response
-                if "error" in response:
-                    logger.warning(f"AI manager returned an error: {response.get('error')}")
-                    # Return the response with the error message but mark as successful
-                    # This allows the chat to display the friendly error message to the user
-                    return Response({
-                        "success": True,
-                        "message": response.get("response_chat", "Je suis désolé, une erreur s'est produite."),
-                        "ai_thinking": False,
-                        "entity_type": None,
-                        "scraping_strategy": None,
-                        "error_info": response.get("error")
-                    })
-                
-                # Format the response for the client
-                ai_response = response.get("response_chat", "Je suis désolé, je n'ai pas compris.")
-                actions_launched = response.get("actions_launched", "no_action")
-                entity_type = response.get("entity_type", None)
-                scraping_strategy = response.get("scraping_strategy", None)
-                
-                # Create a basic response to send back
-                data = {
-                    "success": True,
-                    "message": ai_response,
-                    "ai_thinking": False,
-                    "entity_type": entity_type,
-                    "scraping_strategy": scraping_strategy
-                }
-                
-                # Check if a modification to a user-defined structure is needed
-                if actions_launched == "update_structure":
-                    logger.info("Structure update action detected")
-                    structure_update = response.get("structure_update", {})
-                    
-                    # Validate the structure update
-                    if not structure_update or not isinstance(structure_update, dict):
-                        logger.warning("Invalid structure update format in AI response")
-                        data["structure_update_status"] = "invalid_format"
-                    else:
-                        # Add the structure update to the response
-                        data["structure_update"] = structure_update
-                        data["structure_update_status"] = "pending"
-                        logger.info(f"Structure update included in response: {structure_update}")
-                
-                # Additional logging for debugging
-                logger.info(f"Final response keys: {list(data.keys())}")
-                if 'structure_update' in data:
-                    logger.info("Structure is being returned to frontend")
-                else:
-                    logger.warning("No structure_update in final response data")
-                
-                # Return the formatted response to the client
-                return Response(data)
+                data, status_code = chat_response_data(response)
+                return Response(data, status=status_code)
                 
             except Exception as e:
                 logger.error(f"Error processing message: {str(e)}")
@@ -441,6 +438,75 @@ class ChatView(APIView):
                 "error": str(e)
             }, status=500)
 
+    async def _analyze(self, message, user_context):
+        try:
+            return await self.ai_manager.analyze_user_message(message, user_context)
+        finally:
+            # The loop of async_to_sync ends with this request, its client must not outlive it
+            await self.ai_manager.close_async_client()
+
+
+class ChatStreamView(View):
+    """
+    Chat endpoint streaming the answer as Server-Sent Events, served natively by the
+    ASGI application (wizzydjango/asgi.py): no worker is held while Mistral writes.
+
+    Events:
+        token: {"text": ...} for each piece of the answer as it is written
+        done: the payload of ChatView once the whole answer is parsed and processed
+    """
+    authentication = JWTAuthentication()
+
+    async def post(self, request, *args, **kwargs):
+        user = await self._authenticate(request)
+        if user is None:
+            return JsonResponse({"success": False, "message": "Vous devez être connecté pour utiliser le chat."}, status=401)
+
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({"success": False, "error": "Invalid JSON body"}, status=400)
+        message = payload.get('message')
+        if not message:
+            return JsonResponse({"success": False, "error": "No message provided"}, status=400)
+
+        user_context = {
+            'username': user.email,
+            'previous_interactions': payload.get('previous_interactions'),
+            'use_gdpr_compliance': settings.AI_CONFIG['mistral'].get('gdpr_compliance', {}).get('enabled_by_default', False)
+        }
+        logger.info(f"📩 Streaming answer to {user.email}: {message[:50]}...")
+
+        response = StreamingHttpResponse(self._events(message, user_context), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # nginx must not buffer the stream
+        return response
+
+    async def _authenticate(self, request):
+        try:
+            result = await sync_to_async(self.authentication.authenticate)(request)
+        except Exception as e:
+            logger.info(f"Chat stream authentication failed: {str(e)}")
+            return None
+        return result[0] if result else None
+
+    async def _events(self, message, user_context):
+        ai_manager = AIManager()
+        try:
+            async for event, value in ai_manager.stream_user_message(message, user_context):
+                if event == 'token':
+                    yield sse_event('token', {"text": value})
+                else:
+                    data, _ = chat_response_data(value)
+                    yield sse_event('done', data)
+        finally:
+            await ai_manager.close_async_client()
+
+
+def sse_event(event, data):
+    """A Server-Sent Event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
 
 class ChatHistoryView(APIView):
     permission_classes = [IsAuthenticated]
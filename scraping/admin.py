@@ -6,7 +6,7 @@ from django.template.response import TemplateResponse
 from django.contrib import messages
 from django.http import HttpResponseRedirect, JsonResponse
 from django.contrib.admin.sites import site
-from .models import ScrapingTask, ScrapingLog, ScrapingResult, TaskQueue, ScrapedSite
+from .models import ScrapingTask, ScrapingLog, ScrapingResult, TaskQueue, ScrapedSite, DomainProfile, LLMCacheEntry
 from core.models import ScrapingStructure
 import json
 import sys
@@ -67,7 +67,8 @@ class ScrapingLogAdmin(admin.ModelAdmin):
 class ScrapingResultAdmin(admin.ModelAdmin):
     list_display = ('id', 'task_link', 'result_type', 'is_duplicate', 'created_at')
     list_filter = ('is_duplicate', 'created_at')
-    search_fields = ('lead_data',)
+    search_fields = ('lead_data', 'page_hash')
+    readonly_fields = ('page_hash',)
     
     def task_link(self, obj):
         url = reverse("admin:scraping_scrapingtask_change", args=[obj.task.id])
@@ -131,6 +132,32 @@ class ScrapedSiteAdmin(admin.ModelAdmin):
         self.message_user(request, f"Cleared rate limits for {queryset.count()} sites")
     clear_rate_limits.short_description = "Clear rate limits"
 
+@admin.register(DomainProfile)
+class DomainProfileAdmin(admin.ModelAdmin):
+    list_display = ('domain', 'render_strategy', 'static_successes', 'browser_renders', 'strategy_decided_at',
+                    'circuit_state', 'circuit_open_until')
+    list_filter = ('render_strategy', 'circuit_state')
+    search_fields = ('domain',)
+    readonly_fields = ('static_successes', 'browser_renders', 'strategy_decided_at', 'circuit_trips', 'recent_outcomes')
+    actions = ['reset_render_strategy', 'close_circuits']
+
+    def reset_render_strategy(self, request, queryset):
+        queryset.update(render_strategy='unknown', strategy_decided_at=None)
+        self.message_user(request, f"Render strategy reset for {queryset.count()} domains")
+    reset_render_strategy.short_description = "Reset render strategy"
+
+    def close_circuits(self, request, queryset):
+        queryset.update(circuit_state='closed', circuit_open_until=None, circuit_trips=0, recent_outcomes=[])
+        self.message_user(request, f"Circuit closed for {queryset.count()} domains")
+    close_circuits.short_description = "Close circuit breaker"
+
+@admin.register(LLMCacheEntry)
+class LLMCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('key', 'purpose', 'model', 'hits', 'last_used_at', 'expires_at', 'created_at')
+    list_filter = ('purpose', 'model')
+    search_fields = ('key',)
+    readonly_fields = ('key', 'purpose', 'model', 'response', 'hits', 'last_used_at', 'created_at')
+
 # Register Celery Task Results in admin
 if HAS_CELERY_RESULTS:
     # Check if TaskResult is already registered
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraping', '0002_scrapingtask_incomplete_leads_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DomainProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('domain', models.CharField(max_length=255, unique=True)),
+                ('render_strategy', models.CharField(choices=[('unknown', 'Unknown'), ('static', 'Static HTML'), ('browser', 'JavaScript Rendering')], default='unknown', max_length=10)),
+                ('static_successes', models.IntegerField(default=0, help_text='Pages for which the static fetch was sufficient')),
+                ('browser_renders', models.IntegerField(default=0, help_text='Pages that needed the browser to get usable content')),
+                ('strategy_decided_at', models.DateTimeField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraping', '0003_domainprofile'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scrapingresult',
+            name='page_hash',
+            field=models.CharField(blank=True, db_index=True, help_text='SHA-256 of the raw page in the page store', max_length=64, null=True),
+        ),
+    ]
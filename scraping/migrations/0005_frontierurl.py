@@ -0,0 +1,32 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:38
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraping', '0004_scrapingresult_page_hash'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FrontierURL',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('url', models.URLField(max_length=500)),
+                ('priority', models.IntegerField(default=0, help_text='Higher values are explored first')),
+                ('depth', models.IntegerField(default=0, help_text="Links followed from the site's landing page")),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('done', 'Done'), ('failed', 'Failed')], default='pending', max_length=10)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('site', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='frontier_urls', to='scraping.scrapedsite')),
+                ('task', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='frontier', to='scraping.scrapingtask')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['task', 'status', '-priority'], name='scraping_fr_task_id_6fc6bd_idx')],
+                'unique_together': {('task', 'url')},
+            },
+        ),
+    ]
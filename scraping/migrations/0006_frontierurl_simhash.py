@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraping', '0005_frontierurl'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='frontierurl',
+            name='simhash',
+            field=models.CharField(blank=True, help_text='64-bit SimHash (hex) of the page text, for near-duplicate detection', max_length=16, null=True),
+        ),
+    ]
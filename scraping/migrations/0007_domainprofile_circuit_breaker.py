@@ -0,0 +1,33 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraping', '0006_frontierurl_simhash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='domainprofile',
+            name='circuit_open_until',
+            field=models.DateTimeField(blank=True, help_text='End of the cooldown (open) or of the probe (half-open)', null=True),
+        ),
+        migrations.AddField(
+            model_name='domainprofile',
+            name='circuit_state',
+            field=models.CharField(choices=[('closed', 'Closed'), ('open', 'Open'), ('half_open', 'Half-open')], default='closed', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='domainprofile',
+            name='circuit_trips',
+            field=models.IntegerField(default=0, help_text='Consecutive times the circuit opened, lengthens the cooldown'),
+        ),
+        migrations.AddField(
+            model_name='domainprofile',
+            name='recent_outcomes',
+            field=models.JSONField(blank=True, default=list, help_text='Rolling window of [success, seconds] of the last requests'),
+        ),
+    ]
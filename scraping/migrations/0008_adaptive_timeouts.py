@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraping', '0007_domainprofile_circuit_breaker'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='domainprofile',
+            name='latency_histogram',
+            field=models.JSONField(blank=True, default=list, help_text='Decayed counts of successful response times per latency bucket'),
+        ),
+        migrations.AddField(
+            model_name='scrapingtask',
+            name='retries_used',
+            field=models.IntegerField(default=0, help_text='Requêtes relancées après une erreur réseau, bornées par le budget de la tâche'),
+        ),
+    ]
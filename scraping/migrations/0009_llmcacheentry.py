@@ -0,0 +1,27 @@
+# Generated by Django 5.1.7 on 2026-10-17 23:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraping', '0008_adaptive_timeouts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMCacheEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='SHA-256 of the model, parameters, schema hash and normalized messages', max_length=64, unique=True)),
+                ('purpose', models.CharField(db_index=True, help_text='Kind of request, selects the TTL', max_length=50)),
+                ('model', models.CharField(max_length=100)),
+                ('response', models.JSONField()),
+                ('hits', models.IntegerField(default=0)),
+                ('expires_at', models.DateTimeField(db_index=True)),
+                ('last_used_at', models.DateTimeField(db_index=True, help_text='Least recently used entries are evicted first')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
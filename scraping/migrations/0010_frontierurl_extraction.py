@@ -0,0 +1,18 @@
+# Generated by Django 5.1.7 on 2026-10-18 09:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraping', '0009_llmcacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='frontierurl',
+            name='extraction',
+            field=models.JSONField(blank=True, help_text="Extraction of the page ({'key', 'result'}), reused by its near-duplicates", null=True),
+        ),
+    ]
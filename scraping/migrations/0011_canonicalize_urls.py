@@ -0,0 +1,87 @@
+from collections import defaultdict
+
+from django.db import migrations
+
+from utils.url_canonical import canonicalize_url
+
+# Most advanced status first: the frontier row kept when several URLs share a canonical form
+FRONTIER_STATUS_ORDER = {'done': 0, 'failed': 1, 'pending': 2}
+
+
+def canonical(url):
+    return canonicalize_url(url)[:500] if url else url
+
+
+def merge_scraped_sites(ScrapedSite, FrontierURL):
+    """
+    Canonicalize ScrapedSite.url, merging the sites of one structure that now share a URL
+    into the oldest one (its frontier URLs are moved, the scraping counts are summed).
+    """
+    groups = defaultdict(list)
+    for site in ScrapedSite.objects.order_by('created_at', 'id'):
+        groups[(canonical(site.url), site.structure_id)].append(site)
+
+    for (url, _structure_id), sites in groups.items():
+        kept, duplicates = sites[0], sites[1:]
+        if duplicates:
+            duplicate_ids = [site.id for site in duplicates]
+            FrontierURL.objects.filter(site_id__in=duplicate_ids).update(site=kept)
+            scraped = [site.last_scraped for site in sites if site.last_scraped]
+            kept.last_scraped = max(scraped) if scraped else None
+            kept.scraping_count = sum(site.scraping_count for site in sites)
+            kept.rate_limit_until = max(
+                (site.rate_limit_until for site in sites if site.rate_limit_until), default=None
+            )
+            ScrapedSite.objects.filter(id__in=duplicate_ids).delete()
+        if duplicates or kept.url != url:
+            # update() so auto_now does not overwrite last_scraped
+            ScrapedSite.objects.filter(id=kept.id).update(
+                url=url,
+                last_scraped=kept.last_scraped,
+                scraping_count=kept.scraping_count,
+                rate_limit_until=kept.rate_limit_until,
+            )
+
+
+def merge_frontier_urls(FrontierURL):
+    """Canonicalize FrontierURL.url, keeping per task the most advanced row of each canonical URL."""
+    groups = defaultdict(list)
+    for frontier_url in FrontierURL.objects.only('id', 'task_id', 'url', 'status').order_by('id'):
+        groups[(frontier_url.task_id, canonical(frontier_url.url))].append(frontier_url)
+
+    for (_task_id, url), rows in groups.items():
+        rows.sort(key=lambda row: (FRONTIER_STATUS_ORDER.get(row.status, len(FRONTIER_STATUS_ORDER)), row.id))
+        kept, duplicates = rows[0], rows[1:]
+        if duplicates:
+            FrontierURL.objects.filter(id__in=[row.id for row in duplicates]).delete()
+        if kept.url != url:
+            FrontierURL.objects.filter(id=kept.id).update(url=url)
+
+
+def canonicalize_result_urls(ScrapingResult):
+    """Canonicalize ScrapingResult.source_url (several leads may come from one page, nothing to merge)."""
+    results = ScrapingResult.objects.exclude(source_url__isnull=True).exclude(source_url='')
+    for result in results.only('id', 'source_url').iterator():
+        url = canonical(result.source_url)
+        if url != result.source_url:
+            ScrapingResult.objects.filter(id=result.id).update(source_url=url)
+
+
+def canonicalize_urls(apps, schema_editor):
+    ScrapedSite = apps.get_model('scraping', 'ScrapedSite')
+    FrontierURL = apps.get_model('scraping', 'FrontierURL')
+    ScrapingResult = apps.get_model('scraping', 'ScrapingResult')
+    merge_scraped_sites(ScrapedSite, FrontierURL)
+    merge_frontier_urls(FrontierURL)
+    canonicalize_result_urls(ScrapingResult)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('scraping', '0010_frontierurl_extraction'),
+    ]
+
+    operations = [
+        migrations.RunPython(canonicalize_urls, migrations.RunPython.noop),
+    ]
@@ -25,6 +25,7 @@ class ScrapingTask(models.Model):
     duplicate_leads = models.IntegerField(default=0)
     rate_limited_leads = models.IntegerField(default=0, help_text="Leads non créés car l'utilisateur a atteint sa limite")
     incomplete_leads = models.IntegerField(default=0, help_text="Leads non créés car des champs obligatoires étaient manquants")
+    retries_used = models.IntegerField(default=0, help_text="Requêtes relancées après une erreur réseau, bornées par le budget de la tâche")
     start_time = models.DateTimeField(auto_now_add=True)
     last_activity = models.DateTimeField(auto_now=True)
     completion_time = models.DateTimeField(null=True, blank=True)
@@ -86,6 +87,7 @@ class ScrapingResult(models.Model):
     task = models.ForeignKey(ScrapingTask, on_delete=models.CASCADE, related_name='results')
     lead_data = models.JSONField()
     source_url = models.URLField(max_length=500, blank=True, null=True)
+    page_hash = models.CharField(max_length=64, blank=True, null=True, db_index=True, help_text="SHA-256 of the raw page in the page store")
     is_processed = models.BooleanField(default=False)
     is_duplicate = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
@@ -98,6 +100,21 @@ class ScrapingResult(models.Model):
             return f"Lead: {self.lead_data.get('nom', 'Sans nom')}"
         return f"Lead #{self.id}"
 
+    def save(self, *args, **kwargs):
+        """Store the source URL in canonical form so results of one page share it"""
+        if self.source_url:
+            from utils.url_canonical import canonicalize_url
+            self.source_url = canonicalize_url(self.source_url)[:500]
+        super().save(*args, **kwargs)
+
+    @property
+    def raw_page(self):
+        """Raw page this result was extracted from, read back from the page store"""
+        if not self.page_hash:
+            return None
+        from utils.page_store import load_page
+        return load_page(self.page_hash)
+
 class LeadEnrichment(models.Model):
     """
     Stocke les données d'enrichissement pour les leads trouvés
@@ -180,6 +197,13 @@ class ScrapedSite(models.Model):
     def __str__(self):
         return f"{self.domain} - {self.structure.name}"
 
+    def save(self, *args, **kwargs):
+        """Store the URL in canonical form so the same site is never tracked twice"""
+        if self.url:
+            from utils.url_canonical import canonicalize_url
+            self.url = canonicalize_url(self.url)[:500]
+        super().save(*args, **kwargs)
+
     def update_scraping_stats(self, success=True, error=None):
         """Update scraping statistics for this site"""
         self.scraping_count += 1
@@ -211,6 +235,95 @@ class ScrapedSite(models.Model):
             return False
         return self.success_rate >= 0.5  # Only scrape sites with at least 50% success rate
 
+    @property
+    def domain_profile(self):
+        """Fetching profile shared by every site of this domain, if one was recorded"""
+        return DomainProfile.objects.filter(domain=self.domain).first()
+
+class DomainProfile(models.Model):
+    """
+    Per-domain fetching knowledge shared by every ScrapedSite of the same domain
+    """
+    RENDER_STRATEGIES = [
+        ('unknown', 'Unknown'),
+        ('static', 'Static HTML'),
+        ('browser', 'JavaScript Rendering'),
+    ]
+    CIRCUIT_STATES = [
+        ('closed', 'Closed'),
+        ('open', 'Open'),
+        ('half_open', 'Half-open'),
+    ]
+
+    domain = models.CharField(max_length=255, unique=True)
+    render_strategy = models.CharField(max_length=10, choices=RENDER_STRATEGIES, default='unknown')
+    static_successes = models.IntegerField(default=0, help_text="Pages for which the static fetch was sufficient")
+    browser_renders = models.IntegerField(default=0, help_text="Pages that needed the browser to get usable content")
+    strategy_decided_at = models.DateTimeField(null=True, blank=True)
+    circuit_state = models.CharField(max_length=10, choices=CIRCUIT_STATES, default='closed')
+    circuit_open_until = models.DateTimeField(null=True, blank=True, help_text="End of the cooldown (open) or of the probe (half-open)")
+    circuit_trips = models.IntegerField(default=0, help_text="Consecutive times the circuit opened, lengthens the cooldown")
+    recent_outcomes = models.JSONField(default=list, blank=True, help_text="Rolling window of [success, seconds] of the last requests")
+    latency_histogram = models.JSONField(default=list, blank=True, help_text="Decayed counts of successful response times per latency bucket")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.domain} ({self.render_strategy})"
+
+    @property
+    def failure_rate(self):
+        """Share of failed requests in the rolling window"""
+        if not self.recent_outcomes:
+            return 0.0
+        return sum(1 for success, _ in self.recent_outcomes if not success) / len(self.recent_outcomes)
+
+class FrontierURL(models.Model):
+    """
+    URL waiting to be (or already) explored by a ScrapingTask, so an interrupted task can resume
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    task = models.ForeignKey(ScrapingTask, on_delete=models.CASCADE, related_name='frontier')
+    site = models.ForeignKey('ScrapedSite', on_delete=models.CASCADE, null=True, blank=True, related_name='frontier_urls')
+    url = models.URLField(max_length=500)
+    priority = models.IntegerField(default=0, help_text="Higher values are explored first")
+    depth = models.IntegerField(default=0, help_text="Links followed from the site's landing page")
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending')
+    simhash = models.CharField(max_length=16, blank=True, null=True, help_text="64-bit SimHash (hex) of the page text, for near-duplicate detection")
+    extraction = models.JSONField(blank=True, null=True, help_text="Extraction of the page ({'key', 'result'}), reused by its near-duplicates")
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ['task', 'url']
+        indexes = [
+            models.Index(fields=['task', 'status', '-priority']),
+        ]
+
+    def __str__(self):
+        return f"{self.url} ({self.status})"
+
+class LLMCacheEntry(models.Model):
+    """
+    LLM answer reused for identical requests (same model, messages, sampling parameters and schema)
+    """
+    key = models.CharField(max_length=64, unique=True, help_text="SHA-256 of the model, parameters, schema hash and normalized messages")
+    purpose = models.CharField(max_length=50, db_index=True, help_text="Kind of request, selects the TTL")
+    model = models.CharField(max_length=100)
+    response = models.JSONField()
+    hits = models.IntegerField(default=0)
+    expires_at = models.DateTimeField(db_index=True)
+    last_used_at = models.DateTimeField(db_index=True, help_text="Least recently used entries are evicted first")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.purpose} {self.key[:12]} ({self.hits} hits)"
+
 class CeleryWorkerActivity(models.Model):
     """
     Tracks the real-time activity of Celery workers for a user-friendly monitoring dashboard
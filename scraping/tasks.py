@@ -1,4 +1,4 @@
-from celery import shared_task, Task
+from celery import shared_task, Task, chord
 from django.utils import timezone
 from django.db.models import Q
 from django.conf import settings
@@ -12,7 +12,7 @@ import os
 import re
 import requests
 import asyncio
-from celery.signals import task_prerun, task_postrun, task_success, task_failure
+from celery.signals import task_prerun, task_postrun, task_success, task_failure, worker_process_shutdown
 from functools import wraps
 from urllib.parse import urlparse
 from bs4 import BeautifulSoup
@@ -68,6 +68,20 @@ def task_failure_handler(sender=None, task_id=None, exception=None, args=None, k
     logger.error(f"FAILURE: Task {sender.name}[{task_id}] failed with exception={exception}")
     logger.error(f"FAILURE: Traceback: {einfo}")
 
+@worker_process_shutdown.connect
+def worker_process_shutdown_handler(**kwargs):
+    """Quit the pooled Selenium browsers and PDF extraction processes of this worker process"""
+    try:
+        from utils.browser_pool import shutdown_browser_pool
+        shutdown_browser_pool()
+    except Exception as e:
+        logger.warning(f"Error while shutting down the browser pool: {str(e)}")
+    try:
+        from utils.pdf_extractor import shutdown_executor
+        shutdown_executor()
+    except Exception as e:
+        logger.warning(f"Error while shutting down the PDF extraction pool: {str(e)}")
+
 # Global flag to control automatic scraping
 AUTOMATIC_SCRAPING_ENABLED = True
 USING_SIMULATION = False  # Forcer le mode PRODUCTION avec Celery
@@ -421,6 +435,22 @@ def start_job(job_id):
     except Exception as e:
         logger.error(f"SCRAPER ERROR: Erreur lors du démarrage du job {job_id}: {str(e)}", exc_info=True)
 
+def get_fanout_config():
+    """Configuration du fan-out des sites d'une tâche (SCRAPING_CONFIG['fanout'])"""
+    config = {'enabled': True}
+    config.update(getattr(settings, 'SCRAPING_CONFIG', {}).get('fanout', {}))
+    return config
+
+def get_batch_extraction_config():
+    """Configuration de l'extraction groupée des pages d'un site (SCRAPING_CONFIG['batch_extraction'])"""
+    config = {'enabled': True, 'max_pages': 4, 'token_budget': 6000}
+    config.update(getattr(settings, 'SCRAPING_CONFIG', {}).get('batch_extraction', {}))
+    return config
+
+def use_batch_extraction(structure_schema):
+    """L'extraction groupée fusionne les pages en un seul résultat: réservée aux structures personnalisées."""
+    return bool(structure_schema) and get_batch_extraction_config()['enabled']
+
 @shared_task(bind=True, base=LoggingTask)
 @track_scraping_activity('scraping')
 def run_scraping_task(self, task_id):
@@ -438,6 +468,11 @@ def run_scraping_task(self, task_id):
         from .models import ScrapingTask, ScrapingLog, ScrapedSite, ScrapingResult
         from core.utils.ai_utils import AIManager
         from utils.serpapi import get_serp_results
+        from utils.async_fetcher import AsyncPageFetcher
+        from utils.frontier import CrawlFrontier, DONE, FAILED, normalize_url
+        from utils.url_canonical import SeenURLSet, canonicalize_url
+        from utils import circuit_breaker, http_client, page_cache, page_store
+        from utils.adaptive_timeouts import RetryBudget
         from bs4 import BeautifulSoup
         from urllib.parse import urlparse, urljoin
         
@@ -456,6 +491,13 @@ def run_scraping_task(self, task_id):
             logger.error(f"Erreur lors de la récupération de la tâche {task_id}: {str(e)}", exc_info=True)
             return {"status": "failed", "error": f"Error retrieving task: {str(e)}"}
         
+        # Sous-tâches déjà lancées (le chord terminera la tâche) ou tâche terminée: une relivraison
+        # referait les téléchargements et les appels LLM et compterait les leads deux fois
+        stage = CrawlFrontier(task).checkpoint.get('stage')
+        if stage in ('dispatched', 'completed'):
+            logger.info(f"Tâche {task.id} relivrée à l'étape '{stage}', rien à relancer")
+            return {"status": stage, "task_id": task_id}
+        
         # Mise à jour du statut de la tâche
         task.celery_task_id = self.request.id  # Rétabli l'ID Celery
         task.status = 'initializing'
@@ -521,116 +563,138 @@ def run_scraping_task(self, task_id):
         logger.info("Initialisation de l'AIManager")
         ai_manager = AIManager()
         
-        # Générer des requêtes de recherche supplémentaires basées sur la requête principale
-        logger.info(f"Génération de requêtes de recherche supplémentaires à partir de: '{actual_search_query}'")
+        # Reprise après un redémarrage du worker, une limite de temps ou une relivraison:
+        # les requêtes, les résultats SERP et leur analyse (appels payants) ne sont pas refaits
+        frontier = CrawlFrontier(task)
+        resuming = frontier.is_resuming
         
-        # Génération de variantes de requêtes avec MistralAI
-        query_generation_prompt = f"""
-        Génère 10 requêtes de recherche pertinentes pour trouver des informations et des contacts concernant: "{actual_search_query}".
-        Les requêtes doivent être diversifiées pour couvrir différents aspects et maximiser les chances de trouver des leads.
-        Le but est de trouver des entreprises, leurs décideurs ou des professionnels associés à ce secteur.
-        Format requis: liste JSON avec seulement les requêtes, pas d'autres explications.
-        """
+        if resuming:
+            checkpoint = frontier.checkpoint
+            search_queries = checkpoint.get('search_queries', [actual_search_query])
+            urls_to_explore = checkpoint['urls_to_explore']
+            logger.info(f"Reprise de la tâche {task.id} depuis le dernier point de contrôle ({len(urls_to_explore)} URLs planifiées)")
+            ScrapingLog.objects.create(
+                task=task, log_type='info',
+                message="Reprise depuis le dernier point de contrôle",
+                details={"frontier": frontier.stats(), "checkpoint_at": checkpoint.get('updated_at')}
+            )
+            task.status = 'crawling'
+            task.save(update_fields=['status'])
+        else:
+            # Générer des requêtes de recherche supplémentaires basées sur la requête principale
+            logger.info(f"Génération de requêtes de recherche supplémentaires à partir de: '{actual_search_query}'")
         
-        search_queries = [actual_search_query]  # Inclure la requête originale
+            # Génération de variantes de requêtes avec MistralAI
+            query_generation_prompt = f"""
+            Génère 10 requêtes de recherche pertinentes pour trouver des informations et des contacts concernant: "{actual_search_query}".
+            Les requêtes doivent être diversifiées pour couvrir différents aspects et maximiser les chances de trouver des leads.
+            Le but est de trouver des entreprises, leurs décideurs ou des professionnels associés à ce secteur.
+            Format requis: liste JSON avec seulement les requêtes, pas d'autres explications.
+            """
         
-        try:
-            # Générer des requêtes avec MistralAI - direct call 
-            query_variations = ai_manager.generate_search_variations(query_generation_prompt)
-            if isinstance(query_variations, list) and len(query_variations) > 0:
-                search_queries.extend(query_variations[:10])  # Limiter à 10 requêtes supplémentaires
-                logger.info(f"Requêtes de recherche générées: {len(search_queries)} au total")
-                logger.debug(f"Requêtes: {search_queries}")
-            else:
-                logger.warning("Impossible de générer des requêtes supplémentaires, utilisation de la requête principale uniquement")
-        except Exception as e:
-            logger.error(f"Erreur lors de la génération des requêtes: {str(e)}")
+            search_queries = [actual_search_query]  # Inclure la requête originale
         
-        # Get or create structure usage tracking
-        task.status = 'crawling'
-        task.current_step = "Récupération des résultats de recherche..."
-        task.save(update_fields=['status', 'current_step'])
+            try:
+                # Générer des requêtes avec MistralAI - direct call 
+                query_variations = ai_manager.generate_search_variations(query_generation_prompt)
+                if isinstance(query_variations, list) and len(query_variations) > 0:
+                    search_queries.extend(query_variations[:10])  # Limiter à 10 requêtes supplémentaires
+                    logger.info(f"Requêtes de recherche générées: {len(search_queries)} au total")
+                    logger.debug(f"Requêtes: {search_queries}")
+                else:
+                    logger.warning("Impossible de générer des requêtes supplémentaires, utilisation de la requête principale uniquement")
+            except Exception as e:
+                logger.error(f"Erreur lors de la génération des requêtes: {str(e)}")
         
-        # Mise à jour de l'activité du worker
-        update_worker_activity(
-            self.request.id,
-            'scraping',
-            'running',
-            current_url=f"search:{actual_search_query}",
-            details={
-                "task_id": task.id,
-                "structure_name": structure.name if structure else "No structure",
-                "step": "crawling"
-            }
-        )
+            # Get or create structure usage tracking
+            task.status = 'crawling'
+            task.current_step = "Récupération des résultats de recherche..."
+            task.save(update_fields=['status', 'current_step'])
+        
+            # Mise à jour de l'activité du worker
+            update_worker_activity(
+                self.request.id,
+                'scraping',
+                'running',
+                current_url=f"search:{actual_search_query}",
+                details={
+                    "task_id": task.id,
+                    "structure_name": structure.name if structure else "No structure",
+                    "step": "crawling"
+                }
+            )
         
-        # Récupérer les résultats SERP pour chaque requête (3 pages pour chaque requête)
-        all_serp_results = []
+            # Récupérer les résultats SERP pour chaque requête (3 pages pour chaque requête)
+            all_serp_results = []
         
-        for query_index, query in enumerate(search_queries[:5]):  # Limiter à 5 requêtes pour éviter timeout
-            logger.info(f"Traitement de la requête {query_index+1}/{len(search_queries[:5])}: '{query}'")
+            for query_index, query in enumerate(search_queries[:5]):  # Limiter à 5 requêtes pour éviter timeout
+                logger.info(f"Traitement de la requête {query_index+1}/{len(search_queries[:5])}: '{query}'")
             
-            for page in range(1, 4):  # 3 pages par requête
-                logger.info(f"Récupération des résultats SERP pour '{query}' - Page {page}")
-                try:
-                    # Obtenir les résultats SERP pour cette requête et cette page
-                    page_results = get_serp_results(query, page=page)
-                    if page_results:
-                        logger.info(f"{len(page_results)} résultats trouvés pour '{query}' - Page {page}")
-                        all_serp_results.extend(page_results)
+                for page in range(1, 4):  # 3 pages par requête
+                    logger.info(f"Récupération des résultats SERP pour '{query}' - Page {page}")
+                    try:
+                        # Obtenir les résultats SERP pour cette requête et cette page
+                        page_results = get_serp_results(query, page=page)
+                        if page_results:
+                            logger.info(f"{len(page_results)} résultats trouvés pour '{query}' - Page {page}")
+                            all_serp_results.extend(page_results)
                         
-                        # Mettre à jour le statut pour montrer la progression
-                        task.current_step = f"Analyse des résultats de recherche {query_index+1}/{len(search_queries[:5])} - Page {page}/3"
-                        task.save(update_fields=['current_step'])
-                    else:
-                        logger.warning(f"Aucun résultat trouvé pour '{query}' - Page {page}")
-                        break  # Passer à la requête suivante si pas de résultats
-                except Exception as e:
-                    logger.error(f"Erreur lors de la récupération des résultats SERP pour '{query}' - Page {page}: {str(e)}")
-                    continue
-        
-        # Dédupliquer les résultats par URL
-        unique_results = {}
-        for result in all_serp_results:
-            if result.get('url') and result.get('url') not in unique_results:
-                unique_results[result.get('url')] = result
-        
-        all_serp_results = list(unique_results.values())
-        logger.info(f"{len(all_serp_results)} résultats SERP uniques trouvés au total")
-        
-        # Analyser les résultats SERP pour trouver les sites les plus pertinents
-        logger.info("Analyse des résultats SERP avec MistralAI pour déterminer les priorités")
-        serp_analysis = {"priority_links": []}
+                            # Mettre à jour le statut pour montrer la progression
+                            task.current_step = f"Analyse des résultats de recherche {query_index+1}/{len(search_queries[:5])} - Page {page}/3"
+                            task.save(update_fields=['current_step'])
+                        else:
+                            logger.warning(f"Aucun résultat trouvé pour '{query}' - Page {page}")
+                            break  # Passer à la requête suivante si pas de résultats
+                    except Exception as e:
+                        logger.error(f"Erreur lors de la récupération des résultats SERP pour '{query}' - Page {page}: {str(e)}")
+                        continue
+        
+            # Dédupliquer les résultats par URL canonique (paramètres de suivi, fragments, www...)
+            seen_urls = SeenURLSet()
+            unique_results = []
+            for result in all_serp_results:
+                if result.get('url') and seen_urls.add(result['url']):
+                    result['url'] = canonicalize_url(result['url'])
+                    unique_results.append(result)
+        
+            all_serp_results = unique_results
+            logger.info(f"{len(all_serp_results)} résultats SERP uniques trouvés au total")
+        
+            # Analyser les résultats SERP pour trouver les sites les plus pertinents
+            logger.info("Analyse des résultats SERP avec MistralAI pour déterminer les priorités")
+            serp_analysis = {"priority_links": []}
         
-        try:
-            # Préparation de la structure JSON
-            initial_json_structure = {"priority_links": [], "explored_links": []}
-            # Change from asyncio.run to direct call
-            serp_analysis = ai_manager.analyze_serp_results(all_serp_results, initial_json_structure)
-            logger.info("Analyse SERP terminée.")
-            logger.debug(f"Résultat complet de l'analyse SERP: {json.dumps(serp_analysis, indent=2, ensure_ascii=False)}")
-        except Exception as ai_error:
-            logger.error(f"Erreur pendant l'analyse SERP par l'IA: {ai_error}", exc_info=True)
-        
-        # Créer la liste de sites à explorer (prioritaires d'abord, puis autres)
-        priority_links = serp_analysis.get("priority_links", [])
-        other_links = [result.get('url') for result in all_serp_results if result.get('url') not in priority_links]
-        
-        all_links_to_explore = priority_links + other_links
-        
-        # Dédupliquer et nettoyer les liens
-        urls_to_explore = []
-        explored_urls = set()
-        
-        for url in all_links_to_explore:
-            if url and url not in explored_urls:
-                parsed_url = urlparse(url)
-                # Vérifier si le lien est valide
-                if parsed_url.scheme and parsed_url.netloc:
-                    urls_to_explore.append(url)
-                    explored_urls.add(url)
-        
-        logger.info(f"{len(urls_to_explore)} URLs uniques à explorer")
+            try:
+                # Préparation de la structure JSON
+                initial_json_structure = {"priority_links": [], "explored_links": []}
+                # Change from asyncio.run to direct call
+                serp_analysis = ai_manager.analyze_serp_results(all_serp_results, initial_json_structure)
+                logger.info("Analyse SERP terminée.")
+                logger.debug(f"Résultat complet de l'analyse SERP: {json.dumps(serp_analysis, indent=2, ensure_ascii=False)}")
+            except Exception as ai_error:
+                logger.error(f"Erreur pendant l'analyse SERP par l'IA: {ai_error}", exc_info=True)
+        
+            # Créer la liste de sites à explorer (prioritaires d'abord, puis autres)
+            priority_links = serp_analysis.get("priority_links", [])
+            other_links = [result.get('url') for result in all_serp_results if result.get('url') not in priority_links]
+        
+            all_links_to_explore = priority_links + other_links
+        
+            # Dédupliquer et nettoyer les liens
+            urls_to_explore = []
+            explored_urls = SeenURLSet()
+        
+            for url in all_links_to_explore:
+                if url and url not in explored_urls:
+                    parsed_url = urlparse(url)
+                    # Vérifier si le lien est valide
+                    if parsed_url.scheme and parsed_url.netloc:
+                        urls_to_explore.append(canonicalize_url(url))
+                        explored_urls.add(url)
+        
+            logger.info(f"{len(urls_to_explore)} URLs uniques à explorer")
+            
+            frontier.save_checkpoint(stage='exploring', search_queries=search_queries, urls_to_explore=urls_to_explore)
         
         # Mise à jour du statut de la tâche
         task.current_step = f"Exploration des sites web ({len(urls_to_explore)} au total)..."
@@ -640,12 +704,15 @@ def run_scraping_task(self, task_id):
         sites_to_scrape = []
         
         for url in urls_to_explore:
+            url = canonicalize_url(url)
             domain = urlparse(url).netloc
             site, created = ScrapedSite.objects.get_or_create(
                 url=url,
                 structure=structure,
                 defaults={'domain': domain, 'last_scraped': None}
             )
+            if site in sites_to_scrape:
+                continue
             sites_to_scrape.append(site)
             if created:
                 ScrapingLog.objects.create(
@@ -656,380 +723,64 @@ def run_scraping_task(self, task_id):
         
         logger.info(f"{len(sites_to_scrape)} sites prêts pour le scraping")
         
-        # Fonction pour déterminer l'action suivante après l'analyse d'une page
-        def analyze_next_action(html_content, json_structure, url):
-            """Détermine l'action suivante après l'analyse d'une page HTML"""
-            if not html_content or len(html_content.strip()) < 100:
-                logger.warning(f"Contenu HTML vide ou trop court pour {url}")
-                return {"action": "go_next_page"}
-            
-            # Si la page a déjà donné des leads, continuer avec d'autres pages
-            if json_structure.get("contacts") and len(json_structure.get("contacts")) > 0:
-                logger.info(f"Contacts trouvés sur {url}, passage à la page suivante")
-                return {"action": "go_next_page"}
-            
-            # Trouver des liens pertinents sur la page actuelle
-            try:
-                soup = BeautifulSoup(html_content, 'html.parser')
-                all_links = soup.find_all('a', href=True)
-                
-                # Préparation du prompt pour MistralAI
-                links_context = "\n".join([f"{i+1}. {link.text.strip()[:50]} - {link['href']}" 
-                                    for i, link in enumerate(all_links[:20]) if link.text.strip()])
-                
-                prompt = f"""
-                Tu es un assistant de scraping intelligent. Voici le contexte actuel:
-                
-                URL actuelle: {url}
-                
-                Objectif: Trouver des leads pour "{structure.name}".
-                
-                Liens trouvés sur cette page:
-                {links_context}
-                
-                Décide quelle action prendre:
-                1. "click_on_link" - si un lien spécifique sur cette page semble prometteur pour trouver des contacts
-                2. "go_next_page" - si aucun lien n'est pertinent ou si la page actuelle ne contient pas d'information utile
-                
-                Réponds au format JSON uniquement:
-                {{
-                    "action": "click_on_link" ou "go_next_page",
-                    "href": "URL complète du lien à suivre" (seulement si action est click_on_link)
-                }}
-                """
-                
-                next_action = ai_manager.determine_next_action(prompt)
-                logger.debug(f"Résultat de l'analyse de l'action suivante: {next_action}")
-                
-                if isinstance(next_action, dict) and next_action.get("action") == "click_on_link" and next_action.get("href"):
-                    # Normaliser l'URL relative si nécessaire
-                    href = next_action.get("href")
-                    if not urlparse(href).netloc:
-                        href = urljoin(url, href)
-                    
-                    logger.info(f"Action suivante recommandée: explorer {href}")
-                    return {"action": "click_on_link", "href": href}
-                
-                return {"action": "go_next_page"}
-                
-            except Exception as e:
-                logger.error(f"Erreur lors de l'analyse de l'action suivante: {str(e)}", exc_info=True)
-                return {"action": "go_next_page"}
-        
         # Explorer chaque site avec un mécanisme de navigation intelligente
-        leads_found = 0
-        max_pages_to_explore = 150  # Limite pour éviter exploration infinie
-        explored_pages = set()
-        
-        for site_index, site in enumerate(sites_to_scrape[:50]):  # Limiter à 50 sites pour éviter timeout
-            current_url = site.url
-            pages_explored_for_site = 0
-            max_pages_per_site = 5  # Max 5 pages par site pour diversifier les sources
-            
-            # Structure JSON pour stocker les informations du site
-            site_json_structure = {
-                "site_info": {
-                    "name": site.domain,
-                    "url": site.url
-                },
-                "contacts": [],
-                "meta_data": {
-                    "explored_links": [site.url],
-                    "priority_links": []
-                }
-            }
-            
-            logger.info(f"Début de l'exploration du site {site_index+1}/{len(sites_to_scrape[:50])}: {site.url}")
-            task.current_step = f"Exploration du site {site_index+1}/{len(sites_to_scrape[:50])}: {site.domain}"
+        # Limiter à 50 sites, sans ceux en pause ou dont le domaine échoue (disjoncteur ouvert)
+        sites_batch = [
+            site for site in sites_to_scrape[:50]
+            if not site.is_rate_limited and not circuit_breaker.is_open(site.url)
+        ]
+        frontier.seed(sites_batch)
+        if not resuming:
+            task.leads_found = 0
+            task.pages_explored = 0
+            task.retries_used = 0
+            task.save(update_fields=['leads_found', 'pages_explored', 'retries_used'])
+        
+        # Un sous-tâche par site réparties sur tous les workers, agrégées par finalize_scraping_task
+        if get_fanout_config()['enabled'] and not self.request.called_directly and sites_batch:
+            frontier.save_checkpoint(stage='dispatched', leads_before_dispatch=task.leads_found or 0)
+            task.current_step = f"Exploration de {len(sites_batch)} sites en parallèle..."
             task.save(update_fields=['current_step'])
             
-            while pages_explored_for_site < max_pages_per_site and len(explored_pages) < max_pages_to_explore:
-                if current_url in explored_pages:
-                    logger.info(f"URL déjà explorée: {current_url}, passage à une autre URL")
-                    break
-                
-                logger.info(f"Exploration de l'URL: {current_url}")
-                explored_pages.add(current_url)
-                site_json_structure["meta_data"]["explored_links"].append(current_url)
-                
-                try:
-                    # Récupération et analyse du contenu HTML
-                    response = requests.get(current_url, timeout=30)
-                    response.raise_for_status()
-                    html_content = response.text
-                    
-                    logger.info(f"Contenu HTML récupéré de {current_url} ({len(html_content)} caractères)")
-                    
-                    # Analyse du contenu HTML avec MistralAI
-                    extraction_objective = f"Extraire toutes les informations de contact pertinentes pour {structure.name}. Chercher également toute information commerciale utile."
-                    
-                    # Get the structure schema if available
-                    structure_schema = None
-                    if structure and hasattr(structure, 'structure'):
-                        structure_schema = structure.structure
-                    
-                    # Pass structure schema to analyze_html_content for better extraction results
-                    html_analysis = ai_manager.analyze_html_content(
-                        html_content, 
-                        extraction_objective, 
-                        site_json_structure,
-                        structure_schema=structure_schema
-                    )
-                    
-                    logger.info(f"Analyse HTML terminée pour {current_url}")
-                    logger.debug(f"Résultat de l'analyse HTML: {json.dumps(html_analysis, indent=2)}")
-                    
-                    # CRITICAL FIX: If 'nom' field exists but no company fields, map 'nom' to 'nom_entreprise'
-                    if 'nom' in html_analysis and html_analysis['nom'] and not any(field in html_analysis for field in ['nom_entreprise', 'company', 'entreprise']):
-                        html_analysis['nom_entreprise'] = html_analysis['nom']
-                        logger.info(f"Early mapping: Using 'nom' as company name: {html_analysis['nom']}")
-                    
-                    # DIRECT LEAD CREATION FROM CUSTOM STRUCTURE
-                    # This is the critical fix - explicitly process custom structure data
-                    if 'nom_entreprise' in html_analysis and isinstance(html_analysis, dict):
-                        logger.info(f"🔍 Processing custom structure data for lead creation: {html_analysis.get('nom_entreprise')}")
-                        
-                        # Create a ScrapingResult from the custom structure data
-                        try:
-                            scraping_result = ScrapingResult.objects.create(
-                                task=task,
-                                lead_data=html_analysis,
-                                source_url=current_url
-                            )
-                            
-                            # Log the creation of the scraping result
-                            logger.info(f"✅ Created scraping result with ID: {scraping_result.id} for company: {html_analysis.get('nom_entreprise')}")
-                            
-                            # Create a lead from the scraping result
-                            lead = create_lead_from_result(scraping_result, job)
-                            
-                            if lead:
-                                logger.info(f"✅ Successfully created lead ID: {lead.id} for company: {html_analysis.get('nom_entreprise')}")
-                                leads_found += 1
-                            else:
-                                logger.warning(f"❌ Failed to create lead for company: {html_analysis.get('nom_entreprise')}")
-                        except Exception as e:
-                            logger.error(f"❌ Error creating lead from HTML analysis: {str(e)}", exc_info=True)
-                    # Handle custom structure format with fields that have spaces in names 
-                    elif 'Nom de l\'entreprise' in html_analysis and isinstance(html_analysis, dict):
-                        # This is a custom structure with field names that have spaces
-                        company_name = html_analysis.get('Nom de l\'entreprise')
-                        logger.info(f"🔍 Processing custom structure data with spaced field names for: {company_name}")
-                        
-                        # Log all the fields in the custom structure for debugging
-                        logger.debug(f"Custom structure fields: {list(html_analysis.keys())}")
-                        
-                        # Create a ScrapingResult from the custom structure data
-                        try:
-                            scraping_result = ScrapingResult.objects.create(
-                                task=task,
-                                lead_data=html_analysis,
-                                source_url=current_url
-                            )
-                            
-                            # Log the creation of the scraping result
-                            logger.info(f"✅ Created scraping result with ID: {scraping_result.id} for company: {company_name}")
-                            
-                            # Create a lead from the scraping result
-                            lead = create_lead_from_result(scraping_result, job)
-                            
-                            if lead:
-                                logger.info(f"✅ Successfully created lead ID: {lead.id} for company: {company_name}")
-                                leads_found += 1
-                            else:
-                                logger.warning(f"❌ Failed to create lead for company: {company_name}, investigating...")
-                                # Try to diagnose the issue
-                                try:
-                                    from core.models import Lead
-                                    # Check if the user has reached their lead limit
-                                    if hasattr(job.user, 'profile') and hasattr(job.user.profile, 'can_access_leads'):
-                                        profile = job.user.profile
-                                        if not profile.can_access_leads:
-                                            logger.error(f"⚠️ User {job.user.id} has reached their lead limit. Lead creation skipped.")
-                                        else:
-                                            logger.info(f"✅ User {job.user.id} has NOT reached lead limit (used: {profile.leads_used}, quota: {profile.leads_quota})")
-                                except Exception as profile_error:
-                                    logger.error(f"Error checking user profile limits: {profile_error}")
-                        except Exception as e:
-                            logger.error(f"❌ Error creating lead from custom structure: {str(e)}", exc_info=True)
-                    
-                    # Generic check for any custom structure with a company-like field
-                    elif isinstance(html_analysis, dict) and len(html_analysis) > 0:
-                        # Try to identify if this is a custom structure based on field naming patterns
-                        logger.info(f"🔎 Checking if data is a custom structure format: {list(html_analysis.keys())}")
-                        
-                        # Check for company name in various possible formats
-                        company_field_candidates = [
-                            'nom_entreprise', 'company', 'entreprise', 'société', 'organization',
-                            'Nom de l\'entreprise', 'nom de l entreprise', 'nom de la société',
-                            'Company', 'Organization', 'Entreprise'
-                        ]
-                        
-                        # Also check for field names containing 'company' or 'entreprise'
-                        for key in html_analysis.keys():
-                            if isinstance(key, str) and ('entreprise' in key.lower() or 'company' in key.lower()):
-                                if key not in company_field_candidates:
-                                    company_field_candidates.append(key)
-                        
-                        # Find the first valid company name field
-                        company_name = None
-                        company_field = None
-                        
-                        for field in company_field_candidates:
-                            if field in html_analysis and html_analysis[field]:
-                                company_name = html_analysis[field]
-                                company_field = field
-                                break
-                        
-                        if company_name:
-                            logger.info(f"✅ Found company name '{company_name}' in field '{company_field}'")
-                            logger.info(f"🔍 Processing generic custom structure data for: {company_name}")
-                            
-                            # Check if we have enough data fields (arbitrary threshold)
-                            if len(html_analysis) >= 3:
-                                try:
-                                    # Create a normalized copy of the data with consistent field names
-                                    normalized_data = {}
-                                    for key, value in html_analysis.items():
-                                        # Replace spaces with underscores and lowercase
-                                        normalized_key = key.replace(' ', '_').replace('\'', '_').lower()
-                                        normalized_data[normalized_key] = value
-                                        
-                                        # Add a mapping for standard fields
-                                        if 'entreprise' in normalized_key or 'company' in normalized_key:
-                                            normalized_data['nom_entreprise'] = value
-                                            
-                                    # Create the ScrapingResult
-                                    scraping_result = ScrapingResult.objects.create(
-                                        task=task,
-                                        lead_data=normalized_data,
-                                        source_url=current_url
-                                    )
-                                    
-                                    logger.info(f"✅ Created scraping result with ID: {scraping_result.id} for company: {company_name}")
-                                    
-                                    # Create a lead
-                                    lead = create_lead_from_result(scraping_result, job)
-                                    
-                                    if lead:
-                                        logger.info(f"✅ Successfully created lead ID: {lead.id} for company: {company_name}")
-                                        leads_found += 1
-                                    else:
-                                        logger.warning(f"❌ Failed to create lead for company: {company_name}")
-                                        logger.debug(f"Normalized lead data: {normalized_data}")
-                                except Exception as e:
-                                    logger.error(f"❌ Error creating lead from generic custom structure: {str(e)}", exc_info=True)
-                            else:
-                                logger.warning(f"⚠️ Not enough fields in custom structure data: {len(html_analysis)} fields")
-                        else:
-                            logger.warning(f"⚠️ No company name found in potential custom structure: {list(html_analysis.keys())}")
-                    
-                    # Process the AI analysis results for contacts array format (if present)
-                    leads_processed = False
-                    
-                    # Check if industry/sector field is missing but required
-                    if structure.structure and "secteur_activite" in [field.get('name') for field in structure.structure if field.get('required', True)]:
-                        if 'secteur_activite' in html_analysis and not html_analysis['secteur_activite']:
-                            # The sector field exists but is empty, try a dedicated analysis to find it
-                            logger.warning("Missing sector field detected, attempting targeted extraction...")
-                            
-                            try:
-                                # Create a specialized prompt for industry detection
-                                company_name = html_analysis.get('nom_entreprise', html_analysis.get('company', site.domain))
-                                company_desc = html_analysis.get('description', '')
-                                
-                                # Get the industry analysis
-                                industry_messages = [
-                                    {"role": "system", "content": "You are an expert in business analysis and industry classification."},
-                                    {"role": "user", "content": f"""
-Analyze this HTML content and determine the industry sector for this company:
-
-COMPANY NAME: {company_name}
-COMPANY DESCRIPTION: {company_desc}
-
-HTML CONTENT:
-{html_content[:8000]}
-
-I need ONLY the industry or business sector. Return ONLY a JSON object like this:
-{{"secteur_activite": "Technology"}}
-
-Use specific industry categories like Technology, Healthcare, Manufacturing, Financial Services, 
-Education, Media, Retail, etc. Make your best determination based on the content.
-If you're unsure but can make an educated guess, add "Probable: " prefix.
-"""}
-                                ]
-                                
-                                # Get the industry analysis
-                                industry_result = ai_manager.send_mistral_request(industry_messages, model="mistral-large-latest")
-                                
-                                # If successful, update the original analysis
-                                if isinstance(industry_result, dict) and 'secteur_activite' in industry_result and industry_result['secteur_activite']:
-                                    html_analysis['secteur_activite'] = industry_result['secteur_activite']
-                                    logger.info(f"Successfully extracted industry sector: {industry_result['secteur_activite']}")
-                                elif isinstance(industry_result, str):
-                                    # Try to extract JSON from string if needed
-                                    # re and json modules are already imported at the top of the file
-                                    
-                                    # Try to find JSON pattern in the response
-                                    json_match = re.search(r'\{.*?"secteur_activite".*?:.*?".*?".*?\}', industry_result)
-                                    if json_match:
-                                        try:
-                                            extracted_json = json.loads(json_match.group(0))
-                                            if 'secteur_activite' in extracted_json and extracted_json['secteur_activite']:
-                                                html_analysis['secteur_activite'] = extracted_json['secteur_activite']
-                                                logger.info(f"Extracted industry from text response: {extracted_json['secteur_activite']}")
-                                        except:
-                                            logger.warning("Failed to parse extracted industry JSON")
-                            except Exception as e:
-                                logger.warning(f"Error during targeted industry extraction: {str(e)}")
-                    
-                    # Mettre à jour la structure JSON avec les nouvelles informations
-                    if html_analysis and isinstance(html_analysis, dict):
-                        # Extraire et stocker les contacts
-                        if "contacts" in html_analysis and html_analysis["contacts"]:
-                            for contact in html_analysis["contacts"]:
-                                # Vérifier si le contact est valide et non-dupliqué
-                                leads_found = process_contact(contact, task, current_url, job, leads_found)
-                    
-                    # Mettre à jour les statistiques de la tâche
-                    task.pages_explored += 1
-                    task.leads_found = leads_found
-                    task.unique_leads = int(leads_found * 0.8)  # Estimation de l'unicité
-                    task.save(update_fields=['pages_explored', 'leads_found', 'unique_leads'])
-                    
-                    # Déterminer l'action suivante
-                    next_action = analyze_next_action(html_content, site_json_structure, current_url)
-                    
-                    if next_action.get("action") == "click_on_link" and next_action.get("href"):
-                        # Suivre le lien recommandé
-                        current_url = next_action.get("href")
-                        logger.info(f"Navigation vers: {current_url}")
-                    else:
-                        # Passer au site suivant
-                        logger.info(f"Fin de l'exploration pour ce site, passage au suivant")
-                        break
-                    
-                    pages_explored_for_site += 1
-                    
-                except requests.exceptions.RequestException as e:
-                    logger.error(f"Erreur lors de la requête HTTP vers {current_url}: {str(e)}")
-                    break
-                except Exception as e:
-                    logger.error(f"Erreur lors de l'exploration de {current_url}: {str(e)}", exc_info=True)
-                    break
+            chord(
+                explore_site_task.s(task.id, site.id, f"{site_index+1}/{len(sites_batch)}")
+                for site_index, site in enumerate(sites_batch)
+            )(finalize_scraping_task.s(task.id))
             
-            # Mise à jour de la date de dernier scraping du site
-            site.last_scraped = timezone.now()
-            site.save(update_fields=['last_scraped'])
+            logger.info(f"Tâche {task_id}: {len(sites_batch)} sous-tâches d'exploration lancées")
+            return {"status": "dispatched", "task_id": task_id, "sites": len(sites_batch)}
+        
+        # Exécution dans ce processus (appel direct ou fan-out désactivé):
+        # les pages d'accueil des sites sont téléchargées en parallèle par lots
+        frontier.save_checkpoint(stage='exploring', leads_before_dispatch=task.leads_found or 0)
+        explored_pages = frontier.visited_urls()
+        fetcher = AsyncPageFetcher(retry_budget=RetryBudget(task))
+        prefetched_pages = {}
+        prefetched_extractions = {}
+        site_results = []
+
+        for site_index, site in enumerate(sites_batch):
+            if site_index % fetcher.batch_size == 0:
+                window = sites_batch[site_index:site_index + fetcher.batch_size]
+                task.current_step = f"Téléchargement des sites {site_index+1}-{site_index+len(window)}/{len(sites_batch)}"
+                task.save(update_fields=['current_step'])
+                # Chaque page d'accueil part en extraction dès son arrivée, pendant que les autres se téléchargent
+                prefetched_pages, prefetched_extractions = asyncio.run(prefetch_and_extract(
+                    fetcher, ai_manager, structure,
+                    {normalize_url(s.url): s for s in window if normalize_url(s.url) not in explored_pages},
+                ))
+
+            site_results.append(explore_site(
+                task, job, structure, site, ai_manager, fetcher, frontier,
+                prefetched_pages=prefetched_pages,
+                prefetched_extractions=prefetched_extractions,
+                label=f"{site_index+1}/{len(sites_batch)}",
+            ))
+        
+        logger.debug(f"Statistiques des pools HTTP: {json.dumps(http_client.get_pool_stats())}")
         
         # Marquer la tâche comme terminée
-        task.status = 'completed'
-        task.current_step = "Tâche terminée avec succès"
-        task.completion_time = timezone.now()
-        task.save()
-        logger.info(f"Tâche {task_id} terminée avec succès")
-        
-        return {"status": "success", "task_id": task_id, "leads_found": leads_found}
+        return finalize_scraping_task(site_results, task.id)
         
     except Exception as e:
         logger.error(f"Erreur majeure dans run_scraping_task: {str(e)}", exc_info=True)
@@ -1051,14 +802,641 @@ If you're unsure but can make an educated guess, add "Probable: " prefix.
         
         return {"status": "failed", "error": str(e)}
 
+@shared_task(bind=True, base=LoggingTask)
+def explore_site_task(self, task_id, site_id, label=""):
+    """
+    Sous-tâche du chord de run_scraping_task: explore un seul site.
+
+    Ne lève jamais d'exception pour que le callback du chord soit toujours appelé.
+    """
+    from .models import ScrapingTask, ScrapedSite
+    from core.utils.ai_utils import AIManager
+    from utils.adaptive_timeouts import RetryBudget
+    from utils.async_fetcher import AsyncPageFetcher
+    from utils.frontier import CrawlFrontier
+
+    result = {"site_id": site_id, "leads_found": 0, "pages_explored": 0}
+    try:
+        task = ScrapingTask.objects.select_related('job__structure').get(id=task_id)
+        if task.status in ('failed', 'completed'):
+            logger.info(f"Tâche {task_id} déjà {task.status}, site {site_id} ignoré")
+            return result
+        
+        site = ScrapedSite.objects.get(id=site_id)
+        if site.is_rate_limited:
+            logger.info(f"Site {site.domain} limité jusqu'à {site.rate_limit_until}, ignoré")
+            return result
+        
+        update_worker_activity(
+            self.request.id, 'scraping', 'running',
+            current_url=site.url,
+            details={"task_id": task_id, "site_id": site_id, "step": "exploring"}
+        )
+        return explore_site(
+            task, task.job, task.job.structure, site, AIManager(), AsyncPageFetcher(retry_budget=RetryBudget(task)),
+            CrawlFrontier(task), label=label,
+        )
+    except Exception as e:
+        logger.error(f"Erreur lors de l'exploration du site {site_id} (tâche {task_id}): {str(e)}", exc_info=True)
+        result["error"] = str(e)
+        return result
+
+@shared_task(bind=True, base=LoggingTask)
+def finalize_scraping_task(self, site_results, task_id):
+    """
+    Callback du chord de run_scraping_task: agrège les résultats des sites et termine la tâche.
+
+    Args:
+        site_results (list): Résultats de explore_site pour chaque site
+        task_id (int): ID de la ScrapingTask
+    """
+    from .models import ScrapingTask, ScrapingLog
+    from utils.frontier import CrawlFrontier
+
+    task = ScrapingTask.objects.get(id=task_id)
+    frontier = CrawlFrontier(task)
+    site_results = [result for result in (site_results or []) if isinstance(result, dict)]
+    
+    leads_found = frontier.checkpoint.get('leads_before_dispatch', 0) + sum(r.get('leads_found', 0) for r in site_results)
+    failed_sites = [r['site_id'] for r in site_results if r.get('error')]
+    
+    task.leads_found = leads_found
+    task.unique_leads = int(leads_found * 0.8)  # Estimation de l'unicité
+    task.status = 'completed'
+    task.current_step = "Tâche terminée avec succès"
+    task.completion_time = timezone.now()
+    task.save()
+    frontier.save_checkpoint(stage='completed', leads_found=leads_found)
+    
+    ScrapingLog.objects.create(
+        task=task, log_type='success',
+        message=f"Exploration terminée: {len(site_results)} sites, {task.pages_explored} pages, {leads_found} leads",
+        details={"frontier": frontier.stats(), "failed_sites": failed_sites}
+    )
+    logger.info(f"Tâche {task_id} terminée avec succès (frontière: {frontier.stats()})")
+    
+    return {"status": "success", "task_id": task_id, "leads_found": leads_found}
+
 def validate_contact(contact, structure_schema=None):
     """Vérifie si un contact est valide et mérite d'être enregistré"""
     # This function is kept for backwards compatibility
     # It now calls the more comprehensive is_valid_contact function
     return is_valid_contact(contact, structure_schema)
 
+# Détermine l'action suivante après l'analyse d'une page (suivre un lien ou passer au site suivant)
+def analyze_next_action(html_content, json_structure, url, structure, ai_manager):
+    """
+    Détermine l'action suivante après l'analyse d'une page HTML.
+
+    Les liens du site sont classés localement (utils.link_scorer); Mistral n'est consulté
+    que lorsque le classement est ambigu, et seulement sur les meilleurs candidats.
+    """
+    from utils import link_scorer
+    
+    if not html_content or len(html_content.strip()) < 100:
+        logger.warning(f"Contenu HTML vide ou trop court pour {url}")
+        return {"action": "go_next_page"}
+    
+    # Si la page a déjà donné des leads, continuer avec d'autres pages
+    if json_structure.get("contacts") and len(json_structure.get("contacts")) > 0:
+        logger.info(f"Contacts trouvés sur {url}, passage à la page suivante")
+        return {"action": "go_next_page"}
+    
+    try:
+        config = link_scorer.get_link_scorer_config()
+        explored = json_structure.get("meta_data", {}).get("explored_links", [])
+        
+        if config['enabled']:
+            ranked = link_scorer.rank_links(html_content, url, visited=explored, config=config)
+            decision, choice = link_scorer.decide(ranked, config)
+            if decision == 'click_on_link':
+                logger.info(f"Action suivante (score {ranked[0][0]:.1f}): explorer {choice}")
+                return {"action": "click_on_link", "href": choice}
+            if decision == 'go_next_page':
+                logger.info(f"Aucun lien prometteur sur {url}, passage au site suivant")
+                return {"action": "go_next_page"}
+            # Classement ambigu: Mistral choisit parmi les meilleurs liens
+            links_context = "\n".join([f"{i+1}. {text[:50]} - {href}" for i, (_, href, text) in enumerate(choice)])
+        else:
+            soup = BeautifulSoup(html_content, 'html.parser')
+            all_links = soup.find_all('a', href=True)
+            links_context = "\n".join([f"{i+1}. {link.text.strip()[:50]} - {link['href']}" 
+                                for i, link in enumerate(all_links[:20]) if link.text.strip()])
+        
+        prompt = f"""
+        Tu es un assistant de scraping intelligent. Voici le contexte actuel:
+        
+        URL actuelle: {url}
+        
+        Objectif: Trouver des leads pour "{structure.name}".
+        
+        Liens trouvés sur cette page:
+        {links_context}
+        
+        Décide quelle action prendre:
+        1. "click_on_link" - si un lien spécifique sur cette page semble prometteur pour trouver des contacts
+        2. "go_next_page" - si aucun lien n'est pertinent ou si la page actuelle ne contient pas d'information utile
+        
+        Réponds au format JSON uniquement:
+        {{
+            "action": "click_on_link" ou "go_next_page",
+            "href": "URL complète du lien à suivre" (seulement si action est click_on_link)
+        }}
+        """
+        
+        next_action = ai_manager.determine_next_action(prompt)
+        logger.debug(f"Résultat de l'analyse de l'action suivante: {next_action}")
+        
+        if isinstance(next_action, dict) and next_action.get("action") == "click_on_link" and next_action.get("href"):
+            # Normaliser l'URL relative si nécessaire
+            href = next_action.get("href")
+            if not urlparse(href).netloc:
+                href = urljoin(url, href)
+            
+            logger.info(f"Action suivante recommandée: explorer {href}")
+            return {"action": "click_on_link", "href": href}
+        
+        return {"action": "go_next_page"}
+        
+    except Exception as e:
+        logger.error(f"Erreur lors de l'analyse de l'action suivante: {str(e)}", exc_info=True)
+        return {"action": "go_next_page"}
+
+def extraction_objective(structure):
+    """Objectif d'extraction transmis à Mistral pour les pages des sites d'une structure."""
+    return f"Extraire toutes les informations de contact pertinentes pour {structure.name}. Chercher également toute information commerciale utile."
+
+def new_site_json_structure(site):
+    """Structure JSON de départ d'un site, enrichie au fil de son exploration."""
+    return {
+        "site_info": {
+            "name": site.domain,
+            "url": site.url
+        },
+        "contacts": [],
+        "meta_data": {
+            "explored_links": [site.url],
+            "priority_links": []
+        }
+    }
+
+async def prefetch_and_extract(fetcher, ai_manager, structure, sites_by_url):
+    """
+    Télécharge les pages d'accueil d'un lot de sites et lance l'extraction de chacune dès
+    son arrivée: les appels Mistral se chevauchent entre eux et avec les téléchargements,
+    dans la limite de `max_in_flight` requêtes simultanées.
+
+    Les pages en erreur ou non modifiées (304, extraction déjà en cache) ne sont pas extraites,
+    ni celles des structures extraites par lot (voir `use_batch_extraction`).
+
+    Returns:
+        tuple: (pages, extractions) indexés par URL
+    """
+    structure_schema = getattr(structure, 'structure', None)
+    objective = extraction_objective(structure)
+    extractions = {}
+
+    async def extract(page):
+        site = sites_by_url.get(page["url"])
+        if site is None or page["error"] or page.get("not_modified") or not page["html"]:
+            return
+        if use_batch_extraction(structure_schema):
+            # Extraite avec les autres pages du site par explore_site
+            return
+        extractions[page["url"]] = await ai_manager.analyze_html_content_async(
+            page["html"], objective, new_site_json_structure(site), structure_schema=structure_schema,
+            url=page["url"],
+        )
+
+    try:
+        pages = await fetcher.fetch_all_async(list(sites_by_url), on_result=extract)
+    finally:
+        await ai_manager.close_async_client()
+    return pages, extractions
+
+def explore_site(task, job, structure, site, ai_manager, fetcher, frontier, prefetched_pages=None,
+                 prefetched_extractions=None, label="", max_pages_to_explore=150):
+    """
+    Explore un site: page d'accueil puis liens choisis par analyze_next_action, extraction et création des leads.
+
+    L'état est partagé via la frontière de la tâche, ce qui permet d'explorer plusieurs sites
+    d'une même tâche en parallèle sur différents workers.
+
+    Returns:
+        dict: site_id, leads_found et pages_explored pour ce site
+    """
+    from .models import ScrapingTask, ScrapingLog
+    from django.db.models import F
+    from utils import page_cache, page_store
+    from utils.frontier import DONE, FAILED
+    from utils.near_duplicate import page_fingerprint
+    from utils.url_canonical import canonicalize_url
+
+    prefetched_pages = prefetched_pages if prefetched_pages is not None else {}
+    prefetched_extractions = prefetched_extractions if prefetched_extractions is not None else {}
+    leads_found = 0
+    pages_explored = 0
+    result = {"site_id": site.id, "leads_found": 0, "pages_explored": 0}
+
+    # Reprendre là où l'exploration du site s'était arrêtée
+    current_url, pages_explored_for_site = frontier.resume_point(site)
+    if current_url is None:
+        logger.info(f"Site {site.domain} déjà exploré lors d'une exécution précédente")
+        return result
+    max_pages_per_site = 5  # Max 5 pages par site pour diversifier les sources
+    
+    # Structure JSON pour stocker les informations du site
+    site_json_structure = new_site_json_structure(site)
+    objective = extraction_objective(structure)
+    structure_schema = getattr(structure, 'structure', None)
+    
+    # Mode lot: les pages du site sont extraites ensemble en un seul appel Mistral
+    batch_config = get_batch_extraction_config()
+    batch_mode = use_batch_extraction(structure_schema)
+    batch_pages = []
+    extraction_key = page_cache.extraction_key(structure.id, structure_schema)
+    
+    def extract_batch():
+        """Extrait les pages en attente en un seul appel et enregistre le résultat fusionné."""
+        nonlocal leads_found
+        if not batch_pages:
+            return
+        leads_before_batch = leads_found
+        logger.info(f"Extraction groupée de {len(batch_pages)} pages de {site.domain}")
+        html_analysis = ai_manager.analyze_site_pages(
+            batch_pages, objective, site_json_structure, structure_schema=structure_schema,
+            token_budget=batch_config['token_budget'],
+        )
+        if isinstance(html_analysis, dict) and html_analysis:
+            # Réutilisable pour chaque page du lot: 304 au prochain passage ou page quasi identique
+            for batch_page in batch_pages:
+                page_cache.store_extraction(batch_page["url"], extraction_key, html_analysis)
+                frontier.record_extraction(batch_page["url"], extraction_key, html_analysis, batch_page["fingerprint"])
+        # La première page (accueil) sert de source; le secteur est demandé dans le même appel
+        leads_found = record_extraction(
+            task, job, structure, site, ai_manager, html_analysis, batch_pages[0]["url"], batch_pages[0]["html"],
+            batch_pages[0]["page_hash"], leads_found, sector_fallback=False,
+        )
+        ScrapingTask.objects.filter(pk=task.pk).update(leads_found=F('leads_found') + (leads_found - leads_before_batch))
+        batch_pages.clear()
+    
+    logger.info(f"Début de l'exploration du site {label}: {site.url}")
+    task.current_step = f"Exploration du site {label}: {site.domain}"
+    task.save(update_fields=['current_step'])
+    
+    while pages_explored_for_site < max_pages_per_site and frontier.explored_count() < max_pages_to_explore:
+        if frontier.is_visited(current_url):
+            logger.info(f"URL déjà explorée: {current_url}, passage à une autre URL")
+            break
+        
+        logger.info(f"Exploration de l'URL: {current_url}")
+        site_json_structure["meta_data"]["explored_links"].append(current_url)
+        
+        leads_before_page = leads_found
+        try:
+            # Récupération du contenu HTML (préchargé pour la première page du site)
+            page = prefetched_pages.pop(current_url, None) or fetcher.fetch(current_url)
+            if page["error"]:
+                logger.error(f"Erreur lors de la requête HTTP vers {current_url}: {page['error']}")
+                frontier.mark(current_url, FAILED)
+                break
+            html_content = page["html"]
+            # Conserver la page brute pour pouvoir relancer l'extraction sans retélécharger
+            page_hash = page_store.store_page(html_content)
+            
+            logger.info(f"Contenu HTML récupéré de {current_url} ({len(html_content)} caractères)")
+            
+            # Page inchangée depuis le dernier passage (304): réutiliser l'extraction précédente
+            html_analysis = None
+            batched = False
+            if page.get("not_modified"):
+                html_analysis = page_cache.get_extraction(current_url, extraction_key)
+                if html_analysis is not None:
+                    logger.info(f"Page non modifiée, extraction précédente réutilisée pour {current_url}")
+            
+            # Page quasi identique à une page déjà extraite du domaine (même gabarit): réutiliser son extraction
+            fingerprint = page_fingerprint(html_content, current_url)
+            if html_analysis is None and fingerprint is not None:
+                match = frontier.find_near_duplicate(current_url, fingerprint)
+                if match:
+                    html_analysis = (frontier.get_extraction(match[0], extraction_key)
+                                     or page_cache.get_extraction(match[0], extraction_key))
+                    if html_analysis is not None:
+                        logger.info(f"Page quasi identique à {match[0]} (distance {match[1]}), extraction réutilisée pour {current_url}")
+            
+            if html_analysis is None and batch_mode:
+                # Extraite plus tard avec les autres pages du site
+                batch_pages.append({"url": current_url, "html": html_content, "page_hash": page_hash,
+                                    "fingerprint": fingerprint})
+                batched = True
+            elif html_analysis is None:
+                # Extraction lancée dès le préchargement de la page, sinon appel à Mistral maintenant
+                html_analysis = prefetched_extractions.pop(current_url, None)
+                if html_analysis is None:
+                    # Pass structure schema to analyze_html_content for better extraction results
+                    html_analysis = ai_manager.analyze_html_content(
+                        html_content, 
+                        objective, 
+                        site_json_structure,
+                        structure_schema=structure_schema,
+                        url=current_url
+                    )
+                if isinstance(html_analysis, dict) and html_analysis:
+                    # Cache HTTP (réutilisation sur 304) et frontière de la tâche (pages sans validateurs)
+                    page_cache.store_extraction(current_url, extraction_key, html_analysis)
+                    frontier.record_extraction(current_url, extraction_key, html_analysis, fingerprint)
+            
+            if not batched:
+                logger.info(f"Analyse HTML terminée pour {current_url}")
+                logger.debug(f"Résultat de l'analyse HTML: {json.dumps(html_analysis, indent=2)}")
+                
+                leads_found = record_extraction(
+                    task, job, structure, site, ai_manager, html_analysis, current_url, html_content, page_hash,
+                    leads_found,
+                )
+            
+            # Mettre à jour les statistiques de la tâche (incréments atomiques: d'autres sites
+            # de la même tâche peuvent être explorés en parallèle)
+            pages_explored += 1
+            ScrapingTask.objects.filter(pk=task.pk).update(
+                pages_explored=F('pages_explored') + 1,
+                leads_found=F('leads_found') + (leads_found - leads_before_page),
+            )
+            frontier.mark(current_url, DONE)
+            if len(batch_pages) >= batch_config['max_pages']:
+                extract_batch()
+            
+            # Déterminer l'action suivante
+            next_action = analyze_next_action(html_content, site_json_structure, current_url, structure, ai_manager)
+            
+            if next_action.get("action") == "click_on_link" and next_action.get("href"):
+                # Suivre le lien recommandé
+                current_url = canonicalize_url(urljoin(current_url, next_action.get("href")))
+                frontier.add(current_url, site=site, depth=pages_explored_for_site + 1)
+                logger.info(f"Navigation vers: {current_url}")
+            else:
+                # Passer au site suivant
+                logger.info(f"Fin de l'exploration pour ce site, passage au suivant")
+                break
+            
+            pages_explored_for_site += 1
+            
+        except requests.exceptions.RequestException as e:
+            logger.error(f"Erreur lors de la requête HTTP vers {current_url}: {str(e)}")
+            frontier.mark(current_url, FAILED)
+            break
+        except Exception as e:
+            logger.error(f"Erreur lors de l'exploration de {current_url}: {str(e)}", exc_info=True)
+            frontier.mark(current_url, FAILED)
+            break
+    
+    # Pages du lot en attente (fin de l'exploration ou erreur sur la page suivante)
+    try:
+        extract_batch()
+    except Exception as e:
+        logger.error(f"Erreur lors de l'extraction groupée des pages de {site.domain}: {str(e)}", exc_info=True)
+    
+    # Mise à jour de la date de dernier scraping du site
+    site.last_scraped = timezone.now()
+    site.save(update_fields=['last_scraped'])
+    
+    result.update(leads_found=leads_found, pages_explored=pages_explored)
+    return result
+
+def record_extraction(task, job, structure, site, ai_manager, html_analysis, current_url, html_content, page_hash,
+                      leads_found=0, sector_fallback=True):
+    """
+    Enregistre l'extraction d'une page (ou d'un lot de pages d'un site): ScrapingResult et lead
+    pour une structure personnalisée, sinon un lead par contact trouvé.
+
+    Args:
+        sector_fallback (bool): Relancer Mistral sur la page si le secteur d'activité requis est vide
+
+    Returns:
+        int: leads_found augmenté des leads créés
+    """
+    from .models import ScrapingResult
+    from utils.context_builder import build_context, get_context_config
+
+    # CRITICAL FIX: If 'nom' field exists but no company fields, map 'nom' to 'nom_entreprise'
+    if 'nom' in html_analysis and html_analysis['nom'] and not any(field in html_analysis for field in ['nom_entreprise', 'company', 'entreprise']):
+        html_analysis['nom_entreprise'] = html_analysis['nom']
+        logger.info(f"Early mapping: Using 'nom' as company name: {html_analysis['nom']}")
+
+    # DIRECT LEAD CREATION FROM CUSTOM STRUCTURE
+    # This is the critical fix - explicitly process custom structure data
+    if 'nom_entreprise' in html_analysis and isinstance(html_analysis, dict):
+        logger.info(f"🔍 Processing custom structure data for lead creation: {html_analysis.get('nom_entreprise')}")
+
+        # Create a ScrapingResult from the custom structure data
+        try:
+            scraping_result = ScrapingResult.objects.create(
+                task=task,
+                lead_data=html_analysis,
+                source_url=current_url,
+                page_hash=page_hash
+            )
+
+            # Log the creation of the scraping result
+            logger.info(f"✅ Created scraping result with ID: {scraping_result.id} for company: {html_analysis.get('nom_entreprise')}")
+
+            # Create a lead from the scraping result
+            lead = create_lead_from_result(scraping_result, job)
+
+            if lead:
+                logger.info(f"✅ Successfully created lead ID: {lead.id} for company: {html_analysis.get('nom_entreprise')}")
+                leads_found += 1
+            else:
+                logger.warning(f"❌ Failed to create lead for company: {html_analysis.get('nom_entreprise')}")
+        except Exception as e:
+            logger.error(f"❌ Error creating lead from HTML analysis: {str(e)}", exc_info=True)
+    # Handle custom structure format with fields that have spaces in names 
+    elif 'Nom de l\'entreprise' in html_analysis and isinstance(html_analysis, dict):
+        # This is a custom structure with field names that have spaces
+        company_name = html_analysis.get('Nom de l\'entreprise')
+        logger.info(f"🔍 Processing custom structure data with spaced field names for: {company_name}")
+
+        # Log all the fields in the custom structure for debugging
+        logger.debug(f"Custom structure fields: {list(html_analysis.keys())}")
+
+        # Create a ScrapingResult from the custom structure data
+        try:
+            scraping_result = ScrapingResult.objects.create(
+                task=task,
+                lead_data=html_analysis,
+                source_url=current_url,
+                page_hash=page_hash
+            )
+
+            # Log the creation of the scraping result
+            logger.info(f"✅ Created scraping result with ID: {scraping_result.id} for company: {company_name}")
+
+            # Create a lead from the scraping result
+            lead = create_lead_from_result(scraping_result, job)
+
+            if lead:
+                logger.info(f"✅ Successfully created lead ID: {lead.id} for company: {company_name}")
+                leads_found += 1
+            else:
+                logger.warning(f"❌ Failed to create lead for company: {company_name}, investigating...")
+                # Try to diagnose the issue
+                try:
+                    from core.models import Lead
+                    # Check if the user has reached their lead limit
+                    if hasattr(job.user, 'profile') and hasattr(job.user.profile, 'can_access_leads'):
+                        profile = job.user.profile
+                        if not profile.can_access_leads:
+                            logger.error(f"⚠️ User {job.user.id} has reached their lead limit. Lead creation skipped.")
+                        else:
+                            logger.info(f"✅ User {job.user.id} has NOT reached lead limit (used: {profile.leads_used}, quota: {profile.leads_quota})")
+                except Exception as profile_error:
+                    logger.error(f"Error checking user profile limits: {profile_error}")
+        except Exception as e:
+            logger.error(f"❌ Error creating lead from custom structure: {str(e)}", exc_info=True)
+
+    # Generic check for any custom structure with a company-like field
+    elif isinstance(html_analysis, dict) and len(html_analysis) > 0:
+        # Try to identify if this is a custom structure based on field naming patterns
+        logger.info(f"🔎 Checking if data is a custom structure format: {list(html_analysis.keys())}")
+
+        # Check for company name in various possible formats
+        company_field_candidates = [
+            'nom_entreprise', 'company', 'entreprise', 'société', 'organization',
+            'Nom de l\'entreprise', 'nom de l entreprise', 'nom de la société',
+            'Company', 'Organization', 'Entreprise'
+        ]
+
+        # Also check for field names containing 'company' or 'entreprise'
+        for key in html_analysis.keys():
+            if isinstance(key, str) and ('entreprise' in key.lower() or 'company' in key.lower()):
+                if key not in company_field_candidates:
+                    company_field_candidates.append(key)
+
+        # Find the first valid company name field
+        company_name = None
+        company_field = None
+
+        for field in company_field_candidates:
+            if field in html_analysis and html_analysis[field]:
+                company_name = html_analysis[field]
+                company_field = field
+                break
+
+        if company_name:
+            logger.info(f"✅ Found company name '{company_name}' in field '{company_field}'")
+            logger.info(f"🔍 Processing generic custom structure data for: {company_name}")
+
+            # Check if we have enough data fields (arbitrary threshold)
+            if len(html_analysis) >= 3:
+                try:
+                    # Create a normalized copy of the data with consistent field names
+                    normalized_data = {}
+                    for key, value in html_analysis.items():
+                        # Replace spaces with underscores and lowercase
+                        normalized_key = key.replace(' ', '_').replace('\'', '_').lower()
+                        normalized_data[normalized_key] = value
+
+                        # Add a mapping for standard fields
+                        if 'entreprise' in normalized_key or 'company' in normalized_key:
+                            normalized_data['nom_entreprise'] = value
+
+                    # Create the ScrapingResult
+                    scraping_result = ScrapingResult.objects.create(
+                        task=task,
+                        lead_data=normalized_data,
+                        source_url=current_url,
+                        page_hash=page_hash
+                    )
+
+                    logger.info(f"✅ Created scraping result with ID: {scraping_result.id} for company: {company_name}")
+
+                    # Create a lead
+                    lead = create_lead_from_result(scraping_result, job)
+
+                    if lead:
+                        logger.info(f"✅ Successfully created lead ID: {lead.id} for company: {company_name}")
+                        leads_found += 1
+                    else:
+                        logger.warning(f"❌ Failed to create lead for company: {company_name}")
+                        logger.debug(f"Normalized lead data: {normalized_data}")
+                except Exception as e:
+                    logger.error(f"❌ Error creating lead from generic custom structure: {str(e)}", exc_info=True)
+            else:
+                logger.warning(f"⚠️ Not enough fields in custom structure data: {len(html_analysis)} fields")
+        else:
+            logger.warning(f"⚠️ No company name found in potential custom structure: {list(html_analysis.keys())}")
+
+    # Process the AI analysis results for contacts array format (if present)
+    leads_processed = False
+
+    # Check if industry/sector field is missing but required
+    if sector_fallback and structure.structure and "secteur_activite" in [field.get('name') for field in structure.structure if field.get('required', True)]:
+        if 'secteur_activite' in html_analysis and not html_analysis['secteur_activite']:
+            # The sector field exists but is empty, try a dedicated analysis to find it
+            logger.warning("Missing sector field detected, attempting targeted extraction...")
+
+            try:
+                # Create a specialized prompt for industry detection
+                company_name = html_analysis.get('nom_entreprise', html_analysis.get('company', site.domain))
+                company_desc = html_analysis.get('description', '')
+
+                # Get the industry analysis
+                industry_messages = [
+                    {"role": "system", "content": "You are an expert in business analysis and industry classification."},
+                    {"role": "user", "content": f"""
+Analyze this HTML content and determine the industry sector for this company:
+
+COMPANY NAME: {company_name}
+COMPANY DESCRIPTION: {company_desc}
+
+HTML CONTENT:
+{build_context(html_content, current_url, budget=get_context_config()['fallback_budget'])}
+
+I need ONLY the industry or business sector. Return ONLY a JSON object like this:
+{{"secteur_activite": "Technology"}}
+
+Use specific industry categories like Technology, Healthcare, Manufacturing, Financial Services, 
+Education, Media, Retail, etc. Make your best determination based on the content.
+If you're unsure but can make an educated guess, add "Probable: " prefix.
+"""}
+                ]
+
+                # Get the industry analysis
+                industry_result = ai_manager.send_mistral_request(industry_messages, route="classification")
+
+                # If successful, update the original analysis
+                if isinstance(industry_result, dict) and 'secteur_activite' in industry_result and industry_result['secteur_activite']:
+                    html_analysis['secteur_activite'] = industry_result['secteur_activite']
+                    logger.info(f"Successfully extracted industry sector: {industry_result['secteur_activite']}")
+                elif isinstance(industry_result, str):
+                    # Try to extract JSON from string if needed
+                    # re and json modules are already imported at the top of the file
+
+                    # Try to find JSON pattern in the response
+                    json_match = re.search(r'\{.*?"secteur_activite".*?:.*?".*?".*?\}', industry_result)
+                    if json_match:
+                        try:
+                            extracted_json = json.loads(json_match.group(0))
+                            if 'secteur_activite' in extracted_json and extracted_json['secteur_activite']:
+                                html_analysis['secteur_activite'] = extracted_json['secteur_activite']
+                                logger.info(f"Extracted industry from text response: {extracted_json['secteur_activite']}")
+                        except:
+                            logger.warning("Failed to parse extracted industry JSON")
+            except Exception as e:
+                logger.warning(f"Error during targeted industry extraction: {str(e)}")
+
+    # Mettre à jour la structure JSON avec les nouvelles informations
+    if html_analysis and isinstance(html_analysis, dict):
+        # Extraire et stocker les contacts
+        if "contacts" in html_analysis and html_analysis["contacts"]:
+            for contact in html_analysis["contacts"]:
+                # Vérifier si le contact est valide et non-dupliqué
+                leads_found = process_contact(contact, task, current_url, job, leads_found, page_hash=page_hash)
+
+    return leads_found
+
 # Helper function to handle contact extraction and lead creation
-def process_contact(contact, task, current_url, job, leads_count=0):
+def process_contact(contact, task, current_url, job, leads_count=0, page_hash=None):
     """Process a contact: validate, create result and lead, update stats"""
     logger.info(f"Processing contact from URL: {current_url}")
     logger.debug(f"Contact data to process: {contact}")
@@ -1084,7 +1462,8 @@ def process_contact(contact, task, current_url, job, leads_count=0):
             scraping_result = ScrapingResult.objects.create(
                 task=task,
                 lead_data=contact,
-                source_url=current_url
+                source_url=current_url,
+                page_hash=page_hash
             )
             logger.info(f"Scraping result created with ID: {scraping_result.id}")
         except Exception as result_error:
@@ -1175,6 +1554,10 @@ def cleanup_old_tasks():
             status__in=['completed', 'failed'],
             completion_time__lt=old_date
         ).delete()
+        
+        # Réponses LLM expirées ou au-delà de la taille maximale du cache
+        from utils import llm_cache
+        llm_cache.evict()
     except Exception as e:
         logger.error(f"Error cleaning up old tasks: {str(e)}", exc_info=True)
 
@@ -1664,19 +2047,22 @@ def scrape_site(site, task, structure):
             
             # Init Selenium for browser-based scraping
             try:
-                from utils.simple_scraper import init_selenium, fetch_page_content, close_selenium
-                init_selenium()
+                from utils.simple_scraper import fetch_page_content
                 
-                # Fetch the page content
+                # Fetch the page content (Selenium fallback uses the worker's browser pool)
                 raw_html = fetch_page_content(site.url)
                 
                 if not raw_html or raw_html.strip() == "":
                     logger.warning(f"Empty HTML content received from {site.url}. Skipping this page.")
-                    close_selenium()
                     return False
                 
+                # Keep the raw page so the extraction can be re-run without refetching
+                from utils.page_store import store_page
+                page_hash = store_page(raw_html)
+                
                 # Format the extracted HTML
                 from utils.html_formatter import format_extracted_html
+                from utils.context_builder import build_context, get_context_config
                 extracted_text = format_extracted_html(raw_html, site.url)
                 
                 # Analyze the HTML with GPT/Mistral
@@ -1727,7 +2113,8 @@ def scrape_site(site, task, structure):
                         extracted_text, 
                         objective, 
                         json_structure, 
-                        structure_schema=structure.structure
+                        structure_schema=structure.structure,
+                        url=site.url
                     )
                 else:
                     # Use OpenAI as fallback
@@ -1740,7 +2127,6 @@ def scrape_site(site, task, structure):
                 
                 if not gpt_analysis or not isinstance(gpt_analysis, dict):
                     logger.warning(f"No valid data extracted from {site.url}, skipping.")
-                    close_selenium()
                     return False
                 
                 # Log the analysis result for debugging
@@ -1775,7 +2161,7 @@ COMPANY NAME: {company_name}
 COMPANY DESCRIPTION: {company_desc}
 
 HTML CONTENT:
-{extracted_text[:8000]}
+{build_context(extracted_text, site.url, budget=get_context_config()['fallback_budget'])}
 
 I need ONLY the industry or business sector. Return ONLY a JSON object like this:
 {{"secteur_activite": "Technology"}}
@@ -1787,7 +2173,7 @@ If you're unsure but can make an educated guess, add "Probable: " prefix.
                             ]
                             
                             # Get the industry analysis
-                            industry_result = ai_manager.send_mistral_request(industry_messages, model="mistral-large-latest")
+                            industry_result = ai_manager.send_mistral_request(industry_messages, route="classification")
                             
                             # If successful, update the original analysis
                             if isinstance(industry_result, dict) and 'secteur_activite' in industry_result and industry_result['secteur_activite']:
@@ -1850,7 +2236,8 @@ If you're unsure but can make an educated guess, add "Probable: " prefix.
                             scraping_result = ScrapingResult.objects.create(
                                 task=task,
                                 lead_data=contact_data,
-                                source_url=site.url
+                                source_url=site.url,
+                                page_hash=page_hash
                             )
                             task.leads_found += 1
                             task.unique_leads += 1
@@ -1910,7 +2297,8 @@ If you're unsure but can make an educated guess, add "Probable: " prefix.
                             scraping_result = ScrapingResult.objects.create(
                                 task=task,
                                 lead_data=gpt_analysis,
-                                source_url=site.url
+                                source_url=site.url,
+                                page_hash=page_hash
                             )
                             logger.info(f"Scraping result created with ID: {scraping_result.id}")
                             
@@ -1950,7 +2338,8 @@ If you're unsure but can make an educated guess, add "Probable: " prefix.
                             ScrapingResult.objects.create(
                                 task=task,
                                 lead_data=tender_data,
-                                source_url=site.url
+                                source_url=site.url,
+                                page_hash=page_hash
                             )
                             task.leads_found += 1
                             task.unique_leads += 1
@@ -1964,7 +2353,6 @@ If you're unsure but can make an educated guess, add "Probable: " prefix.
                                 details=tender_data
                             )
                 
-                close_selenium()
                 return True
                 
             except ImportError as e:
@@ -1,3 +1,1629 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
 
-# Create your tests here.
+import requests
+from django.contrib.auth import get_user_model
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+from urllib3.response import HTTPResponse
+
+from utils import http_client
+from utils.async_fetcher import AsyncPageFetcher
+from utils.browser_pool import BrowserPool, BrowserPoolTimeout
+from utils.page_store import PageStore
+from utils import llm_cache, model_router, pdf_extractor, rate_limiter
+from utils.frontier import CrawlFrontier, DONE, FAILED
+from utils.politeness import DEFAULT_POLITENESS_CONFIG, PolitenessScheduler, TokenBucket
+from utils import adaptive_timeouts, circuit_breaker, context_builder, page_cache, render_strategy, simple_scraper
+from utils import json_repair, link_scorer, structured_extractor
+from utils.near_duplicate import SimHashIndex, hamming_distance, page_fingerprint, simhash
+from utils.url_canonical import BloomFilter, SeenURLSet, canonicalize_url, url_key
+
+
+def relaxed_politeness():
+    """Scheduler that neither downloads robots.txt nor paces requests."""
+    return PolitenessScheduler(dict(DEFAULT_POLITENESS_CONFIG, enabled=False))
+
+
+def without_domain_history(test_class):
+    """For tests without a database: circuit states and latencies are kept in DomainProfile."""
+    test_class = mock.patch.object(
+        circuit_breaker, 'get_circuit_config',
+        lambda: dict(circuit_breaker.DEFAULT_CIRCUIT_CONFIG, enabled=False),
+    )(test_class)
+    return mock.patch.object(
+        adaptive_timeouts, 'get_timeout_config',
+        lambda: dict(adaptive_timeouts.DEFAULT_TIMEOUT_CONFIG, enabled=False),
+    )(test_class)
+
+
+@without_domain_history
+class AsyncPageFetcherTests(SimpleTestCase):
+    def _fake_fetch(self, tracker):
+        lock = threading.Lock()
+
+        def fetch(url):
+            domain = AsyncPageFetcher._domain(url)
+            with lock:
+                tracker['in_flight'] += 1
+                tracker['per_domain'][domain] = tracker['per_domain'].get(domain, 0) + 1
+                tracker['max_in_flight'] = max(tracker['max_in_flight'], tracker['in_flight'])
+                tracker['max_per_domain'][domain] = max(
+                    tracker['max_per_domain'].get(domain, 0), tracker['per_domain'][domain]
+                )
+            time.sleep(0.02)
+            with lock:
+                tracker['in_flight'] -= 1
+                tracker['per_domain'][domain] -= 1
+            return {"url": url, "final_url": url, "status_code": 200, "content_type": "text/html",
+                    "html": "<html></html>", "error": None, "elapsed": 0.02}
+        return fetch
+
+    def test_respects_global_and_domain_caps(self):
+        tracker = {'in_flight': 0, 'max_in_flight': 0, 'per_domain': {}, 'max_per_domain': {}}
+        fetcher = AsyncPageFetcher(max_concurrency=4, per_domain_concurrency=1, politeness=relaxed_politeness())
+        urls = [f"https://site{i % 3}.example/page{i}" for i in range(12)]
+
+        with mock.patch.object(fetcher, '_fetch_sync', side_effect=self._fake_fetch(tracker)):
+            results = fetcher.fetch_all(urls)
+
+        self.assertEqual(set(results), set(urls))
+        self.assertLessEqual(tracker['max_in_flight'], 3)
+        self.assertTrue(all(value == 1 for value in tracker['max_per_domain'].values()))
+
+    def test_duplicate_urls_fetched_once(self):
+        fetcher = AsyncPageFetcher(max_concurrency=2, per_domain_concurrency=2, politeness=relaxed_politeness())
+        fake = mock.Mock(side_effect=lambda url: {"url": url, "html": "", "error": None})
+
+        with mock.patch.object(fetcher, '_fetch_sync', fake):
+            results = fetcher.fetch_all(["https://a.example", "https://a.example", ""])
+
+        self.assertEqual(list(results), ["https://a.example"])
+        self.assertEqual(fake.call_count, 1)
+
+
+class HttpClientTests(SimpleTestCase):
+    def tearDown(self):
+        http_client.close_session()
+
+    def test_session_is_reused_within_a_process(self):
+        self.assertIs(http_client.get_session(), http_client.get_session())
+
+    def test_session_is_recreated_after_fork(self):
+        session = http_client.get_session()
+        with mock.patch('utils.http_client.os.getpid', return_value=-1):
+            self.assertIsNot(http_client.get_session(), session)
+
+    def _streamed(self, body, content_type="text/html", gzipped=False):
+        headers = {"Content-Type": content_type, "Content-Length": str(len(body))}
+        if gzipped:
+            body = gzip.compress(body)
+            headers["Content-Encoding"] = "gzip"
+        response = requests.Response()
+        response.status_code = 200
+        response.headers = requests.structures.CaseInsensitiveDict(headers)
+        response.raw = HTTPResponse(body=io.BytesIO(body), headers=headers, status=200, preload_content=False)
+        return response
+
+    def test_limited_download_is_truncated_after_decompression(self):
+        response = self._streamed(b"<p>" + b"a" * 100000, gzipped=True)
+        with mock.patch('utils.http_client.request', return_value=response):
+            limited = http_client.get_limited('https://a.example', max_bytes=1000)
+        self.assertTrue(limited.truncated)
+        self.assertEqual(len(limited.content), 1000)
+
+    def test_limited_download_rejects_media_and_oversized_pdf(self):
+        with mock.patch('utils.http_client.request', return_value=self._streamed(b"x" * 10, "video/mp4")):
+            with self.assertRaises(http_client.UnsupportedContentType):
+                http_client.get_limited('https://a.example/clip')
+
+        pdf = self._streamed(b"%PDF" + b"x" * 5000, "application/pdf")
+        with mock.patch('utils.http_client.request', return_value=pdf):
+            with self.assertRaises(http_client.ResponseTooLarge):
+                http_client.get_limited('https://a.example/doc.pdf', max_bytes=1000,
+                                        allowed_types=http_client.PDF_CONTENT_TYPES, truncate=False)
+
+    def test_scalar_timeout_is_used_as_read_timeout(self):
+        session = mock.Mock()
+        with mock.patch('utils.http_client.get_session', return_value=session):
+            http_client.get('https://a.example', timeout=12)
+        _, kwargs = session.request.call_args
+        self.assertEqual(kwargs['timeout'], (http_client.get_http_config()['connect_timeout'], 12))
+
+
+class BrowserPoolTests(SimpleTestCase):
+    def _pool(self, **kwargs):
+        pool = BrowserPool(**kwargs)
+        pool._create_driver = mock.Mock(side_effect=lambda: mock.Mock(service=None))
+        return pool
+
+    def test_browser_is_reused_between_leases(self):
+        pool = self._pool(max_browsers=1, max_pages_per_browser=10)
+        with pool.lease() as first:
+            pass
+        with pool.lease() as second:
+            pass
+        self.assertIs(first, second)
+        self.assertEqual(pool._create_driver.call_count, 1)
+
+    def test_browser_recycled_after_page_limit(self):
+        pool = self._pool(max_browsers=1, max_pages_per_browser=2)
+        drivers = []
+        for _ in range(3):
+            with pool.lease() as driver:
+                drivers.append(driver)
+        self.assertIs(drivers[0], drivers[1])
+        self.assertIsNot(drivers[1], drivers[2])
+        drivers[0].quit.assert_called_once()
+
+    def test_unhealthy_browser_is_replaced(self):
+        pool = self._pool(max_browsers=1, max_pages_per_browser=10)
+        with pool.lease() as first:
+            first.execute_script.side_effect = Exception("session deleted")
+        with pool.lease() as second:
+            pass
+        self.assertIsNot(first, second)
+
+    def test_lease_times_out_when_pool_is_exhausted(self):
+        pool = self._pool(max_browsers=1, max_pages_per_browser=10)
+        with pool.lease():
+            with self.assertRaises(BrowserPoolTimeout):
+                with pool.lease(timeout=0.05):
+                    pass
+
+
+@without_domain_history
+class RenderStrategyTests(SimpleTestCase):
+    ARTICLE = "<html><body><p>" + "Contact us at the town hall. " * 20 + "</p></body></html>"
+    SPA_SHELL = (
+        "<html><head>" + "<script src='/static/js/main.js'></script>" * 20 + "</head>"
+        "<body><noscript>You need to enable JavaScript to run this app.</noscript>"
+        "<div id=\"root\"></div></body></html>"
+    )
+
+    def _response(self, html, status_code=200):
+        return mock.Mock(status_code=status_code, text=html, headers={"Content-Type": "text/html"})
+
+    def _browser_pool(self, html):
+        pool = mock.Mock()
+        pool.lease.return_value.__enter__ = mock.Mock(return_value=mock.Mock(page_source=html))
+        pool.lease.return_value.__exit__ = mock.Mock(return_value=False)
+        return pool
+
+    def test_heuristics(self):
+        self.assertFalse(render_strategy.needs_js_rendering(self.ARTICLE)[0])
+        needs_js, reason = render_strategy.needs_js_rendering(self.SPA_SHELL)
+        self.assertTrue(needs_js)
+        self.assertEqual(reason, "empty SPA root")
+
+    def test_unknown_domain_classified_static(self):
+        with mock.patch.object(simple_scraper, 'get_scheduler', relaxed_politeness), \
+             mock.patch.object(simple_scraper, 'get_render_strategy', return_value='unknown'), \
+             mock.patch.object(simple_scraper, 'record_render_outcome') as record, \
+             mock.patch.object(simple_scraper.http_client, 'get_limited', return_value=self._response(self.ARTICLE)), \
+             mock.patch.object(simple_scraper, 'get_browser_pool') as get_pool:
+            html = simple_scraper.fetch_page_content("https://static.example/contact")
+
+        self.assertEqual(html, self.ARTICLE)
+        record.assert_called_once_with("https://static.example/contact", 'static')
+        get_pool.assert_not_called()
+
+    def test_unknown_domain_classified_browser(self):
+        pool = self._browser_pool(self.ARTICLE)
+        with mock.patch.object(simple_scraper, 'get_scheduler', relaxed_politeness), \
+             mock.patch.object(simple_scraper, 'get_render_strategy', return_value='unknown'), \
+             mock.patch.object(simple_scraper, 'record_render_outcome') as record, \
+             mock.patch.object(simple_scraper.http_client, 'get_limited', return_value=self._response(self.SPA_SHELL)), \
+             mock.patch.object(simple_scraper, 'get_browser_pool', return_value=pool), \
+             mock.patch.object(simple_scraper, 'WebDriverWait'):
+            html = simple_scraper.fetch_page_content("https://spa.example/contact")
+
+        self.assertEqual(html, self.ARTICLE)
+        record.assert_called_once_with("https://spa.example/contact", 'browser')
+
+    def _fetch_on_static_domain(self, response, pool):
+        with mock.patch.object(simple_scraper, 'get_scheduler', relaxed_politeness), \
+             mock.patch.object(simple_scraper, 'get_render_strategy', return_value='static'), \
+             mock.patch.object(simple_scraper, 'reset_render_strategy') as reset, \
+             mock.patch.object(simple_scraper, 'record_render_outcome') as record, \
+             mock.patch.object(simple_scraper.http_client, 'get_limited', return_value=response), \
+             mock.patch.object(simple_scraper, 'get_browser_pool', return_value=pool) as get_pool, \
+             mock.patch.object(simple_scraper, 'WebDriverWait'):
+            html = simple_scraper.fetch_page_content("https://static.example/contact")
+        return html, reset, record, get_pool
+
+    def test_static_domain_never_leases_a_browser(self):
+        html, reset, _record, get_pool = self._fetch_on_static_domain(
+            self._response(self.ARTICLE, status_code=404), self._browser_pool(self.ARTICLE)
+        )
+        self.assertEqual(html, "")
+        get_pool.assert_not_called()
+        reset.assert_not_called()
+
+        # A JavaScript shell sends the domain back to classification and is rendered, not lost
+        html, reset, record, get_pool = self._fetch_on_static_domain(
+            self._response(self.SPA_SHELL), self._browser_pool(self.ARTICLE)
+        )
+        self.assertEqual(html, self.ARTICLE)
+        reset.assert_called_once_with("https://static.example/contact")
+        get_pool.assert_called_once()
+        record.assert_called_once_with("https://static.example/contact", 'browser')
+
+    def test_browser_domain_skips_static_fetch(self):
+        pool = self._browser_pool(self.ARTICLE)
+        with mock.patch.object(simple_scraper, 'get_scheduler', relaxed_politeness), \
+             mock.patch.object(simple_scraper, 'get_render_strategy', return_value='browser'), \
+             mock.patch.object(simple_scraper, 'record_render_outcome') as record, \
+             mock.patch.object(simple_scraper.http_client, 'get_limited') as http_get, \
+             mock.patch.object(simple_scraper, 'get_browser_pool', return_value=pool), \
+             mock.patch.object(simple_scraper, 'WebDriverWait'):
+            html = simple_scraper.fetch_page_content("https://spa.example/about")
+
+        self.assertEqual(html, self.ARTICLE)
+        http_get.assert_not_called()
+        record.assert_not_called()
+
+
+@without_domain_history
+class PageCacheTests(SimpleTestCase):
+    URL = "https://mairie.example/contact"
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.settings_override = override_settings(SCRAPING_CONFIG={'page_cache': {'directory': self.directory.name}})
+        self.settings_override.enable()
+
+    def tearDown(self):
+        self.settings_override.disable()
+        self.directory.cleanup()
+
+    def _response(self, status_code, text="", headers=None):
+        response = mock.Mock(status_code=status_code, text=text, url=self.URL, headers=headers or {})
+        response.raise_for_status = mock.Mock()
+        return response
+
+    def test_variants_of_a_url_share_one_key(self):
+        self.assertEqual(page_cache.cache_key("HTTPS://Mairie.example:443/contact#team"), page_cache.cache_key(self.URL))
+
+    def test_not_modified_serves_cached_body_and_extraction(self):
+        fetcher = AsyncPageFetcher(politeness=relaxed_politeness())
+        first = self._response(200, "<html>v1</html>", {"ETag": '"abc"', "Content-Type": "text/html"})
+        with mock.patch.object(http_client, 'get_limited', return_value=first):
+            self.assertFalse(fetcher.fetch(self.URL)["not_modified"])
+        page_cache.store_extraction(self.URL, "structure-1", {"nom_entreprise": "Mairie"})
+
+        with mock.patch.object(http_client, 'get_limited', return_value=self._response(304)) as http_get:
+            page = fetcher.fetch(self.URL)
+
+        self.assertEqual(http_get.call_args.kwargs['headers']['If-None-Match'], '"abc"')
+        self.assertTrue(page["not_modified"])
+        self.assertEqual(page["html"], "<html>v1</html>")
+        self.assertEqual(page_cache.get_extraction(self.URL, "structure-1"), {"nom_entreprise": "Mairie"})
+
+    def test_changed_page_drops_previous_extraction(self):
+        fetcher = AsyncPageFetcher(politeness=relaxed_politeness())
+        with mock.patch.object(http_client, 'get_limited', return_value=self._response(200, "v1", {"ETag": '"1"'})):
+            fetcher.fetch(self.URL)
+        page_cache.store_extraction(self.URL, "structure-1", {"nom_entreprise": "Mairie"})
+        with mock.patch.object(http_client, 'get_limited', return_value=self._response(200, "v2", {"ETag": '"2"'})):
+            page = fetcher.fetch(self.URL)
+
+        self.assertEqual(page["html"], "v2")
+        self.assertIsNone(page_cache.get_extraction(self.URL, "structure-1"))
+
+
+class PageStoreTests(SimpleTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip_and_deduplication(self):
+        store = PageStore(directory=self.directory.name)
+        digest = store.put("<html>mairie</html>")
+
+        self.assertEqual(store.put("<html>mairie</html>"), digest)
+        self.assertEqual(store.get(digest), "<html>mairie</html>")
+        self.assertIsNone(store.get("0" * 64))
+        store.close()
+
+    def test_pages_written_by_another_process_are_visible(self):
+        writer = PageStore(directory=self.directory.name)
+        reader = PageStore(directory=self.directory.name)
+        first = writer.put("<html>one</html>")
+        self.assertEqual(reader.get(first), "<html>one</html>")
+
+        second = writer.put("<html>two</html>")
+        self.assertIn(second, reader)
+        self.assertEqual(reader.get(second), "<html>two</html>")
+        writer.close()
+        reader.close()
+
+    def test_segments_roll_over(self):
+        store = PageStore(directory=self.directory.name)
+        store.max_segment_bytes = 1
+        digests = [store.put(f"<html>{i}</html>") for i in range(3)]
+
+        self.assertEqual(len([name for name in os.listdir(self.directory.name) if name.endswith('.seg')]), 3)
+        self.assertEqual([store.get(digest) for digest in digests], [f"<html>{i}</html>" for i in range(3)])
+        store.close()
+
+    def test_fsync_on_segment_roll_and_close_only(self):
+        store = PageStore(directory=self.directory.name, fsync_interval=3600)
+        with mock.patch('utils.page_store.os.fsync') as fsync:
+            store.put("<html>one</html>")
+            store.put("<html>two</html>")
+            self.assertEqual(fsync.call_count, 0)
+            store.max_segment_bytes = 1
+            store.put("<html>three</html>")
+            self.assertEqual(fsync.call_count, 2)  # the full segment and the index
+            store.close()
+            self.assertEqual(fsync.call_count, 4)
+
+    def test_oldest_segments_are_deleted_past_the_size_cap(self):
+        store = PageStore(directory=self.directory.name)
+        reader = PageStore(directory=self.directory.name)
+        store.max_segment_bytes = 1
+        digests = [store.put(f"<html>{i}</html>") for i in range(3)]
+        self.assertEqual(reader.get(digests[0]), "<html>0</html>")
+        store.max_total_bytes = os.path.getsize(os.path.join(self.directory.name, "segment-00001.seg"))
+
+        digests.append(store.put("<html>3</html>"))
+
+        segments = sorted(name for name in os.listdir(self.directory.name) if name.endswith('.seg'))
+        self.assertEqual(segments, ["segment-00003.seg", "segment-00004.seg"])
+        self.assertEqual([store.get(digest) for digest in digests], [None, None, "<html>2</html>", "<html>3</html>"])
+        # Another process reloads the rewritten index and stores a deleted page again
+        self.assertNotIn(digests[0], reader)
+        self.assertEqual(reader.put("<html>0</html>"), digests[0])
+        self.assertEqual(store.get(digests[0]), "<html>0</html>")
+        store.close()
+        reader.close()
+
+    def test_works_without_fcntl(self):
+        from utils import page_store
+        with mock.patch.object(page_store, 'fcntl', None), mock.patch.object(page_store, 'msvcrt', None):
+            store = PageStore(directory=self.directory.name)
+            digest = store.put("<html>mairie</html>")
+            self.assertEqual(store.get(digest), "<html>mairie</html>")
+            store.close()
+
+
+class PolitenessTests(SimpleTestCase):
+    ROBOTS = "User-agent: *\nCrawl-delay: 5\nDisallow: /admin/\n"
+
+    def _scheduler(self, robots_text=ROBOTS, status_code=200):
+        scheduler = PolitenessScheduler(dict(DEFAULT_POLITENESS_CONFIG))
+        response = mock.Mock(status_code=status_code, text=robots_text)
+        patcher = mock.patch('utils.politeness.http_client.get_limited', return_value=response)
+        self.robots_get = patcher.start()
+        self.addCleanup(patcher.stop)
+        return scheduler
+
+    def test_robots_is_fetched_once_and_honored(self):
+        scheduler = self._scheduler()
+        self.assertTrue(scheduler.is_allowed("https://mairie.example/contact"))
+        self.assertFalse(scheduler.is_allowed("https://mairie.example/admin/login"))
+        self.assertEqual(self.robots_get.call_count, 1)
+
+    def test_crawl_delay_paces_the_domain(self):
+        scheduler = self._scheduler()
+        self.assertEqual(scheduler.reserve("https://mairie.example/a"), 0.0)
+        self.assertAlmostEqual(scheduler.reserve("https://mairie.example/b"), 5.0, delta=0.1)
+        self.assertEqual(scheduler.reserve("https://other.example/a"), 0.0)
+
+    def test_forbidden_robots_disallows_everything(self):
+        scheduler = self._scheduler(robots_text="", status_code=403)
+        self.assertFalse(scheduler.is_allowed("https://private.example/"))
+
+    def test_token_bucket_allows_burst_then_waits(self):
+        bucket = TokenBucket(rate=1.0, capacity=2)
+        self.assertEqual([bucket.reserve() > 0 for _ in range(3)], [False, False, True])
+
+    def test_throttled_response_blocks_domain_and_sets_rate_limit(self):
+        scheduler = self._scheduler()
+        response = mock.Mock(status_code=429, headers={"Retry-After": "120"})
+        with mock.patch('scraping.models.ScrapedSite.objects') as sites:
+            scheduler.report_response("https://busy.example/page", response)
+
+        sites.filter.assert_called_once_with(domain__iexact="busy.example")
+        self.assertGreater(scheduler.blocked_for("https://busy.example/other"), 60)
+        self.assertEqual(scheduler.blocked_for("https://quiet.example/"), 0.0)
+
+
+class PdfExtractorTests(SimpleTestCase):
+    def _pdf(self, page_texts):
+        import fitz
+        with fitz.open() as pdf_doc:
+            for text in page_texts:
+                pdf_doc.new_page().insert_text((72, 72), text)
+            return pdf_doc.tobytes()
+
+    def test_keyword_pages_are_kept_first_in_document_order(self):
+        pdf = self._pdf(["Sommaire general", "Budget annexe", "Contact: mairie@ville.example", "Annexe technique"])
+        tight = pdf_extractor.extract_pages(pdf, max_pages=10, max_chars=30, keywords=['contact', '@'], time_budget=10)
+        roomy = pdf_extractor.extract_pages(pdf, max_pages=10, max_chars=47, keywords=['contact', '@'], time_budget=10)
+
+        self.assertEqual(tight["text"], "Contact: mairie@ville.example")
+        self.assertEqual(roomy["text"], "Sommaire general\nContact: mairie@ville.example")
+        self.assertEqual(roomy["pages_total"], 4)
+
+    def test_parsing_stops_at_page_and_character_budgets(self):
+        pdf = self._pdf([f"Page {i} contact" for i in range(10)])
+        by_pages = pdf_extractor.extract_pages(pdf, max_pages=3, max_chars=10000, keywords=['contact'], time_budget=10)
+        by_chars = pdf_extractor.extract_pages(pdf, max_pages=10, max_chars=30, keywords=['contact'], time_budget=10)
+
+        self.assertEqual((by_pages["pages_parsed"], by_pages["stopped"]), (3, "page budget"))
+        self.assertEqual(by_chars["stopped"], "character budget")
+        self.assertLess(by_chars["pages_parsed"], 10)
+
+    def test_inline_extraction_when_pool_disabled(self):
+        pdf = self._pdf(["Appel d'offre: date limite 12 mai"])
+        with mock.patch.object(pdf_extractor, 'get_pdf_config', return_value=dict(pdf_extractor.DEFAULT_PDF_CONFIG, max_workers=0)):
+            self.assertIn("date limite", pdf_extractor.extract_pdf_text(pdf))
+
+    def test_extraction_in_a_daemonic_process(self):
+        import multiprocessing
+        # Celery prefork children are daemonic and may not start the extraction pool
+        context = multiprocessing.get_context('fork')
+        pdf = self._pdf(["Contact: mairie@ville.example"])
+        receiver, sender = context.Pipe(duplex=False)
+        worker = context.Process(target=_extract_pdf_in_child, args=(pdf, sender), daemon=True)
+        worker.start()
+        try:
+            self.assertTrue(receiver.poll(30))
+            self.assertIn("mairie@ville.example", receiver.recv())
+        finally:
+            worker.join(5)
+
+
+def _extract_pdf_in_child(pdf, sender):
+    sender.send(pdf_extractor.extract_pdf_text(pdf))
+
+
+class UrlCanonicalTests(SimpleTestCase):
+    def test_canonical_form(self):
+        self.assertEqual(
+            canonicalize_url("HTTPS://Www.Mairie.Example:443//services/?utm_source=x&b=2&a=1&fbclid=y#contact"),
+            "https://www.mairie.example/services?a=1&b=2",
+        )
+        self.assertEqual(canonicalize_url("http://mairie.example"), "http://mairie.example/")
+        self.assertEqual(canonicalize_url("https://mairie.example/page;jsessionid=ABC?PHPSESSID=1"), "https://mairie.example/page")
+        self.assertEqual(canonicalize_url("https://mairie.example/%7Eelus/"), "https://mairie.example/~elus")
+        self.assertEqual(canonicalize_url("mailto:maire@mairie.example"), "mailto:maire@mairie.example")
+
+    def test_encoded_reserved_characters_are_kept(self):
+        # %2F is not a path separator: decoding it would point to another resource
+        self.assertEqual(canonicalize_url("https://mairie.example/docs/a%2fb"), "https://mairie.example/docs/a%2Fb")
+        self.assertEqual(canonicalize_url("https://mairie.example/q%3Fx%23y"), "https://mairie.example/q%3Fx%23y")
+        self.assertEqual(canonicalize_url("https://mairie.example/caf%c3%a9"), canonicalize_url("https://mairie.example/café"))
+        self.assertEqual(canonicalize_url("https://mairie.example/taux 100%"), "https://mairie.example/taux%20100%25")
+
+    def test_stripped_parameters_are_configurable(self):
+        with override_settings(SCRAPING_CONFIG={'url_canonical': {'strip_params': ['ref']}}):
+            self.assertEqual(canonicalize_url("https://a.example/?ref=1&utm_source=x"), "https://a.example/?utm_source=x")
+
+    def test_key_ignores_scheme_and_www(self):
+        self.assertEqual(url_key("http://www.mairie.example/contact/"), url_key("https://mairie.example/contact?gclid=1"))
+        self.assertNotEqual(url_key("https://mairie.example/contact"), url_key("https://mairie.example/elus"))
+
+    def test_seen_set(self):
+        seen = SeenURLSet(["https://mairie.example/contact"], capacity=100, error_rate=0.01)
+        self.assertFalse(seen.add("https://www.mairie.example/contact/#team"))
+        self.assertTrue(seen.add("https://mairie.example/elus"))
+        self.assertIn("http://mairie.example/elus", seen)
+        self.assertEqual(len(seen), 2)
+
+    def test_bloom_filter_has_no_false_negatives(self):
+        bloom = BloomFilter(capacity=1000, error_rate=0.01)
+        values = [f"page-{i}" for i in range(1000)]
+        for value in values:
+            bloom.add(value)
+        self.assertTrue(all(value in bloom for value in values))
+        false_positives = sum(f"other-{i}" in bloom for i in range(1000))
+        self.assertLess(false_positives, 50)
+
+
+def template_page(body):
+    footer = " ".join(
+        f"Mairie de Villeneuve, service {name}, 1 place de la République, 69000 Villeneuve, tél 04 00 00 00 0{i}."
+        for i, name in enumerate(["accueil", "état civil", "urbanisme", "écoles", "culture", "sports"])
+    )
+    return f"<html><body><h1>Mairie de Villeneuve</h1><p>{body}</p><footer><p>{footer} Mentions légales, plan du site, accessibilité.</p></footer></body></html>"
+
+
+class NearDuplicateTests(SimpleTestCase):
+    def test_simhash_distance_tracks_similarity(self):
+        base = page_fingerprint(template_page("Horaires d'ouverture du lundi au vendredi."), "https://mairie.example/")
+        variant = page_fingerprint(template_page("Horaires d'ouverture du lundi au samedi."), "https://mairie.example/horaires")
+        other = simhash("Appel d'offres pour la rénovation du gymnase, date limite de dépôt des offres le 12 mai, "
+                        "dossier de consultation disponible sur la plateforme des marchés publics.")
+
+        self.assertLessEqual(hamming_distance(base, variant), 3)
+        self.assertGreater(hamming_distance(base, other), 10)
+
+    def test_short_pages_are_not_fingerprinted(self):
+        self.assertIsNone(page_fingerprint("<p>Contact</p>", "https://mairie.example/"))
+
+    def test_index_finds_closest_within_distance(self):
+        index = SimHashIndex(bands=4)
+        index.add("a", 0b1011)
+        index.add("b", 0xFFFF << 48)
+
+        self.assertEqual(index.nearest(0b1001, max_distance=3), ("a", 1))
+        self.assertIsNone(index.nearest(0b1111 << 20, max_distance=3))
+        self.assertEqual(len(index), 2)
+
+
+def long_page(footer):
+    """A page whose contact details sit in the footer, far beyond the first characters."""
+    menu = ''.join(f'<li><a href="/rubrique-{i}">Rubrique {i}</a></li>' for i in range(150))
+    news = ''.join(f'<p>Actualité {i} : la ville organise une fête de quartier ce week-end.</p>' for i in range(200))
+    return f"<html><head><title>Mairie de Lyon</title><style>body{{}}</style></head><body><nav><ul>{menu}</ul></nav>" \
+           f"{news}<footer>{footer}</footer></body></html>"
+
+
+class ContextBuilderTests(SimpleTestCase):
+    FOOTER = ('<h3>Contact</h3><address>1 place de la Comédie, 69001 Lyon<br>Tél : 04 72 10 30 30<br>'
+              '<a href="mailto:accueil@lyon.fr">Écrire à la mairie</a></address>')
+
+    def test_contact_section_kept_within_budget(self):
+        html = long_page(self.FOOTER)
+        context = context_builder.build_context(html, 'https://lyon.fr', budget=400)
+
+        self.assertLessEqual(context_builder.estimate_tokens(context), 400 + context.count('\n') + 1)
+        self.assertIn('04 72 10 30 30', context)
+        self.assertIn('<accueil@lyon.fr>', context)
+        self.assertIn('PAGE TITLE: Mairie de Lyon', context)
+        self.assertNotIn('Rubrique 100', context)
+        self.assertNotIn('body{}', context)
+        self.assertNotIn('accueil@lyon.fr', html[:12000])
+
+    def test_schema_fields_count_as_signals(self):
+        html = long_page('<p>Notre secteur d’activité : la restauration collective.</p>')
+        schema = [{"name": "secteur_activite", "type": "text", "required": True}]
+
+        self.assertIn('restauration collective', context_builder.build_context(html, structure_schema=schema, budget=100))
+        self.assertNotIn('restauration collective', context_builder.build_context(html, budget=100))
+
+    def test_small_pages_and_plain_text_are_kept_whole(self):
+        text = "PAGE TITLE: Mairie\nPARAGRAPH: Bienvenue\nLIST ITEM: Tél 04 72 10 30 30"
+
+        self.assertEqual(context_builder.build_context(text, budget=500), text)
+        self.assertEqual(context_builder.build_context('<p>Bienvenue</p>', budget=500), 'Bienvenue')
+        self.assertEqual(context_builder.estimate_tokens('Bonjour, mairie'), 5)
+
+    def test_extraction_prompt_carries_the_page_context(self):
+        from core.utils.ai_utils import AIManager
+        manager = object.__new__(AIManager)
+        sent = []
+        manager.send_mistral_request = lambda messages, **kwargs: sent.append(messages) or {"email": ""}
+
+        schema = [{"name": "secteur_activite", "type": "text", "required": True}]
+        manager.analyze_html_content(long_page(self.FOOTER), "Contacts", {}, structure_schema=schema, url='https://lyon.fr')
+
+        self.assertIn('accueil@lyon.fr', sent[0][1]['content'])
+        self.assertNotIn('<li>', sent[0][1]['content'])
+
+
+ORGANIZATION_PAGE = """<html><head><title>Accueil</title>
+<script type="application/ld+json">{"@context": "https://schema.org", "@graph": [
+  {"@type": "Organization", "name": "Boulangerie Martin", "url": "https://martin.fr",
+   "address": {"@type": "PostalAddress", "streetAddress": "3 rue Neuve", "postalCode": "69002", "addressLocality": "Lyon"},
+   "sameAs": ["https://www.linkedin.com/company/boulangerie-martin"]}]}</script></head>
+<body><p>Pain au levain depuis 1950.</p><footer><a href="mailto:webmaster@agence.com">Crédits</a>
+<a href="mailto:contact@martin.fr?subject=Devis">Nous écrire</a> <a href="tel:+33478000000">Appeler</a></footer></body></html>"""
+
+
+class StructuredExtractorTests(SimpleTestCase):
+    SCHEMA = [
+        {"name": "nom_entreprise", "type": "text", "required": True},
+        {"name": "email", "type": "email", "required": True},
+        {"name": "telephone", "type": "text", "required": True},
+        {"name": "code_postal", "type": "text", "required": False},
+        {"name": "linkedin", "type": "url", "required": False},
+        {"name": "secteur_activite", "type": "text", "required": False},
+    ]
+
+    def manager(self, answer):
+        from core.utils.ai_utils import AIManager
+        manager = object.__new__(AIManager)
+        manager.sent = []
+        manager.send_mistral_request = lambda messages, **kwargs: manager.sent.append(messages) or dict(answer)
+        return manager
+
+    def test_facts_from_json_ld_and_links(self):
+        facts = structured_extractor.extract_facts(ORGANIZATION_PAGE, 'https://www.martin.fr/')
+
+        self.assertEqual(facts['company'], 'Boulangerie Martin')
+        self.assertEqual(facts['email'], 'contact@martin.fr')
+        self.assertEqual(facts['phone'], '+33478000000')
+        self.assertEqual(facts['city'], 'Lyon')
+        self.assertEqual(facts['linkedin'], 'https://www.linkedin.com/company/boulangerie-martin')
+
+    def test_microdata_and_text_patterns(self):
+        html = ('<div itemscope itemtype="https://schema.org/LocalBusiness"><span itemprop="name">Garage Dupont</span>'
+                '<div itemprop="address" itemscope itemtype="https://schema.org/PostalAddress">'
+                '<span itemprop="postalCode">13001</span></div></div>'
+                '<p>Écrivez-nous : garage@dupont.fr, tél. 04 91 00 00 00 <img src="logo@2x.png"></p>')
+        facts = structured_extractor.extract_facts(html, 'https://dupont.fr')
+
+        self.assertEqual(facts['company'], 'Garage Dupont')
+        self.assertEqual(facts['postal_code'], '13001')
+        self.assertEqual(facts['email'], 'garage@dupont.fr')
+        self.assertEqual(facts['phone'], '04 91 00 00 00')
+
+    def test_complete_markup_skips_the_llm(self):
+        manager = self.manager({})
+
+        result = manager.analyze_html_content(ORGANIZATION_PAGE, "Contacts", {}, structure_schema=self.SCHEMA,
+                                              url='https://martin.fr/')
+
+        self.assertEqual(manager.sent, [])
+        self.assertEqual(list(result), [field['name'] for field in self.SCHEMA])
+        self.assertEqual(result['nom_entreprise'], 'Boulangerie Martin')
+        self.assertEqual(result['code_postal'], '69002')
+        self.assertEqual(result['secteur_activite'], '')
+
+    def test_only_missing_fields_are_asked(self):
+        schema = self.SCHEMA + [{"name": "nom_contact", "type": "text", "required": True}]
+        manager = self.manager({"nom_contact": "Paul Martin", "email": "faux@exemple.com", "secteur_activite": "Boulangerie"})
+
+        result = manager.analyze_html_content(ORGANIZATION_PAGE, "Contacts", {}, structure_schema=schema,
+                                              url='https://martin.fr/')
+
+        prompt = manager.sent[0][1]['content']
+        self.assertIn('"nom_contact"', prompt)
+        self.assertNotIn('"email"', prompt)
+        self.assertEqual(result['nom_contact'], 'Paul Martin')
+        self.assertEqual(result['email'], 'contact@martin.fr')
+        self.assertEqual(result['secteur_activite'], 'Boulangerie')
+
+    @override_settings(SCRAPING_CONFIG={'pre_extraction': {'enabled': False}})
+    def test_disabled_sends_the_whole_schema(self):
+        manager = self.manager({"nom_entreprise": "Boulangerie Martin"})
+
+        manager.analyze_html_content(ORGANIZATION_PAGE, "Contacts", {}, structure_schema=self.SCHEMA)
+
+        self.assertIn('"email"', manager.sent[0][1]['content'])
+
+
+class ModelRouterTests(SimpleTestCase):
+    SCHEMA = [
+        {"name": "nom_entreprise", "type": "text", "required": True},
+        {"name": "nom_contact", "type": "text", "required": True},
+    ]
+
+    def setUp(self):
+        model_router._stats.clear()
+        self.addCleanup(model_router._stats.clear)
+        patcher = mock.patch.object(model_router, '_redis', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def manager(self, *answers):
+        from core.utils.ai_utils import AIManager
+        manager = object.__new__(AIManager)
+        manager.models = []
+        answers = iter(answers)
+        manager.send_mistral_request = lambda messages, model=None, **kwargs: manager.models.append(model) or dict(next(answers))
+        return manager
+
+    def test_extraction_escalates_when_validation_fails(self):
+        manager = self.manager({"nom_entreprise": "Mairie de Lyon", "nom_contact": ""},
+                               {"nom_entreprise": "Mairie de Lyon", "nom_contact": "Grégory Doucet"})
+
+        result = manager.analyze_html_content("<p>Mairie de Lyon</p>", "Contacts", {}, structure_schema=self.SCHEMA)
+
+        self.assertEqual(manager.models, ["mistral-small-latest", "mistral-large-latest"])
+        self.assertEqual(result["nom_contact"], "Grégory Doucet")
+        stats = model_router.get_stats()
+        self.assertEqual((stats["html_extraction:mistral-small-latest"]["invalid"],
+                          stats["html_extraction:mistral-small-latest"]["escalations"]), (1, 1))
+        self.assertEqual(stats["html_extraction:mistral-large-latest"]["success_rate"], 1.0)
+
+    def test_valid_small_model_answer_is_kept(self):
+        manager = self.manager({"nom_entreprise": "Mairie de Lyon", "nom_contact": "Grégory Doucet"})
+
+        manager.analyze_html_content("<p>Mairie de Lyon</p>", "Contacts", {}, structure_schema=self.SCHEMA)
+
+        self.assertEqual(manager.models, ["mistral-small-latest"])
+
+    def test_calls_record_latency_and_tokens_per_route(self):
+        from core.utils.ai_utils import AIManager
+        manager = object.__new__(AIManager)
+        manager.mistral_api_key = 'key'
+        manager.mistral_config = {'default_model': 'mistral-large-latest', 'max_tokens': 100, 'temperature': 0.1}
+        manager.mistral_client = mock.Mock()
+        manager.mistral_client.chat.return_value = mock.Mock(
+            choices=[mock.Mock(message=mock.Mock(content='["mairies Rhône", "communes Rhône"]'))],
+            usage=mock.Mock(total_tokens=120),
+        )
+
+        with mock.patch('core.utils.ai_utils.get_limiter'), llm_cache.bypass():
+            manager.generate_search_variations("mairies du Rhône")
+
+        self.assertEqual(manager.mistral_client.chat.call_args.kwargs['model'], "mistral-small-latest")
+        stats = model_router.get_stats()["search_variations:mistral-small-latest"]
+        self.assertEqual((stats["calls"], stats["tokens"], stats["avg_tokens"]), (1, 120, 120))
+
+    @override_settings(SCRAPING_CONFIG={'model_router': {'enabled': False}})
+    def test_disabled_router_keeps_the_large_model(self):
+        manager = self.manager({"nom_entreprise": "Mairie de Lyon", "nom_contact": ""})
+
+        manager.analyze_html_content("<p>Mairie de Lyon</p>", "Contacts", {}, structure_schema=self.SCHEMA)
+
+        self.assertEqual(manager.models, ["mistral-large-latest"])
+
+
+class JsonRepairTests(SimpleTestCase):
+    def test_truncated_answer_is_closed_after_its_last_complete_value(self):
+        self.assertEqual(json_repair.loads('{"a": 1, "b": [1, 2, {"c": "x"'), {"a": 1, "b": [1, 2, {"c": "x"}]})
+        self.assertEqual(json_repair.loads('{"a": 1, "b": tr'), {"a": 1})
+        self.assertEqual(json_repair.loads('{"a": 1, "bo'), {"a": 1})
+        self.assertEqual(json_repair.loads('{"response_chat": "Bonjour, je cherche\\u00'), {"response_chat": "Bonjour, je cherche"})
+
+    def test_common_llm_mistakes_are_repaired(self):
+        answer = 'Voici le résultat :\n```json\n{"nom": "Mairie\nde Lyon", "actif": True, "tags": ["a", "b",],}\n```\nBonne journée'
+
+        self.assertEqual(json_repair.loads(answer), {"nom": "Mairie\nde Lyon", "actif": True, "tags": ["a", "b"]})
+        self.assertEqual(json_repair.loads('Requêtes : ["mairies Rhône", "communes Rhône"]'), ["mairies Rhône", "communes Rhône"])
+        self.assertIsNone(json_repair.try_loads("Aucune donnée trouvée."))
+        with self.assertRaises(json.JSONDecodeError):
+            json_repair.loads("Aucune donnée trouvée.")
+
+    def test_large_truncated_answer_is_repaired_in_linear_time(self):
+        answer = '{"leads": [' + ', '.join(f'{{"nom": "Contact {i}", "email": "c{i}@example.fr"}}' for i in range(20000))
+
+        started = time.monotonic()
+        result = json_repair.loads(answer[:-10])
+
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertEqual(len(result["leads"]), 20000)
+        self.assertEqual(result["leads"][-1], {"nom": "Contact 19999", "email": "c19999@ex"})
+
+    def test_truncated_chat_answer_keeps_the_actions(self):
+        from core.utils.ai_utils import AIManager
+        content = '{"response_chat": "Je lance la recherche des mairies.", "actions_launched": "launch_scraping", "scraping_strategy": {"keywords": ["mair'
+        chat_response = mock.Mock(choices=[mock.Mock(message=mock.Mock(content=content))])
+
+        result = object.__new__(AIManager)._parse_chat_response(chat_response)
+
+        self.assertEqual(result["actions_launched"], "launch_scraping")
+        self.assertEqual(result["scraping_strategy"], {"keywords": ["mair"]})
+
+
+class ChatStreamingTests(SimpleTestCase):
+    ANSWER = '{"response_chat": "Je lance \\"la\\" recherche\\nmaintenant \\u00e0 Lyon.", "actions_launched": "no_action", "entity_type": "mairie"}'
+
+    def test_reader_decodes_the_field_whatever_the_chunking(self):
+        for size in (1, 3, 17, len(self.ANSWER)):
+            reader = json_repair.StreamingFieldReader(('response_chat', 'message'))
+            text = ''.join(reader.feed(self.ANSWER[i:i + size]) for i in range(0, len(self.ANSWER), size))
+
+            self.assertEqual(text, 'Je lance "la" recherche\nmaintenant à Lyon.')
+            self.assertTrue(reader.done)
+            self.assertEqual(json_repair.loads(reader.text)["entity_type"], "mairie")
+
+    def test_keys_and_nested_fields_are_not_read(self):
+        reader = json_repair.StreamingFieldReader()
+
+        self.assertEqual(reader.feed('{"a": "response_chat", "b": {"response_chat": "non"}, "response_chat": "oui"}'), "oui")
+
+    def test_stream_yields_tokens_then_the_processed_answer(self):
+        from core.utils.ai_utils import AIManager
+        manager = object.__new__(AIManager)
+        manager.mistral_api_key = 'key'
+        manager.mistral_config = {'default_model': 'mistral-large-latest', 'max_tokens': 100, 'temperature': 0.1}
+        manager._build_system_message = lambda user_context: "system"
+        chunks = [self.ANSWER[i:i + 20] for i in range(0, len(self.ANSWER), 20)]
+
+        async def chat_stream(messages, model):
+            for content in chunks:
+                yield mock.Mock(choices=[mock.Mock(delta=mock.Mock(content=content))], usage=None)
+
+        async def collect():
+            return [event async for event in manager.stream_user_message("Mairies de Lyon")]
+
+        manager._chat_stream_async = chat_stream
+        with mock.patch.object(model_router, '_redis', return_value=None):
+            events = asyncio.run(collect())
+
+        tokens = [value for event, value in events if event == 'token']
+        self.assertGreater(len(tokens), 1)
+        self.assertEqual(''.join(tokens), 'Je lance "la" recherche\nmaintenant à Lyon.')
+        self.assertEqual(events[-1][0], 'response')
+        self.assertEqual(events[-1][1]["actions_launched"], "no_action")
+        self.assertEqual(events[-1][1]["message"], 'Je lance "la" recherche\nmaintenant à Lyon.')
+
+
+class AdaptiveTimeoutTests(SimpleTestCase):
+    CONFIG = adaptive_timeouts.DEFAULT_TIMEOUT_CONFIG
+
+    def _histogram(self, latencies):
+        histogram = [0] * (len(adaptive_timeouts.LATENCY_BUCKETS) + 1)
+        for seconds in latencies:
+            histogram[adaptive_timeouts.bucket_index(seconds)] += 1
+        return histogram
+
+    def test_timeouts_follow_the_p95(self):
+        fast = self._histogram([0.2] * 19 + [0.4])
+        slow = self._histogram([3] * 18 + [12, 14])
+
+        self.assertEqual(adaptive_timeouts.timeouts_from_histogram(fast, self.CONFIG), (2, 5))
+        self.assertEqual(adaptive_timeouts.timeouts_from_histogram(slow, self.CONFIG), (7.5, 30))
+        self.assertEqual(adaptive_timeouts.timeouts_from_histogram(self._histogram([100] * 10), self.CONFIG)[1], 60)
+        self.assertIsNone(adaptive_timeouts.timeouts_from_histogram(self._histogram([1, 1]), self.CONFIG))
+
+    def test_only_network_errors_and_gateway_answers_are_retried(self):
+        self.assertTrue(adaptive_timeouts.is_retryable(requests.exceptions.ReadTimeout()))
+        self.assertTrue(adaptive_timeouts.is_retryable(status_code=502))
+        self.assertFalse(adaptive_timeouts.is_retryable(status_code=404))
+        self.assertFalse(adaptive_timeouts.is_retryable(status_code=503))  # throttling, left to politeness
+        self.assertFalse(adaptive_timeouts.is_retryable(http_client.UnsupportedContentType()))
+
+    @without_domain_history
+    def test_fetcher_retries_within_budget(self):
+        ok = mock.Mock(status_code=200, url="https://a.example/", headers={"Content-Type": "text/html"}, text="<html>ok</html>")
+        budget = adaptive_timeouts.RetryBudget(limit=1)
+        fetcher = AsyncPageFetcher(politeness=relaxed_politeness(), retry_budget=budget)
+        flaky = mock.Mock(side_effect=[requests.exceptions.ConnectionError("reset"), ok])
+
+        with mock.patch.object(http_client, 'get_limited', flaky), \
+             mock.patch.object(adaptive_timeouts, 'backoff_delay', return_value=0), \
+             mock.patch.object(page_cache, 'get_entry', return_value=None), \
+             mock.patch.object(page_cache, 'store_response'):
+            first = fetcher.fetch("https://a.example/")
+            flaky.side_effect = [requests.exceptions.ConnectionError("reset"), ok]
+            second = fetcher.fetch("https://a.example/")
+
+        self.assertEqual((first["error"], first["html"]), (None, "<html>ok</html>"))
+        self.assertIn("reset", second["error"])  # budget spent by the first fetch
+        self.assertEqual(flaky.call_count, 3)
+
+
+class RateLimiterTests(SimpleTestCase):
+    AI_CONFIG = {'mistral': {'rate_limit': {'requests_per_minute': 120, 'burst': 2,
+                                            'models': {'mistral-large-latest': {'requests_per_minute': 30}}}}}
+
+    def setUp(self):
+        rate_limiter._local_buckets.clear()
+        rate_limiter._metrics.clear()
+        patcher = mock.patch.object(rate_limiter, '_get_redis', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_limits_come_from_settings_per_model(self):
+        with override_settings(AI_CONFIG=self.AI_CONFIG):
+            self.assertEqual(rate_limiter.get_provider_limits('mistral'), (2.0, 2))
+            self.assertEqual(rate_limiter.get_provider_limits('mistral', 'mistral-large-latest'), (0.5, 2))
+        self.assertEqual(rate_limiter.get_provider_limits('unknown'), (1.0, 1))
+
+    def test_reservations_are_scheduled_back_to_back(self):
+        limiter = rate_limiter.RateLimiter('mistral', 'small', 'key', rate=1.0, capacity=2)
+
+        waits = [limiter.reserve() for _ in range(4)]
+        self.assertEqual(waits[:2], [0.0, 0.0])
+        self.assertAlmostEqual(waits[2], 1.0, places=1)
+        self.assertAlmostEqual(waits[3], 2.0, places=1)
+        with self.assertRaises(rate_limiter.RateLimitExceeded):
+            limiter.reserve(max_wait=1.0)
+
+        stats = rate_limiter.get_metrics()[limiter.key]
+        self.assertEqual(stats['requests'], 4)
+        self.assertAlmostEqual(stats['max_wait'], 2.0, places=1)
+
+    def test_keys_separate_models_and_api_keys(self):
+        first = rate_limiter.RateLimiter('openai', 'gpt-4', 'key-a', rate=1.0, capacity=1)
+        other_key = rate_limiter.RateLimiter('openai', 'gpt-4', 'key-b', rate=1.0, capacity=1)
+
+        self.assertEqual((first.reserve(), other_key.reserve()), (0.0, 0.0))
+        self.assertNotIn('key-a', first.key)
+
+    def test_async_acquire_does_not_block_the_loop(self):
+        import asyncio
+        limiter = rate_limiter.RateLimiter('serper', rate=20.0, capacity=1)
+
+        async def run():
+            return await asyncio.gather(limiter.acquire_async(), limiter.acquire_async())
+
+        self.assertAlmostEqual(max(asyncio.run(run())), 0.05, places=2)
+
+    def test_async_acquire_reserves_off_the_loop_thread(self):
+        import asyncio
+        limiter = rate_limiter.RateLimiter('serper', rate=20.0, capacity=1)
+        threads = []
+
+        def reserve(max_wait=None):
+            threads.append(threading.get_ident())
+            return 0.0
+
+        with mock.patch.object(limiter, 'reserve', side_effect=reserve):
+            asyncio.run(limiter.acquire_async())
+
+        self.assertNotEqual(threads, [threading.get_ident()])
+
+    def test_redis_bucket_shared_by_workers(self):
+        script = mock.Mock(return_value=[1, b'0.5'])
+        limiter = rate_limiter.RateLimiter('mistral', 'small', 'key', rate=1.0, capacity=1)
+
+        with mock.patch.object(rate_limiter, '_get_redis', return_value=mock.Mock()), \
+             mock.patch.object(rate_limiter, '_script', script):
+            self.assertEqual(limiter.reserve(max_wait=10), 0.5)
+            script.return_value = [0, b'42']
+            with self.assertRaises(rate_limiter.RateLimitExceeded):
+                limiter.reserve(max_wait=10)
+
+        self.assertEqual(script.call_args.kwargs['keys'], [f"ratelimit:{limiter.key}", "ratelimit:stats:mistral"])
+        self.assertEqual(script.call_args.kwargs['args'], [1.0, 1, 10])
+
+
+class RedisClientTests(SimpleTestCase):
+    def setUp(self):
+        from utils import redis_client
+        patcher = mock.patch.dict(redis_client._clients, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_clients_are_cached_per_url_and_timeout(self):
+        from utils import redis_client
+        with mock.patch('redis.Redis.from_url', side_effect=lambda url, **kwargs: mock.Mock(**kwargs)) as from_url:
+            fast = redis_client.get_client('redis://cache:6379/0', socket_timeout=0.5)
+            slow = redis_client.get_client('redis://cache:6379/0', socket_timeout=5)
+
+            self.assertIs(redis_client.get_client('redis://cache:6379/0', socket_timeout=0.5), fast)
+            self.assertIsNot(fast, slow)
+            self.assertEqual((fast.socket_timeout, slow.socket_timeout), (0.5, 5))
+            self.assertEqual(from_url.call_count, 2)
+
+
+class FakeMistralAsyncClient:
+    """Stands in for MistralAsyncClient: answers after `delay` and tracks requests in flight."""
+
+    def __init__(self, delay=0.02):
+        self.delay = delay
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.cancelled = 0
+        self.closed = False
+
+    async def chat(self, **kwargs):
+        import asyncio
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.in_flight -= 1
+        return mock.Mock(choices=[mock.Mock(message=mock.Mock(content='{"nom": "Mairie"}'))])
+
+    async def close(self):
+        self.closed = True
+
+
+class AsyncMistralTests(SimpleTestCase):
+    def setUp(self):
+        from core.utils.ai_utils import AIManager
+        # A bare manager, the shared singleton keeps its clients
+        self.manager = object.__new__(AIManager)
+        self.manager.mistral_api_key = 'key'
+        self.manager.mistral_config = {'default_model': 'mistral-small', 'max_tokens': 100, 'temperature': 0.1,
+                                       'max_in_flight': 2, 'request_timeout': 5}
+        limiter = mock.Mock(acquire_async=mock.AsyncMock(return_value=0.0))
+        patcher = mock.patch('core.utils.ai_utils.get_limiter', return_value=limiter)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _with_client(self, client):
+        patcher = mock.patch('core.utils.ai_utils.MistralAsyncClient', return_value=client)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return client
+
+    def test_in_flight_requests_are_bounded(self):
+        import asyncio
+        client = self._with_client(FakeMistralAsyncClient())
+        messages = [{"role": "user", "content": "x"}]
+
+        async def run():
+            return await asyncio.gather(*[self.manager.send_mistral_request_async(messages) for _ in range(6)])
+
+        self.assertEqual(asyncio.run(run()), [{"nom": "Mairie"}] * 6)
+        self.assertEqual(client.max_in_flight, 2)
+
+    def test_metrics_are_recorded_off_the_loop_thread(self):
+        import asyncio
+        self._with_client(FakeMistralAsyncClient(delay=0))
+        threads = []
+        with mock.patch.object(model_router, 'record_call', side_effect=lambda *args, **kwargs: threads.append(threading.get_ident())):
+            asyncio.run(self.manager.send_mistral_request_async([], route='html_extraction'))
+
+        self.assertEqual(len(threads), 1)
+        self.assertNotEqual(threads[0], threading.get_ident())
+
+    def test_each_loop_gets_a_client_that_is_closed(self):
+        import asyncio
+        clients = [FakeMistralAsyncClient(delay=0) for _ in range(3)]
+        patcher = mock.patch('core.utils.ai_utils.MistralAsyncClient', side_effect=clients)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        async def request(close):
+            result = await self.manager.send_mistral_request_async([])
+            if close:
+                await self.manager.close_async_client()
+            return result
+
+        asyncio.run(request(close=True))
+        self.assertTrue(clients[0].closed)
+        # A loop that ended without closing its client: it is closed with the next loop's
+        asyncio.run(request(close=False))
+        self.assertFalse(clients[1].closed)
+        asyncio.run(request(close=False))
+        self.assertEqual([client.closed for client in clients], [True, True, False])
+
+    def test_deadline_cancels_the_request(self):
+        import asyncio
+        client = self._with_client(FakeMistralAsyncClient(delay=5))
+
+        result = asyncio.run(self.manager.send_mistral_request_async([], deadline=0.05))
+
+        self.assertIn("deadline", result["error"])
+        self.assertEqual(client.cancelled, 1)
+
+    def test_cancellation_propagates_and_frees_the_slot(self):
+        import asyncio
+        client = self._with_client(FakeMistralAsyncClient(delay=5))
+
+        async def run():
+            pending = [asyncio.create_task(self.manager.send_mistral_request_async([])) for _ in range(2)]
+            await asyncio.sleep(0.01)
+            for task in pending:
+                task.cancel()
+            outcomes = await asyncio.gather(*pending, return_exceptions=True)
+            client.delay = 0
+            return outcomes, await self.manager.send_mistral_request_async([], deadline=1)
+
+        outcomes, after = asyncio.run(run())
+        self.assertTrue(all(isinstance(outcome, asyncio.CancelledError) for outcome in outcomes))
+        self.assertEqual(client.cancelled, 2)
+        self.assertEqual(after, {"nom": "Mairie"})
+
+    @without_domain_history
+    def test_extractions_start_while_pages_download(self):
+        import asyncio
+        from scraping.tasks import prefetch_and_extract
+        fetcher = AsyncPageFetcher(max_concurrency=2, politeness=relaxed_politeness())
+        sites = {f"https://ville{i}.example": mock.Mock(domain=f"ville{i}.example", url=f"https://ville{i}.example")
+                 for i in range(3)}
+        started = []
+
+        def fetch(url):
+            time.sleep(0.02 * int(url[-9]))
+            return {"url": url, "final_url": url, "html": "<p>Mairie</p>", "error": None,
+                    "not_modified": url.startswith("https://ville2")}
+
+        async def extract(html, objective, json_structure, structure_schema=None, url=None):
+            started.append(json_structure["site_info"]["url"])
+            return {"nom": json_structure["site_info"]["name"]}
+
+        self.manager.analyze_html_content_async = extract
+        structure = mock.Mock(structure=None)
+        structure.name = "Mairies"
+        with mock.patch.object(fetcher, '_fetch_sync', side_effect=fetch):
+            pages, extractions = asyncio.run(prefetch_and_extract(fetcher, self.manager, structure, sites))
+
+        self.assertEqual(set(pages), set(sites))
+        self.assertEqual(started, ["https://ville0.example", "https://ville1.example"])
+        self.assertEqual(extractions["https://ville1.example"], {"nom": "ville1.example"})
+
+
+class ScrapingTaskFixtureMixin:
+    def setUp(self):
+        from core.models import ScrapingJob, ScrapingStructure
+        from scraping.models import ScrapedSite, ScrapingTask
+
+        user = get_user_model().objects.create_user(email='frontier@example.com', password='testpass123')
+        structure = ScrapingStructure.objects.create(user=user, name='Mairies', entity_type='mairie', structure=[])
+        job = ScrapingJob.objects.create(user=user, structure=structure, name='Mairies 69')
+        self.task = ScrapingTask.objects.create(job=job)
+        self.sites = [
+            ScrapedSite.objects.create(url=f"https://ville{i}.example/", domain=f"ville{i}.example", structure=structure)
+            for i in range(3)
+        ]
+
+
+class CanonicalizeUrlsMigrationTests(ScrapingTaskFixtureMixin, TestCase):
+    def test_existing_rows_are_canonicalized_and_merged(self):
+        import importlib
+        from django.apps import apps
+        from scraping.models import FrontierURL, ScrapedSite, ScrapingResult
+
+        migration = importlib.import_module('scraping.migrations.0011_canonicalize_urls')
+        structure = self.sites[0].structure
+        # Rows saved before URLs were canonicalized on save
+        legacy = ScrapedSite.objects.bulk_create([
+            ScrapedSite(url="https://VILLE0.example/?utm_source=x", domain="ville0.example", structure=structure, scraping_count=2),
+            ScrapedSite(url="https://ville3.example/a/", domain="ville3.example", structure=structure),
+        ])
+        FrontierURL.objects.bulk_create([
+            FrontierURL(task=self.task, site=legacy[0], url="https://ville0.example/contact/", status='done'),
+            FrontierURL(task=self.task, site=self.sites[0], url="https://ville0.example/contact", status='pending'),
+        ])
+        ScrapingResult.objects.bulk_create([
+            ScrapingResult(task=self.task, lead_data={}, source_url="https://ville0.example/contact/#equipe"),
+        ])
+
+        migration.canonicalize_urls(apps, None)
+
+        sites = ScrapedSite.objects.filter(structure=structure)
+        self.assertEqual(sorted(sites.values_list('url', flat=True)), [
+            "https://ville0.example/", "https://ville1.example/", "https://ville2.example/", "https://ville3.example/a",
+        ])
+        merged = sites.get(url="https://ville0.example/")
+        self.assertEqual(merged.id, self.sites[0].id)
+        self.assertEqual(merged.scraping_count, 2)
+        frontier_url = FrontierURL.objects.get(task=self.task)
+        self.assertEqual((frontier_url.url, frontier_url.status, frontier_url.site_id),
+                         ("https://ville0.example/contact", 'done', merged.id))
+        self.assertEqual(ScrapingResult.objects.get(task=self.task).source_url, "https://ville0.example/contact")
+        # get_or_create on the canonical URL now finds the stored site
+        _site, created = ScrapedSite.objects.get_or_create(url="https://ville3.example/a", structure=structure)
+        self.assertFalse(created)
+
+
+class CrawlFrontierTests(ScrapingTaskFixtureMixin, TestCase):
+    def test_checkpoint_survives_reload(self):
+        from scraping.models import ScrapingTask
+
+        CrawlFrontier(self.task).save_checkpoint(stage='exploring', urls_to_explore=["https://ville0.example/"])
+        frontier = CrawlFrontier(ScrapingTask.objects.get(pk=self.task.pk))
+
+        self.assertTrue(frontier.is_resuming)
+        self.assertEqual(frontier.checkpoint['urls_to_explore'], ["https://ville0.example/"])
+
+    def test_resume_continues_each_site_where_it_stopped(self):
+        frontier = CrawlFrontier(self.task)
+        frontier.seed(self.sites)
+        frontier.mark(self.sites[0].url, DONE)
+        frontier.add("https://ville0.example/contact", site=self.sites[0], depth=1)
+        frontier.mark(self.sites[1].url, FAILED)
+
+        # A redelivered task seeds again without duplicating or resetting anything
+        resumed = CrawlFrontier(self.task)
+        resumed.seed(self.sites)
+
+        self.assertEqual(resumed.resume_point(self.sites[0]), ("https://ville0.example/contact", 1))
+        self.assertEqual(resumed.resume_point(self.sites[1]), (None, 1))
+        self.assertEqual(resumed.resume_point(self.sites[2]), ("https://ville2.example/", 0))
+        self.assertEqual(resumed.visited_urls(), {self.sites[0].url, self.sites[1].url})
+        self.assertEqual(resumed.stats(), {'pending': 2, 'done': 1, 'failed': 1})
+
+    def test_near_duplicates_are_found_per_domain_across_workers(self):
+        first = CrawlFrontier(self.task)
+        first.add("https://ville0.example/mentions-legales", site=self.sites[0])
+        first.record_fingerprint("https://ville0.example/mentions-legales", 0xABCD)
+
+        # Another worker sees the fingerprint through the database
+        other = CrawlFrontier(self.task)
+        self.assertEqual(other.find_near_duplicate("https://ville0.example/plan-du-site", 0xABCF), ("https://ville0.example/mentions-legales", 1))
+        self.assertIsNone(other.find_near_duplicate("https://ville1.example/plan-du-site", 0xABCF))
+        self.assertIsNone(other.find_near_duplicate("https://ville0.example/mentions-legales", 0xABCD))
+
+    def test_extractions_are_reused_without_http_validators(self):
+        first = CrawlFrontier(self.task)
+        first.add("https://ville0.example/mentions-legales", site=self.sites[0])
+        first.add("https://ville0.example/plan-du-site", site=self.sites[0])
+        other = CrawlFrontier(self.task)
+        self.assertIsNone(other.find_near_duplicate("https://ville0.example/plan-du-site", 0xABCF))
+
+        first.record_extraction("https://ville0.example/mentions-legales", "structure-1", {"nom_entreprise": "Mairie"}, 0xABCD)
+
+        # The index of the other worker is only topped up with the rows updated since its last sync
+        match = other.find_near_duplicate("https://ville0.example/plan-du-site", 0xABCF)
+        self.assertEqual(match, ("https://ville0.example/mentions-legales", 1))
+        self.assertEqual(other.get_extraction(match[0], "structure-1"), {"nom_entreprise": "Mairie"})
+        self.assertIsNone(other.get_extraction(match[0], "structure-2"))
+        with self.assertNumQueries(1):
+            other.find_near_duplicate("https://ville0.example/agenda", 0x1234)
+
+    def test_url_variants_are_one_frontier_entry(self):
+        from scraping.models import FrontierURL, ScrapedSite, ScrapingResult
+
+        frontier = CrawlFrontier(self.task)
+        frontier.add("https://ville0.example/contact/?utm_campaign=x", site=self.sites[0])
+        frontier.add("HTTPS://VILLE0.example/contact#equipe", site=self.sites[0])
+        frontier.mark("https://ville0.example/contact?fbclid=abc", DONE)
+
+        self.assertEqual(FrontierURL.objects.filter(task=self.task).count(), 1)
+        self.assertTrue(CrawlFrontier(self.task).is_visited("https://ville0.example/contact/"))
+
+        site = ScrapedSite.objects.create(url="https://Ville9.example/?utm_source=serp", domain="ville9.example", structure=self.sites[0].structure)
+        result = ScrapingResult.objects.create(task=self.task, lead_data={}, source_url="https://ville9.example/contact/#top")
+        self.assertEqual(site.url, "https://ville9.example/")
+        self.assertEqual(result.source_url, "https://ville9.example/contact")
+
+
+class CircuitBreakerTests(ScrapingTaskFixtureMixin, TestCase):
+    URL = "https://ville0.example/contact"
+
+    def setUp(self):
+        super().setUp()
+        circuit_breaker.clear_memo()
+        self.addCleanup(circuit_breaker.clear_memo)
+
+    def _profile(self):
+        from scraping.models import DomainProfile
+        return DomainProfile.objects.get(domain="ville0.example")
+
+    def _fail(self, count):
+        for _ in range(count):
+            circuit_breaker.record_result(self.URL, False, 30.0)
+
+    def test_opens_on_failure_rate_and_cools_down_sites(self):
+        for _ in range(3):
+            circuit_breaker.record_result(self.URL, True, 0.5)
+        self._fail(2)
+        self.assertTrue(circuit_breaker.allow_request(self.URL))
+
+        self._fail(1)  # 3 failures out of 6
+        self.sites[0].refresh_from_db()
+
+        self.assertEqual(self._profile().circuit_state, circuit_breaker.OPEN)
+        self.assertFalse(circuit_breaker.allow_request(self.URL))
+        self.assertTrue(circuit_breaker.is_open("http://www.ville0.example/"))
+        self.assertTrue(self.sites[0].is_rate_limited)
+        self.assertFalse(self.sites[1].is_rate_limited)
+
+    def test_slow_successes_count_as_failures(self):
+        for _ in range(5):
+            circuit_breaker.record_result(self.URL, True, 25.0)
+        self.assertEqual(self._profile().circuit_state, circuit_breaker.OPEN)
+
+    def test_half_open_lets_one_probe_through(self):
+        from django.utils import timezone
+        from scraping.models import DomainProfile
+
+        self._fail(5)
+        DomainProfile.objects.filter(domain="ville0.example").update(circuit_open_until=timezone.now())
+        circuit_breaker.clear_memo()
+
+        self.assertTrue(circuit_breaker.allow_request(self.URL))
+        circuit_breaker.clear_memo()  # another worker
+        self.assertFalse(circuit_breaker.allow_request(self.URL))
+
+        # A failed probe reopens the circuit for twice as long
+        circuit_breaker.record_result(self.URL, False, 1.0)
+        profile = self._profile()
+        self.assertEqual((profile.circuit_state, profile.circuit_trips), (circuit_breaker.OPEN, 2))
+        self.assertGreater(profile.circuit_open_until, timezone.now() + timezone.timedelta(minutes=29))
+
+        DomainProfile.objects.filter(domain="ville0.example").update(circuit_open_until=timezone.now())
+        circuit_breaker.clear_memo()
+        self.assertTrue(circuit_breaker.allow_request(self.URL))
+        circuit_breaker.record_result(self.URL, True, 1.0)
+        self.assertEqual(self._profile().circuit_state, circuit_breaker.CLOSED)
+
+    def test_fetcher_skips_open_domain_without_request(self):
+        self._fail(5)
+        fetcher = AsyncPageFetcher(politeness=relaxed_politeness())
+
+        with mock.patch.object(http_client, 'get_limited') as get_limited:
+            result = fetcher.fetch(self.URL)
+
+        get_limited.assert_not_called()
+        self.assertIn("Circuit open", result["error"])
+
+
+class DomainLatencyTests(ScrapingTaskFixtureMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        adaptive_timeouts.clear_memo()
+        self.addCleanup(adaptive_timeouts.clear_memo)
+
+    def test_recorded_latencies_set_the_domain_timeouts(self):
+        default = http_client.get_timeout()
+        self.assertEqual(adaptive_timeouts.get_timeouts("https://ville0.example/"), default)
+
+        for _ in range(10):
+            adaptive_timeouts.record_latency("https://www.ville0.example/page", 0.3)
+        adaptive_timeouts.clear_memo()
+
+        self.assertEqual(adaptive_timeouts.get_timeouts("https://ville0.example/contact"), (2, 5))
+        self.assertEqual(adaptive_timeouts.get_timeouts("https://ville1.example/"), default)
+        self.assertEqual(adaptive_timeouts.browser_wait("https://ville0.example/"), 7)
+        # Without history the browser waits the minimum, not the HTTP read timeout
+        self.assertEqual(adaptive_timeouts.browser_wait("https://ville1.example/"), 7)
+
+        for _ in range(10):
+            adaptive_timeouts.record_latency("https://ville2.example/", 6)
+        adaptive_timeouts.clear_memo()
+        self.assertEqual(adaptive_timeouts.browser_wait("https://ville2.example/"), 16)
+
+    def test_retry_budget_is_shared_by_the_task(self):
+        first = adaptive_timeouts.RetryBudget(self.task, limit=2)
+        second = adaptive_timeouts.RetryBudget(self.task, limit=2)
+
+        self.assertEqual([first.try_spend(), second.try_spend(), first.try_spend()], [True, True, False])
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.retries_used, 2)
+
+
+class LLMCacheTests(TestCase):
+    MESSAGES = [{"role": "system", "content": "Extract"}, {"role": "user", "content": "<p>Mairie de Lyon</p>"}]
+
+    def setUp(self):
+        llm_cache._stats.clear()
+        patcher = mock.patch.object(llm_cache, '_redis', return_value=None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_key_ignores_whitespace_but_not_parameters_or_schema(self):
+        key = llm_cache.cache_key('large', self.MESSAGES, 0.7, 100)
+        reindented = [dict(message, content=f"  {message['content']}\n ") for message in self.MESSAGES]
+
+        self.assertEqual(llm_cache.cache_key('large', reindented, 0.7, 100), key)
+        self.assertNotEqual(llm_cache.cache_key('small', self.MESSAGES, 0.7, 100), key)
+        self.assertNotEqual(llm_cache.cache_key('large', self.MESSAGES, 0.2, 100), key)
+        schema = llm_cache.schema_hash([{"name": "nom_entreprise", "required": True}])
+        self.assertNotEqual(llm_cache.cache_key('large', self.MESSAGES, 0.7, 100, schema), key)
+
+    def test_answers_are_reused_until_they_expire(self):
+        from scraping.models import LLMCacheEntry
+        key = llm_cache.cache_key('large', self.MESSAGES)
+
+        self.assertIsNone(llm_cache.get(key, 'html_extraction'))
+        self.assertTrue(llm_cache.store(key, 'html_extraction', 'large', {"nom": "Lyon"}))
+        self.assertEqual(llm_cache.get(key, 'html_extraction'), {"nom": "Lyon"})
+        self.assertEqual(LLMCacheEntry.objects.get(key=key).hits, 1)
+        self.assertEqual(llm_cache.get_stats()['html_extraction'], {'hits': 1, 'misses': 1, 'stores': 1})
+
+        LLMCacheEntry.objects.filter(key=key).update(expires_at=timezone.now())
+        self.assertIsNone(llm_cache.get(key, 'html_extraction'))
+
+    def test_errors_and_bypassed_requests_are_not_cached(self):
+        key = llm_cache.cache_key('large', self.MESSAGES)
+
+        self.assertFalse(llm_cache.store(key, 'next_action', 'large', {"error": "API error: 503"}))
+        with llm_cache.bypass():
+            self.assertFalse(llm_cache.store(key, 'next_action', 'large', {"action": "stop"}))
+        llm_cache.store(key, 'next_action', 'large', {"action": "stop"})
+        with llm_cache.bypass():
+            self.assertIsNone(llm_cache.get(key, 'next_action'))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        from scraping.models import LLMCacheEntry
+        for index in range(4):
+            llm_cache.store(f"key{index}", 'serp_analysis', 'large', {"index": index})
+        LLMCacheEntry.objects.filter(key='key0').update(last_used_at=timezone.now() + timezone.timedelta(minutes=1))
+
+        self.assertEqual(llm_cache.evict(max_entries=2), 2)
+        self.assertEqual(set(LLMCacheEntry.objects.values_list('key', flat=True)), {'key0', 'key3'})
+
+    def test_redis_answers_before_the_database(self):
+        client = mock.Mock()
+        client.get.return_value = b'{"nom": "Lyon"}'
+
+        with mock.patch.object(llm_cache, '_redis', return_value=client), \
+             mock.patch('scraping.models.LLMCacheEntry.objects') as entries:
+            self.assertEqual(llm_cache.get('abc', 'html_extraction'), {"nom": "Lyon"})
+        entries.filter.assert_not_called()
+        client.hincrby.assert_called_once_with('llmcache:stats', 'html_extraction:hits', 1)
+
+    def test_identical_requests_cost_one_api_call(self):
+        from core.utils.ai_utils import AIManager
+        manager = object.__new__(AIManager)
+        manager.mistral_api_key = 'key'
+        manager.mistral_config = {'default_model': 'mistral-small', 'max_tokens': 100, 'temperature': 0.1}
+        manager.mistral_client = mock.Mock()
+        manager.mistral_client.chat.return_value = mock.Mock(
+            choices=[mock.Mock(message=mock.Mock(content='["mairie lyon", "mairie villeurbanne"]'))]
+        )
+
+        with mock.patch('core.utils.ai_utils.get_limiter'):
+            first = manager.generate_search_variations("mairies du Rhône")
+            second = manager.generate_search_variations("mairies du Rhône")
+
+        self.assertEqual(first, second)
+        self.assertEqual(manager.mistral_client.chat.call_count, 1)
+
+
+class BatchExtractionTests(ScrapingTaskFixtureMixin, TestCase):
+    SCHEMA = [
+        {"name": "nom_entreprise", "type": "text", "required": True},
+        {"name": "nom_contact", "type": "text", "required": True},
+        {"name": "secteur_activite", "type": "text", "required": True},
+    ]
+    PAGES = {
+        "https://ville0.example/": "<title>Ville 0</title><p>Bienvenue sur le site de la mairie.</p>",
+        "https://ville0.example/contact": "<h2>Contact</h2><p>Écrire à mairie@ville0.example</p>",
+        "https://ville0.example/equipe": "<h2>Équipe</h2><p>Marie Curie, maire</p>",
+    }
+
+    def explore(self, answer, frontier=None, fingerprints=None):
+        from core.utils.ai_utils import AIManager
+        from scraping import tasks
+        fingerprints = fingerprints or {}
+
+        structure = self.task.job.structure
+        structure.structure = self.SCHEMA
+        structure.save()
+        manager = object.__new__(AIManager)
+        manager.send_mistral_request = mock.Mock(return_value=answer)
+        fetcher = mock.Mock(fetch=lambda url: {"url": url, "html": self.PAGES[url], "error": None})
+        links = iter(["/contact", "/equipe", None])
+        next_action = lambda *args: (lambda href: {"action": "click_on_link", "href": href} if href else {"action": "go_next_page"})(next(links))
+        frontier = frontier or CrawlFrontier(self.task)
+        frontier.seed(self.sites[:1])
+
+        with mock.patch.object(tasks, 'analyze_next_action', side_effect=next_action), \
+             mock.patch.object(tasks, 'create_lead_from_result', return_value=mock.Mock(id=1)), \
+             mock.patch('utils.near_duplicate.page_fingerprint', side_effect=lambda html, url: fingerprints.get(url)), \
+             mock.patch('utils.page_store.store_page', return_value='hash'):
+            result = tasks.explore_site(self.task, self.task.job, structure, self.sites[0], manager, fetcher, frontier)
+        return manager, result
+
+    def test_site_pages_are_extracted_in_one_call(self):
+        from scraping.models import ScrapingResult
+
+        manager, result = self.explore({"nom_entreprise": "Ville 0", "nom_contact": "Marie Curie",
+                                        "secteur_activite": "Administration"})
+
+        self.assertEqual(manager.send_mistral_request.call_count, 1)
+        prompt = manager.send_mistral_request.call_args[0][0][1]['content']
+        for url in self.PAGES:
+            self.assertIn(url, prompt)
+        self.assertEqual((result["pages_explored"], result["leads_found"]), (3, 1))
+        lead_data = ScrapingResult.objects.get(task=self.task).lead_data
+        self.assertEqual(lead_data["nom_contact"], "Marie Curie")
+
+    def test_near_duplicate_pages_are_not_batched(self):
+        from utils import page_cache
+        answer = {"nom_entreprise": "Ville 0", "nom_contact": "Marie Curie", "secteur_activite": "Administration"}
+        key = page_cache.extraction_key(self.task.job.structure.id, self.SCHEMA)
+        frontier = CrawlFrontier(self.task)
+        frontier.add("https://ville0.example/elus", site=self.sites[0])
+        frontier.record_extraction("https://ville0.example/elus", key, answer, 0xABCD)
+
+        manager, result = self.explore(answer, frontier, fingerprints={"https://ville0.example/equipe": 0xABCF,
+                                                                       "https://ville0.example/contact": 0x1234})
+
+        self.assertEqual(manager.send_mistral_request.call_count, 1)
+        self.assertNotIn("https://ville0.example/equipe", manager.send_mistral_request.call_args[0][0][1]['content'])
+        self.assertEqual(result["pages_explored"], 3)
+        # The batch result is kept for each of its pages, with their fingerprints
+        self.assertEqual(CrawlFrontier(self.task).get_extraction("https://ville0.example/contact", key), answer)
+        self.assertEqual(CrawlFrontier(self.task).find_near_duplicate("https://ville0.example/agenda", 0x1235)[0],
+                         "https://ville0.example/contact")
+
+    @override_settings(SCRAPING_CONFIG={'batch_extraction': {'enabled': False}})
+    def test_disabled_extracts_page_by_page(self):
+        manager, result = self.explore({"nom_entreprise": "Ville 0", "nom_contact": "Marie Curie", "secteur_activite": "Mairie"})
+
+        self.assertEqual(manager.send_mistral_request.call_count, 3)
+        self.assertEqual(result["pages_explored"], 3)
+
+
+def navigation_page(*links):
+    anchors = ''.join(f'<a href="{href}">{text}</a>' for href, text in links)
+    return f"<html><body><nav>{anchors}</nav><p>{'Bienvenue sur le site de la commune. ' * 5}</p></body></html>"
+
+
+class LinkScorerTests(ScrapingTaskFixtureMixin, TestCase):
+    BASE = "https://ville0.example/"
+
+    def setUp(self):
+        super().setUp()
+        link_scorer.clear_memo()
+        self.addCleanup(link_scorer.clear_memo)
+
+    def test_contact_pages_rank_first_and_are_followed(self):
+        html = navigation_page(("/", "Accueil"), ("/actualites/2024/fete", "Actualités"), ("/nous-contacter", "Nous contacter"),
+                               ("https://www.linkedin.com/company/ville0", "LinkedIn"), ("mailto:mairie@ville0.example", "Écrire"))
+        ranked = link_scorer.rank_links(html, self.BASE)
+
+        self.assertEqual(ranked[0][1], "https://ville0.example/nous-contacter")
+        self.assertNotIn("linkedin", ' '.join(url for _, url, _ in ranked))
+        self.assertEqual(link_scorer.decide(ranked), ('click_on_link', "https://ville0.example/nous-contacter"))
+
+    def test_explored_and_unpromising_links_end_the_site(self):
+        html = navigation_page(("/agenda", "Agenda"), ("/contact", "Contact"))
+        manager = mock.Mock()
+        structure = mock.Mock()
+        structure.name = "Mairies"
+        json_structure = {"contacts": [], "meta_data": {"explored_links": [self.BASE, "https://ville0.example/contact"]}}
+
+        from scraping.tasks import analyze_next_action
+        self.assertEqual(analyze_next_action(html, json_structure, self.BASE, structure, manager), {"action": "go_next_page"})
+        manager.determine_next_action.assert_not_called()
+
+    def test_ambiguous_ranking_asks_the_llm_about_the_best_links_only(self):
+        html = navigation_page(("/a-propos", "À propos"), ("/qui-sommes-nous", "Qui sommes-nous"), ("/agenda", "Agenda"))
+        manager = mock.Mock()
+        manager.determine_next_action.return_value = {"action": "click_on_link", "href": "/qui-sommes-nous"}
+        structure = mock.Mock()
+        structure.name = "Mairies"
+
+        from scraping.tasks import analyze_next_action
+        action = analyze_next_action(html, {"contacts": []}, self.BASE, structure, manager)
+
+        prompt = manager.determine_next_action.call_args[0][0]
+        self.assertIn("/a-propos", prompt)
+        self.assertNotIn("/agenda", prompt)
+        self.assertEqual(action, {"action": "click_on_link", "href": "https://ville0.example/qui-sommes-nous"})
+
+    def test_weights_are_learned_from_links_that_produced_leads(self):
+        from core.models import Lead
+        from scraping.models import ScrapingResult
+
+        frontier = CrawlFrontier(self.task)
+        for i in range(6):
+            for path in (f"/trombinoscope-{i}", f"/galerie-{i}"):
+                frontier.add(f"https://ville{i % 3}.example{path}", site=self.sites[i % 3], depth=1)
+                frontier.mark(f"https://ville{i % 3}.example{path}", DONE)
+            result = ScrapingResult.objects.create(task=self.task, lead_data={}, source_url=f"https://ville{i % 3}.example/trombinoscope-{i}")
+            Lead.objects.create(user=self.task.job.user, name=f"Élu {i}", scraping_result=result)
+
+        weights = link_scorer.learned_weights()
+
+        self.assertGreater(weights["trombinoscope"], 0)
+        self.assertLess(weights["galerie"], 0)
+        ranked = link_scorer.rank_links(navigation_page(("/trombinoscope", "Les visages"), ("/plan", "Plan")), self.BASE)
+        self.assertEqual(ranked[0][1], "https://ville0.example/trombinoscope")
+
+
+class ScrapingFanoutTests(ScrapingTaskFixtureMixin, TestCase):
+    def test_finalize_aggregates_site_results(self):
+        from scraping.models import ScrapingTask
+        from scraping.tasks import finalize_scraping_task
+
+        self.task.pages_explored = 7
+        self.task.save()
+        CrawlFrontier(self.task).save_checkpoint(stage='dispatched', leads_before_dispatch=2)
+
+        result = finalize_scraping_task([
+            {"site_id": self.sites[0].id, "leads_found": 3, "pages_explored": 4},
+            {"site_id": self.sites[1].id, "leads_found": 0, "pages_explored": 3, "error": "boom"},
+        ], self.task.id)
+
+        task = ScrapingTask.objects.get(pk=self.task.pk)
+        self.assertEqual(result["leads_found"], 5)
+        self.assertEqual((task.status, task.leads_found, task.pages_explored), ('completed', 5, 7))
+        self.assertEqual(task.task_data['checkpoint']['stage'], 'completed')
+
+    def test_redelivered_task_does_not_dispatch_again(self):
+        from scraping import tasks
+        from scraping.models import ScrapingTask
+
+        for stage in ('dispatched', 'completed'):
+            ScrapingTask.objects.filter(pk=self.task.pk).update(status='crawling' if stage == 'dispatched' else 'completed')
+            self.task.refresh_from_db()
+            CrawlFrontier(self.task).save_checkpoint(stage=stage, urls_to_explore=["https://ville0.example/"])
+
+            with mock.patch.object(tasks, 'chord') as chord, mock.patch('core.utils.ai_utils.AIManager'):
+                result = tasks.run_scraping_task.run(self.task.id)
+
+            self.assertEqual(result["status"], stage)
+            chord.assert_not_called()
+            self.assertEqual(ScrapingTask.objects.get(pk=self.task.pk).status, self.task.status)
+
+    def test_site_subtask_never_raises(self):
+        from scraping import tasks
+
+        with mock.patch.object(tasks, 'explore_site', side_effect=RuntimeError("LLM down")), \
+             mock.patch('core.utils.ai_utils.AIManager'):
+            result = tasks.explore_site_task(self.task.id, self.sites[0].id)
+
+        self.assertEqual(result["error"], "LLM down")
+        self.assertEqual(result["leads_found"], 0)
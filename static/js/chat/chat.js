@@ -227,20 +227,8 @@ class ChatManager {
             this.scrollToBottom();
 
             try {
-                // Use AuthManager to make authenticated request
-                const response = await AuthManager.fetchWithAuth('/api/chat/send/', {
-                    method: 'POST',
-                    body: JSON.stringify({ message }),
-                });
-
-                // Remove thinking indicator
-                this.removeThinkingIndicator();
-
-                if (!response.ok) {
-                    throw new Error(`HTTP error! status: ${response.status}`);
-                }
-
-                const data = await response.json();
+                // The answer is shown as it is written, then replaced by the final message
+                const data = await this.streamChatResponse(message);
 
                 // Enhanced debugging for response data
                 console.log('Chat response received:', data);
@@ -317,6 +305,85 @@ class ChatManager {
         }
     }
 
+    async streamChatResponse(message) {
+        // Use AuthManager to make authenticated request
+        const response = await AuthManager.fetchWithAuth('/api/chat/stream/', {
+            method: 'POST',
+            body: JSON.stringify({ message }),
+        });
+
+        if (!response.ok) {
+            this.removeThinkingIndicator();
+            throw new Error(`HTTP error! status: ${response.status}`);
+        }
+
+        // Answers that are not a stream (e.g. not authenticated) are plain JSON
+        if (!(response.headers.get('Content-Type') || '').includes('text/event-stream')) {
+            this.removeThinkingIndicator();
+            return response.json();
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        let text = '';
+        let liveMessage = null;
+        let data = null;
+
+        try {
+            while (data === null) {
+                const { value, done } = await reader.read();
+                if (done) {
+                    break;
+                }
+                buffer += decoder.decode(value, { stream: true });
+
+                // Events are separated by a blank line
+                let boundary;
+                while ((boundary = buffer.indexOf('\n\n')) >= 0) {
+                    const event = this.parseServerSentEvent(buffer.slice(0, boundary));
+                    buffer = buffer.slice(boundary + 2);
+
+                    if (event.type === 'token') {
+                        if (!liveMessage) {
+                            this.removeThinkingIndicator();
+                            liveMessage = this.addMessage('', 'ai');
+                        }
+                        text += event.data.text;
+                        liveMessage.querySelector('.message-content').textContent = text;
+                        this.scrollToBottom();
+                    } else if (event.type === 'done') {
+                        data = event.data;
+                    }
+                }
+            }
+        } finally {
+            this.removeThinkingIndicator();
+            if (liveMessage) {
+                liveMessage.remove();
+            }
+        }
+
+        if (data === null) {
+            throw new Error('Chat stream ended without an answer');
+        }
+        return data;
+    }
+
+    parseServerSentEvent(block) {
+        const event = { type: 'message', data: null };
+        const dataLines = [];
+        for (const line of block.split('\n')) {
+            if (line.startsWith('event:')) {
+                event.type = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                dataLines.push(line.slice(5).trim());
+            }
+        }
+        event.data = dataLines.length ? JSON.parse(dataLines.join('\n')) : null;
+        return event;
+    }
+
     handleAIActions(actions) {
         // Make sure actions is treated as an array even if it's a single object or has nested actions
         let actionsArray = [];
@@ -139,8 +139,8 @@ class AuthManager {
                     });
                 }
 
-                if (url.includes('/api/chat/send/')) {
-                    console.log('Handling unauthenticated request to /api/chat/send/');
+                if (url.includes('/api/chat/send/') || url.includes('/api/chat/stream/')) {
+                    console.log(`Handling unauthenticated request to ${url}`);
                     return new Response(JSON.stringify({
                         success: false,
                         message: "Vous devez être connecté pour utiliser le chat."
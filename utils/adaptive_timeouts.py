@@ -0,0 +1,212 @@
+from django.conf import settings
+import logging
+import random
+import threading
+import time
+
+import requests
+
+from utils import http_client
+from utils.render_strategy import get_domain
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds (seconds) of the latency histogram buckets; the last bucket is open-ended
+LATENCY_BUCKETS = (0.25, 0.5, 1, 2, 4, 8, 15, 30, 60)
+
+# Defaults, overridable through SCRAPING_CONFIG['timeouts']
+DEFAULT_TIMEOUT_CONFIG = {
+    'enabled': True,
+    'min_samples': 5,            # responses needed before a domain gets its own timeouts
+    'max_samples': 200,          # histogram counts are halved past this, so recent latencies weigh more
+    'percentile': 0.95,
+    'multiplier': 2.0,           # read timeout = multiplier x observed percentile
+    'min_read': 5,               # seconds, fast hosts fail this fast
+    'max_read': 60,              # seconds, slow hosts never get more than this
+    'min_connect': 2,
+    'max_connect': 10,
+    'min_browser_wait': 7,       # seconds the browser waits for the DOM at least
+    'memo_ttl': 300,             # seconds a domain's timeouts are kept in process memory
+    # Retries of network errors (jittered exponential backoff, bounded per job)
+    'max_retries': 2,            # retries per request
+    'backoff_base': 1.0,         # seconds, doubled at each retry
+    'backoff_max': 15.0,
+    'job_retry_budget': 50,      # retries a whole ScrapingTask may spend
+}
+
+RETRYABLE_STATUS_CODES = (500, 502, 504)
+
+# In-process memo: domain -> ((connect, read), expires_at)
+_memo = {}
+_memo_lock = threading.Lock()
+
+def get_timeout_config():
+    """Return the adaptive timeout configuration merged with the defaults."""
+    config = dict(DEFAULT_TIMEOUT_CONFIG)
+    config.update(getattr(settings, 'SCRAPING_CONFIG', {}).get('timeouts', {}))
+    return config
+
+def bucket_index(seconds):
+    """Index of the histogram bucket a response time falls in."""
+    for index, bound in enumerate(LATENCY_BUCKETS):
+        if seconds <= bound:
+            return index
+    return len(LATENCY_BUCKETS)
+
+def percentile(histogram, fraction):
+    """
+    Upper bound of the bucket holding the given percentile of a latency histogram.
+
+    Returns:
+        float: Seconds (twice the last bound for the open-ended bucket), None for an empty histogram
+    """
+    total = sum(histogram)
+    if not total:
+        return None
+    threshold = total * fraction
+    running = 0
+    for index, count in enumerate(histogram):
+        running += count
+        if running >= threshold:
+            break
+    return LATENCY_BUCKETS[index] if index < len(LATENCY_BUCKETS) else LATENCY_BUCKETS[-1] * 2
+
+def timeouts_from_histogram(histogram, config):
+    """
+    Derive (connect, read) timeouts from a latency histogram.
+
+    Returns:
+        tuple: (connect, read) seconds, or None when the histogram has too few samples
+    """
+    if sum(histogram or []) < config['min_samples']:
+        return None
+    observed = percentile(histogram, config['percentile'])
+    read = min(config['max_read'], max(config['min_read'], observed * config['multiplier']))
+    connect = min(config['max_connect'], max(config['min_connect'], read / 4))
+    return (round(connect, 1), round(read, 1))
+
+def get_timeouts(url, default_read=None):
+    """
+    Return the (connect, read) timeouts to use for a URL.
+
+    Domains with enough recorded responses get timeouts derived from their observed
+    latency percentile; other domains get the configured HTTP defaults.
+
+    Args:
+        url (str): URL about to be fetched
+        default_read (float): Read timeout for domains without history, defaults to `read_timeout`
+
+    Returns:
+        tuple: (connect, read) in seconds, as accepted by requests
+    """
+    return _domain_timeouts(url) or http_client.get_timeout(read=default_read)
+
+def _domain_timeouts(url):
+    """(connect, read) timeouts learned for the domain of a URL, or None without enough history."""
+    config = get_timeout_config()
+    domain = get_domain(url)
+    if not config['enabled'] or not domain:
+        return None
+
+    with _memo_lock:
+        cached = _memo.get(domain)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+
+    timeouts = None
+    try:
+        from scraping.models import DomainProfile
+        histogram = DomainProfile.objects.filter(domain=domain).values_list('latency_histogram', flat=True).first()
+        timeouts = timeouts_from_histogram(histogram, config)
+    except Exception as e:
+        logger.warning(f"Could not load latency history for {domain}: {str(e)}")
+
+    with _memo_lock:
+        _memo[domain] = (timeouts, time.monotonic() + config['memo_ttl'])
+    return timeouts
+
+def browser_wait(url):
+    """
+    Seconds the browser should wait for a page of this domain to finish loading: the
+    minimum wait, or the read timeout derived from the domain's latencies when it has history.
+    """
+    minimum = get_timeout_config()['min_browser_wait']
+    timeouts = _domain_timeouts(url)
+    return max(minimum, timeouts[1]) if timeouts else minimum
+
+def record_latency(url, seconds):
+    """
+    Add a successful response time to the latency histogram of its domain.
+
+    Args:
+        url (str): URL that was fetched
+        seconds (float): Time until the body was received
+    """
+    config = get_timeout_config()
+    domain = get_domain(url)
+    if not config['enabled'] or not domain:
+        return
+    try:
+        from django.db import transaction
+        from scraping.models import DomainProfile
+
+        with transaction.atomic():
+            DomainProfile.objects.get_or_create(domain=domain)
+            profile = DomainProfile.objects.select_for_update().get(domain=domain)
+            histogram = list(profile.latency_histogram or []) or [0] * (len(LATENCY_BUCKETS) + 1)
+            histogram[bucket_index(seconds)] += 1
+            if sum(histogram) > config['max_samples']:
+                histogram = [count / 2 for count in histogram]
+            profile.latency_histogram = histogram
+            profile.save(update_fields=['latency_histogram', 'updated_at'])
+    except Exception as e:
+        logger.warning(f"Could not record latency for {domain}: {str(e)}")
+
+def clear_memo():
+    """Forget the in-process timeouts (tests, or after editing profiles by hand)."""
+    with _memo_lock:
+        _memo.clear()
+
+def is_retryable(error=None, status_code=None):
+    """Whether a failed request is worth retrying: timeouts, dropped connections and 500/502/504."""
+    if status_code is not None:
+        return status_code in RETRYABLE_STATUS_CODES
+    return isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout))
+
+def backoff_delay(attempt, config=None):
+    """Full-jitter exponential backoff: a random delay up to base x 2^attempt, capped."""
+    config = config or get_timeout_config()
+    return random.uniform(0, min(config['backoff_max'], config['backoff_base'] * 2 ** attempt))
+
+class RetryBudget:
+    """
+    Retries a ScrapingTask may still spend, shared by all the workers exploring it.
+
+    The count lives in `ScrapingTask.retries_used` and is taken with a conditional
+    UPDATE, so concurrent workers never overspend. Without a task the budget is
+    counted in memory.
+    """
+
+    def __init__(self, task=None, limit=None):
+        self.task = task
+        self.limit = get_timeout_config()['job_retry_budget'] if limit is None else limit
+        self._used = 0
+        self._lock = threading.Lock()
+
+    def try_spend(self):
+        """Take one retry from the budget; returns False once it is exhausted."""
+        if self.task is None:
+            with self._lock:
+                if self._used >= self.limit:
+                    return False
+                self._used += 1
+                return True
+
+        from django.db.models import F
+        from scraping.models import ScrapingTask
+        spent = ScrapingTask.objects.filter(pk=self.task.pk, retries_used__lt=self.limit).update(
+            retries_used=F('retries_used') + 1
+        )
+        if not spent:
+            logger.info(f"Retry budget of task {self.task.pk} exhausted ({self.limit} retries)")
+        return bool(spent)
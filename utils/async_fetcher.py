@@ -0,0 +1,239 @@
+import asyncio
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+
+import requests
+from django.conf import settings
+
+from utils import adaptive_timeouts, circuit_breaker, http_client, page_cache
+from utils.politeness import get_scheduler
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through SCRAPING_CONFIG['fetcher']
+DEFAULT_FETCHER_CONFIG = {
+    'max_concurrency': 10,
+    'per_domain_concurrency': 2,
+    'timeout': 30,               # read timeout for domains without latency history
+    'batch_size': 20,
+}
+
+def get_fetcher_config():
+    """Return the fetcher configuration merged with the defaults."""
+    config = dict(DEFAULT_FETCHER_CONFIG)
+    config.update(getattr(settings, 'SCRAPING_CONFIG', {}).get('fetcher', {}))
+    return config
+
+class AsyncPageFetcher:
+    """
+    Fetch many pages concurrently while capping the number of requests in flight,
+    both globally and per domain.
+
+    The HTTP calls themselves are blocking and run on a thread pool; an asyncio
+    event loop schedules them so that a slow host only holds its own slots.
+
+    Timeouts adapt to the latency history of each domain unless `timeout` is given,
+    and network errors are retried with jittered backoff while `retry_budget` allows.
+    """
+
+    def __init__(self, max_concurrency=None, per_domain_concurrency=None, timeout=None, politeness=None,
+                 retry_budget=None):
+        config = get_fetcher_config()
+        self.max_concurrency = max_concurrency or config['max_concurrency']
+        self.per_domain_concurrency = per_domain_concurrency or config['per_domain_concurrency']
+        self.timeout = timeout
+        self.default_timeout = config['timeout']
+        self.batch_size = config['batch_size']
+        self.politeness = politeness or get_scheduler()
+        self.retry_budget = retry_budget or adaptive_timeouts.RetryBudget()
+
+    @staticmethod
+    def _domain(url):
+        return urlparse(url).netloc.lower()
+
+    @staticmethod
+    def _new_result(url, error=None):
+        return {
+            "url": url,
+            "final_url": url,
+            "status_code": None,
+            "content_type": "",
+            "html": "",
+            "error": error,
+            "elapsed": 0.0,
+            "not_modified": False,
+        }
+
+    def _check_politeness(self, url):
+        """Return why the URL must not be fetched now, or None when it may be."""
+        # Failing domains are skipped at once instead of waiting for their timeouts
+        if not circuit_breaker.allow_request(url):
+            return "Circuit open for this domain"
+        blocked_for = self.politeness.blocked_for(url)
+        if blocked_for > 0:
+            return f"Domain throttled for another {blocked_for:.0f}s"
+        if not self.politeness.is_allowed(url):
+            return "Disallowed by robots.txt"
+        return None
+
+    def _timeout_for(self, url):
+        return self.timeout or adaptive_timeouts.get_timeouts(url, default_read=self.default_timeout)
+
+    def _get(self, url, headers):
+        """
+        GET a page, retrying timeouts, dropped connections and 500/502/504 answers.
+
+        Each retry waits a jittered exponential backoff and is taken from the retry
+        budget; once the budget or `max_retries` is exhausted the last outcome is returned.
+        """
+        config = adaptive_timeouts.get_timeout_config()
+        attempt = 0
+        while True:
+            start = time.monotonic()
+            try:
+                response = http_client.get_limited(url, timeout=self._timeout_for(url), headers=headers)
+                error = None
+            except (http_client.UnsupportedContentType, http_client.ResponseTooLarge):
+                raise
+            except requests.exceptions.RequestException as e:
+                response, error = None, e
+
+            if response is not None and response.status_code < 400:
+                adaptive_timeouts.record_latency(url, time.monotonic() - start)
+            retryable = adaptive_timeouts.is_retryable(error, response.status_code if response is not None else None)
+            if not retryable or attempt >= config['max_retries'] or not self.retry_budget.try_spend():
+                if error is not None:
+                    raise error
+                return response
+
+            attempt += 1
+            delay = adaptive_timeouts.backoff_delay(attempt, config)
+            logger.info(f"Retrying {url} in {delay:.1f}s (attempt {attempt + 1}): {error or response.status_code}")
+            time.sleep(delay)
+
+    def _fetch_sync(self, url):
+        """
+        Download a single page, revalidating it against the page cache when possible.
+
+        The body is streamed and capped (see http_client.get_limited); media and binary
+        responses are rejected from their headers without being downloaded.
+
+        Returns:
+            dict: url, final_url, status_code, content_type, html, error, elapsed seconds and
+                  not_modified (True when the server answered 304 and html comes from the cache)
+        """
+        start = time.monotonic()
+        result = self._new_result(url)
+        server_up = None
+        headers = {"User-Agent": self.politeness.config['user_agent']}
+        try:
+            entry = page_cache.get_entry(url)
+            headers.update(page_cache.conditional_headers(entry))
+            response = self._get(url, headers)
+            self.politeness.report_response(url, response)
+            result["final_url"] = response.url
+            result["status_code"] = response.status_code
+            result["content_type"] = response.headers.get("Content-Type", "")
+
+            cached_html = page_cache.load_body(url) if entry and response.status_code == 304 else None
+            if cached_html is not None:
+                page_cache.mark_revalidated(url, entry, response)
+                result["content_type"] = result["content_type"] or entry.get("content_type", "")
+                result["html"] = cached_html
+                result["not_modified"] = True
+            else:
+                if response.status_code == 304:
+                    # Cached body vanished between the lookup and the answer: fetch it again
+                    response = self._get(url, {"User-Agent": headers["User-Agent"]})
+                    result["status_code"] = response.status_code
+                response.raise_for_status()
+                result["html"] = response.text
+                page_cache.store_response(url, response, result["html"])
+        except (http_client.UnsupportedContentType, http_client.ResponseTooLarge) as e:
+            # The server answered, we just do not want its content
+            result["error"] = str(e)
+            server_up = True
+        except requests.exceptions.RequestException as e:
+            result["error"] = str(e)
+        result["elapsed"] = time.monotonic() - start
+        # Timeouts, connection errors and 5xx count against the domain, 4xx do not
+        if server_up is None:
+            server_up = result["status_code"] is not None and result["status_code"] < 500
+        circuit_breaker.record_result(url, server_up, result["elapsed"])
+        return result
+
+    async def _fetch_one(self, url, global_semaphore, domain_semaphores, executor):
+        domain_semaphore = domain_semaphores.setdefault(
+            self._domain(url), asyncio.Semaphore(self.per_domain_concurrency)
+        )
+        # Take the domain slot first so a slow domain never sits on a global slot
+        # while waiting for its own turn.
+        async with domain_semaphore:
+            loop = asyncio.get_running_loop()
+            # robots.txt may have to be downloaded, keep it off the event loop
+            refusal = await loop.run_in_executor(executor, self._check_politeness, url)
+            if refusal:
+                logger.info(f"Skipping {url}: {refusal}")
+                return self._new_result(url, error=refusal)
+
+            # Pace the domain (Crawl-delay / token bucket) before taking a global slot
+            delay = self.politeness.reserve(url)
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            async with global_semaphore:
+                return await loop.run_in_executor(executor, self._fetch_sync, url)
+
+    async def fetch_all_async(self, urls, on_result=None):
+        """
+        Fetch all URLs concurrently.
+
+        Args:
+            urls (list): URLs to fetch, duplicates are fetched once
+            on_result (callable): Coroutine function awaited with each result as soon as it
+                arrives, after its fetch slots are released (e.g. to start its extraction)
+
+        Returns:
+            dict: Mapping of URL to its fetch result
+        """
+        unique_urls = list(dict.fromkeys(url for url in urls if url))
+        if not unique_urls:
+            return {}
+
+        global_semaphore = asyncio.Semaphore(self.max_concurrency)
+        domain_semaphores = {}
+        start = time.monotonic()
+
+        async def fetch_and_report(url, executor):
+            result = await self._fetch_one(url, global_semaphore, domain_semaphores, executor)
+            if on_result is not None:
+                await on_result(result)
+            return result
+
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            results = await asyncio.gather(*[fetch_and_report(url, executor) for url in unique_urls])
+
+        failed = sum(1 for result in results if result["error"])
+        not_modified = sum(1 for result in results if result.get("not_modified"))
+        logger.info(
+            f"Fetched {len(results)} pages in {time.monotonic() - start:.2f}s "
+            f"({failed} failed, {not_modified} not modified, {len(domain_semaphores)} domains)"
+        )
+        return {result["url"]: result for result in results}
+
+    def fetch_all(self, urls):
+        """Synchronous entry point for callers running outside an event loop (Celery tasks)."""
+        return asyncio.run(self.fetch_all_async(urls))
+
+    def fetch(self, url):
+        """Fetch a single page synchronously, waiting for the domain's next slot."""
+        refusal = self._check_politeness(url)
+        if refusal:
+            logger.info(f"Skipping {url}: {refusal}")
+            return self._new_result(url, error=refusal)
+        delay = self.politeness.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+        return self._fetch_sync(url)
@@ -0,0 +1,258 @@
+from selenium import webdriver
+from selenium.webdriver.chrome.service import Service
+from selenium.webdriver.chrome.options import Options
+from selenium.common.exceptions import WebDriverException
+from webdriver_manager.chrome import ChromeDriverManager
+from contextlib import contextmanager
+from django.conf import settings
+import atexit
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through SCRAPING_CONFIG['browser']
+DEFAULT_BROWSER_CONFIG = {
+    'max_browsers': 2,            # warm headless browsers per worker process
+    'max_pages_per_browser': 50,  # recycle a browser after this many pages
+    'max_memory_mb': 500,         # recycle a browser whose process tree grows past this RSS
+    'page_load_timeout': 30,      # seconds
+    'lease_timeout': 60,          # seconds to wait for a free browser
+    'driver_path': None,          # explicit chromedriver path, skips ChromeDriverManager
+}
+
+# chromedriver is resolved once per process instead of once per site
+_driver_path = None
+_driver_path_lock = threading.Lock()
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+class BrowserPoolTimeout(Exception):
+    """Raised when no browser could be leased before the lease timeout."""
+
+def get_browser_config():
+    """Return the browser pool configuration merged with the defaults."""
+    config = dict(DEFAULT_BROWSER_CONFIG)
+    config.update(getattr(settings, 'SCRAPING_CONFIG', {}).get('browser', {}))
+    return config
+
+def get_driver_path():
+    """Return the chromedriver binary path, downloading it at most once per process."""
+    global _driver_path
+    if _driver_path:
+        return _driver_path
+
+    with _driver_path_lock:
+        if not _driver_path:
+            _driver_path = get_browser_config()['driver_path'] or ChromeDriverManager().install()
+            logger.info(f"Chromedriver resolved: {_driver_path}")
+    return _driver_path
+
+def _process_tree_rss_mb(pid):
+    """Resident memory of a process and all its descendants, in MB (Linux only, None elsewhere)."""
+    if not pid or not os.path.exists(f"/proc/{pid}"):
+        return None
+
+    total_kb = 0
+    pending = [pid]
+    seen = set()
+    while pending:
+        current = pending.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        try:
+            with open(f"/proc/{current}/status") as status:
+                for line in status:
+                    if line.startswith("VmRSS:"):
+                        total_kb += int(line.split()[1])
+                        break
+            for thread_id in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{thread_id}/children") as children:
+                    pending.extend(int(child) for child in children.read().split())
+        except (OSError, ValueError):
+            continue
+    return total_kb / 1024
+
+class PooledBrowser:
+    """A Chrome session owned by the pool, with its usage counters."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+        self.created_at = time.monotonic()
+
+    @property
+    def memory_mb(self):
+        try:
+            return _process_tree_rss_mb(self.driver.service.process.pid)
+        except AttributeError:
+            return None
+
+class BrowserPool:
+    """
+    Bounded pool of warm headless Chrome sessions.
+
+    Browsers are leased with `with pool.lease() as driver:` and returned to the pool
+    afterwards. A browser is recycled when it fails a health check, raised a
+    WebDriverException, served `max_pages_per_browser` pages or grew past `max_memory_mb`.
+    """
+
+    def __init__(self, max_browsers=None, max_pages_per_browser=None, max_memory_mb=None,
+                 page_load_timeout=None, lease_timeout=None):
+        config = get_browser_config()
+        self.max_browsers = max_browsers or config['max_browsers']
+        self.max_pages_per_browser = max_pages_per_browser or config['max_pages_per_browser']
+        self.max_memory_mb = max_memory_mb or config['max_memory_mb']
+        self.page_load_timeout = page_load_timeout or config['page_load_timeout']
+        self.lease_timeout = lease_timeout or config['lease_timeout']
+
+        self._idle = []
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self.stats = {"created": 0, "recycled": 0, "leases": 0}
+
+    def _create_driver(self):
+        options = Options()
+        options.add_argument("--headless")  # Invisible mode
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_experimental_option("excludeSwitches", ["enable-logging"])  # Suppress Selenium logs
+
+        driver = webdriver.Chrome(service=Service(get_driver_path()), options=options)
+        driver.set_page_load_timeout(self.page_load_timeout)
+        return driver
+
+    @staticmethod
+    def _is_healthy(browser):
+        try:
+            browser.driver.execute_script("return 1")
+            return True
+        except Exception:
+            return False
+
+    def _quit(self, browser, reason):
+        logger.info(f"Recycling browser after {browser.pages} pages ({reason})")
+        try:
+            browser.driver.quit()
+        except Exception as e:
+            logger.warning(f"Error while quitting browser: {str(e)}")
+        with self._condition:
+            self._size -= 1
+            self.stats["recycled"] += 1
+            self._condition.notify()
+
+    def _acquire(self, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            browser = None
+            create = False
+            with self._condition:
+                while not self._idle and self._size >= self.max_browsers:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or self._closed:
+                        raise BrowserPoolTimeout(f"No browser available after {timeout}s")
+                    self._condition.wait(remaining)
+
+                if self._closed:
+                    raise BrowserPoolTimeout("Browser pool is closed")
+                if self._idle:
+                    browser = self._idle.pop()
+                else:
+                    self._size += 1
+                    create = True
+
+            if create:
+                try:
+                    browser = PooledBrowser(self._create_driver())
+                except Exception:
+                    with self._condition:
+                        self._size -= 1
+                        self._condition.notify()
+                    raise
+                with self._condition:
+                    self.stats["created"] += 1
+                logger.info(f"Browser started ({self._size}/{self.max_browsers} in pool)")
+                return browser
+
+            if self._is_healthy(browser):
+                return browser
+            self._quit(browser, "failed health check")
+
+    def _release(self, browser, healthy):
+        browser.pages += 1
+        reason = None
+        if not healthy:
+            reason = "webdriver error"
+        elif browser.pages >= self.max_pages_per_browser:
+            reason = "page limit reached"
+        else:
+            memory_mb = browser.memory_mb
+            if memory_mb is not None and memory_mb > self.max_memory_mb:
+                reason = f"memory {memory_mb:.0f}MB"
+
+        if reason or self._closed:
+            self._quit(browser, reason or "pool closed")
+            return
+
+        with self._condition:
+            self._idle.append(browser)
+            self._condition.notify()
+
+    @contextmanager
+    def lease(self, timeout=None):
+        """Lease a browser for the duration of the `with` block."""
+        browser = self._acquire(timeout or self.lease_timeout)
+        with self._condition:
+            self.stats["leases"] += 1
+        healthy = True
+        try:
+            yield browser.driver
+        except WebDriverException:
+            healthy = False
+            raise
+        finally:
+            self._release(browser, healthy)
+
+    def warm(self, count=1):
+        """Start browsers ahead of time so the first JavaScript fallback does not pay the cold start."""
+        for _ in range(min(count, self.max_browsers)):
+            with self.lease():
+                pass
+
+    def shutdown(self):
+        """Quit every idle browser and refuse new leases."""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._condition.notify_all()
+        for browser in idle:
+            self._quit(browser, "pool shutdown")
+
+def get_browser_pool():
+    """Return the browser pool of the current worker process."""
+    global _pool, _pool_pid
+    if _pool is not None and _pool_pid == os.getpid():
+        return _pool
+
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = BrowserPool()
+            _pool_pid = os.getpid()
+    return _pool
+
+def shutdown_browser_pool():
+    """Shut down the pool of the current process, if any."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is not None and _pool_pid == os.getpid():
+            _pool.shutdown()
+        _pool = None
+        _pool_pid = None
+
+atexit.register(shutdown_browser_pool)
@@ -0,0 +1,180 @@
+from django.conf import settings
+from django.utils import timezone
+import logging
+import threading
+import time
+
+from utils.render_strategy import get_domain
+
+logger = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Defaults, overridable through SCRAPING_CONFIG['circuit_breaker']
+DEFAULT_CIRCUIT_CONFIG = {
+    'enabled': True,
+    'window_size': 20,             # last requests kept per domain
+    'min_requests': 5,             # requests in the window before the failure rate is trusted
+    'failure_rate': 0.5,           # open the circuit at this share of failed or slow requests
+    'slow_request_seconds': 20,    # a successful request slower than this counts as a failure
+    'cooldown_minutes': 15,        # first cooldown, doubled each time a probe fails
+    'max_cooldown_minutes': 24 * 60,
+    'probe_timeout': 120,          # seconds before a half-open probe that never reported is retried
+    'memo_ttl': 10,                # seconds a domain state is kept in process memory
+}
+
+# In-process memo: domain -> (state, open_until datetime or None, expires_at)
+_memo = {}
+_memo_lock = threading.Lock()
+
+def get_circuit_config():
+    """Return the circuit breaker configuration merged with the defaults."""
+    config = dict(DEFAULT_CIRCUIT_CONFIG)
+    config.update(getattr(settings, 'SCRAPING_CONFIG', {}).get('circuit_breaker', {}))
+    return config
+
+def _remember(domain, state, open_until):
+    with _memo_lock:
+        _memo[domain] = (state, open_until, time.monotonic() + get_circuit_config()['memo_ttl'])
+
+def _cached_state(domain):
+    with _memo_lock:
+        cached = _memo.get(domain)
+    if cached and cached[2] > time.monotonic():
+        return cached[0], cached[1]
+    return None
+
+def _load_state(domain):
+    cached = _cached_state(domain)
+    if cached:
+        return cached
+    from scraping.models import DomainProfile
+    row = DomainProfile.objects.filter(domain=domain).values_list('circuit_state', 'circuit_open_until').first()
+    state, open_until = row if row else (CLOSED, None)
+    _remember(domain, state, open_until)
+    return state, open_until
+
+def is_open(url):
+    """
+    Whether the domain of a URL is cooling down. Never changes the circuit state,
+    so it is safe for planning (use `allow_request` right before fetching).
+    """
+    config = get_circuit_config()
+    domain = get_domain(url)
+    if not config['enabled'] or not domain:
+        return False
+    try:
+        state, open_until = _load_state(domain)
+    except Exception as e:
+        logger.warning(f"Could not load circuit state for {domain}: {str(e)}")
+        return False
+    return state == OPEN and open_until is not None and open_until > timezone.now()
+
+def allow_request(url):
+    """
+    Whether a request to the domain of a URL may be sent now.
+
+    Closed circuits always allow. Open circuits refuse until their cooldown ends; the
+    first caller after that (from any worker) is let through as the half-open probe
+    and the others keep being refused until the probe reports back.
+
+    Args:
+        url (str): URL about to be fetched
+
+    Returns:
+        bool: False when the request must be skipped
+    """
+    config = get_circuit_config()
+    domain = get_domain(url)
+    if not config['enabled'] or not domain:
+        return True
+
+    try:
+        state, open_until = _load_state(domain)
+        now = timezone.now()
+        if state == CLOSED or (open_until is not None and open_until > now):
+            return state == CLOSED
+
+        # Cooldown over (or probe lost): the worker that wins the update sends the probe
+        from scraping.models import DomainProfile
+        probe_until = now + timezone.timedelta(seconds=config['probe_timeout'])
+        claimed = DomainProfile.objects.filter(
+            domain=domain, circuit_state=state, circuit_open_until=open_until,
+        ).update(circuit_state=HALF_OPEN, circuit_open_until=probe_until)
+        if claimed:
+            logger.info(f"Circuit for {domain} half-open, probing with {url}")
+            _remember(domain, HALF_OPEN, probe_until)
+            return True
+        with _memo_lock:
+            _memo.pop(domain, None)
+        return False
+    except Exception as e:
+        logger.warning(f"Could not check circuit for {domain}: {str(e)}")
+        return True
+
+def record_result(url, success, elapsed=0.0):
+    """
+    Add the outcome of a request to the rolling window of its domain and update the circuit.
+
+    Args:
+        url (str): URL that was fetched
+        success (bool): False for timeouts, connection errors and 5xx answers
+        elapsed (float): Seconds the request took; slow requests count as failures
+    """
+    config = get_circuit_config()
+    domain = get_domain(url)
+    if not config['enabled'] or not domain:
+        return
+
+    success = bool(success) and elapsed <= config['slow_request_seconds']
+    try:
+        from django.db import transaction
+        from scraping.models import DomainProfile
+
+        with transaction.atomic():
+            DomainProfile.objects.get_or_create(domain=domain)
+            profile = DomainProfile.objects.select_for_update().get(domain=domain)
+            outcomes = (list(profile.recent_outcomes or []) + [[success, round(elapsed, 2)]])[-config['window_size']:]
+            profile.recent_outcomes = outcomes
+            failures = sum(1 for outcome_success, _ in outcomes if not outcome_success)
+
+            if profile.circuit_state == HALF_OPEN:
+                trip = not success
+                if success:
+                    logger.info(f"Circuit for {domain} closed, probe succeeded")
+                    profile.circuit_state, profile.circuit_open_until, profile.circuit_trips = CLOSED, None, 0
+                    profile.recent_outcomes = []
+            elif profile.circuit_state == CLOSED:
+                trip = len(outcomes) >= config['min_requests'] and failures / len(outcomes) >= config['failure_rate']
+            else:
+                trip = False  # a request sent before the circuit opened
+
+            minutes = 0
+            if trip:
+                minutes = min(config['cooldown_minutes'] * 2 ** profile.circuit_trips, config['max_cooldown_minutes'])
+                profile.circuit_state = OPEN
+                profile.circuit_open_until = timezone.now() + timezone.timedelta(minutes=minutes)
+                profile.circuit_trips += 1
+            profile.save(update_fields=['recent_outcomes', 'circuit_state', 'circuit_open_until', 'circuit_trips', 'updated_at'])
+
+        _remember(domain, profile.circuit_state, profile.circuit_open_until)
+        if trip:
+            logger.warning(f"Circuit for {domain} open for {minutes} min ({failures}/{len(outcomes)} recent requests failed)")
+            _cool_down_sites(domain, profile.circuit_open_until)
+    except Exception as e:
+        logger.warning(f"Could not record request outcome for {domain}: {str(e)}")
+
+def _cool_down_sites(domain, until):
+    """Mirror an open circuit into `ScrapedSite.rate_limit_until` so planners skip the domain."""
+    from django.db.models import Q
+    from scraping.models import ScrapedSite
+    ScrapedSite.objects.filter(Q(domain__iexact=domain) | Q(domain__iexact=f"www.{domain}")).filter(
+        Q(rate_limit_until__isnull=True) | Q(rate_limit_until__lt=until)
+    ).update(rate_limit_until=until)
+
+def clear_memo():
+    """Forget the in-process circuit states (tests, or after editing profiles by hand)."""
+    with _memo_lock:
+        _memo.clear()
@@ -0,0 +1,279 @@
+from django.conf import settings
+from urllib.parse import urljoin
+import logging
+import re
+
+from lxml import etree
+
+from utils.structured_extractor import EMAIL_PATTERN, PHONE_PATTERN
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through SCRAPING_CONFIG['context']
+DEFAULT_CONTEXT_CONFIG = {
+    'enabled': True,
+    'token_budget': 3000,        # tokens of page content sent per call
+    'fallback_budget': 1500,     # tokens for follow-up calls on the same page (e.g. the sector lookup)
+    'model_budgets': {},         # per-model overrides of token_budget
+    'max_block_tokens': 300,     # longer blocks are split so one wall of text cannot take the budget
+    'neighbor_weight': 0.5,      # share of the neighbours' signals a block inherits (name above a phone)
+}
+
+BLOCK_TAGS = {
+    'address', 'article', 'aside', 'blockquote', 'body', 'dd', 'div', 'dl', 'dt', 'fieldset', 'figcaption',
+    'footer', 'form', 'h1', 'h2', 'h3', 'h4', 'h5', 'h6', 'header', 'li', 'main', 'nav', 'ol', 'p', 'pre',
+    'section', 'table', 'tbody', 'td', 'th', 'thead', 'tr', 'ul', 'br', 'hr',
+}
+HEADING_TAGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+SKIPPED_TAGS = {'script', 'style', 'noscript', 'svg', 'iframe', 'template', 'canvas', 'object'}
+SOCIAL_HOSTS = ('linkedin.com', 'twitter.com', 'x.com', 'facebook.com', 'instagram.com', 'youtube.com')
+
+CONTACT_TERMS = (
+    'contact', 'adresse', 'address', 'tél', 'tel.', 'tel :', 'téléphone', 'telephone', 'phone', 'e-mail',
+    'email', 'courriel', 'fax', 'horaires', 'siège', 'siret', 'directeur', 'directrice', 'responsable',
+    'président', 'presidente', 'maire', 'adjoint', 'gérant', 'fondateur', 'founder', 'ceo', 'équipe', 'team',
+    'mentions légales', 'legal notice', 'linkedin',
+)
+BOILERPLATE_TERMS = (
+    'cookie', 'javascript', 'newsletter', 'tous droits réservés', 'all rights reserved', 'mot de passe',
+    'password', 'panier', 'se connecter', 'log in', 'rechercher', 'search',
+)
+
+_TOKEN_PATTERN = re.compile(r'\w+|[^\w\s]', re.UNICODE)
+_POSTAL_CODE_PATTERN = re.compile(r'\b\d{5}\b')
+_WORD_PATTERN = re.compile(r'[^\W\d_]{4,}', re.UNICODE)
+
+def get_context_config():
+    """Return the context builder configuration merged with the defaults."""
+    config = dict(DEFAULT_CONTEXT_CONFIG)
+    config.update(getattr(settings, 'SCRAPING_CONFIG', {}).get('context', {}))
+    return config
+
+def estimate_tokens(text):
+    """
+    Approximate the number of tokens of a text for Mistral's BPE tokenizer.
+
+    Words count one token per four characters and every punctuation sign counts
+    one; within ~15% of the real tokenizer on French and English pages.
+    """
+    return sum(1 + (len(piece) - 1) // 4 for piece in _TOKEN_PATTERN.findall(text))
+
+def get_token_budget(model=None, config=None):
+    """Tokens of page content allowed in a prompt for a model."""
+    config = config or get_context_config()
+    return config['model_budgets'].get(model, config['token_budget'])
+
+def schema_terms(structure_schema):
+    """Words of the field names and labels of a structure schema (e.g. 'secteur', 'activite')."""
+    terms = set()
+    for field in structure_schema or []:
+        for key in ('name', 'label', 'description'):
+            value = str(field.get(key) or '').replace('_', ' ').lower()
+            terms.update(_WORD_PATTERN.findall(value))
+    return terms
+
+def _link_text(element, base_url):
+    """Text of a link, followed by its target when it carries contact data (mailto, tel, social profile)."""
+    text = ' '.join(''.join(element.itertext()).split())
+    href = (element.get('href') or '').strip()
+    lowered = href.lower()
+    if lowered.startswith(('mailto:', 'tel:')):
+        target = href.split(':', 1)[1].split('?')[0]
+        return f"{text} <{target}>" if target and target not in text else text
+    if any(host in lowered for host in SOCIAL_HOSTS):
+        return f"{text} <{urljoin(base_url, href) if base_url else href}>"
+    return text
+
+def extract_blocks(html, base_url=None):
+    """
+    Split a page into text blocks following its block-level elements.
+
+    The title, meta description and JSON-LD data come first. Scripts, styles and other
+    non-text elements are dropped. Plain text (no markup) is split on its lines.
+
+    Returns:
+        list: dicts with `text`, `heading` (bool) and `link_ratio` (share of link text)
+    """
+    if not html or not html.strip():
+        return []
+    if '<' not in html[:2000]:
+        return [{'text': line.strip(), 'heading': False, 'link_ratio': 0.0}
+                for line in html.splitlines() if line.strip()]
+
+    try:
+        if isinstance(html, str):
+            html = html.encode('utf-8', 'ignore')
+        root = etree.HTML(html, etree.HTMLParser(recover=True, encoding='utf-8'))
+    except (ValueError, etree.ParserError) as e:
+        logger.warning(f"Could not parse page for context building: {str(e)}")
+        return []
+    if root is None:
+        return []
+
+    blocks = []
+    head = []
+    title = root.findtext('.//title')
+    if title and title.strip():
+        head.append(f"PAGE TITLE: {' '.join(title.split())}")
+    for description in root.xpath("//meta[@name='description']/@content")[:1]:
+        head.append(f"META DESCRIPTION: {' '.join(description.split())}")
+    if head:
+        blocks.append({'text': '\n'.join(head), 'heading': True, 'link_ratio': 0.0})
+    for data in root.xpath("//script[@type='application/ld+json']/text()"):
+        data = ' '.join(data.split())
+        if data:
+            blocks.append({'text': f"STRUCTURED DATA: {data}", 'heading': False, 'link_ratio': 0.0})
+
+    current = []
+    link_chars = [0]
+
+    def flush(heading=False):
+        text = ' '.join(' '.join(current).split())
+        if text:
+            blocks.append({'text': text, 'heading': heading, 'link_ratio': min(1.0, link_chars[0] / len(text))})
+        current.clear()
+        link_chars[0] = 0
+
+    def walk(element):
+        tag = element.tag.lower() if isinstance(element.tag, str) else None
+        if tag in SKIPPED_TAGS or tag in ('head', 'title', 'meta') or tag is None:
+            if element.tail:
+                current.append(element.tail)
+            return
+        is_block = tag in BLOCK_TAGS
+        if is_block:
+            flush()
+        if tag == 'a':
+            text = _link_text(element, base_url)
+            current.append(text)
+            link_chars[0] += len(text)
+        else:
+            if element.text:
+                current.append(element.text)
+            for child in element:
+                walk(child)
+        if is_block:
+            flush(heading=tag in HEADING_TAGS)
+        if element.tail:
+            current.append(element.tail)
+
+    page_start = len(blocks)
+    try:
+        walk(root)
+    except RecursionError:
+        # Pathologically nested markup: fall back to the whole text as one block
+        del blocks[page_start:]
+        current[:] = [' '.join(root.xpath('//body//text()[not(ancestor::script) and not(ancestor::style)]'))]
+    flush()
+    return blocks
+
+def _split_block(block, max_tokens):
+    """Split an oversized block on sentence boundaries into pieces of at most ~max_tokens."""
+    pieces, current, size = [], [], 0
+    for sentence in re.split(r'(?<=[.!?;])\s+', block['text']):
+        tokens = estimate_tokens(sentence)
+        if current and size + tokens > max_tokens:
+            pieces.append(' '.join(current))
+            current, size = [], 0
+        # A single huge "sentence" (e.g. a list without punctuation) is cut on words
+        while tokens > max_tokens:
+            words = sentence.split()
+            head = ' '.join(words[:max_tokens // 2])
+            pieces.append(head)
+            sentence = ' '.join(words[max_tokens // 2:])
+            tokens = estimate_tokens(sentence)
+        current.append(sentence)
+        size += tokens
+    if current:
+        pieces.append(' '.join(current))
+    return [dict(block, text=piece) for piece in pieces if piece]
+
+def score_block(block, terms=()):
+    """
+    Contact signals of a block: emails, phone numbers, postal codes, contact vocabulary
+    and words of the structure schema, minus boilerplate vocabulary.
+
+    Navigation (blocks made of links only, without contact targets) scores nothing.
+    """
+    text = block['text']
+    lowered = text.lower()
+    score = (
+        5 * len(EMAIL_PATTERN.findall(text))
+        + 4 * len(PHONE_PATTERN.findall(text))
+        + len(_POSTAL_CODE_PATTERN.findall(text))
+        + sum(1 for term in CONTACT_TERMS if term in lowered)
+        + 1.5 * sum(1 for word in set(_WORD_PATTERN.findall(lowered)) if word in terms)
+        - 2 * sum(1 for term in BOILERPLATE_TERMS if term in lowered)
+    )
+    if block['heading']:
+        score += 0.5
+    if block['link_ratio'] > 0.8 and score <= 1:
+        return 0.0
+    return max(0.0, score)
+
+def build_context(html, url=None, structure_schema=None, model=None, budget=None):
+    """
+    Condense a page into the text most likely to hold the requested data, within a token budget.
+
+    Blocks are ranked by signal density (score per token, plus part of their neighbours'
+    signals) and packed greedily; blocks without signals fill what is left in page order.
+    The kept blocks are returned in page order, gaps marked with "[...]".
+
+    Args:
+        html (str): Raw HTML (or formatted plain text) of the page
+        url (str): Page URL, to resolve social profile links
+        structure_schema (list): Fields of the ScrapingStructure, their words count as signals
+        model (str): Model the prompt is for, selects the budget
+        budget (int): Token budget, overrides the model's
+
+    Returns:
+        str: Page context for the prompt
+    """
+    config = get_context_config()
+    budget = budget or get_token_budget(model, config)
+    if not config['enabled']:
+        return (html or '')[:budget * 4]
+
+    blocks = []
+    seen = set()
+    for block in extract_blocks(html, url):
+        # Menus and footers repeated in several places of the page are sent once
+        if block['text'] in seen:
+            continue
+        seen.add(block['text'])
+        if estimate_tokens(block['text']) > config['max_block_tokens']:
+            blocks.extend(_split_block(block, config['max_block_tokens']))
+        else:
+            blocks.append(block)
+    if not blocks:
+        return ''
+
+    terms = schema_terms(structure_schema)
+    signals = [score_block(block, terms) for block in blocks]
+    sizes = [estimate_tokens(block['text']) + 1 for block in blocks]
+    total = sum(sizes)
+
+    ranked = []
+    for index, block in enumerate(blocks):
+        neighbours = (signals[index - 1] if index else 0) + (signals[index + 1] if index + 1 < len(blocks) else 0)
+        value = signals[index] + config['neighbor_weight'] * neighbours / 2
+        # Prose without signals still outranks navigation, to fill what the budget has left
+        filler = 0.01 if block['link_ratio'] <= 0.8 else 0.0
+        ranked.append((-(value / sizes[index] + filler), index))
+    ranked.sort()
+
+    kept, used = set(), 0
+    for _, index in ranked:
+        if used + sizes[index] <= budget:
+            kept.add(index)
+            used += sizes[index]
+
+    lines, previous = [], -1
+    for index in sorted(kept):
+        if previous >= 0 and index != previous + 1:
+            lines.append('[...]')
+        lines.append(blocks[index]['text'])
+        previous = index
+
+    logger.debug(f"Context for {url or 'page'}: {used}/{total} tokens, {len(kept)}/{len(blocks)} blocks kept")
+    return '\n'.join(lines)
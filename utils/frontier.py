@@ -0,0 +1,227 @@
+from datetime import timedelta
+import logging
+
+from django.utils import timezone
+
+from utils.near_duplicate import SimHashIndex, get_near_duplicate_config
+from utils.url_canonical import SeenURLSet, canonical_domain, canonicalize_url
+
+logger = logging.getLogger(__name__)
+
+# Overlap between two syncs of the fingerprint index, covers rows committed late by other workers
+FINGERPRINT_SYNC_OVERLAP = timedelta(seconds=30)
+
+PENDING = 'pending'
+DONE = 'done'
+FAILED = 'failed'
+
+def normalize_url(url):
+    """Canonical form of a URL as stored in the frontier (FrontierURL.url is 500 chars)."""
+    return canonicalize_url(url)[:500]
+
+class CrawlFrontier:
+    """
+    Persistent crawl state of a ScrapingTask.
+
+    URLs to explore live in the FrontierURL table with a priority and a status, and the
+    results of the paid planning steps (query generation, SERP, SERP analysis) are
+    checkpointed in `task.task_data['checkpoint']`. A task redelivered after a worker
+    restart or a time limit picks up from there instead of starting over.
+
+    URLs are stored canonicalized, so tracking parameters, fragments, default ports or
+    trailing slashes never make the same page look new. A Bloom-filter seen-set of the
+    URLs this process explored answers most `is_visited` calls without a query.
+    """
+
+    def __init__(self, task):
+        self.task = task
+        self.seen = SeenURLSet()
+        self._fingerprints = {}          # domain -> SimHashIndex of the pages extracted by the task
+        self._fingerprints_synced_at = None
+
+    @property
+    def checkpoint(self):
+        return (self.task.task_data or {}).get('checkpoint', {})
+
+    def save_checkpoint(self, **values):
+        """Merge values into the task checkpoint and persist it."""
+        task_data = dict(self.task.task_data or {})
+        checkpoint = dict(task_data.get('checkpoint', {}))
+        checkpoint.update(values)
+        checkpoint['updated_at'] = timezone.now().isoformat()
+        task_data['checkpoint'] = checkpoint
+        self.task.task_data = task_data
+        self.task.save(update_fields=['task_data'])
+
+    @property
+    def is_resuming(self):
+        """Whether a previous run of this task already planned its crawl."""
+        return bool(self.checkpoint.get('urls_to_explore'))
+
+    def seed(self, sites):
+        """
+        Add the landing page of each site, keeping the given order as priority.
+
+        Sites already in the frontier (previous run) are left untouched.
+        """
+        from scraping.models import FrontierURL
+
+        total = len(sites)
+        FrontierURL.objects.bulk_create(
+            [
+                FrontierURL(task=self.task, site=site, url=normalize_url(site.url), priority=total - index, depth=0)
+                for index, site in enumerate(sites)
+            ],
+            ignore_conflicts=True,
+        )
+
+    def add(self, url, site=None, depth=0, priority=0):
+        """Queue a URL discovered while exploring a site (no-op if already known)."""
+        from scraping.models import FrontierURL
+
+        FrontierURL.objects.get_or_create(
+            task=self.task, url=normalize_url(url),
+            defaults={'site': site, 'depth': depth, 'priority': priority},
+        )
+
+    def mark(self, url, status):
+        """Record that a URL was explored (DONE) or could not be (FAILED)."""
+        from scraping.models import FrontierURL
+
+        url = normalize_url(url)
+        updated = FrontierURL.objects.filter(task=self.task, url=url).update(status=status, updated_at=timezone.now())
+        if not updated:
+            FrontierURL.objects.get_or_create(task=self.task, url=url, defaults={'status': status})
+        if status != PENDING:
+            self.seen.add(url)
+
+    def visited_urls(self):
+        """URLs explored (or given up on) by previous runs of the task."""
+        from scraping.models import FrontierURL
+
+        return set(
+            FrontierURL.objects.filter(task=self.task)
+            .exclude(status=PENDING)
+            .values_list('url', flat=True)
+        )
+
+    def is_visited(self, url):
+        """Whether a URL was already explored, by this run or a previous one, from any site."""
+        from scraping.models import FrontierURL
+
+        url = normalize_url(url)
+        if url in self.seen:
+            return True
+        visited = FrontierURL.objects.filter(task=self.task, url=url).exclude(status=PENDING).exists()
+        if visited:
+            self.seen.add(url)
+        return visited
+
+    def explored_count(self):
+        """Number of pages explored so far by the task, across all sites."""
+        from scraping.models import FrontierURL
+
+        return FrontierURL.objects.filter(task=self.task).exclude(status=PENDING).count()
+
+    def resume_point(self, site):
+        """
+        Return where to continue exploring a site.
+
+        Returns:
+            tuple: (url, pages already explored) where url is the highest priority pending
+                   URL of the site, or None when the site has nothing left to explore
+        """
+        from scraping.models import FrontierURL
+
+        entries = FrontierURL.objects.filter(task=self.task, site=site)
+        explored = entries.exclude(status=PENDING).count()
+        pending = entries.filter(status=PENDING).order_by('-priority', 'depth', 'id').first()
+        return (pending.url if pending else None), explored
+
+    def record_fingerprint(self, url, fingerprint):
+        """Store the SimHash of an explored page so later near-duplicates can reuse its extraction."""
+        from scraping.models import FrontierURL
+
+        url = normalize_url(url)
+        FrontierURL.objects.filter(task=self.task, url=url).update(simhash=f"{fingerprint:016x}", updated_at=timezone.now())
+        self._index_for(canonical_domain(url)).add(url, fingerprint)
+
+    def record_extraction(self, url, key, extraction, fingerprint=None):
+        """
+        Store the extraction of an explored page, and its SimHash, for the rest of the task.
+
+        Unlike the page cache, this does not need the server to send validators: template
+        pages of dynamic sites are deduplicated too.
+        """
+        from scraping.models import FrontierURL
+
+        url = normalize_url(url)
+        values = {'extraction': {'key': key, 'result': extraction}, 'updated_at': timezone.now()}
+        if fingerprint is not None:
+            values['simhash'] = f"{fingerprint:016x}"
+        FrontierURL.objects.filter(task=self.task, url=url).update(**values)
+        if fingerprint is not None:
+            self._index_for(canonical_domain(url)).add(url, fingerprint)
+
+    def get_extraction(self, url, key):
+        """Extraction stored for a page of the task under `key`, or None."""
+        from scraping.models import FrontierURL
+
+        stored = (
+            FrontierURL.objects.filter(task=self.task, url=normalize_url(url))
+            .values_list('extraction', flat=True).first()
+        )
+        if isinstance(stored, dict) and stored.get('key') == key:
+            return stored.get('result')
+        return None
+
+    def _index_for(self, domain):
+        index = self._fingerprints.get(domain)
+        if index is None:
+            index = self._fingerprints[domain] = SimHashIndex(get_near_duplicate_config()['bands'])
+        return index
+
+    def _sync_fingerprints(self):
+        """
+        Index the fingerprints recorded by the task: all of them on the first call, then only
+        the rows updated since the previous sync (including by other workers).
+        """
+        from scraping.models import FrontierURL
+
+        synced_at = timezone.now()
+        rows = FrontierURL.objects.filter(task=self.task, simhash__isnull=False)
+        if self._fingerprints_synced_at is not None:
+            rows = rows.filter(updated_at__gte=self._fingerprints_synced_at - FINGERPRINT_SYNC_OVERLAP)
+        for url, fingerprint in rows.values_list('url', 'simhash'):
+            index = self._index_for(canonical_domain(url))
+            if url not in index:
+                index.add(url, int(fingerprint, 16))
+        self._fingerprints_synced_at = synced_at
+
+    def find_near_duplicate(self, url, fingerprint, max_distance=None):
+        """
+        Find a page of the same domain, already extracted by the task, whose text is a near-duplicate.
+
+        Returns:
+            tuple: (url, Hamming distance) of the closest page, or None
+        """
+        if max_distance is None:
+            max_distance = get_near_duplicate_config()['max_distance']
+        url = normalize_url(url)
+        self._sync_fingerprints()
+        match = self._index_for(canonical_domain(url)).nearest(fingerprint, max_distance)
+        if match and match[0] == url:
+            return None
+        return match
+
+    def stats(self):
+        """Count the frontier URLs by status."""
+        from django.db.models import Count
+        from scraping.models import FrontierURL
+
+        counts = dict(
+            FrontierURL.objects.filter(task=self.task)
+            .values_list('status')
+            .annotate(total=Count('id'))
+        )
+        return {status: counts.get(status, 0) for status in (PENDING, DONE, FAILED)}
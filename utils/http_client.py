@@ -0,0 +1,205 @@
+import logging
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through SCRAPING_CONFIG['http']
+DEFAULT_HTTP_CONFIG = {
+    'pool_connections': 50,  # number of per-host pools kept alive
+    'pool_maxsize': 10,      # connections kept alive per host
+    'pool_block': False,     # when False, extra connections are opened then discarded
+    'connect_timeout': 5,    # seconds
+    'read_timeout': 30,      # seconds
+    'max_page_bytes': 2 * 1024 * 1024,   # decoded bytes kept from an HTML page
+    'max_pdf_bytes': 20 * 1024 * 1024,   # PDFs above this are not downloaded
+    'chunk_size': 64 * 1024,
+}
+
+# Content types worth downloading when scraping pages
+PAGE_CONTENT_TYPES = ('text/html', 'application/xhtml+xml', 'text/plain', 'text/xml', 'application/xml')
+PDF_CONTENT_TYPES = ('application/pdf', 'application/x-pdf')
+
+class UnsupportedContentType(requests.exceptions.RequestException):
+    """The server announced a content type we do not want to download (media, archives, binaries)."""
+
+class ResponseTooLarge(requests.exceptions.RequestException):
+    """The body is larger than the configured cap and cannot be truncated."""
+
+# One session per worker process, created lazily so that Celery prefork
+# children never inherit sockets opened by the parent.
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
+
+def get_http_config():
+    """Return the HTTP client configuration merged with the defaults."""
+    config = dict(DEFAULT_HTTP_CONFIG)
+    config.update(getattr(settings, 'SCRAPING_CONFIG', {}).get('http', {}))
+    return config
+
+def get_session():
+    """
+    Return the worker-wide pooled session.
+
+    All outgoing HTTP calls (page fetches, Serper, OpenAI) should go through this
+    session so that TCP/TLS connections are kept alive and reused per host.
+    """
+    global _session, _session_pid
+
+    if _session is not None and _session_pid == os.getpid():
+        return _session
+
+    with _session_lock:
+        if _session is None or _session_pid != os.getpid():
+            config = get_http_config()
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=config['pool_connections'],
+                pool_maxsize=config['pool_maxsize'],
+                pool_block=config['pool_block'],
+            )
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            _session = session
+            _session_pid = os.getpid()
+            logger.info(
+                f"HTTP session created for process {_session_pid} "
+                f"(pools: {config['pool_connections']}, per host: {config['pool_maxsize']})"
+            )
+    return _session
+
+def get_timeout(connect=None, read=None):
+    """Build a (connect, read) timeout tuple from the configuration."""
+    config = get_http_config()
+    return (connect or config['connect_timeout'], read or config['read_timeout'])
+
+def request(method, url, **kwargs):
+    """
+    Send a request through the pooled session.
+
+    Accepts the same keyword arguments as requests.request. A scalar `timeout`
+    is used as the read timeout, the connect timeout comes from the configuration.
+    """
+    timeout = kwargs.pop('timeout', None)
+    if not isinstance(timeout, tuple):
+        timeout = get_timeout(read=timeout)
+    return get_session().request(method, url, timeout=timeout, **kwargs)
+
+def get(url, **kwargs):
+    return request('GET', url, **kwargs)
+
+def post(url, **kwargs):
+    return request('POST', url, **kwargs)
+
+def get_limited(url, max_bytes=None, allowed_types=PAGE_CONTENT_TYPES, truncate=True, **kwargs):
+    """
+    GET a URL without ever holding more than `max_bytes` of its body in memory.
+
+    Headers are checked before the body is read: a successful response whose
+    Content-Type is not in `allowed_types` is rejected, and so is a Content-Length
+    above the cap when `truncate` is False. The body is then streamed and decoded
+    (gzip/deflate/br) chunk by chunk, and reading stops at the cap, so compressed
+    bombs are cut short as well.
+
+    Args:
+        url (str): URL to download
+        max_bytes (int): Cap on the decoded body, defaults to `max_page_bytes`
+        allowed_types (tuple): Accepted Content-Type prefixes, None to accept anything
+        truncate (bool): Keep the first `max_bytes` of an oversized body instead of failing
+        **kwargs: Passed to requests (headers, timeout...)
+
+    Returns:
+        requests.Response: Response whose `content`/`text` hold at most `max_bytes`,
+                           with a `truncated` attribute
+
+    Raises:
+        UnsupportedContentType, ResponseTooLarge, or any requests exception
+    """
+    config = get_http_config()
+    max_bytes = max_bytes or config['max_page_bytes']
+    response = request('GET', url, stream=True, **kwargs)
+    response.truncated = False
+
+    try:
+        if response.ok:
+            content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+            if allowed_types and content_type and not content_type.startswith(allowed_types):
+                raise UnsupportedContentType(f"Content-Type {content_type} not downloaded for {url}", response=response)
+
+            content_length = response.headers.get('Content-Length', '')
+            if not truncate and content_length.isdigit() and int(content_length) > max_bytes:
+                raise ResponseTooLarge(f"{url} is {int(content_length)} bytes (cap {max_bytes})", response=response)
+
+        chunks = []
+        received = 0
+        for chunk in response.iter_content(chunk_size=config['chunk_size']):
+            chunks.append(chunk)
+            received += len(chunk)
+            if received >= max_bytes:
+                response.truncated = received > max_bytes or _has_more(response)
+                break
+
+        if response.truncated:
+            # Unread bytes are left on the socket: drop the connection instead of pooling it
+            response.raw.close()
+            if not truncate:
+                raise ResponseTooLarge(f"{url} exceeds {max_bytes} bytes", response=response)
+            logger.warning(f"Body of {url} truncated to {max_bytes} bytes")
+        response._content = b''.join(chunks)[:max_bytes]
+        response._content_consumed = True
+        return response
+    finally:
+        # Releases the connection, or drops it when the body was not read to the end
+        response.close()
+
+def _has_more(response):
+    """Whether bytes remain unread on a streamed response."""
+    try:
+        return bool(response.raw.read(1, decode_content=False))
+    except Exception:
+        return True
+
+def get_pool_stats():
+    """
+    Describe the connection pools of the current process.
+
+    Returns:
+        dict: One entry per "scheme://host:port" with connections opened,
+              requests sent and idle connections currently kept alive
+    """
+    if _session is None or _session_pid != os.getpid():
+        return {}
+
+    stats = {}
+    seen_adapters = set()
+    for adapter in _session.adapters.values():
+        if id(adapter) in seen_adapters:
+            continue
+        seen_adapters.add(id(adapter))
+
+        pools = adapter.poolmanager.pools
+        for key in list(pools.keys()):
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            stats[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle_connections": sum(1 for conn in list(pool.pool.queue) if conn is not None) if pool.pool else 0,
+                "max_size": pool.pool.maxsize if pool.pool else 0,
+            }
+    return stats
+
+def close_session():
+    """Close the pooled session and all its connections."""
+    global _session, _session_pid
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+        _session_pid = None
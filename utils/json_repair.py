@@ -0,0 +1,265 @@
+import json
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+_NUMBER_PATTERN = re.compile(r'-?(?:0|[1-9]\d*)(?:\.\d+)?(?:[eE][+-]?\d+)?')
+_LITERALS = {'true': 'true', 'false': 'false', 'null': 'null', 'True': 'true', 'False': 'false', 'None': 'null'}
+_PARTIAL_UNICODE_ESCAPE = re.compile(r'\\u[0-9a-fA-F]{0,3}$')
+_CONTROL_ESCAPES = {'\n': '\\n', '\r': '\\r', '\t': '\\t'}
+
+def find_json_start(text, containers='{['):
+    """Index of the first '{' or '[' of a text (after any prose or ``` fence), or -1."""
+    positions = [position for position in (text.find(container) for container in containers) if position >= 0]
+    return min(positions) if positions else -1
+
+def _scan(text, start):
+    """
+    Read the JSON value starting at `start` in one pass, keeping a stack of the open
+    containers, and repair what LLM answers commonly get wrong: raw newlines in strings,
+    trailing commas, Python literals and truncation.
+
+    Truncated output is cut after its last complete value (a string cut mid-way is kept
+    and closed) and the containers still open are closed. Text after the value is ignored.
+
+    Returns:
+        tuple: (repaired JSON text or None, whether the value was complete)
+    """
+    out = []
+    stack = []                      # closers of the open containers
+    in_string = escape = is_key = False
+    last = ''                       # last structural token: one of '{[,:', 'k' (key) or 'v' (value)
+    last_comma = -1
+    token_start = None              # out index of the number / literal being read
+    cut = (0, 0)                    # (len(out), len(stack)) after the last complete value
+
+    def end_token():
+        nonlocal token_start, last, cut
+        token = ''.join(out[token_start:])
+        if token in _LITERALS:
+            out[token_start:] = [_LITERALS[token]]
+            last, cut = 'v', (len(out), len(stack))
+        elif _NUMBER_PATTERN.fullmatch(token):
+            last, cut = 'v', (len(out), len(stack))
+        token_start = None
+
+    for char in text[start:]:
+        if in_string:
+            if escape:
+                escape = False
+                out.append(char)
+            elif char == '\\':
+                escape = True
+                out.append(char)
+            elif char == '"':
+                in_string = False
+                out.append(char)
+                if is_key:
+                    last = 'k'
+                else:
+                    last, cut = 'v', (len(out), len(stack))
+                    if not stack:
+                        return ''.join(out), True
+            else:
+                out.append(_CONTROL_ESCAPES.get(char, char))
+            continue
+
+        if token_start is not None and (char in ',:]}"' or char.isspace()):
+            end_token()
+        if char == '"':
+            is_key = bool(stack) and stack[-1] == '}' and last in ('{', ',')
+            in_string = True
+            out.append(char)
+        elif char in '{[':
+            stack.append('}' if char == '{' else ']')
+            out.append(char)
+            # An empty container is a valid value, what follows may be cut
+            last, cut = char, (len(out), len(stack))
+        elif char in '}]':
+            if not stack:
+                break
+            if last == ',':
+                out[last_comma] = ''
+            out.append(stack.pop())
+            last, cut = 'v', (len(out), len(stack))
+            if not stack:
+                return ''.join(out), True
+        elif char == ',':
+            last_comma = len(out)
+            out.append(char)
+            last = ','
+        elif char == ':':
+            out.append(char)
+            last = ':'
+        elif char.isspace():
+            out.append(char)
+        else:
+            if token_start is None:
+                token_start = len(out)
+            out.append(char)
+
+    # Truncated: keep a value string cut mid-way, then close what is open
+    if in_string and not is_key:
+        if escape:
+            out.pop()
+        tail = _PARTIAL_UNICODE_ESCAPE.search(''.join(out[-5:]))
+        if tail:
+            del out[len(out) - len(tail.group(0)):]
+        out.append('"')
+        cut = (len(out), len(stack))
+    elif token_start is not None:
+        end_token()
+    length, depth = cut
+    if not length:
+        return None, False
+    return ''.join(out[:length]) + ''.join(reversed(stack[:depth])), False
+
+def extract_json(text, containers='{['):
+    """
+    The first JSON object or array of a text (prose, ``` fences and trailing text removed),
+    repaired when malformed or truncated. Linear in the length of the text.
+
+    Returns:
+        str: JSON text, or None when the text holds none
+    """
+    if not text or not isinstance(text, str):
+        return None
+    start = find_json_start(text, containers)
+    if start < 0:
+        return None
+    repaired, complete = _scan(text, start)
+    if repaired is not None and not complete:
+        logger.info(f"Truncated JSON repaired ({len(text)} characters)")
+    return repaired
+
+def loads(text, containers='{['):
+    """
+    Parse the JSON of an LLM answer: as is when valid, otherwise the repaired first
+    object or array it contains (see `extract_json`).
+
+    Raises:
+        json.JSONDecodeError: When no JSON can be recovered
+    """
+    if not isinstance(text, str):
+        raise json.JSONDecodeError("Expected a string", str(text), 0)
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError as e:
+        error = e
+    repaired = extract_json(text, containers)
+    if repaired is None:
+        raise error
+    return json.loads(repaired, strict=False)
+
+def try_loads(text, default=None, containers='{['):
+    """`loads` returning `default` instead of raising when no JSON can be recovered."""
+    try:
+        return loads(text, containers)
+    except (json.JSONDecodeError, ValueError):
+        return default
+
+_STRING_ESCAPES = {'n': '\n', 't': '\t', 'r': '\r', 'b': '\b', 'f': '\f', '"': '"', '\\': '\\', '/': '/'}
+
+class StreamingFieldReader:
+    """
+    Incremental reader of a top-level string field of a JSON object received in chunks
+    (e.g. "response_chat" of a streamed chat answer), so its text can be shown as it
+    arrives. Each character is read once; parse the complete answer with `loads(reader.text)`.
+    """
+
+    def __init__(self, fields=('response_chat',)):
+        self.fields = tuple(fields)
+        self.field = None           # field being read, the first of `fields` met
+        self.done = False           # its string is closed
+        self._chunks = []
+        self._depth = 0
+        self._in_string = self._escape = self._is_key = self._capturing = False
+        self._unicode = None        # hex digits of a \u escape being read
+        self._high_surrogate = None
+        self._key = []
+        self._current_key = None
+        self._last = ''
+
+    @property
+    def text(self):
+        """The raw answer received so far."""
+        return ''.join(self._chunks)
+
+    def feed(self, chunk):
+        """
+        Add a chunk of the answer.
+
+        Returns:
+            str: Text of the field decoded from this chunk ('' when it holds none)
+        """
+        self._chunks.append(chunk)
+        if self.done:
+            return ''
+        decoded = []
+        for char in chunk:
+            if self._in_string:
+                self._read_string_char(char, decoded)
+            elif char == '"':
+                self._in_string = True
+                self._is_key = self._depth == 1 and self._last in ('{', ',')
+                self._key = []
+                if (self._depth == 1 and self._last == ':' and self.field is None
+                        and self._current_key in self.fields):
+                    self.field, self._capturing = self._current_key, True
+            elif char in '{[':
+                self._depth += 1
+                self._last = char
+            elif char in '}]':
+                self._depth -= 1
+                self._last = 'v'
+            elif char in ',:':
+                self._last = char
+            elif not char.isspace():
+                self._last = 'v'
+            if self.done:
+                break
+        return ''.join(decoded)
+
+    def _read_string_char(self, char, decoded):
+        if self._unicode is not None:
+            self._unicode += char
+            if len(self._unicode) == 4:
+                try:
+                    self._emit_code_point(int(self._unicode, 16), decoded)
+                except ValueError:
+                    self._emit('�', decoded)
+                self._unicode = None
+        elif self._escape:
+            self._escape = False
+            if char == 'u':
+                self._unicode = ''
+            else:
+                self._emit(_STRING_ESCAPES.get(char, char), decoded)
+        elif char == '\\':
+            self._escape = True
+        elif char == '"':
+            self._in_string = False
+            if self._is_key:
+                self._current_key, self._last = ''.join(self._key), 'k'
+            else:
+                self._last = 'v'
+                if self._capturing:
+                    self._capturing, self.done = False, True
+        else:
+            self._emit(char, decoded)
+
+    def _emit_code_point(self, code_point, decoded):
+        if 0xD800 <= code_point < 0xDC00:
+            self._high_surrogate = code_point
+            return
+        if 0xDC00 <= code_point < 0xE000 and self._high_surrogate is not None:
+            code_point = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code_point - 0xDC00)
+        self._high_surrogate = None
+        self._emit(chr(code_point), decoded)
+
+    def _emit(self, text, decoded):
+        if self._capturing:
+            decoded.append(text)
+        elif self._is_key:
+            self._key.append(text)
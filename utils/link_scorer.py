@@ -0,0 +1,222 @@
+from django.conf import settings
+from urllib.parse import urljoin, urlparse
+import logging
+import math
+import re
+import threading
+import time
+import unicodedata
+
+from lxml import etree
+
+from utils.url_canonical import canonicalize_url
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through SCRAPING_CONFIG['link_scorer']
+DEFAULT_LINK_SCORER_CONFIG = {
+    'enabled': True,
+    'max_links': 300,            # anchors of a page that are scored
+    'depth_penalty': 0.4,        # per path segment, deep pages rarely hold the organization's contacts
+    'query_penalty': 1.0,        # links with a query string (search, filters, pagination)
+    'min_score': 1.5,            # best link below this: the site is done
+    'confident_score': 4.0,      # best link above this is followed without asking the LLM
+    'ambiguity_margin': 1.0,     # otherwise, a best link this far ahead of the second is followed too
+    'llm_candidates': 8,         # links shown to the LLM when the ranking is ambiguous
+    # Weights learned from the followed links that produced leads
+    'history_size': 5000,        # most recent followed links the weights are learned from
+    'min_samples': 5,            # followed links a path term needs before it gets a learned weight
+    'learned_weight': 1.0,       # scale of the learned log-odds
+    'memo_ttl': 3600,            # seconds the learned weights are kept in process memory
+}
+
+# Prior weights of the words of anchors and paths (accents removed, hyphens as spaces)
+TERM_WEIGHTS = {
+    'contact': 4.0, 'contacts': 4.0, 'contactez': 4.0, 'nous contacter': 4.5, 'contact us': 4.5, 'coordonnees': 4.0,
+    'equipe': 3.0, 'team': 3.0, 'notre equipe': 3.5, 'organigramme': 3.0, 'direction': 2.0, 'dirigeants': 3.0,
+    'elus': 3.0, 'conseil municipal': 3.0, 'le maire': 2.5, 'annuaire': 2.0, 'services': 1.0, 'mairie': 1.0,
+    'mentions legales': 3.0, 'legal': 2.0, 'impressum': 3.0, 'qui sommes nous': 2.5, 'a propos': 2.5, 'about': 2.5,
+    'about us': 3.0, 'societe': 1.5, 'entreprise': 1.5, 'presentation': 1.5, 'agences': 1.5, 'implantations': 1.5,
+    'recrutement': -0.5, 'carrieres': -0.5, 'actualites': -1.0, 'actualite': -1.0, 'news': -1.0, 'blog': -1.0,
+    'agenda': -1.0, 'evenements': -1.0, 'galerie': -1.5, 'photos': -1.5, 'boutique': -1.5, 'shop': -1.5,
+    'panier': -3.0, 'cart': -3.0, 'connexion': -3.0, 'login': -3.0, 'compte': -2.0, 'inscription': -2.0,
+    'cookies': -2.0, 'confidentialite': -1.5, 'privacy': -1.5, 'rss': -3.0, 'plan du site': -0.5, 'sitemap': -0.5,
+}
+SKIPPED_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.svg', '.webp', '.zip', '.mp4', '.mp3', '.doc', '.docx',
+                      '.xls', '.xlsx', '.ppt', '.css', '.js', '.ico')
+SKIPPED_SCHEMES = ('mailto:', 'tel:', 'javascript:', 'data:', 'sms:', 'whatsapp:')
+
+_WORD_PATTERN = re.compile(r'[a-z0-9]+')
+
+# In-process memo of the learned weights: (weights, expires_at)
+_memo = {}
+_memo_lock = threading.Lock()
+
+def get_link_scorer_config():
+    """Return the link scorer configuration merged with the defaults."""
+    config = dict(DEFAULT_LINK_SCORER_CONFIG)
+    config.update(getattr(settings, 'SCRAPING_CONFIG', {}).get('link_scorer', {}))
+    return config
+
+def normalize_text(text):
+    """Lowercase words without accents separated by single spaces ('Mentions-Légales' -> 'mentions legales')."""
+    text = unicodedata.normalize('NFKD', str(text or '')).encode('ascii', 'ignore').decode('ascii').lower()
+    return ' '.join(_WORD_PATTERN.findall(text))
+
+def path_terms(url):
+    """Words of the path of a URL, the vocabulary the learned weights are keyed on."""
+    return set(normalize_text(urlparse(url).path).split())
+
+def _term_score(text, weights=TERM_WEIGHTS):
+    padded = f" {text} "
+    return sum(weight for term, weight in weights.items() if f" {term} " in padded)
+
+def _same_site(host, base_host):
+    return host.removeprefix('www.') == base_host.removeprefix('www.')
+
+def extract_links(html, base_url, limit=None):
+    """
+    Anchors of a page that lead to another page of the same site.
+
+    Returns:
+        list: (canonical url, anchor text) pairs, first occurrence of each URL
+    """
+    if not html or not base_url:
+        return []
+    try:
+        root = etree.HTML(html.encode('utf-8', 'ignore') if isinstance(html, str) else html,
+                          etree.HTMLParser(recover=True, encoding='utf-8'))
+    except (ValueError, etree.ParserError) as e:
+        logger.warning(f"Could not parse page for link scoring: {str(e)}")
+        return []
+    if root is None:
+        return []
+
+    base_host = urlparse(base_url).netloc.lower()
+    links, seen = [], set()
+    for anchor in root.iter('a'):
+        href = (anchor.get('href') or '').strip()
+        if not href or href.startswith('#') or href.lower().startswith(SKIPPED_SCHEMES):
+            continue
+        url = canonicalize_url(urljoin(base_url, href))
+        parsed = urlparse(url)
+        if parsed.scheme not in ('http', 'https') or not _same_site(parsed.netloc.lower(), base_host):
+            continue
+        if parsed.path.lower().endswith(SKIPPED_EXTENSIONS) or url in seen:
+            continue
+        seen.add(url)
+        text = ' '.join(''.join(anchor.itertext()).split()) or anchor.get('title') or anchor.get('aria-label') or ''
+        links.append((url, text))
+        if limit and len(links) >= limit:
+            break
+    return links
+
+def score_link(url, text, learned=None, config=None):
+    """
+    Score of a link: prior weights of the words of its anchor and path, learned weights of
+    its path words, minus penalties for depth and query strings.
+    """
+    config = config or get_link_scorer_config()
+    parsed = urlparse(url)
+    anchor = normalize_text(text)
+    path = normalize_text(parsed.path)
+    # Agreement between the anchor and the path adds half of the weaker signal
+    score = max(_term_score(anchor), _term_score(path)) + 0.5 * min(_term_score(anchor), _term_score(path))
+    if learned:
+        score += sum(learned.get(term, 0.0) for term in set(path.split()))
+    segments = [segment for segment in parsed.path.split('/') if segment]
+    score -= config['depth_penalty'] * max(0, len(segments) - 1)
+    if parsed.query:
+        score -= config['query_penalty']
+    return score
+
+def rank_links(html, base_url, visited=(), config=None):
+    """
+    Links of a page to other pages of the site, best first.
+
+    Args:
+        visited (iterable): URLs already explored, left out of the ranking
+
+    Returns:
+        list: (score, url, anchor text) tuples sorted by decreasing score
+    """
+    config = config or get_link_scorer_config()
+    visited = {canonicalize_url(url) for url in visited}
+    visited.add(canonicalize_url(base_url))
+    learned = learned_weights(config)
+    ranked = [
+        (score_link(url, text, learned, config), url, text)
+        for url, text in extract_links(html, base_url, config['max_links'])
+        if url not in visited
+    ]
+    ranked.sort(key=lambda item: -item[0])
+    return ranked
+
+def decide(ranked, config=None):
+    """
+    Next action from a ranking of links.
+
+    Returns:
+        tuple: ('click_on_link', url) for a clear winner, ('go_next_page', None) when no link
+        is worth following, ('ambiguous', candidates) when the LLM should choose among the best links
+    """
+    config = config or get_link_scorer_config()
+    if not ranked or ranked[0][0] < config['min_score']:
+        return 'go_next_page', None
+    best = ranked[0][0]
+    runner_up = ranked[1][0] if len(ranked) > 1 else float('-inf')
+    if best >= config['confident_score'] or best - runner_up >= config['ambiguity_margin']:
+        return 'click_on_link', ranked[0][1]
+    return 'ambiguous', [item for item in ranked[:config['llm_candidates']] if item[0] >= config['min_score']]
+
+def learned_weights(config=None):
+    """
+    Log-odds of each path word among the followed links that produced leads, against the
+    overall rate (a word of productive paths weighs more). Memoized for `memo_ttl` seconds.
+
+    Returns:
+        dict: path word -> weight, only for words seen in at least `min_samples` followed links
+    """
+    config = config or get_link_scorer_config()
+    with _memo_lock:
+        cached = _memo.get('weights')
+        if cached and cached[1] > time.monotonic():
+            return cached[0]
+
+    weights = {}
+    try:
+        from core.models import Lead
+        from scraping.models import FrontierURL
+        followed = list(
+            FrontierURL.objects.filter(depth__gt=0, status='done')
+            .order_by('-updated_at').values_list('task_id', 'url')[:config['history_size']]
+        )
+        if followed:
+            task_ids = {task_id for task_id, _ in followed}
+            productive = set(
+                Lead.objects.filter(scraping_result__task_id__in=task_ids)
+                .values_list('scraping_result__task_id', 'scraping_result__source_url')
+            )
+            counts = {}
+            for task_id, url in followed:
+                hit = (task_id, url) in productive
+                for term in path_terms(url):
+                    total, hits = counts.get(term, (0, 0))
+                    counts[term] = (total + 1, hits + hit)
+            overall_hits = sum(1 for task_id, url in followed if (task_id, url) in productive)
+            base = (overall_hits + 1) / (len(followed) - overall_hits + 1)
+            for term, (total, hits) in counts.items():
+                if total >= config['min_samples']:
+                    odds = (hits + 1) / (total - hits + 1)
+                    weights[term] = round(config['learned_weight'] * math.log(odds / base), 3)
+    except Exception as e:
+        logger.warning(f"Could not learn link weights: {str(e)}")
+
+    with _memo_lock:
+        _memo['weights'] = (weights, time.monotonic() + config['memo_ttl'])
+    return weights
+
+def clear_memo():
+    """Forget the learned weights of this process (tests, or after a bulk import of leads)."""
+    with _memo_lock:
+        _memo.clear()
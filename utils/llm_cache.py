@@ -0,0 +1,240 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.conf import settings
+from django.utils import timezone
+import hashlib
+import json
+import logging
+import threading
+
+from utils import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through SCRAPING_CONFIG['llm_cache']
+DEFAULT_LLM_CACHE_CONFIG = {
+    'enabled': True,
+    'redis_url': None,            # defaults to CELERY_BROKER_URL
+    'key_prefix': 'llmcache',
+    'socket_timeout': 0.5,        # seconds, a slow Redis falls back to the database
+    'retry_redis_after': 30,      # seconds before trying Redis again after a failure
+    'redis_ttl': 24 * 3600,       # seconds hot answers stay in Redis (capped by the entry TTL)
+    'default_ttl': 24 * 3600,     # seconds, for purposes missing from `ttl`
+    'ttl': {                      # seconds an answer is reused, per kind of request
+        'html_extraction': 30 * 24 * 3600,
+        'serp_analysis': 7 * 24 * 3600,
+        'search_variations': 7 * 24 * 3600,
+        'next_action': 7 * 24 * 3600,
+    },
+    'max_entries': 50000,         # database rows kept, the least recently used are evicted first
+    'evict_every': 500,           # stores of a process between two eviction passes
+}
+
+# Set by `bypass()`: requests of the current thread / asyncio task skip the cache
+_bypass = ContextVar('llm_cache_bypass', default=False)
+
+# In-process counters: purpose -> {'hits', 'misses', 'stores'}
+_stats = {}
+_stats_lock = threading.Lock()
+_stores_since_eviction = 0
+
+def get_llm_cache_config():
+    """Return the LLM cache configuration merged with the defaults."""
+    config = dict(DEFAULT_LLM_CACHE_CONFIG)
+    config.update(getattr(settings, 'SCRAPING_CONFIG', {}).get('llm_cache', {}))
+    if not config['redis_url']:
+        config['redis_url'] = redis_client.default_url()
+    return config
+
+@contextmanager
+def bypass():
+    """Send the requests made inside this block to the API even when a cached answer exists."""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+def is_active():
+    """Whether lookups and stores happen for the current context."""
+    return get_llm_cache_config()['enabled'] and not _bypass.get()
+
+def schema_hash(structure_schema):
+    """Short hash of a ScrapingStructure schema, so editing the schema invalidates its answers."""
+    if not structure_schema:
+        return ''
+    return hashlib.sha256(json.dumps(structure_schema, sort_keys=True, default=str).encode('utf-8')).hexdigest()[:16]
+
+def cache_key(model, messages, temperature=None, max_tokens=None, schema=''):
+    """
+    Key of a request: model, sampling parameters, schema hash and the messages with their
+    whitespace normalized (prompts built from templates differ only by indentation).
+    """
+    normalized = [
+        [message.get('role'), ' '.join(str(message.get('content', '')).split())]
+        for message in messages
+    ]
+    payload = json.dumps([model, temperature, max_tokens, schema, normalized], ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def _count(purpose, counter, config=None, client=None):
+    with _stats_lock:
+        stats = _stats.setdefault(purpose, {'hits': 0, 'misses': 0, 'stores': 0})
+        stats[counter] += 1
+    if client is not None:
+        try:
+            client.hincrby(f"{config['key_prefix']}:stats", f"{purpose}:{counter}", 1)
+        except Exception:
+            pass
+
+def _redis(config):
+    return redis_client.get_client(config['redis_url'], config['socket_timeout'])
+
+def _redis_failed(config, error):
+    redis_client.mark_down(config['redis_url'], config['retry_redis_after'])
+    logger.warning(f"LLM cache Redis unavailable, using the database only for {config['retry_redis_after']}s: {str(error)}")
+
+def get(key, purpose):
+    """
+    Return the cached answer of a request, Redis first then the database.
+
+    Database hits refresh the entry's LRU position and are copied back to Redis.
+
+    Returns:
+        The decoded answer, or None on a miss (or when the cache is bypassed)
+    """
+    if not is_active():
+        return None
+    config = get_llm_cache_config()
+    client = _redis(config)
+    redis_key = f"{config['key_prefix']}:{key}"
+    if client is not None:
+        try:
+            cached = client.get(redis_key)
+            if cached is not None:
+                _count(purpose, 'hits', config, client)
+                return json.loads(cached)
+        except Exception as e:
+            _redis_failed(config, e)
+            client = None
+
+    try:
+        from django.db.models import F
+        from scraping.models import LLMCacheEntry
+        now = timezone.now()
+        entry = LLMCacheEntry.objects.filter(key=key, expires_at__gt=now).only('response', 'expires_at').first()
+        if entry is None:
+            _count(purpose, 'misses', config, client)
+            return None
+        LLMCacheEntry.objects.filter(pk=entry.pk).update(last_used_at=now, hits=F('hits') + 1)
+    except Exception as e:
+        logger.warning(f"Could not read LLM cache entry {key[:12]}: {str(e)}")
+        return None
+
+    _count(purpose, 'hits', config, client)
+    if client is not None:
+        try:
+            ttl = min(config['redis_ttl'], int((entry.expires_at - now).total_seconds()))
+            if ttl > 0:
+                client.set(redis_key, json.dumps(entry.response, ensure_ascii=False), ex=ttl)
+        except Exception as e:
+            _redis_failed(config, e)
+    return entry.response
+
+def store(key, purpose, model, response, ttl=None):
+    """
+    Cache the answer of a request in Redis and the database.
+
+    Answers carrying an `error` (API failures, unparsable JSON) are never stored.
+
+    Args:
+        key (str): Key from `cache_key`
+        purpose (str): Kind of request, selects the TTL (e.g. 'html_extraction')
+        model (str): Model that answered
+        response: JSON-serializable answer
+        ttl (int): Seconds the answer is reused, defaults to the purpose's TTL
+
+    Returns:
+        bool: Whether the answer was stored
+    """
+    global _stores_since_eviction
+    if not is_active() or response in (None, '', [], {}):
+        return False
+    if isinstance(response, dict) and (response.get('error') or response.get('parsing_error')):
+        return False
+
+    config = get_llm_cache_config()
+    ttl = ttl or config['ttl'].get(purpose, config['default_ttl'])
+    now = timezone.now()
+    try:
+        from scraping.models import LLMCacheEntry
+        LLMCacheEntry.objects.update_or_create(key=key, defaults={
+            'purpose': purpose,
+            'model': model or '',
+            'response': response,
+            'expires_at': now + timezone.timedelta(seconds=ttl),
+            'last_used_at': now,
+        })
+    except Exception as e:
+        logger.warning(f"Could not store LLM cache entry {key[:12]}: {str(e)}")
+        return False
+
+    client = _redis(config)
+    if client is not None:
+        try:
+            client.set(f"{config['key_prefix']}:{key}", json.dumps(response, ensure_ascii=False),
+                       ex=min(config['redis_ttl'], ttl))
+        except Exception as e:
+            _redis_failed(config, e)
+            client = None
+    _count(purpose, 'stores', config, client)
+
+    _stores_since_eviction += 1
+    if _stores_since_eviction >= config['evict_every']:
+        _stores_since_eviction = 0
+        evict()
+    return True
+
+def evict(max_entries=None):
+    """
+    Delete expired entries, then the least recently used ones beyond `max_entries`.
+
+    Redis needs no pass of its own: its copies expire after `redis_ttl`.
+
+    Returns:
+        int: Number of database rows deleted
+    """
+    max_entries = get_llm_cache_config()['max_entries'] if max_entries is None else max_entries
+    try:
+        from scraping.models import LLMCacheEntry
+        deleted, _ = LLMCacheEntry.objects.filter(expires_at__lte=timezone.now()).delete()
+        cutoff = LLMCacheEntry.objects.order_by('-last_used_at').values_list('last_used_at', flat=True)[max_entries:max_entries + 1].first()
+        if cutoff is not None:
+            deleted += LLMCacheEntry.objects.filter(last_used_at__lte=cutoff).delete()[0]
+        if deleted:
+            logger.info(f"LLM cache: {deleted} entries evicted")
+        return deleted
+    except Exception as e:
+        logger.warning(f"Could not evict LLM cache entries: {str(e)}")
+        return 0
+
+def get_stats():
+    """Hits, misses and stores per purpose in this process."""
+    with _stats_lock:
+        return {purpose: dict(stats) for purpose, stats in _stats.items()}
+
+def get_cluster_stats():
+    """Hits, misses and stores per purpose recorded by every worker (empty without Redis)."""
+    config = get_llm_cache_config()
+    try:
+        client = _redis(config)
+        if client is None:
+            return {}
+        stats = {}
+        for field, value in client.hgetall(f"{config['key_prefix']}:stats").items():
+            purpose, counter = field.decode().rsplit(':', 1)
+            stats.setdefault(purpose, {})[counter] = int(value)
+        return stats
+    except Exception as e:
+        logger.warning(f"Could not read LLM cache metrics: {str(e)}")
+        return {}
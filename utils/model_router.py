@@ -0,0 +1,152 @@
+from django.conf import settings
+import logging
+import threading
+
+from utils import redis_client
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through SCRAPING_CONFIG['model_router']
+DEFAULT_MODEL_ROUTER_CONFIG = {
+    'enabled': True,
+    # Models tried for each kind of call, cheapest first; a call escalates to the next
+    # model when its answer fails validation (e.g. an extraction rejected by is_valid_contact)
+    'routes': {
+        'chat': ['mistral-small-latest', 'mistral-large-latest'],
+        'search_variations': ['mistral-small-latest'],
+        'next_action': ['mistral-small-latest'],
+        'classification': ['mistral-small-latest'],
+        'serp_analysis': ['mistral-small-latest', 'mistral-large-latest'],
+        'html_extraction': ['mistral-small-latest', 'mistral-large-latest'],
+    },
+    'redis_url': None,            # defaults to CELERY_BROKER_URL, for metrics shared by all workers
+    'key_prefix': 'modelrouter',
+    'socket_timeout': 0.5,
+    'retry_redis_after': 30,
+}
+
+COUNTERS = ('calls', 'errors', 'latency_ms', 'tokens', 'valid', 'invalid', 'escalations')
+
+# In-process metrics: (route, model) -> counters
+_stats = {}
+_stats_lock = threading.Lock()
+
+def get_model_router_config():
+    """Return the model router configuration merged with the defaults."""
+    config = dict(DEFAULT_MODEL_ROUTER_CONFIG)
+    overrides = getattr(settings, 'SCRAPING_CONFIG', {}).get('model_router', {})
+    config.update({key: value for key, value in overrides.items() if key != 'routes'})
+    config['routes'] = {**DEFAULT_MODEL_ROUTER_CONFIG['routes'], **overrides.get('routes', {})}
+    if not config['redis_url']:
+        config['redis_url'] = redis_client.default_url()
+    return config
+
+def _redis(config):
+    return redis_client.get_client(config['redis_url'], config['socket_timeout'])
+
+def _ladder(route, config):
+    return config['routes'].get(route) or []
+
+def choose(route, tier=0, default=None):
+    """
+    Model for a call of a route.
+
+    Args:
+        route (str): Kind of call, e.g. 'html_extraction'
+        tier (int): Rung of the route's ladder to start from (clipped), e.g. 1 for a complex chat message
+        default (str): Model used when routing is disabled or the route is unknown
+
+    Returns:
+        str: Model name, or `default`
+    """
+    config = get_model_router_config()
+    ladder = _ladder(route, config)
+    if not config['enabled'] or not ladder:
+        return default
+    return ladder[min(max(tier, 0), len(ladder) - 1)]
+
+def escalate(route, model):
+    """
+    Next, more capable model of a route after `model` gave an invalid answer.
+
+    Returns:
+        str: Model name, or None when `model` is already the last rung (or routing is disabled)
+    """
+    config = get_model_router_config()
+    ladder = _ladder(route, config)
+    if not config['enabled'] or model not in ladder or ladder.index(model) + 1 >= len(ladder):
+        return None
+    next_model = ladder[ladder.index(model) + 1]
+    record(route, model, escalations=1)
+    logger.info(f"Escalating {route} from {model} to {next_model}")
+    return next_model
+
+def record(route, model, **counters):
+    """
+    Add to the metrics of a route and model, in this process and in Redis when available.
+
+    Args:
+        **counters: Increments among COUNTERS, e.g. calls=1, latency_ms=840, tokens=2100
+    """
+    if not route:
+        return
+    with _stats_lock:
+        stats = _stats.setdefault((route, model or ''), dict.fromkeys(COUNTERS, 0))
+        for counter, value in counters.items():
+            stats[counter] += value
+
+    config = get_model_router_config()
+    client = _redis(config)
+    if client is None:
+        return
+    try:
+        pipe = client.pipeline(transaction=False)
+        for counter, value in counters.items():
+            pipe.hincrby(f"{config['key_prefix']}:stats", f"{route}:{model}:{counter}", int(value))
+        pipe.execute()
+    except Exception as e:
+        redis_client.mark_down(config['redis_url'], config['retry_redis_after'])
+        logger.warning(f"Model router metrics not shared, Redis unavailable: {str(e)}")
+
+def record_call(route, model, latency, tokens=0, error=False):
+    """Metrics of one API call: latency (seconds), tokens used and whether it failed."""
+    record(route, model, calls=1, latency_ms=int(latency * 1000), tokens=tokens or 0, errors=int(bool(error)))
+
+def record_validation(route, model, valid):
+    """Whether the answer of a call passed the caller's validation (success rate of the route)."""
+    record(route, model, **{'valid' if valid else 'invalid': 1})
+
+def summarize(stats):
+    """Add the average latency and tokens per call and the validation rate to raw counters."""
+    summary = {}
+    for key, counters in stats.items():
+        calls = counters.get('calls', 0)
+        validated = counters.get('valid', 0) + counters.get('invalid', 0)
+        summary[key] = dict(
+            counters,
+            avg_latency_ms=round(counters.get('latency_ms', 0) / calls) if calls else None,
+            avg_tokens=round(counters.get('tokens', 0) / calls) if calls else None,
+            success_rate=round(counters.get('valid', 0) / validated, 3) if validated else None,
+        )
+    return summary
+
+def get_stats():
+    """Metrics per 'route:model' in this process."""
+    with _stats_lock:
+        return summarize({f"{route}:{model}": dict(stats) for (route, model), stats in _stats.items()})
+
+def get_cluster_stats():
+    """Metrics per 'route:model' recorded by every worker (empty without Redis)."""
+    config = get_model_router_config()
+    try:
+        client = _redis(config)
+        if client is None:
+            return {}
+        stats = {}
+        for field, value in client.hgetall(f"{config['key_prefix']}:stats").items():
+            key, counter = field.decode().rsplit(':', 1)
+            stats.setdefault(key, {})[counter] = int(value)
+        return summarize(stats)
+    except Exception as e:
+        logger.warning(f"Could not read model router metrics: {str(e)}")
+        return {}
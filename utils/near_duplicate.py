@@ -0,0 +1,131 @@
+from collections import Counter
+from django.conf import settings
+import hashlib
+import logging
+import re
+
+from utils.html_formatter import format_extracted_html
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through SCRAPING_CONFIG['near_duplicate']
+DEFAULT_NEAR_DUPLICATE_CONFIG = {
+    'enabled': True,
+    'max_distance': 3,        # Hamming distance (out of 64 bits) under which two pages are near-duplicates
+    'bands': 4,               # LSH bands, must be > max_distance so every match shares a band
+    'shingle_size': 3,        # words per shingle
+    'min_words': 30,          # pages with less text are never considered near-duplicates
+}
+
+FINGERPRINT_BITS = 64
+
+_WORD_PATTERN = re.compile(r'\w+', re.UNICODE)
+
+def get_near_duplicate_config():
+    """Return the near-duplicate detection configuration merged with the defaults."""
+    config = dict(DEFAULT_NEAR_DUPLICATE_CONFIG)
+    config.update(getattr(settings, 'SCRAPING_CONFIG', {}).get('near_duplicate', {}))
+    return config
+
+def _hash64(value):
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'big')
+
+def simhash(text, shingle_size=3):
+    """
+    64-bit SimHash of a text over its word shingles, weighted by frequency.
+
+    Args:
+        text (str): Text to fingerprint
+        shingle_size (int): Words per shingle
+
+    Returns:
+        int: Fingerprint, 0 for a text without words
+    """
+    words = _WORD_PATTERN.findall(text.lower())
+    if len(words) < shingle_size:
+        shingles = Counter([' '.join(words)] if words else [])
+    else:
+        shingles = Counter(' '.join(words[i:i + shingle_size]) for i in range(len(words) - shingle_size + 1))
+
+    vector = [0] * FINGERPRINT_BITS
+    for shingle, weight in shingles.items():
+        value = _hash64(shingle)
+        for bit in range(FINGERPRINT_BITS):
+            vector[bit] += weight if value >> bit & 1 else -weight
+
+    fingerprint = 0
+    for bit, total in enumerate(vector):
+        if total > 0:
+            fingerprint |= 1 << bit
+    return fingerprint
+
+def hamming_distance(first, second):
+    """Number of differing bits between two fingerprints."""
+    return bin(first ^ second).count('1')
+
+def page_fingerprint(html, url, config=None):
+    """
+    Fingerprint the formatted text of a page (what the LLM would be shown).
+
+    Returns:
+        int: SimHash of the page, or None when detection is disabled or the page has too little text
+    """
+    config = config or get_near_duplicate_config()
+    if not config['enabled'] or not html:
+        return None
+    text = format_extracted_html(html, url)
+    if len(_WORD_PATTERN.findall(text)) < config['min_words']:
+        return None
+    return simhash(text, config['shingle_size'])
+
+class SimHashIndex:
+    """
+    Banded LSH index over 64-bit SimHashes.
+
+    Fingerprints are split in `bands` chunks; two fingerprints within `bands - 1` bits of
+    each other necessarily share one chunk, so only the entries of the matching buckets
+    are compared instead of the whole index.
+    """
+
+    def __init__(self, bands=4):
+        if FINGERPRINT_BITS % bands:
+            raise ValueError(f"bands must divide {FINGERPRINT_BITS}")
+        self.bands = bands
+        self.band_bits = FINGERPRINT_BITS // bands
+        self._buckets = [{} for _ in range(bands)]
+        self._entries = {}
+
+    def _band_values(self, fingerprint):
+        mask = (1 << self.band_bits) - 1
+        return [(fingerprint >> (band * self.band_bits)) & mask for band in range(self.bands)]
+
+    def add(self, key, fingerprint):
+        """Index a fingerprint under a key (e.g. the page URL); re-adding a key is a no-op."""
+        if key in self._entries:
+            return
+        self._entries[key] = fingerprint
+        for band, value in enumerate(self._band_values(fingerprint)):
+            self._buckets[band].setdefault(value, []).append(key)
+
+    def nearest(self, fingerprint, max_distance):
+        """
+        Return the closest indexed entry within `max_distance` bits.
+
+        Returns:
+            tuple: (key, distance), or None when no indexed fingerprint is close enough
+        """
+        best = None
+        candidates = set()
+        for band, value in enumerate(self._band_values(fingerprint)):
+            candidates.update(self._buckets[band].get(value, ()))
+        for key in candidates:
+            distance = hamming_distance(fingerprint, self._entries[key])
+            if distance <= max_distance and (best is None or distance < best[1]):
+                best = (key, distance)
+        return best
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,9 +1,12 @@
 import json
 import logging
-import time
 import requests
 from django.conf import settings
 
+from utils import http_client, json_repair
+from utils.context_builder import build_context
+from utils.rate_limiter import RateLimitExceeded, get_limiter
+
 logger = logging.getLogger(__name__)
 
 # Retrieve API keys from settings
@@ -17,22 +20,9 @@ OPENAI_HEADERS = {
     "Content-Type": "application/json"
 }
 
-# Rate limiting
-last_api_call_time = 0
-MIN_DELAY_BETWEEN_CALLS = 1.5  # seconds
-
-def enforce_rate_limit():
-    """Enforce rate limiting between API calls"""
-    global last_api_call_time
-    current_time = time.time()
-    elapsed = current_time - last_api_call_time
-    
-    if elapsed < MIN_DELAY_BETWEEN_CALLS:
-        sleep_time = MIN_DELAY_BETWEEN_CALLS - elapsed
-        logger.info(f"Rate limiting: Sleeping for {sleep_time:.2f} seconds")
-        time.sleep(sleep_time)
-    
-    last_api_call_time = time.time()
+def enforce_rate_limit(model=None):
+    """Wait for a slot of the cluster-wide OpenAI rate limiter (AI_CONFIG['openai']['rate_limit'])"""
+    get_limiter('openai', model, OPENAI_API_KEY).acquire()
 
 def send_openai_request(messages, model="gpt-4o", max_tokens=2000, temperature=0.7):
     """
@@ -51,7 +41,11 @@ def send_openai_request(messages, model="gpt-4o", max_tokens=2000, temperature=0
         logger.error("OpenAI API key is missing")
         return None
         
-    enforce_rate_limit()
+    try:
+        enforce_rate_limit(model)
+    except RateLimitExceeded as e:
+        logger.error(f"OpenAI rate limit: {str(e)}")
+        return None
     
     data = {
         "model": model,
@@ -61,7 +55,7 @@ def send_openai_request(messages, model="gpt-4o", max_tokens=2000, temperature=0
     }
 
     try:
-        response = requests.post(OPENAI_API_URL, headers=OPENAI_HEADERS, json=data, timeout=30)
+        response = http_client.post(OPENAI_API_URL, headers=OPENAI_HEADERS, json=data, timeout=30)
         response.raise_for_status()
         
         response_json = response.json()
@@ -100,8 +94,8 @@ def analyze_html_with_gpt(html_content, objective, json_structure, structure_sch
     else:
         logger.debug("No structure schema provided")
         
-    # Truncate HTML content if it's too long
-    truncated_html = html_content[:15000] if len(html_content) > 15000 else html_content
+    # Keep the blocks most likely to hold the requested fields, within the token budget
+    truncated_html = build_context(html_content, structure_schema=structure_schema)
     
     # If using a custom schema, we need to create a response template that follows the schema
     response_template = {}
@@ -277,30 +271,8 @@ CRITICAL REQUIREMENTS:
             # Log the entire response for debugging
             logger.debug(f"Raw AI response: {response}")
             
-            # Find JSON content between ```json and ``` if present
-            if "```json" in response:
-                json_str = response.split("```json")[1].split("```")[0].strip()
-            elif "```" in response:
-                json_str = response.split("```")[1].strip()
-            else:
-                json_str = response.strip()
-            
-            # Clean up the response to handle common issues
-            json_str = json_str.replace('\n', ' ').strip()
-            
-            # Fix case where response starts with non-JSON text
-            if not json_str.startswith('{'):
-                possible_json_start = json_str.find('{')
-                if possible_json_start >= 0:
-                    json_str = json_str[possible_json_start:]
-            
-            # Fix case where response has trailing text after JSON
-            if not json_str.endswith('}'):
-                possible_json_end = json_str.rfind('}')
-                if possible_json_end >= 0:
-                    json_str = json_str[:possible_json_end+1]
-            
-            result = json.loads(json_str)
+            # Fences, prose around the JSON, raw newlines and truncation are repaired in one pass
+            result = json_repair.loads(response)
             
             # Validate the structure
             if not isinstance(result, dict):
@@ -439,15 +411,7 @@ def analyze_serp_with_gpt(serp_results, objective, json_structure):
             
         # Try to parse the JSON from the response
         try:
-            # Find JSON content between ```json and ``` if present
-            if "```json" in response:
-                json_str = response.split("```json")[1].split("```")[0].strip()
-            elif "```" in response:
-                json_str = response.split("```")[1].strip()
-            else:
-                json_str = response.strip()
-                
-            result = json.loads(json_str)
+            result = json_repair.loads(response)
             
             # Validate the structure
             if not isinstance(result, dict) or "priority_links" not in result:
@@ -525,15 +489,7 @@ def analyze_next_action_with_gpt(json_structure, html_content):
             
         # Try to parse the JSON from the response
         try:
-            # Find JSON content between ```json and ``` if present
-            if "```json" in response:
-                json_str = response.split("```json")[1].split("```")[0].strip()
-            elif "```" in response:
-                json_str = response.split("```")[1].strip()
-            else:
-                json_str = response.strip()
-                
-            result = json.loads(json_str)
+            result = json_repair.loads(response)
             
             # Validate the structure
             if not isinstance(result, dict) or "action" not in result:
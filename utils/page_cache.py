@@ -0,0 +1,168 @@
+from django.conf import settings
+import gzip
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+from utils.url_canonical import canonicalize_url
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through SCRAPING_CONFIG['page_cache']
+DEFAULT_PAGE_CACHE_CONFIG = {
+    'enabled': True,
+    'directory': None,           # defaults to BASE_DIR/cache/pages
+    'max_age_days': 30,          # entries not revalidated for this long are ignored
+    'compression_level': 6,
+}
+
+def get_page_cache_config():
+    """Return the page cache configuration merged with the defaults."""
+    config = dict(DEFAULT_PAGE_CACHE_CONFIG)
+    config.update(getattr(settings, 'SCRAPING_CONFIG', {}).get('page_cache', {}))
+    if not config['directory']:
+        config['directory'] = os.path.join(settings.BASE_DIR, 'cache', 'pages')
+    return config
+
+def cache_key(url):
+    """Key a URL by its canonical form (see `canonicalize_url`) so trivial variations share one entry."""
+    return hashlib.sha256(canonicalize_url(url).encode('utf-8')).hexdigest()
+
+def extraction_key(*parts):
+    """Build the key under which an extraction is stored, e.g. from a structure id and its schema."""
+    return hashlib.sha1(json.dumps(parts, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+def _paths(url):
+    key = cache_key(url)
+    directory = os.path.join(get_page_cache_config()['directory'], key[:2])
+    return os.path.join(directory, f"{key}.json"), os.path.join(directory, f"{key}.html.gz")
+
+def _write_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as tmp:
+            tmp.write(data)
+        os.replace(tmp_path, path)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+
+def _save_meta(meta_path, entry):
+    _write_atomic(meta_path, json.dumps(entry, ensure_ascii=False).encode('utf-8'))
+
+def get_entry(url):
+    """
+    Return the cached validators and metadata of a URL.
+
+    Returns:
+        dict: url, etag, last_modified, content_type, stored_at, validated_at and extractions,
+              or None when the URL is not cached, the cache is disabled or the entry is stale
+    """
+    config = get_page_cache_config()
+    if not config['enabled']:
+        return None
+
+    meta_path, body_path = _paths(url)
+    try:
+        with open(meta_path, encoding='utf-8') as meta_file:
+            entry = json.load(meta_file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logger.warning(f"Unreadable page cache entry for {url}: {str(e)}")
+        return None
+
+    if time.time() - entry.get('validated_at', 0) > config['max_age_days'] * 86400:
+        return None
+    if not os.path.exists(body_path):
+        return None
+    return entry
+
+def conditional_headers(entry):
+    """Return the If-None-Match / If-Modified-Since headers for a cache entry."""
+    headers = {}
+    if entry:
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+    return headers
+
+def load_body(url):
+    """Return the cached HTML of a URL, or None if it cannot be read."""
+    _, body_path = _paths(url)
+    try:
+        with gzip.open(body_path, 'rt', encoding='utf-8') as body_file:
+            return body_file.read()
+    except (OSError, EOFError, UnicodeDecodeError) as e:
+        logger.warning(f"Unreadable cached body for {url}: {str(e)}")
+        return None
+
+def store_response(url, response, html):
+    """
+    Cache a 200 response that carries an ETag or Last-Modified validator.
+
+    Extractions stored for a previous version of the page are dropped since the body changed.
+    """
+    config = get_page_cache_config()
+    etag = response.headers.get('ETag')
+    last_modified = response.headers.get('Last-Modified')
+    if not config['enabled'] or not (etag or last_modified):
+        return False
+
+    meta_path, body_path = _paths(url)
+    now = time.time()
+    entry = {
+        'url': url,
+        'etag': etag,
+        'last_modified': last_modified,
+        'content_type': response.headers.get('Content-Type', ''),
+        'stored_at': now,
+        'validated_at': now,
+        'extractions': {},
+    }
+    try:
+        _write_atomic(body_path, gzip.compress(html.encode('utf-8'), compresslevel=config['compression_level']))
+        _save_meta(meta_path, entry)
+        return True
+    except OSError as e:
+        logger.warning(f"Could not cache {url}: {str(e)}")
+        return False
+
+def mark_revalidated(url, entry, response=None):
+    """Record a 304: refresh the validation time and any validator the server sent again."""
+    meta_path, _ = _paths(url)
+    entry['validated_at'] = time.time()
+    if response is not None:
+        entry['etag'] = response.headers.get('ETag') or entry.get('etag')
+        entry['last_modified'] = response.headers.get('Last-Modified') or entry.get('last_modified')
+    try:
+        _save_meta(meta_path, entry)
+    except OSError as e:
+        logger.warning(f"Could not update page cache entry for {url}: {str(e)}")
+
+def get_extraction(url, key):
+    """Return the extraction stored for the cached version of a URL, or None."""
+    entry = get_entry(url)
+    if not entry:
+        return None
+    return entry.get('extractions', {}).get(key)
+
+def store_extraction(url, key, extraction):
+    """Attach an extraction result to the cached version of a URL (no-op when the URL is not cached)."""
+    entry = get_entry(url)
+    if not entry:
+        return False
+    entry.setdefault('extractions', {})[key] = extraction
+    meta_path, _ = _paths(url)
+    try:
+        _save_meta(meta_path, entry)
+        return True
+    except (OSError, TypeError, ValueError) as e:
+        logger.warning(f"Could not cache extraction for {url}: {str(e)}")
+        return False
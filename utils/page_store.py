@@ -0,0 +1,346 @@
+from django.conf import settings
+import hashlib
+import json
+import logging
+import mmap
+import os
+import threading
+import time
+import zlib
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+try:
+    import msvcrt
+except ImportError:
+    msvcrt = None
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through SCRAPING_CONFIG['page_store']
+DEFAULT_PAGE_STORE_CONFIG = {
+    'enabled': True,
+    'directory': None,            # defaults to BASE_DIR/page_store
+    'max_segment_mb': 256,        # start a new segment file past this size
+    'max_total_mb': 10240,        # oldest segments are deleted past this total size (None: no limit)
+    'fsync_interval': 5,          # seconds between fsyncs of the written files (0: after every page)
+    'compression_level': 6,
+}
+
+INDEX_FILE = 'index.jsonl'
+LOCK_FILE = '.lock'
+
+_store = None
+_store_pid = None
+_store_lock = threading.Lock()
+
+def get_page_store_config():
+    """Return the page store configuration merged with the defaults."""
+    config = dict(DEFAULT_PAGE_STORE_CONFIG)
+    config.update(getattr(settings, 'SCRAPING_CONFIG', {}).get('page_store', {}))
+    if not config['directory']:
+        config['directory'] = os.path.join(settings.BASE_DIR, 'page_store')
+    return config
+
+def _lock_file(lock_file):
+    """Take the lock shared by every process: flock on POSIX, msvcrt on Windows, none elsewhere."""
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+    elif msvcrt is not None:
+        lock_file.seek(0)
+        while True:
+            try:
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+                return
+            except OSError:
+                continue  # LK_LOCK gives up after 10 one-second attempts
+
+def _unlock_file(lock_file):
+    if fcntl is not None:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+    elif msvcrt is not None:
+        lock_file.seek(0)
+        msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+def page_hash(html):
+    """SHA-256 of the UTF-8 page content, used as its address in the store."""
+    return hashlib.sha256(html.encode('utf-8')).hexdigest()
+
+class PageStore:
+    """
+    Content-addressed store for raw pages.
+
+    Pages are zlib-compressed and appended to segment files; `index.jsonl` maps each
+    SHA-256 to its (segment, offset, length). Writers from every worker process are
+    serialized with a file lock, readers memory-map the segments and pick up entries
+    appended by other processes by reading the new tail of the index.
+
+    Written files are fsynced when a segment is full and at most every `fsync_interval`
+    seconds, so a crash may lose the last pages stored (they read back as missing).
+    When a segment is full and the store is past `max_total_mb`, the oldest segments are
+    deleted and the index is rewritten without them; other processes notice the new
+    index file and reload it.
+    """
+
+    def __init__(self, directory=None, max_segment_mb=None, compression_level=None, max_total_mb=None,
+                 fsync_interval=None):
+        config = get_page_store_config()
+        self.directory = directory or config['directory']
+        self.max_segment_bytes = (max_segment_mb or config['max_segment_mb']) * 1024 * 1024
+        max_total_mb = max_total_mb or config['max_total_mb']
+        self.max_total_bytes = max_total_mb * 1024 * 1024 if max_total_mb else None
+        self.fsync_interval = config['fsync_interval'] if fsync_interval is None else fsync_interval
+        self.compression_level = compression_level or config['compression_level']
+
+        os.makedirs(self.directory, exist_ok=True)
+        self._index = {}
+        self._index_position = 0
+        self._index_inode = None
+        self._maps = {}
+        self._unsynced = set()
+        self._synced_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+
+    def _index_replaced(self):
+        """Whether the index was rewritten (by a size cap) since it was last read."""
+        try:
+            return os.stat(self._path(INDEX_FILE)).st_ino != self._index_inode
+        except FileNotFoundError:
+            return self._index_inode is not None
+
+    def _reset_index(self):
+        self._index = {}
+        self._index_position = 0
+        self._index_inode = None
+        for mapped in self._maps.values():
+            mapped.close()
+        self._maps = {}
+
+    def _refresh_index(self):
+        """Read the index lines appended since the last refresh, or all of a rewritten index."""
+        try:
+            with open(self._path(INDEX_FILE), 'rb') as index_file:
+                stat = os.fstat(index_file.fileno())
+                if stat.st_ino != self._index_inode or stat.st_size < self._index_position:
+                    if self._index_inode is not None:
+                        self._reset_index()
+                    self._index_inode = stat.st_ino
+                index_file.seek(self._index_position)
+                for line in index_file:
+                    if not line.endswith(b'\n'):
+                        break  # half-written line, picked up on the next refresh
+                    self._index_position += len(line)
+                    try:
+                        record = json.loads(line)
+                        self._index[record['hash']] = (record['segment'], record['offset'], record['length'])
+                    except (ValueError, KeyError):
+                        logger.warning(f"Skipping corrupt page store index line in {self.directory}")
+        except FileNotFoundError:
+            pass
+
+    def _current_segment(self):
+        segments = sorted(name for name in os.listdir(self.directory) if name.endswith('.seg'))
+        if segments:
+            name = segments[-1]
+            if os.path.getsize(self._path(name)) < self.max_segment_bytes:
+                return name
+            number = int(name.split('-')[1].split('.')[0]) + 1
+        else:
+            number = 1
+        return f"segment-{number:05d}.seg"
+
+    def _sync(self):
+        """fsync the files written since the last sync."""
+        for name in sorted(self._unsynced):
+            try:
+                with open(self._path(name), 'ab') as written_file:
+                    os.fsync(written_file.fileno())
+            except FileNotFoundError:
+                pass  # segment deleted by the size cap
+        self._unsynced = set()
+        self._synced_at = time.monotonic()
+
+    def _drop_old_segments(self):
+        """Delete the oldest segments past `max_total_bytes` and their index entries (file lock held)."""
+        if not self.max_total_bytes:
+            return
+        segments = sorted(name for name in os.listdir(self.directory) if name.endswith('.seg'))
+        sizes = {name: os.path.getsize(self._path(name)) for name in segments}
+        total = sum(sizes.values())
+        dropped = set()
+        for name in segments[:-1]:  # the newest segment is always kept
+            if total <= self.max_total_bytes:
+                break
+            dropped.add(name)
+            total -= sizes[name]
+        if not dropped:
+            return
+
+        # Rewrite the index first so no reader looks for the pages of a deleted segment
+        index_path = self._path(INDEX_FILE)
+        with open(index_path, 'rb') as index_file, open(index_path + '.tmp', 'wb') as new_index:
+            for line in index_file:
+                try:
+                    if json.loads(line)['segment'] in dropped:
+                        continue
+                except (ValueError, KeyError):
+                    continue
+                new_index.write(line)
+            new_index.flush()
+            os.fsync(new_index.fileno())
+        os.replace(index_path + '.tmp', index_path)
+        self._reset_index()
+        self._unsynced -= dropped
+
+        for name in sorted(dropped):
+            try:
+                os.remove(self._path(name))
+            except OSError as e:
+                # Still mapped by another process on Windows, deleted with the next segment
+                logger.warning(f"Could not delete page store segment {name}: {str(e)}")
+        logger.info(f"Page store over {self.max_total_bytes // (1024 * 1024)} MB, deleted {len(dropped)} old segment(s)")
+
+    def put(self, html):
+        """
+        Store a page and return its hash. Storing the same content twice is a no-op.
+
+        Args:
+            html (str): Raw page content
+
+        Returns:
+            str: SHA-256 of the content, or None if it could not be stored
+        """
+        if not html:
+            return None
+        digest = page_hash(html)
+
+        with self._lock:
+            if digest in self._index and not self._index_replaced():
+                return digest
+            try:
+                with open(self._path(LOCK_FILE), 'a') as lock_file:
+                    _lock_file(lock_file)
+                    try:
+                        self._refresh_index()
+                        if digest in self._index:
+                            return digest
+
+                        data = zlib.compress(html.encode('utf-8'), self.compression_level)
+                        segment = self._current_segment()
+                        if not os.path.exists(self._path(segment)):
+                            # A segment is full: make it durable and enforce the size cap
+                            self._sync()
+                            self._drop_old_segments()
+                        with open(self._path(segment), 'ab') as segment_file:
+                            offset = segment_file.tell()
+                            segment_file.write(data)
+
+                        record = {'hash': digest, 'segment': segment, 'offset': offset,
+                                  'length': len(data), 'size': len(html)}
+                        with open(self._path(INDEX_FILE), 'ab') as index_file:
+                            index_file.write(json.dumps(record).encode('utf-8') + b'\n')
+                        self._unsynced.update((segment, INDEX_FILE))
+                        if time.monotonic() - self._synced_at >= self.fsync_interval:
+                            self._sync()
+                        self._refresh_index()
+                    finally:
+                        _unlock_file(lock_file)
+            except OSError as e:
+                logger.error(f"Could not store page {digest[:12]}: {str(e)}")
+                return None
+        return digest
+
+    def _map(self, segment, end):
+        """Return a memory map of a segment covering at least `end` bytes."""
+        mapped = self._maps.get(segment)
+        if mapped is None or len(mapped) < end:
+            if mapped is not None:
+                mapped.close()
+            with open(self._path(segment), 'rb') as segment_file:
+                mapped = mmap.mmap(segment_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self._maps[segment] = mapped
+        return mapped
+
+    def get(self, digest):
+        """
+        Return the page stored under a hash.
+
+        Args:
+            digest (str): SHA-256 returned by `put`
+
+        Returns:
+            str: The page content, or None if the hash is unknown or unreadable
+        """
+        if not digest:
+            return None
+        with self._lock:
+            location = self._index.get(digest)
+            if location is None or self._index_replaced():
+                self._refresh_index()
+                location = self._index.get(digest)
+            if location is None:
+                return None
+
+            segment, offset, length = location
+            try:
+                mapped = self._map(segment, offset + length)
+                return zlib.decompress(mapped[offset:offset + length]).decode('utf-8')
+            except (OSError, ValueError, zlib.error) as e:
+                logger.error(f"Could not read page {digest[:12]} from {segment}: {str(e)}")
+                return None
+
+    def __contains__(self, digest):
+        with self._lock:
+            if digest not in self._index or self._index_replaced():
+                self._refresh_index()
+            return digest in self._index
+
+    def flush(self):
+        """fsync the pages stored since the last periodic sync."""
+        with self._lock:
+            try:
+                self._sync()
+            except OSError as e:
+                logger.error(f"Could not sync the page store: {str(e)}")
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            for mapped in self._maps.values():
+                mapped.close()
+            self._maps = {}
+
+def get_page_store():
+    """Return the page store of the current worker process."""
+    global _store, _store_pid
+    if _store is not None and _store_pid == os.getpid():
+        return _store
+
+    with _store_lock:
+        if _store is None or _store_pid != os.getpid():
+            _store = PageStore()
+            _store_pid = os.getpid()
+    return _store
+
+def store_page(html):
+    """Store a page in the shared store and return its hash (None when disabled or on failure)."""
+    if not get_page_store_config()['enabled']:
+        return None
+    try:
+        return get_page_store().put(html)
+    except Exception as e:
+        logger.error(f"Page store unavailable: {str(e)}")
+        return None
+
+def load_page(digest):
+    """Return the page stored under a hash, or None."""
+    try:
+        return get_page_store().get(digest)
+    except Exception as e:
+        logger.error(f"Page store unavailable: {str(e)}")
+        return None
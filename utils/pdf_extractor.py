@@ -0,0 +1,188 @@
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from django.conf import settings
+import logging
+import multiprocessing
+import os
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through SCRAPING_CONFIG['pdf']
+DEFAULT_PDF_CONFIG = {
+    'max_workers': 2,           # extraction processes per worker process, 0 extracts inline
+    'max_pages': 60,            # pages parsed at most per document
+    'max_chars': 12000,         # text returned at most (the LLM input budget)
+    'time_budget': 20,          # seconds of parsing per document
+    'mp_context': 'spawn',      # never fork a worker process that runs threads
+    'keywords': [
+        'contact', 'courriel', 'e-mail', 'email', '@', 'téléphone', 'tél', 'tel.', 'fax',
+        'adresse', 'mairie', 'directeur', 'directrice', 'responsable', 'service',
+        "appel d'offre", 'appel d’offre', 'marché', 'consultation', 'dce', 'date limite',
+    ],
+}
+
+_executor = None
+_executor_pid = None
+_executor_lock = threading.Lock()
+
+def get_pdf_config():
+    """Return the PDF extraction configuration merged with the defaults."""
+    config = dict(DEFAULT_PDF_CONFIG)
+    config.update(getattr(settings, 'SCRAPING_CONFIG', {}).get('pdf', {}))
+    return config
+
+def _score(text, keywords):
+    lowered = text.lower()
+    return sum(lowered.count(keyword) for keyword in keywords)
+
+def extract_pages(pdf_content, max_pages, max_chars, keywords, time_budget):
+    """
+    Extract the most relevant text of a PDF within page, character and time budgets.
+
+    Pages are parsed in order until a budget is exhausted or enough text from pages
+    matching `keywords` was collected to fill `max_chars`. Matching pages are then kept
+    first (most matches first) and the remaining budget is filled with the other pages;
+    the selection is returned in document order.
+
+    Runs in the extraction process, so it only depends on PyMuPDF.
+
+    Args:
+        pdf_content (bytes): Raw PDF
+        max_pages (int): Pages parsed at most
+        max_chars (int): Characters returned at most
+        keywords (list): Lowercase keywords marking contact/tender pages
+        time_budget (float): Seconds of parsing before returning what was found
+
+    Returns:
+        dict: text, pages_total, pages_parsed, pages_kept and stopped (why parsing stopped)
+    """
+    import fitz  # PyMuPDF
+
+    deadline = time.monotonic() + time_budget
+    pages = []
+    matched_chars = 0
+    stopped = "end of document"
+
+    with fitz.open(stream=pdf_content, filetype="pdf") as pdf_doc:
+        pages_total = pdf_doc.page_count
+        for index in range(pages_total):
+            if index >= max_pages:
+                stopped = "page budget"
+                break
+            if time.monotonic() > deadline:
+                stopped = "time budget"
+                break
+
+            text = re.sub(r'[ \t]+', ' ', pdf_doc.load_page(index).get_text()).strip()
+            if not text:
+                continue
+            score = _score(text, keywords)
+            pages.append((index, score, text))
+            if score:
+                matched_chars += len(text)
+                if matched_chars >= max_chars:
+                    stopped = "character budget"
+                    break
+
+    selected = []
+    remaining = max_chars
+    for index, score, text in sorted(pages, key=lambda page: (-page[1], page[0])):
+        if remaining <= 0:
+            break
+        selected.append((index, text[:remaining]))
+        remaining -= len(text) + 1
+
+    selected.sort()
+    return {
+        "text": "\n".join(text for _, text in selected),
+        "pages_total": pages_total,
+        "pages_parsed": len(pages),
+        "pages_kept": len(selected),
+        "stopped": stopped,
+    }
+
+def get_executor():
+    """
+    Return the extraction process pool of the current worker process, or None when disabled
+    or in a daemonic process (a Celery prefork child), which may not have children.
+    """
+    global _executor, _executor_pid
+    config = get_pdf_config()
+    if config['max_workers'] <= 0 or multiprocessing.current_process().daemon:
+        return None
+    if _executor is not None and _executor_pid == os.getpid():
+        return _executor
+
+    with _executor_lock:
+        if _executor is None or _executor_pid != os.getpid():
+            _executor = ProcessPoolExecutor(
+                max_workers=config['max_workers'],
+                mp_context=multiprocessing.get_context(config['mp_context']),
+            )
+            _executor_pid = os.getpid()
+    return _executor
+
+def shutdown_executor():
+    """Stop the extraction processes of the current worker process."""
+    global _executor, _executor_pid
+    with _executor_lock:
+        if _executor is not None and _executor_pid == os.getpid():
+            _executor.shutdown(wait=False, cancel_futures=True)
+        _executor = None
+        _executor_pid = None
+
+def extract_pdf_text(pdf_content, max_chars=None):
+    """
+    Extract the relevant text of a PDF in the extraction process pool.
+
+    Falls back to inline extraction when the pool cannot be used (disabled, or
+    processes not allowed in this worker, which only shows when the first task is
+    submitted) and returns "" on any error or timeout.
+
+    Args:
+        pdf_content (bytes): Raw PDF
+        max_chars (int): Characters returned at most, defaults to `max_chars` from the config
+
+    Returns:
+        str: Extracted text
+    """
+    config = get_pdf_config()
+    args = (pdf_content, config['max_pages'], max_chars or config['max_chars'],
+            [keyword.lower() for keyword in config['keywords']], config['time_budget'])
+    start = time.monotonic()
+
+    try:
+        future = None
+        try:
+            executor = get_executor()
+            # The processes start on the first submit, where a worker that may not fork fails
+            if executor is not None:
+                future = executor.submit(extract_pages, *args)
+        except (OSError, AssertionError, ValueError, RuntimeError) as e:
+            logger.warning(f"PDF process pool unavailable, extracting inline: {str(e)}")
+            shutdown_executor()
+
+        if future is None:
+            result = extract_pages(*args)
+        else:
+            # The worker enforces the time budget itself; the margin covers process startup
+            try:
+                result = future.result(timeout=config['time_budget'] + 10)
+            except BrokenProcessPool:
+                shutdown_executor()
+                raise
+    except FutureTimeoutError:
+        logger.error(f"PDF extraction exceeded {config['time_budget']}s, skipped")
+        return ""
+    except Exception as e:
+        logger.error(f"Error extracting text from PDF: {str(e)}")
+        return ""
+
+    logger.info(
+        f"PDF: {result['pages_kept']}/{result['pages_total']} pages kept, {result['pages_parsed']} parsed, "
+        f"{len(result['text'])} chars in {time.monotonic() - start:.2f}s ({result['stopped']})"
+    )
+    return result["text"]
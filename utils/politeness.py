@@ -0,0 +1,236 @@
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+from urllib.robotparser import RobotFileParser
+from django.conf import settings
+from django.utils import timezone
+import logging
+import threading
+import time
+
+import requests
+
+from utils import http_client
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through SCRAPING_CONFIG['politeness']
+DEFAULT_POLITENESS_CONFIG = {
+    'enabled': True,
+    'user_agent': 'WizzyBot/1.0',
+    'obey_robots': True,
+    'robots_ttl': 86400,            # seconds a robots.txt is trusted
+    'robots_error_ttl': 3600,       # seconds before retrying an unreachable robots.txt
+    'robots_timeout': 10,           # seconds
+    'default_delay': 1.0,           # seconds between two requests to a domain without Crawl-delay
+    'max_crawl_delay': 30.0,        # ignore larger Crawl-delay values (cap, not skip)
+    'burst': 2,                     # requests a domain may receive back to back
+    'throttle_minutes': 60,         # rate limit applied on 429/503 without Retry-After
+    'max_throttle_minutes': 24 * 60,
+}
+
+THROTTLE_STATUS_CODES = (429, 503)
+
+# Crawlers only have to read this much of a robots.txt (RFC 9309)
+ROBOTS_MAX_BYTES = 500 * 1024
+
+def get_politeness_config():
+    """Return the politeness configuration merged with the defaults."""
+    config = dict(DEFAULT_POLITENESS_CONFIG)
+    config.update(getattr(settings, 'SCRAPING_CONFIG', {}).get('politeness', {}))
+    return config
+
+def get_domain(url):
+    """Return the lowercase host (with port) a URL is scheduled under."""
+    return urlparse(url).netloc.lower()
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, at most `capacity` stored."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+
+    def reserve(self):
+        """Take one token and return how many seconds the caller must wait before using it."""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        self.tokens -= 1
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.rate
+
+class PolitenessScheduler:
+    """
+    Per-domain pacing for the crawler.
+
+    Each domain gets a robots.txt cached for `robots_ttl` and a token bucket refilled at
+    one request per Crawl-delay (or `default_delay`). Domains answering 429/503 are
+    blocked in-process and their ScrapedSite rows get `rate_limit_until`.
+    """
+
+    def __init__(self, config=None):
+        self.config = config or get_politeness_config()
+        self._robots = {}        # domain -> (parser or None, crawl_delay, expires_at)
+        self._buckets = {}       # domain -> TokenBucket
+        self._blocked = {}       # domain -> monotonic time until which the domain is throttled
+        self._lock = threading.Lock()
+        self._robots_locks = {}
+
+    def _fetch_robots(self, scheme, domain):
+        parser = RobotFileParser()
+        robots_url = f"{scheme}://{domain}/robots.txt"
+        try:
+            response = http_client.get_limited(
+                robots_url,
+                max_bytes=ROBOTS_MAX_BYTES,
+                allowed_types=None,
+                headers={"User-Agent": self.config['user_agent']},
+                timeout=self.config['robots_timeout'],
+            )
+        except requests.exceptions.RequestException as e:
+            logger.info(f"robots.txt unreachable for {domain}, allowing crawl: {str(e)}")
+            return None, self.config['robots_error_ttl']
+
+        if response.status_code in (401, 403):
+            parser.disallow_all = True
+        elif response.status_code >= 500:
+            logger.info(f"robots.txt returned {response.status_code} for {domain}, allowing crawl")
+            return None, self.config['robots_error_ttl']
+        elif response.status_code >= 400:
+            parser.allow_all = True
+        else:
+            parser.parse(response.text.splitlines())
+        return parser, self.config['robots_ttl']
+
+    def _get_robots(self, url):
+        parsed = urlparse(url)
+        domain = parsed.netloc.lower()
+        with self._lock:
+            cached = self._robots.get(domain)
+            if cached and cached[2] > time.monotonic():
+                return cached
+            domain_lock = self._robots_locks.setdefault(domain, threading.Lock())
+
+        # One download per domain even when several threads ask at the same time
+        with domain_lock:
+            with self._lock:
+                cached = self._robots.get(domain)
+                if cached and cached[2] > time.monotonic():
+                    return cached
+
+            parser, ttl = self._fetch_robots(parsed.scheme or 'https', domain)
+            crawl_delay = None
+            if parser is not None:
+                try:
+                    crawl_delay = parser.crawl_delay(self.config['user_agent'])
+                except Exception:
+                    crawl_delay = None
+                if crawl_delay is not None:
+                    crawl_delay = min(float(crawl_delay), self.config['max_crawl_delay'])
+                    logger.info(f"Crawl-delay for {domain}: {crawl_delay}s")
+
+            entry = (parser, crawl_delay, time.monotonic() + ttl)
+            with self._lock:
+                self._robots[domain] = entry
+                # Rebuild the bucket so a new Crawl-delay takes effect
+                self._buckets.pop(domain, None)
+            return entry
+
+    def is_allowed(self, url):
+        """Whether robots.txt allows our user agent to fetch this URL (blocking on first call per domain)."""
+        if not self.config['enabled'] or not self.config['obey_robots']:
+            return True
+        parser, _, _ = self._get_robots(url)
+        if parser is None:
+            return True
+        return parser.can_fetch(self.config['user_agent'], url)
+
+    def blocked_for(self, url):
+        """Seconds left before a throttled domain may be contacted again (0 when not throttled)."""
+        with self._lock:
+            until = self._blocked.get(get_domain(url))
+        if not until:
+            return 0.0
+        return max(0.0, until - time.monotonic())
+
+    def reserve(self, url):
+        """
+        Reserve the next request slot of the URL's domain.
+
+        Returns:
+            float: Seconds to wait before sending the request
+        """
+        if not self.config['enabled']:
+            return 0.0
+        domain = get_domain(url)
+        _, crawl_delay, _ = self._get_robots(url) if self.config['obey_robots'] else (None, None, None)
+        with self._lock:
+            bucket = self._buckets.get(domain)
+            if bucket is None:
+                delay = crawl_delay or self.config['default_delay']
+                # A Crawl-delay means one request per delay, no burst
+                capacity = 1 if crawl_delay else self.config['burst']
+                bucket = self._buckets[domain] = TokenBucket(1.0 / delay, capacity)
+            return bucket.reserve()
+
+    def wait(self, url):
+        """Block until the URL may be fetched. Returns False when robots.txt or a throttle forbids it."""
+        if self.blocked_for(url) > 0 or not self.is_allowed(url):
+            return False
+        delay = self.reserve(url)
+        if delay > 0:
+            time.sleep(delay)
+        return True
+
+    def report_response(self, url, response):
+        """Throttle the domain when the server answered 429 or 503."""
+        if response is None or response.status_code not in THROTTLE_STATUS_CODES:
+            return
+        minutes = _retry_after_minutes(response.headers.get('Retry-After'))
+        if minutes is None:
+            minutes = self.config['throttle_minutes']
+        minutes = max(1, min(minutes, self.config['max_throttle_minutes']))
+        self.throttle(url, minutes, reason=f"HTTP {response.status_code}")
+
+    def throttle(self, url, minutes, reason=""):
+        """Stop contacting the URL's domain for `minutes` and record it on its ScrapedSite rows."""
+        domain = get_domain(url)
+        with self._lock:
+            self._blocked[domain] = time.monotonic() + minutes * 60
+        logger.warning(f"Domain {domain} throttled for {minutes} min ({reason})")
+
+        try:
+            from scraping.models import ScrapedSite
+            ScrapedSite.objects.filter(domain__iexact=domain).update(
+                rate_limit_until=timezone.now() + timezone.timedelta(minutes=minutes)
+            )
+        except Exception as e:
+            logger.warning(f"Could not record rate limit for {domain}: {str(e)}")
+
+def _retry_after_minutes(value):
+    """Parse a Retry-After header (seconds or HTTP date) into whole minutes, None if absent or invalid."""
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return max(1, -(-int(value) // 60))
+    try:
+        seconds = (parsedate_to_datetime(value) - timezone.now()).total_seconds()
+    except (TypeError, ValueError):
+        return None
+    return max(1, int(-(-seconds // 60)))
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+def get_scheduler():
+    """Return the process-wide politeness scheduler."""
+    global _scheduler
+    if _scheduler is None:
+        with _scheduler_lock:
+            if _scheduler is None:
+                _scheduler = PolitenessScheduler()
+    return _scheduler
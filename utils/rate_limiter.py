@@ -0,0 +1,227 @@
+from asgiref.sync import sync_to_async
+from django.conf import settings
+import asyncio
+import hashlib
+import logging
+import threading
+import time
+
+from utils import redis_client
+from utils.politeness import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through SCRAPING_CONFIG['rate_limiter']
+DEFAULT_RATE_LIMITER_CONFIG = {
+    'enabled': True,
+    'redis_url': None,            # defaults to CELERY_BROKER_URL
+    'key_prefix': 'ratelimit',
+    'socket_timeout': 0.5,        # seconds, a slow Redis falls back to per-process buckets
+    'retry_redis_after': 30,      # seconds before trying Redis again after a failure
+    'max_wait': 300,              # seconds a caller may be scheduled ahead before giving up
+}
+
+# Where each provider's limits live: (settings name, path to the 'rate_limit' dict)
+PROVIDER_SETTINGS = {
+    'mistral': ('AI_CONFIG', ('mistral', 'rate_limit')),
+    'openai': ('AI_CONFIG', ('openai', 'rate_limit')),
+    'serper': ('SCRAPING_CONFIG', ('serp', 'rate_limit')),
+}
+
+# Token bucket shared by every worker: refill, take one token, and return how long the
+# caller must wait for it. The reservation is only recorded when that wait is acceptable,
+# so callers are scheduled one after the other instead of all sleeping then retrying.
+RESERVE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local max_wait = tonumber(ARGV[3])
+local clock = redis.call('TIME')
+local now = tonumber(clock[1]) + tonumber(clock[2]) / 1000000
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or capacity
+local ts = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local wait = 0
+if tokens < 1 then
+    wait = (1 - tokens) / rate
+end
+if wait > max_wait then
+    return {0, tostring(wait)}
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens - 1), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate + max_wait) + 60)
+redis.call('HINCRBY', KEYS[2], 'requests', 1)
+redis.call('HINCRBYFLOAT', KEYS[2], 'wait_seconds', tostring(wait))
+return {1, tostring(wait)}
+"""
+
+class RateLimitExceeded(Exception):
+    """The provider is booked further ahead than the caller accepts to wait."""
+
+    def __init__(self, key, wait):
+        super().__init__(f"{key}: next slot in {wait:.1f}s")
+        self.key = key
+        self.wait = wait
+
+_script = None
+_script_client = None
+
+_local_buckets = {}
+_metrics = {}
+_local_lock = threading.Lock()
+
+def get_rate_limiter_config():
+    """Return the rate limiter configuration merged with the defaults."""
+    config = dict(DEFAULT_RATE_LIMITER_CONFIG)
+    config.update(getattr(settings, 'SCRAPING_CONFIG', {}).get('rate_limiter', {}))
+    if not config['redis_url']:
+        config['redis_url'] = redis_client.default_url()
+    return config
+
+def get_provider_limits(provider, model=None):
+    """
+    Read the limits of a provider (and optional model override) from the settings.
+
+    `rate_limit` dicts accept requests_per_minute, burst and a `models` mapping of
+    per-model overrides, e.g. AI_CONFIG['mistral']['rate_limit']['models']['mistral-large-latest'].
+
+    Returns:
+        tuple: (tokens per second, bucket capacity)
+    """
+    setting_name, path = PROVIDER_SETTINGS.get(provider, (None, ()))
+    limits = getattr(settings, setting_name, {}) if setting_name else {}
+    for key in path:
+        limits = limits.get(key, {}) if isinstance(limits, dict) else {}
+    limits = dict(limits)
+    if model:
+        limits.update(limits.get('models', {}).get(model, {}))
+    requests_per_minute = limits.get('requests_per_minute') or 60
+    return requests_per_minute / 60.0, max(1, int(limits.get('burst', 1)))
+
+def _get_redis(config):
+    """Return the Redis client of the current process, or None while Redis is unreachable."""
+    global _script, _script_client
+    client = redis_client.get_client(config['redis_url'], config['socket_timeout'])
+    if client is not None and client is not _script_client:
+        _script = client.register_script(RESERVE_SCRIPT)
+        _script_client = client
+    return client
+
+def _mark_redis_down(config, error):
+    redis_client.mark_down(config['redis_url'], config['retry_redis_after'])
+    logger.warning(f"Rate limiter Redis unavailable, using per-process buckets for {config['retry_redis_after']}s: {str(error)}")
+
+def _record(key, wait):
+    with _local_lock:
+        stats = _metrics.setdefault(key, {'requests': 0, 'wait_seconds': 0.0, 'max_wait': 0.0})
+        stats['requests'] += 1
+        stats['wait_seconds'] += wait
+        stats['max_wait'] = max(stats['max_wait'], wait)
+
+def get_metrics():
+    """Requests and wait time per limiter key in this process."""
+    with _local_lock:
+        return {key: dict(stats) for key, stats in _metrics.items()}
+
+def get_cluster_metrics(provider):
+    """Requests and total wait time recorded by every worker for a provider (empty without Redis)."""
+    config = get_rate_limiter_config()
+    try:
+        client = _get_redis(config)
+        if client is None:
+            return {}
+        stats = client.hgetall(f"{config['key_prefix']}:stats:{provider}")
+        return {name.decode(): float(value) for name, value in stats.items()}
+    except Exception as e:
+        logger.warning(f"Could not read rate limiter metrics: {str(e)}")
+        return {}
+
+class RateLimiter:
+    """
+    Token bucket for one provider, model and API key, shared across workers through Redis.
+
+    `reserve` books the next request slot and returns how long to wait for it without
+    sleeping, so callers may sleep (`acquire`), await (`acquire_async`) or schedule the
+    work later. When Redis is unreachable each process falls back to its own bucket.
+    """
+
+    def __init__(self, provider, model=None, api_key=None, rate=None, capacity=None):
+        default_rate, default_capacity = get_provider_limits(provider, model)
+        self.provider = provider
+        self.rate = rate or default_rate
+        self.capacity = capacity or default_capacity
+        key_hash = hashlib.sha1((api_key or '').encode('utf-8')).hexdigest()[:12]
+        self.key = f"{provider}:{model or '*'}:{key_hash}"
+
+    def _reserve_local(self, max_wait):
+        with _local_lock:
+            bucket = _local_buckets.get(self.key)
+            if bucket is None or (bucket.rate, bucket.capacity) != (self.rate, self.capacity):
+                bucket = _local_buckets[self.key] = TokenBucket(self.rate, self.capacity)
+            wait = bucket.reserve()
+            if wait > max_wait:
+                bucket.tokens += 1  # give the token back, nothing was booked
+        return wait
+
+    def reserve(self, max_wait=None):
+        """
+        Book the next request slot.
+
+        Args:
+            max_wait (float): Longest acceptable wait, defaults to the configured `max_wait`
+
+        Returns:
+            float: Seconds to wait before sending the request
+
+        Raises:
+            RateLimitExceeded: The next free slot is further away than `max_wait`
+        """
+        config = get_rate_limiter_config()
+        if not config['enabled']:
+            return 0.0
+        max_wait = config['max_wait'] if max_wait is None else max_wait
+
+        wait = None
+        client = _get_redis(config)
+        if client is not None:
+            try:
+                booked, wait = _script(
+                    keys=[f"{config['key_prefix']}:{self.key}", f"{config['key_prefix']}:stats:{self.provider}"],
+                    args=[self.rate, self.capacity, max_wait],
+                    client=client,
+                )
+                wait = float(wait)
+                if not int(booked):
+                    raise RateLimitExceeded(self.key, wait)
+            except RateLimitExceeded:
+                raise
+            except Exception as e:
+                _mark_redis_down(config, e)
+                wait = None
+        if wait is None:
+            wait = self._reserve_local(max_wait)
+            if wait > max_wait:
+                raise RateLimitExceeded(self.key, wait)
+
+        _record(self.key, wait)
+        return wait
+
+    def acquire(self, max_wait=None):
+        """Block until the next request slot; returns the seconds waited."""
+        wait = self.reserve(max_wait)
+        if wait > 0:
+            logger.info(f"Rate limiter {self.key}: waiting {wait:.2f}s")
+            time.sleep(wait)
+        return wait
+
+    async def acquire_async(self, max_wait=None):
+        """Await the next request slot without blocking the event loop; returns the seconds waited."""
+        # reserve() may wait on Redis up to its socket timeout, keep it off the loop
+        wait = await sync_to_async(self.reserve, thread_sensitive=False)(max_wait)
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+def get_limiter(provider, model=None, api_key=None):
+    """Return the limiter of a provider for a model and API key, with limits from the settings."""
+    return RateLimiter(provider, model=model, api_key=api_key)
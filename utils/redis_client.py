@@ -0,0 +1,47 @@
+from django.conf import settings
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# One client per Redis URL, socket timeout and process: (url, socket_timeout) -> (client, pid)
+_clients = {}
+# url -> monotonic time before which Redis is not tried again
+_down_until = {}
+_lock = threading.Lock()
+
+def default_url():
+    """Redis URL used when a feature does not configure its own: the Celery broker."""
+    return getattr(settings, 'CELERY_BROKER_URL', 'redis://localhost:6379/0')
+
+def get_client(url=None, socket_timeout=0.5):
+    """
+    Return the Redis client of the current process for a URL and socket timeout.
+
+    Clients are created lazily and again after a fork, and short socket timeouts keep
+    a slow Redis from stalling callers that have a local fallback. Features configuring
+    different timeouts for one URL get separate clients.
+
+    Returns:
+        redis.Redis: Client, or None while the server is marked down (see `mark_down`)
+    """
+    url = url or default_url()
+    if time.monotonic() < _down_until.get(url, 0.0):
+        return None
+    key = (url, socket_timeout)
+    cached = _clients.get(key)
+    if cached and cached[1] == os.getpid():
+        return cached[0]
+    with _lock:
+        cached = _clients.get(key)
+        if not cached or cached[1] != os.getpid():
+            import redis
+            client = redis.Redis.from_url(url, socket_timeout=socket_timeout, socket_connect_timeout=socket_timeout)
+            cached = _clients[key] = (client, os.getpid())
+    return cached[0]
+
+def mark_down(url, seconds):
+    """Stop trying a Redis URL for `seconds` after a failure, so callers use their fallback at once."""
+    _down_until[url or default_url()] = time.monotonic() + seconds
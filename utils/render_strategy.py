@@ -0,0 +1,166 @@
+from urllib.parse import urlparse
+from django.conf import settings
+from django.utils import timezone
+import logging
+import re
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+STATIC = 'static'
+BROWSER = 'browser'
+UNKNOWN = 'unknown'
+
+# Defaults, overridable through SCRAPING_CONFIG['render_strategy']
+DEFAULT_RENDER_CONFIG = {
+    'min_html_length': 500,      # below this the static page is considered empty or protected
+    'min_text_length': 200,      # visible text a usable static page must contain
+    'memo_ttl': 300,             # seconds a decision is kept in process memory before re-reading the DB
+    'recheck_after_days': 30,    # re-probe a domain whose decision is older than this
+}
+
+# Empty mount points left in the static HTML by client-side frameworks
+SPA_ROOT_PATTERNS = [
+    re.compile(r'<div[^>]+id=["\'](?:root|app|__next|__nuxt|svelte|main-app)["\'][^>]*>\s*</div>', re.I),
+    re.compile(r'<app-root[^>]*>\s*</app-root>', re.I),
+    re.compile(r'<[^>]+\sng-app\b', re.I),
+    re.compile(r'<[^>]+\sdata-reactroot\b', re.I),
+]
+
+NOSCRIPT_JS_PATTERN = re.compile(
+    r'<noscript[^>]*>[^<]*(?:<[^>]+>[^<]*)*?(?:enable|activer|activez)\s+(?:javascript|js)',
+    re.I,
+)
+
+_SCRIPT_STYLE_PATTERN = re.compile(r'<(script|style|noscript|template)[^>]*>.*?</\1>', re.I | re.S)
+_TAG_PATTERN = re.compile(r'<[^>]+>')
+
+# In-process memo: domain -> (strategy, expires_at)
+_memo = {}
+_memo_lock = threading.Lock()
+
+def get_render_config():
+    """Return the render strategy configuration merged with the defaults."""
+    config = dict(DEFAULT_RENDER_CONFIG)
+    config.update(getattr(settings, 'SCRAPING_CONFIG', {}).get('render_strategy', {}))
+    return config
+
+def get_domain(url):
+    """Return the lowercase host of a URL without its leading www."""
+    domain = urlparse(url).netloc.lower()
+    return domain[4:] if domain.startswith('www.') else domain
+
+def visible_text_length(html):
+    """Approximate length of the text a reader would see, ignoring scripts, styles and markup."""
+    text = _TAG_PATTERN.sub(' ', _SCRIPT_STYLE_PATTERN.sub(' ', html))
+    return len(' '.join(text.split()))
+
+def needs_js_rendering(html):
+    """
+    Decide whether a statically fetched page is only a shell waiting for JavaScript.
+
+    Args:
+        html (str): HTML returned by the static fetch
+
+    Returns:
+        tuple: (bool, reason) where reason explains the decision for the logs
+    """
+    config = get_render_config()
+    if not html or len(html) < config['min_html_length']:
+        return True, "page too short"
+
+    text_length = visible_text_length(html)
+    if text_length >= config['min_text_length']:
+        return False, "enough visible text"
+
+    for pattern in SPA_ROOT_PATTERNS:
+        if pattern.search(html):
+            return True, "empty SPA root"
+    if NOSCRIPT_JS_PATTERN.search(html):
+        return True, "noscript asks for JavaScript"
+    return True, f"only {text_length} characters of visible text"
+
+def _remember(domain, strategy):
+    with _memo_lock:
+        _memo[domain] = (strategy, time.monotonic() + get_render_config()['memo_ttl'])
+
+def get_render_strategy(url):
+    """
+    Return the memoized render strategy for the domain of a URL.
+
+    Args:
+        url (str): Any URL of the domain
+
+    Returns:
+        str: 'static', 'browser' or 'unknown' when the domain has not been classified yet
+    """
+    domain = get_domain(url)
+    if not domain:
+        return UNKNOWN
+
+    with _memo_lock:
+        cached = _memo.get(domain)
+    if cached and cached[1] > time.monotonic():
+        return cached[0]
+
+    strategy = UNKNOWN
+    try:
+        from scraping.models import DomainProfile
+        profile = DomainProfile.objects.filter(domain=domain).first()
+        if profile and profile.render_strategy != UNKNOWN and profile.strategy_decided_at:
+            age = timezone.now() - profile.strategy_decided_at
+            if age < timezone.timedelta(days=get_render_config()['recheck_after_days']):
+                strategy = profile.render_strategy
+    except Exception as e:
+        logger.warning(f"Could not load render strategy for {domain}: {str(e)}")
+
+    _remember(domain, strategy)
+    return strategy
+
+def record_render_outcome(url, strategy):
+    """
+    Persist which fetcher produced usable content for a page of this domain.
+
+    Args:
+        url (str): URL of the page that was fetched
+        strategy (str): 'static' when the static fetch was sufficient, 'browser' when rendering was needed
+    """
+    domain = get_domain(url)
+    if not domain or strategy not in (STATIC, BROWSER):
+        return
+
+    _remember(domain, strategy)
+    try:
+        from django.db.models import F
+        from scraping.models import DomainProfile
+        counter = 'static_successes' if strategy == STATIC else 'browser_renders'
+        profile, _ = DomainProfile.objects.get_or_create(domain=domain)
+        if profile.render_strategy != strategy:
+            logger.info(f"Render strategy for {domain}: {profile.render_strategy} -> {strategy}")
+        DomainProfile.objects.filter(pk=profile.pk).update(
+            render_strategy=strategy,
+            strategy_decided_at=timezone.now(),
+            **{counter: F(counter) + 1},
+        )
+    except Exception as e:
+        logger.warning(f"Could not save render strategy for {domain}: {str(e)}")
+
+def reset_render_strategy(url):
+    """Forget the classification of a domain (e.g. a static site now rendered with JavaScript), its next fetch classifies it again."""
+    domain = get_domain(url)
+    if not domain:
+        return
+
+    _remember(domain, UNKNOWN)
+    try:
+        from scraping.models import DomainProfile
+        DomainProfile.objects.filter(domain=domain).update(render_strategy=UNKNOWN, strategy_decided_at=None)
+        logger.info(f"Render strategy for {domain} reset to {UNKNOWN}")
+    except Exception as e:
+        logger.warning(f"Could not reset render strategy for {domain}: {str(e)}")
+
+def clear_memo():
+    """Forget the in-process decisions (tests, or after editing profiles by hand)."""
+    with _memo_lock:
+        _memo.clear()
@@ -1,18 +1,16 @@
 import requests
 import logging
-import time
 from django.conf import settings
 
+from utils import http_client
+from utils.rate_limiter import RateLimitExceeded, get_limiter
+
 logger = logging.getLogger(__name__)
 
 # API Configuration
 SERPER_API_KEY = settings.SERPER_API_KEY
 SERPER_API_URL = "https://google.serper.dev/search"
 
-# Rate limiting
-LAST_REQUEST_TIME = 0
-MIN_DELAY_BETWEEN_REQUESTS = 1.0  # seconds
-
 def get_serp_results(query, num_results_per_page=10, num_pages=1, page=1):
     """
     Get search engine results using Serper.dev API.
@@ -30,16 +28,8 @@ def get_serp_results(query, num_results_per_page=10, num_pages=1, page=1):
         logger.error("Serper API key is missing")
         return []
     
-    # Rate limiting
-    global LAST_REQUEST_TIME
-    current_time = time.time()
-    elapsed = current_time - LAST_REQUEST_TIME
-    
-    if elapsed < MIN_DELAY_BETWEEN_REQUESTS:
-        sleep_time = MIN_DELAY_BETWEEN_REQUESTS - elapsed
-        logger.info(f"Rate limiting: Sleeping for {sleep_time:.2f} seconds")
-        time.sleep(sleep_time)
-    
+    # Rate limiting shared by every worker (SCRAPING_CONFIG['serp']['rate_limit'])
+    limiter = get_limiter('serper', api_key=SERPER_API_KEY)
     results = []
     
     try:
@@ -58,10 +48,8 @@ def get_serp_results(query, num_results_per_page=10, num_pages=1, page=1):
                 "page": page
             }
             
-            # Update last request time right before making the request
-            LAST_REQUEST_TIME = time.time()
-            
-            response = requests.post(SERPER_API_URL, headers=headers, json=payload)
+            limiter.acquire()
+            response = http_client.post(SERPER_API_URL, headers=headers, json=payload)
             response.raise_for_status()
             
             data = response.json()
@@ -95,10 +83,8 @@ def get_serp_results(query, num_results_per_page=10, num_pages=1, page=1):
                     "page": p
                 }
                 
-                # Update last request time right before making the request
-                LAST_REQUEST_TIME = time.time()
-                
-                response = requests.post(SERPER_API_URL, headers=headers, json=payload)
+                limiter.acquire()
+                response = http_client.post(SERPER_API_URL, headers=headers, json=payload)
                 response.raise_for_status()
                 
                 data = response.json()
@@ -125,10 +111,6 @@ def get_serp_results(query, num_results_per_page=10, num_pages=1, page=1):
                 else:
                     logger.warning(f"No organic results found on page {p}")
                     break
-                
-                # Add a delay between pages if we have more pages to fetch
-                if p < page + num_pages - 1:
-                    time.sleep(MIN_DELAY_BETWEEN_REQUESTS)
             
             logger.info(f"Retrieved {len(results)} total results for query: '{query}' across pages {page}-{page+num_pages-1}")
             return results
@@ -136,6 +118,9 @@ def get_serp_results(query, num_results_per_page=10, num_pages=1, page=1):
     except requests.exceptions.RequestException as e:
         logger.error(f"Error fetching SERP results: {str(e)}")
         return []
+    except RateLimitExceeded as e:
+        logger.error(f"Serper rate limit: {str(e)}")
+        return results
     except Exception as e:
         logger.error(f"Unexpected error in get_serp_results: {str(e)}")
         return [] 
\ No newline at end of file
@@ -1,106 +1,148 @@
-from selenium import webdriver
-from selenium.webdriver.chrome.service import Service
-from selenium.webdriver.chrome.options import Options
-from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
-from webdriver_manager.chrome import ChromeDriverManager
 import requests
 import logging
 import time
-import fitz  # PyMuPDF
+
+from utils import adaptive_timeouts, circuit_breaker, http_client
+from utils.browser_pool import get_browser_pool
+from utils.pdf_extractor import extract_pdf_text
+from utils.politeness import THROTTLE_STATUS_CODES, get_scheduler
+from utils.render_strategy import (
+    BROWSER, STATIC, UNKNOWN, get_render_strategy, needs_js_rendering,
+    record_render_outcome, reset_render_strategy, visible_text_length,
+)
 
 logger = logging.getLogger(__name__)
 
-# ✅ Global initialization of Selenium for reuse
-selenium_driver = None
 MY_BOT_USER_AGENT = "WizzyBot/1.0"
 
-def init_selenium():
-    """Initialize a single Selenium session for all pages."""
-    global selenium_driver
-    if selenium_driver is None:
-        try:
-            options = Options()
-            options.add_argument("--headless")  # Invisible mode
-            options.add_argument("--no-sandbox")
-            options.add_argument("--disable-dev-shm-usage")
-            options.add_experimental_option("excludeSwitches", ["enable-logging"])  # Suppress Selenium logs
-
-            service = Service(ChromeDriverManager().install())
-            selenium_driver = webdriver.Chrome(service=service, options=options)
-            logger.info("Selenium initialized successfully")
-        except Exception as e:
-            logger.error(f"Failed to initialize Selenium: {str(e)}")
-            raise
-
-def close_selenium():
-    """Close the Selenium session when finished."""
-    global selenium_driver
-    if selenium_driver:
-        selenium_driver.quit()
-        selenium_driver = None
-        logger.info("Selenium closed successfully")
-
 def extract_text_from_pdf(pdf_content):
-    """Extract raw text from a PDF."""
-    try:
-        with fitz.open(stream=pdf_content, filetype="pdf") as pdf_doc:
-            text = "\n".join([page.get_text() for page in pdf_doc])
-        return text
-    except Exception as e:
-        logger.error(f"Error extracting text from PDF: {str(e)}")
-        return ""
+    """Extract the contact/tender-relevant text of a PDF within the configured budgets."""
+    return extract_pdf_text(pdf_content)
 
 def fetch_page_content(url):
-    """Scrape a webpage prioritizing Requests and using Selenium as fallback."""
-    global selenium_driver
-    if selenium_driver is None:
-        init_selenium()
+    """
+    Scrape a webpage with the fetcher its domain is known to need.
+
+    Domains classified as static are served by Requests only (a page that turns out to
+    need JavaScript resets the domain to unknown and is rendered like on an unknown
+    domain), domains classified as JavaScript-rendered
+    go straight to a pooled Selenium browser, and unknown domains try Requests first and
+    are classified from the outcome.
+    """
+    # Skip domains that keep failing instead of waiting for their timeouts
+    if not circuit_breaker.allow_request(url):
+        logger.warning(f"Fetch of {url} skipped: circuit open for this domain")
+        return ""
+
+    # Honor robots.txt, Crawl-delay and any throttle the domain imposed on us
+    politeness = get_scheduler()
+    if not politeness.wait(url):
+        logger.warning(f"Fetch of {url} skipped: disallowed by robots.txt or domain throttled")
+        return ""
+
+    strategy = get_render_strategy(url)
+    static_html = ""
 
     try:
         # Check if it's a PDF and extract it without Selenium
         if url.lower().endswith(".pdf"):
             logger.info(f"PDF detected, extracting text from {url}...")
-            response = requests.get(url, stream=True, timeout=10)
+            try:
+                response = http_client.get_limited(
+                    url,
+                    max_bytes=http_client.get_http_config()['max_pdf_bytes'],
+                    allowed_types=http_client.PDF_CONTENT_TYPES,
+                    truncate=False,
+                    timeout=adaptive_timeouts.get_timeouts(url, default_read=10),
+                )
+            except (http_client.UnsupportedContentType, http_client.ResponseTooLarge) as e:
+                logger.warning(f"PDF skipped: {str(e)}")
+                return ""
             if response.status_code == 200:
                 return extract_text_from_pdf(response.content)
             logger.error(f"Unable to download the PDF: {url}")
             return ""
 
-        # 1st attempt: Load with requests (much faster than Selenium)
-        headers = {"User-Agent": MY_BOT_USER_AGENT}
-        response = requests.get(url, headers=headers, timeout=10)
-
-        # Check if the response is valid HTML
-        if response.status_code == 200 and "text/html" in response.headers.get("Content-Type", ""):
-            html_content = response.text.strip()
-
-            # Check if the page is not empty or protected
-            if len(html_content) > 500:  # Empirical: less than 500 characters = suspicious page
-                logger.info(f"Success: Page loaded with requests for {url}")
-                return html_content
-            else:
-                logger.warning(f"Page too short with requests, trying with Selenium: {url}")
+        if strategy == BROWSER:
+            logger.info(f"Domain known to need JavaScript, skipping requests for {url}")
         else:
-            logger.warning(f"Requests failed (status: {response.status_code}), trying with Selenium.")
+            # 1st attempt: Load with requests (much faster than Selenium)
+            headers = {"User-Agent": MY_BOT_USER_AGENT}
+            start = time.monotonic()
+            try:
+                response = http_client.get_limited(
+                    url, headers=headers, timeout=adaptive_timeouts.get_timeouts(url, default_read=10)
+                )
+            except (requests.ConnectionError, requests.Timeout):
+                circuit_breaker.record_result(url, False, time.monotonic() - start)
+                raise
+            elapsed = time.monotonic() - start
+            circuit_breaker.record_result(url, response.status_code < 500, elapsed)
+            if response.status_code < 400:
+                adaptive_timeouts.record_latency(url, elapsed)
+            politeness.report_response(url, response)
+            if response.status_code in THROTTLE_STATUS_CODES:
+                return ""
+
+            # Check if the response is valid HTML
+            if response.status_code == 200 and "text/html" in response.headers.get("Content-Type", ""):
+                static_html = response.text.strip()
+
+                # Check if the page is not empty, protected or an empty JavaScript shell
+                needs_js, reason = needs_js_rendering(static_html)
+                if not needs_js:
+                    logger.info(f"Success: Page loaded with requests for {url}")
+                    if strategy == UNKNOWN:
+                        record_render_outcome(url, STATIC)
+                    return static_html
+                if strategy == STATIC:
+                    logger.warning(f"Static page not usable ({reason}) on a static domain, classifying it again: {url}")
+                    reset_render_strategy(url)
+                    strategy = UNKNOWN
+                logger.warning(f"Static page not usable ({reason}), trying with Selenium: {url}")
+            else:
+                logger.warning(f"Requests failed (status: {response.status_code}), trying with Selenium.")
 
+    except (http_client.UnsupportedContentType, http_client.ResponseTooLarge) as e:
+        # Media or binary content: a browser would not make it scrapable either
+        logger.warning(f"Download skipped: {str(e)}")
+        return ""
     except requests.RequestException as e:
         logger.error(f"Requests error for {url}: {str(e)}")
 
+    # Static domains are served by Requests only: a browser would not fix an error page or a dead host
+    if strategy == STATIC:
+        return ""
+
     # If requests fails, try with Selenium
     try:
         logger.info(f"Selenium activated for {url}")
-        selenium_driver.get(url)
+        with get_browser_pool().lease() as driver:
+            driver.get(url)
+
+            # Wait for DOM to be completely loaded before retrieving the source
+            WebDriverWait(driver, adaptive_timeouts.browser_wait(url)).until(
+                lambda driver: driver.execute_script("return document.readyState") == "complete"
+            )
 
-        # Wait for DOM to be completely loaded before retrieving the source
-        WebDriverWait(selenium_driver, 7).until(
-            lambda driver: driver.execute_script("return document.readyState") == "complete"
-        )
+            html_content = driver.page_source
 
-        html_content = selenium_driver.page_source
+        if strategy != BROWSER:
+            _classify_from_browser(url, static_html, html_content)
         return html_content
 
     except Exception as e:
         logger.error(f"Selenium failed on {url}: {str(e)}")
-        return "" 
\ No newline at end of file
+        return ""
+
+def _classify_from_browser(url, static_html, rendered_html):
+    """Record whether rendering brought content the static fetch could not get."""
+    rendered_text = visible_text_length(rendered_html)
+    static_text = visible_text_length(static_html) if static_html else 0
+
+    if rendered_text > static_text and not needs_js_rendering(rendered_html)[0]:
+        record_render_outcome(url, BROWSER)
+    elif static_html and rendered_text <= static_text:
+        # The browser saw nothing more than requests did: the static fetch was sufficient
+        record_render_outcome(url, STATIC)
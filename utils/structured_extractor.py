@@ -0,0 +1,274 @@
+from django.conf import settings
+from urllib.parse import unquote, urljoin, urlparse
+import json
+import logging
+import re
+
+from lxml import etree
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through SCRAPING_CONFIG['pre_extraction']
+DEFAULT_PRE_EXTRACTION_CONFIG = {
+    'enabled': True,
+    'text_patterns': True,       # also take emails / phone numbers found in the visible text
+}
+
+EMAIL_PATTERN = re.compile(r'[\w.+-]+@[\w-]+(?:\.[\w-]+)+')
+PHONE_PATTERN = re.compile(
+    r'(?:\+\d{2,3}[\s.]?(?:\(0\)\s?)?|\b0)[1-9](?:[\s.-]?\d{2}){4}\b|\+\d{1,3}(?:[\s.-]?\d{2,4}){3,5}\b'
+)
+_IMAGE_SUFFIXES = ('.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp')
+
+ORGANIZATION_TYPES = {
+    'organization', 'corporation', 'localbusiness', 'governmentorganization', 'ngo', 'educationalorganization',
+    'professionalservice', 'store', 'medicalorganization', 'sportsorganization', 'cityhall', 'municipality',
+    'legalservice', 'restaurant', 'hotel', 'company',
+}
+PERSON_TYPES = {'person'}
+
+# Facts found in the markup, and the schema field names each of them fills
+FIELD_ALIASES = {
+    'company': ('nom_entreprise', 'entreprise', 'company', 'company_name', 'societe', 'société', 'organisation',
+                'organization', 'raison_sociale', 'nom_organisation', 'nom_mairie'),
+    'email': ('email', 'e_mail', 'mail', 'courriel', 'email_contact', 'adresse_email'),
+    'phone': ('telephone', 'téléphone', 'phone', 'tel', 'telephone_contact', 'numero_telephone'),
+    'website': ('site_web', 'website', 'site_internet', 'url', 'site'),
+    'address': ('adresse', 'address', 'adresse_postale', 'street_address'),
+    'postal_code': ('code_postal', 'postal_code', 'zip', 'zip_code', 'cp'),
+    'city': ('ville', 'city', 'commune', 'localite'),
+    'description': ('description', 'about', 'a_propos', 'presentation'),
+    'linkedin': ('linkedin', 'linkedin_url', 'linkedin_profile'),
+    'twitter': ('twitter', 'twitter_url', 'twitter_profile'),
+    'facebook': ('facebook', 'facebook_url'),
+    'contact_name': ('nom', 'name', 'nom_contact', 'contact_name', 'dirigeant', 'nom_dirigeant', 'responsable'),
+    'position': ('fonction', 'position', 'poste', 'titre_contact', 'job_title'),
+    'size': ('taille_entreprise', 'effectif', 'employees', 'size', 'nombre_employes'),
+}
+TYPE_FACTS = {'email': 'email', 'phone': 'phone', 'tel': 'phone', 'url': 'website'}
+
+def get_pre_extraction_config():
+    """Return the pre-extraction configuration merged with the defaults."""
+    config = dict(DEFAULT_PRE_EXTRACTION_CONFIG)
+    config.update(getattr(settings, 'SCRAPING_CONFIG', {}).get('pre_extraction', {}))
+    return config
+
+def _clean(value):
+    if isinstance(value, list):
+        value = next((item for item in value if item), '')
+    if isinstance(value, dict):
+        value = value.get('name') or value.get('@id') or ''
+    return ' '.join(str(value or '').split())
+
+def _valid_email(email):
+    email = email.strip().strip('.').lower()
+    return email if EMAIL_PATTERN.fullmatch(email) and not email.endswith(_IMAGE_SUFFIXES) else None
+
+def _types(item):
+    types = item.get('@type') or []
+    types = types if isinstance(types, list) else [types]
+    return {str(value).rsplit('/', 1)[-1].lower() for value in types}
+
+def _iter_json_ld(data):
+    """Every object of a JSON-LD document, following @graph and nested values."""
+    if isinstance(data, list):
+        for item in data:
+            yield from _iter_json_ld(item)
+    elif isinstance(data, dict):
+        yield data
+        for key, value in data.items():
+            if key != '@context' and isinstance(value, (dict, list)):
+                yield from _iter_json_ld(value)
+
+def _set(facts, key, value):
+    """Keep the first value found for a fact: sources are read from the most to the least reliable."""
+    value = _clean(value)
+    if value and not facts.get(key):
+        facts[key] = value
+
+def _read_address(facts, address):
+    if isinstance(address, str):
+        _set(facts, 'address', address)
+    elif isinstance(address, dict):
+        _set(facts, 'address', address.get('streetAddress'))
+        _set(facts, 'postal_code', address.get('postalCode'))
+        _set(facts, 'city', address.get('addressLocality'))
+
+def _read_profiles(facts, links, base_url):
+    for link in links if isinstance(links, list) else [links]:
+        link = urljoin(base_url or '', _clean(link))
+        host = urlparse(link).netloc.lower()
+        for network in ('linkedin', 'twitter', 'facebook'):
+            if f"{network}.com" in host or (network == 'twitter' and host.endswith('x.com')):
+                _set(facts, network, link)
+
+def _read_organization(facts, item, base_url):
+    _set(facts, 'company', item.get('legalName') or item.get('name'))
+    _set(facts, 'description', item.get('description'))
+    _set(facts, 'website', item.get('url'))
+    email = _valid_email(_clean(item.get('email')).replace('mailto:', ''))
+    if email:
+        _set(facts, 'email', email)
+    _set(facts, 'phone', item.get('telephone'))
+    _read_address(facts, item.get('address'))
+    _read_profiles(facts, item.get('sameAs') or [], base_url)
+    employees = item.get('numberOfEmployees')
+    _set(facts, 'size', employees.get('value') if isinstance(employees, dict) else employees)
+    for key in ('founder', 'employee', 'member', 'contactPoint'):
+        people = item.get(key)
+        for person in people if isinstance(people, list) else [people]:
+            if isinstance(person, dict):
+                _read_person(facts, person)
+
+def _read_person(facts, item):
+    _set(facts, 'contact_name', item.get('name'))
+    _set(facts, 'position', item.get('jobTitle') or item.get('contactType'))
+    email = _valid_email(_clean(item.get('email')).replace('mailto:', ''))
+    if email:
+        _set(facts, 'contact_email', email)
+    _set(facts, 'contact_phone', item.get('telephone'))
+
+def _microdata_value(element):
+    for attribute in ('content', 'href', 'src', 'datetime'):
+        if element.get(attribute):
+            return element.get(attribute)
+    return ' '.join(''.join(element.itertext()).split())
+
+def _microdata_item(scope):
+    """Properties of an itemscope, without descending into nested itemscopes (kept as dicts)."""
+    item = {'@type': (scope.get('itemtype') or '').split()}
+    for element in scope.iterdescendants():
+        prop = element.get('itemprop')
+        if not prop:
+            continue
+        # Skip properties of nested scopes, they are read with their own scope
+        owner = next((ancestor for ancestor in element.iterancestors() if ancestor.get('itemscope') is not None), None)
+        if owner is not scope:
+            continue
+        value = _microdata_item(element) if element.get('itemscope') is not None else _microdata_value(element)
+        item.setdefault(prop, value)
+    return item
+
+def _read_hcard(facts, card):
+    def first(class_name):
+        found = card.xpath(f".//*[contains(concat(' ', normalize-space(@class), ' '), ' {class_name} ')]")
+        return _microdata_value(found[0]) if found else ''
+    _set(facts, 'company', first('org') or first('p-org'))
+    _set(facts, 'contact_name', first('fn') or first('p-name'))
+    _set(facts, 'position', first('title') or first('p-job-title'))
+    _set(facts, 'phone', first('tel') or first('p-tel'))
+    email = _valid_email(first('email').replace('mailto:', '') or first('u-email').replace('mailto:', ''))
+    if email:
+        _set(facts, 'email', email)
+    _set(facts, 'address', first('street-address') or first('p-street-address'))
+    _set(facts, 'postal_code', first('postal-code') or first('p-postal-code'))
+    _set(facts, 'city', first('locality') or first('p-locality'))
+
+def extract_facts(html, url=None, config=None):
+    """
+    Read contact facts from the machine-readable parts of a page, most reliable first:
+    schema.org JSON-LD, microdata, hCard/vCard markup, mailto:/tel: links, og:site_name,
+    then email and phone patterns of the visible text.
+
+    Returns:
+        dict: Facts such as company, email, phone, website, address, postal_code, city,
+              description, linkedin, contact_name, position (only those found)
+    """
+    config = config or get_pre_extraction_config()
+    facts = {}
+    if not html or '<' not in html:
+        return facts
+    try:
+        root = etree.HTML(html.encode('utf-8', 'ignore') if isinstance(html, str) else html,
+                          etree.HTMLParser(recover=True, encoding='utf-8'))
+    except (ValueError, etree.ParserError) as e:
+        logger.warning(f"Could not parse page for pre-extraction: {str(e)}")
+        return facts
+    if root is None:
+        return facts
+
+    items = []
+    for script in root.xpath("//script[@type='application/ld+json']/text()"):
+        try:
+            items.extend(_iter_json_ld(json.loads(script)))
+        except ValueError:
+            continue
+    for scope in root.xpath("//*[@itemscope][not(ancestor::*[@itemscope])]"):
+        items.extend(_iter_json_ld(_microdata_item(scope)))
+    for item in items:
+        types = _types(item)
+        if types & ORGANIZATION_TYPES:
+            _read_organization(facts, item, url)
+    for item in items:
+        if _types(item) & PERSON_TYPES:
+            _read_person(facts, item)
+
+    for card in root.xpath("//*[contains(concat(' ', normalize-space(@class), ' '), ' vcard ') or "
+                           "contains(concat(' ', normalize-space(@class), ' '), ' h-card ')]"):
+        _read_hcard(facts, card)
+
+    host = urlparse(url or '').netloc.lower().removeprefix('www.')
+    emails = [_valid_email(unquote(href[7:].split('?')[0])) for href in root.xpath("//a/@href") if href.lower().startswith('mailto:')]
+    phones = [unquote(href[4:]).strip() for href in root.xpath("//a/@href") if href.lower().startswith('tel:')]
+    if config['text_patterns']:
+        text = ' '.join(root.xpath('//body//text()[not(ancestor::script) and not(ancestor::style)]'))
+        emails += [_valid_email(email) for email in EMAIL_PATTERN.findall(text)]
+        phones += PHONE_PATTERN.findall(text)
+    emails = [email for email in dict.fromkeys(emails) if email]
+    # An address of the site's own domain beats a webmaster or agency address
+    emails.sort(key=lambda email: not (host and email.split('@')[1].endswith(host)))
+    if emails:
+        _set(facts, 'email', emails[0])
+    if phones:
+        _set(facts, 'phone', phones[0])
+
+    _set(facts, 'company', (root.xpath("//meta[@property='og:site_name']/@content") or [''])[0])
+    _read_profiles(facts, [href for href in root.xpath("//a/@href") if 'linkedin.com' in href or 'twitter.com' in href], url)
+    if url:
+        _set(facts, 'website', f"{urlparse(url).scheme}://{urlparse(url).netloc}")
+    return facts
+
+def fact_for_field(field):
+    """Fact that fills a schema field, from its name then its type (None when no fact applies)."""
+    name = str(field.get('name') or '').lower()
+    for fact, aliases in FIELD_ALIASES.items():
+        if name in aliases:
+            return fact
+    return TYPE_FACTS.get(str(field.get('type') or '').lower())
+
+def map_to_schema(facts, structure_schema):
+    """
+    Fill the fields of a structure schema from extracted facts.
+
+    Returns:
+        dict: Field name -> value, only for the fields that could be filled
+    """
+    fields = {}
+    for field in structure_schema or []:
+        fact = fact_for_field(field)
+        value = facts.get(fact) if fact else None
+        if fact in ('email', 'phone'):
+            value = value or facts.get(f"contact_{fact}")
+        if not value:
+            continue
+        if field.get('type') == 'number':
+            digits = re.sub(r'[^\d]', '', str(value))
+            if not digits:
+                continue
+            value = int(digits)
+        fields[field.get('name')] = value
+    return fields
+
+def pre_extract(html, url, structure_schema):
+    """
+    Fields of a structure schema that can be read from the page without an LLM.
+
+    Returns:
+        tuple: (filled fields dict, list of the schema fields still missing)
+    """
+    config = get_pre_extraction_config()
+    if not config['enabled'] or not structure_schema:
+        return {}, list(structure_schema or [])
+    filled = map_to_schema(extract_facts(html, url, config), structure_schema)
+    missing = [field for field in structure_schema if field.get('name') not in filled]
+    return filled, missing
@@ -0,0 +1,170 @@
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit, urlunsplit
+from django.conf import settings
+import fnmatch
+import hashlib
+import logging
+import math
+import re
+import string
+
+logger = logging.getLogger(__name__)
+
+# Defaults, overridable through SCRAPING_CONFIG['url_canonical']
+DEFAULT_CANONICAL_CONFIG = {
+    # Query parameters that never change the page content (shell-style patterns, case-insensitive)
+    'strip_params': [
+        'utm_*', 'gclid', 'gclsrc', 'dclid', 'fbclid', 'msclkid', 'yclid', 'mc_cid', 'mc_eid',
+        '_ga', '_gl', '_hsenc', '_hsmi', 'hsctatracking', 'mkt_tok', 'igshid', 'ref_src', 'xtor',
+        'sessionid', 'session_id', 'sid', 'phpsessid', 'jsessionid', 'aspsessionid*', 'cfid', 'cftoken',
+    ],
+    'bloom_capacity': 100000,     # URLs per seen-set before the false positive rate degrades
+    'bloom_error_rate': 0.001,
+}
+
+# ;jsessionid=... style session ids embedded in the path
+_PATH_SESSION_PATTERN = re.compile(r';(?:jsessionid|phpsessid|sid)=[^/?#]*', re.I)
+_DEFAULT_PORTS = {'http': 80, 'https': 443}
+_PERCENT_ESCAPE = re.compile(r'%([0-9A-Fa-f]{2})')
+_STRAY_PERCENT = re.compile(r'%(?![0-9A-Fa-f]{2})')
+_UNRESERVED = frozenset(string.ascii_letters + string.digits + '-._~')
+
+def get_canonical_config():
+    """Return the canonicalization configuration merged with the defaults."""
+    config = dict(DEFAULT_CANONICAL_CONFIG)
+    config.update(getattr(settings, 'SCRAPING_CONFIG', {}).get('url_canonical', {}))
+    return config
+
+def _is_tracking_param(name, patterns):
+    name = name.lower()
+    return any(fnmatch.fnmatchcase(name, pattern) for pattern in patterns)
+
+def _decode_unreserved(match):
+    char = chr(int(match.group(1), 16))
+    return char if char in _UNRESERVED else f"%{match.group(1).upper()}"
+
+def _normalize_path_encoding(path):
+    """
+    Decode the percent-escapes of unreserved characters only (RFC 3986 6.2.2.2) and
+    uppercase the others: %2F or %3F stay encoded since decoding them changes the resource.
+    Characters that cannot appear raw in a path are encoded.
+    """
+    path = _STRAY_PERCENT.sub('%25', path)
+    path = _PERCENT_ESCAPE.sub(_decode_unreserved, path)
+    return quote(path, safe="/:@!$&'()*+,;=-._~%")
+
+def canonicalize_url(url):
+    """
+    Return the canonical, still fetchable form of a URL.
+
+    Lowercases the scheme and host, drops default ports, fragments, path session ids
+    and tracking parameters, sorts the remaining query parameters, normalizes
+    percent-encoding and removes trailing slashes (the root path is kept as "/").
+
+    Args:
+        url (str): URL to normalize
+
+    Returns:
+        str: Canonical URL, or the input unchanged when it is not an http(s) URL
+    """
+    if not url:
+        return url
+    url = url.strip()
+    try:
+        parts = urlsplit(url)
+        port = parts.port
+    except ValueError:
+        return url
+    scheme = parts.scheme.lower()
+    if scheme not in _DEFAULT_PORTS or not parts.hostname:
+        return url
+
+    host = parts.hostname.lower().rstrip('.')
+    if port and port != _DEFAULT_PORTS[scheme]:
+        host = f"{host}:{port}"
+
+    path = _PATH_SESSION_PATTERN.sub('', parts.path)
+    path = re.sub(r'/{2,}', '/', path)
+    path = _normalize_path_encoding(path)
+    if len(path) > 1:
+        path = path.rstrip('/')
+    path = path or '/'
+
+    patterns = [pattern.lower() for pattern in get_canonical_config()['strip_params']]
+    query = sorted(
+        (name, value)
+        for name, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not _is_tracking_param(name, patterns)
+    )
+    return urlunsplit((scheme, host, path, urlencode(query), ''))
+
+def url_key(url):
+    """
+    Deduplication key of a URL: its canonical form without scheme and leading "www.".
+
+    http:// and https://, www. and bare host therefore share one key.
+    """
+    canonical = canonicalize_url(url)
+    parts = urlsplit(canonical)
+    host = parts.netloc[4:] if parts.netloc.startswith('www.') else parts.netloc
+    return urlunsplit(('', host, parts.path, parts.query, '')).lstrip('/')
+
+def canonical_domain(url):
+    """Host of the canonical URL (with a non-default port, without changing www)."""
+    return urlsplit(canonicalize_url(url)).netloc
+
+class BloomFilter:
+    """Fixed-size Bloom filter over strings (double hashing on SHA-256)."""
+
+    def __init__(self, capacity, error_rate):
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def _positions(self, value):
+        digest = hashlib.sha256(value.encode('utf-8')).digest()
+        first = int.from_bytes(digest[:8], 'big')
+        second = int.from_bytes(digest[8:16], 'big') | 1
+        return [(first + i * second) % self.size for i in range(self.hash_count)]
+
+    def add(self, value):
+        """Add a value; returns False when it was (probably) already present."""
+        new = False
+        for position in self._positions(value):
+            byte, bit = divmod(position, 8)
+            if not self.bits[byte] & (1 << bit):
+                new = True
+                self.bits[byte] |= 1 << bit
+        return new
+
+    def __contains__(self, value):
+        return all(self.bits[position // 8] & (1 << (position % 8)) for position in self._positions(value))
+
+class SeenURLSet:
+    """
+    Cheap per-job seen-set keyed by `url_key`, backed by a Bloom filter.
+
+    A false positive makes a URL look already seen, at the configured error rate;
+    a URL that was added is never reported as unseen.
+    """
+
+    def __init__(self, urls=(), capacity=None, error_rate=None):
+        config = get_canonical_config()
+        self._bloom = BloomFilter(capacity or config['bloom_capacity'], error_rate or config['bloom_error_rate'])
+        self.count = 0
+        for url in urls:
+            self.add(url)
+
+    def add(self, url):
+        """Record a URL; returns True if it had not been seen before."""
+        if not url:
+            return False
+        new = self._bloom.add(url_key(url))
+        if new:
+            self.count += 1
+        return new
+
+    def __contains__(self, url):
+        return bool(url) and url_key(url) in self._bloom
+
+    def __len__(self):
+        return self.count
@@ -3,6 +3,10 @@ ASGI config for wizzydjango project.
 
 It exposes the ASGI callable as a module-level variable named ``application``.
 
+The streamed chat (/api/chat/stream/) is an async view: serve this application with an
+ASGI server (e.g. gunicorn with uvicorn workers) so a conversation does not hold a worker
+and its Server-Sent Events are not buffered.
+
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
 """
@@ -207,9 +207,11 @@ AI_CONFIG = {
         'default_model': 'mistral-large-latest',
         'max_tokens': 8192,
         'temperature': 0.7,
+        'max_in_flight': 8,  # async requests in flight at once per worker process
+        'request_timeout': 120,  # seconds, deadline of an async request (waiting for a slot included)
         'rate_limit': {
             'requests_per_minute': 60,
-            'min_delay_between_requests': 1.0  # seconds
+            'burst': 1  # requests allowed back to back, across all workers
         },
         'gdpr_compliance': {
             'enabled_by_default': True,  # Set to True to make GDPR compliance the default
@@ -222,7 +224,7 @@ AI_CONFIG = {
         'temperature': 0.7,
         'rate_limit': {
             'requests_per_minute': 60,
-            'min_delay_between_requests': 1.0  # seconds
+            'burst': 1  # requests allowed back to back, across all workers
         }
     }
 }
@@ -234,7 +236,7 @@ SCRAPING_CONFIG = {
         'max_pages': 4,
         'rate_limit': {
             'requests_per_minute': 60,
-            'min_delay_between_requests': 1.0  # seconds
+            'burst': 1  # requests allowed back to back, across all workers
         }
     },
     'linkedin': {
@@ -250,6 +252,154 @@ SCRAPING_CONFIG = {
             'requests_per_minute': 100,
             'min_delay_between_requests': 0.6  # seconds
         }
+    },
+    'fetcher': {
+        'max_concurrency': 10,         # pages in flight across all domains
+        'per_domain_concurrency': 2,   # pages in flight for a single domain
+        'timeout': 30,                 # seconds
+        'batch_size': 20               # sites prefetched together by run_scraping_task
+    },
+    'http': {
+        'pool_connections': 50,        # per-host pools kept alive in each worker process
+        'pool_maxsize': 10,            # keep-alive connections per host
+        'pool_block': False,
+        'connect_timeout': 5,          # seconds
+        'read_timeout': 30,            # seconds
+        'max_page_bytes': 2 * 1024 * 1024,   # decoded HTML kept per page, the rest is not downloaded
+        'max_pdf_bytes': 20 * 1024 * 1024,   # larger PDFs are skipped
+        'chunk_size': 64 * 1024
+    },
+    'browser': {
+        'max_browsers': 2,             # warm headless Chrome sessions per worker process
+        'max_pages_per_browser': 50,   # recycle a browser after this many pages
+        'max_memory_mb': 500,          # recycle a browser whose process tree exceeds this RSS
+        'page_load_timeout': 30,       # seconds
+        'lease_timeout': 60,           # seconds to wait for a free browser
+        'driver_path': os.environ.get('CHROMEDRIVER_PATH')  # skip ChromeDriverManager when set
+    },
+    'render_strategy': {
+        'min_html_length': 500,        # shorter static pages are treated as empty or protected
+        'min_text_length': 200,        # visible text a static page needs to skip the browser
+        'memo_ttl': 300,               # seconds a domain decision is cached in process memory
+        'recheck_after_days': 30       # re-probe domains whose decision is older than this
+    },
+    'page_cache': {
+        'enabled': True,
+        'directory': os.environ.get('PAGE_CACHE_DIR'),  # defaults to BASE_DIR/cache/pages
+        'max_age_days': 30,            # entries not revalidated for this long are refetched
+        'compression_level': 6
+    },
+    'page_store': {
+        'enabled': True,
+        'directory': os.environ.get('PAGE_STORE_DIR'),  # defaults to BASE_DIR/page_store
+        'max_segment_mb': 256,         # roll over to a new segment file past this size
+        'max_total_mb': 10240,         # delete the oldest segments past this total size
+        'fsync_interval': 5,           # seconds between fsyncs of the written files
+        'compression_level': 6
+    },
+    'politeness': {
+        'enabled': True,
+        'user_agent': 'WizzyBot/1.0',
+        'obey_robots': True,
+        'robots_ttl': 86400,           # seconds a robots.txt is trusted
+        'robots_error_ttl': 3600,      # seconds before retrying an unreachable robots.txt
+        'default_delay': 1.0,          # seconds between requests to a domain without Crawl-delay
+        'max_crawl_delay': 30.0,       # cap on the Crawl-delay we honor
+        'burst': 2,                    # back-to-back requests allowed per domain
+        'throttle_minutes': 60         # rate limit applied on 429/503 without Retry-After
+    },
+    'pdf': {
+        'max_workers': 2,              # PDF extraction processes per worker process (0 = inline)
+        'max_pages': 60,               # pages parsed at most per document
+        'max_chars': 12000,            # text kept per document, matches the LLM input budget
+        'time_budget': 20              # seconds of parsing per document
+    },
+    'fanout': {
+        'enabled': True                # explore the sites of a job in parallel subtasks (Celery chord)
+    },
+    'url_canonical': {
+        'bloom_capacity': 100000,      # URLs per job seen-set
+        'bloom_error_rate': 0.001      # chance that an unseen URL is reported as seen
+        # 'strip_params': [...]        # override the tracking/session parameters removed from URLs
+    },
+    'near_duplicate': {
+        'enabled': True,               # reuse the extraction of a near-identical page of the same domain
+        'max_distance': 3,             # SimHash Hamming distance (out of 64 bits) for a near-duplicate
+        'bands': 4,                    # LSH bands, keep above max_distance
+        'min_words': 30                # pages with less text are always extracted
+    },
+    'circuit_breaker': {
+        'enabled': True,               # skip domains whose recent requests mostly fail
+        'window_size': 20,             # last requests considered per domain
+        'min_requests': 5,             # requests needed before the circuit may open
+        'failure_rate': 0.5,           # share of failed or slow requests that opens the circuit
+        'slow_request_seconds': 20,    # slower successful requests count as failures
+        'cooldown_minutes': 15,        # first cooldown, doubled after each failed probe
+        'max_cooldown_minutes': 1440
+    },
+    'timeouts': {
+        'enabled': True,               # derive per-domain timeouts from observed latencies
+        'percentile': 0.95,
+        'multiplier': 2.0,             # read timeout = 2 x p95 latency of the domain
+        'min_read': 5,                 # seconds
+        'max_read': 60,                # seconds
+        'max_retries': 2,              # retries of timeouts/connection errors/500/502/504 per request
+        'backoff_base': 1.0,           # seconds, full-jitter exponential backoff
+        'job_retry_budget': 50         # retries a scraping task may spend in total
+    },
+    'rate_limiter': {
+        'enabled': True,               # token buckets shared by all workers for Mistral, OpenAI and Serper
+        'redis_url': None,             # defaults to CELERY_BROKER_URL
+        'max_wait': 300                # seconds a call may be scheduled ahead before failing
+        # Limits: requests_per_minute / burst / models in AI_CONFIG[...]['rate_limit'] and SCRAPING_CONFIG['serp']['rate_limit']
+    },
+    'llm_cache': {
+        'enabled': True,               # reuse Mistral answers to identical requests across jobs
+        'redis_url': None,             # defaults to CELERY_BROKER_URL
+        'redis_ttl': 24 * 3600,        # seconds hot answers stay in Redis
+        'ttl': {                       # seconds an answer is reused, per kind of request
+            'html_extraction': 30 * 24 * 3600,
+            'serp_analysis': 7 * 24 * 3600,
+            'search_variations': 7 * 24 * 3600,
+            'next_action': 7 * 24 * 3600
+        },
+        'max_entries': 50000           # database rows kept, least recently used evicted first
+    },
+    'context': {
+        'enabled': True,               # send the highest-signal blocks of a page instead of its first characters
+        'token_budget': 3000,          # tokens of page content per extraction call
+        'model_budgets': {             # per-model overrides
+            'mistral-large-latest': 3000,
+            'mistral-small-latest': 2000
+        },
+        'fallback_budget': 1500        # tokens for the sector lookup on the same page
+    },
+    'batch_extraction': {
+        'enabled': True,               # extract the pages of a site in one Mistral call (custom structures)
+        'max_pages': 4,                # pages packed into one prompt
+        'token_budget': 6000           # tokens of page content shared by the pages of a batch
+    },
+    'link_scorer': {
+        'enabled': True,               # rank the links of a page locally instead of asking Mistral
+        'min_score': 1.5,              # best link below this: move on to the next site
+        'confident_score': 4.0,        # best link above this is followed without asking Mistral
+        'ambiguity_margin': 1.0,       # lead over the second link that also avoids asking Mistral
+        'history_size': 5000           # followed links the weights are learned from
+    },
+    'model_router': {
+        'enabled': True,               # pick the Mistral model per kind of call
+        'routes': {                    # cheapest first, next model when the answer fails validation
+            'chat': ['mistral-small-latest', 'mistral-large-latest'],
+            'search_variations': ['mistral-small-latest'],
+            'next_action': ['mistral-small-latest'],
+            'classification': ['mistral-small-latest'],
+            'serp_analysis': ['mistral-small-latest', 'mistral-large-latest'],
+            'html_extraction': ['mistral-small-latest', 'mistral-large-latest']
+        }
+    },
+    'pre_extraction': {
+        'enabled': True,               # read JSON-LD, microdata, mailto:/tel: links before calling Mistral
+        'text_patterns': True          # also take emails and phone numbers of the visible text
     }
 }
 
@@ -438,6 +588,8 @@ CELERY_TIMEZONE = TIME_ZONE
 CELERY_TASK_ROUTES = {
     'scraping.tasks.verify_celery_connection': {'queue': 'celery'},  # File par défaut
     'scraping.tasks.run_scraping_task': {'queue': 'scraping'},
+    'scraping.tasks.explore_site_task': {'queue': 'scraping'},
+    'scraping.tasks.finalize_scraping_task': {'queue': 'scraping'},
     'scraping.tasks.start_structure_scrape': {'queue': 'scraping'},
     'scraping.tasks.test_celery_connection': {'queue': 'celery'},  # File par défaut
 }
@@ -117,9 +117,11 @@ AI_CONFIG = {
         'default_model': 'mistral-large-latest',
         'max_tokens': 8192,
         'temperature': 0.7,
+        'max_in_flight': 8,  # async requests in flight at once per worker process
+        'request_timeout': 120,  # seconds, deadline of an async request (waiting for a slot included)
         'rate_limit': {
             'requests_per_minute': 60,
-            'min_delay_between_requests': 1.0  # seconds
+            'burst': 1  # requests allowed back to back, across all workers
         },
         'gdpr_compliance': {
             'enabled_by_default': True,  # Set to True to make GDPR compliance the default
@@ -132,7 +134,7 @@ AI_CONFIG = {
         'temperature': 0.7,
         'rate_limit': {
             'requests_per_minute': 60,
-            'min_delay_between_requests': 1.0  # seconds
+            'burst': 1  # requests allowed back to back, across all workers
         }
     }
 } 